@@ -170,10 +170,42 @@ class Settings(BaseSettings):
         # 默认值
         return f"http://127.0.0.1:{default_port}"
     
+    def _get_service_urls(service_name: str, single_url: str) -> str:
+        """
+        获取服务的全部节点（逗号分隔），用于多机部署时的客户端负载均衡
+        优先级：环境变量 {NAME}_SERVICE_URLS（由 pydantic 读取）> 环境变量 {NAME}_SERVICE_URL（单节点）
+               > 配置文件 services.{name}.endpoints > 单节点 URL
+        endpoints 中每项可以是完整 URL，也可以是 {"host": ..., "port": ...}
+        """
+        if os.getenv(f"{service_name.upper()}_SERVICE_URL"):
+            return single_url
+        if _services_config and "services" in _services_config:
+            endpoints = _services_config["services"].get(service_name, {}).get("endpoints") or []
+            urls = []
+            for ep in endpoints:
+                if isinstance(ep, str):
+                    urls.append(ep.rstrip("/"))
+                elif isinstance(ep, dict) and ep.get("port"):
+                    urls.append(f"http://{ep.get('host', '127.0.0.1')}:{ep['port']}")
+            if urls:
+                return ",".join(urls)
+        return single_url
+
     asr_service_url: str = _get_service_url("asr_minnan", 9011)
     tts_service_url: str = _get_service_url("tts", 9030)
     tts_minnan_service_url: str = _get_service_url("tts", 9030)  # 使用标准 TTS 服务
     tts_cjg_service_url: str = _get_service_url("tts_cjg", 9031)
+    # 多节点部署：逗号分隔的节点列表（为空时只使用上面的单节点 URL）
+    tts_minnan_service_urls: str = _get_service_urls("tts", tts_minnan_service_url)
+    tts_cjg_service_urls: str = _get_service_urls("tts_cjg", tts_cjg_service_url)
+    # 多节点选路策略：least（最少在途请求）/ p2c（随机二选一）
+    tts_load_balance_strategy: str = "least"
+    tts_health_probe_interval: float = 5.0  # 秒，0 表示不做后台健康检查
+    # 对冲请求：片段超过近期延迟分位数仍未返回时向另一节点重发一份（仅多节点时生效）
+    tts_hedge_enabled: bool = True
+    tts_hedge_percentile: float = 0.95
+    tts_hedge_budget: float = 0.05  # 对冲请求最多约占请求总数的比例
+    tts_hedge_min_delay: float = 0.5  # 秒
     speech_translation_service_url: str = os.getenv("SPEECH_TRANSLATION_SERVICE_URL", "")
     voice_interaction_service_url: str = os.getenv("VOICE_INTERACTION_SERVICE_URL", "")
     voice_cloning_service_url: str = os.getenv("VOICE_CLONING_SERVICE_URL", "")
@@ -182,6 +214,12 @@ class Settings(BaseSettings):
     
     # 统一的请求配置
     model_request_timeout: int = 60  # 秒
+
+    # 陈嘉庚TTS调度：每个节点同时发出的请求数上限（超出部分按优先级排队，低于连接池上限以给取消等请求留余量）
+    tts_cjg_max_concurrency: int = 16
+    # 实时对话片段的截止时间（秒）：排队超过该时间的片段不再合成
+    tts_first_segment_deadline: float = 20.0
+    tts_interactive_deadline: float = 45.0
     
     # LLM厂商配置
     
@@ -196,12 +234,38 @@ class Settings(BaseSettings):
     provider_name: str = os.getenv("PROVIDER_NAME", "qwen")
     llm_model_name: str = os.getenv("LLM_MODEL_NAME", "qwen-max")
     provider_api_key: str = os.getenv("PROVIDER_API_KEY", "sk-75c80f6957ca4655a2033fc5cda4bb3c")
+    # OpenAI 兼容 Provider 的地址覆盖（如指向本地桩服务 test_single/mock_openai_server.py），为空时使用默认地址
+    llm_provider_base_url: str = os.getenv("LLM_PROVIDER_BASE_URL", "")
+    # Provider 连接池：keep-alive 需长于两轮对话的间隔，首个 token 才不必等待 TLS 握手
+    llm_max_connections: int = 100
+    llm_max_keepalive_connections: int = 20
+    llm_keepalive_expiry: float = 120.0  # 秒
+    llm_http2: bool = True  # 需安装 h2，未安装时回退到 HTTP/1.1
+    # Provider Key 调度（见 key_scheduler）：每把 Key 的并发、RPM/TPM 上限（0 表示不限）与 429 冷却
+    llm_per_key_concurrency: int = 8  # 每把 Key 同时在途的请求数上限
+    provider_key_rpm: int = 0
+    provider_key_tpm: int = 0
+    provider_key_cooldown: float = 10.0  # 秒，429 未带 Retry-After 时的首次冷却时长
+    llm_expected_output_tokens: int = 512  # 预扣 TPM 时估算的回复长度
+    llm_coalesce_enabled: bool = True  # 相同的在途 LLM 请求只调用一次上游（见 single_flight）
+    # 提示词预算（见 context_builder）：历史对话超预算时折叠进按会话缓存的滚动摘要
+    llm_tokenizer: str = os.getenv("LLM_TOKENIZER", "")  # 目标模型分词器（如 Qwen/Qwen3-1.7B），为空时按字符估算
+    llm_max_prompt_tokens: int = 8192  # 提示词（不含回复）的 token 上限
+    context_max_turns: int = 10  # 摘要之后最多保留的原文轮数（一问一答为一轮）
+    context_keep_recent_turns: int = 4  # 触发压缩后保留的最近轮数
+    context_summary_max_tokens: int = 300
+    context_summary_with_llm: bool = True  # 后台用 LLM 改写抽取式摘要
+    context_max_sessions: int = 1000  # 缓存滚动摘要的会话数上限
 
 
     # 数字嘉庚相关：检索内容文件路径（默认硬编码到仓库内）
     jiageng_stories_path: str = "data/jiageng_stories.txt"
     minnan_examples_path: str = "data/minnan_examples.json"
     minnan_lexicon_path: str = "data/minnan_lexicon.json"
+    # 文本转语音的汉字→POJ 转换（见 poj_converter）：词表最长匹配，仅未登录片段回退 LLM
+    minnan_poj_lexicon_path: str = "data/minnan_poj_lexicon.json"
+    poj_llm_fallback: bool = True  # 关闭后未登录片段直接丢弃，完全不调用 LLM
+    poj_cache_size: int = 2048  # 分句转换结果的 LRU 容量
     
     # 音频处理配置
     audio_sample_rate: int = 16000
@@ -210,6 +274,17 @@ class Settings(BaseSettings):
     # 缓存配置
     enable_cache: bool = True
     cache_ttl: int = 3600  # 1小时
+    # 数字嘉庚回答缓存：常见问题直接返回已生成的文本 + 音频 + 字幕（见 answer_cache）
+    answer_cache_enabled: bool = True
+    answer_cache_max_entries: int = 500
+    answer_cache_ttl: int = 86400  # 秒
+    answer_cache_similarity: float = 0.85  # 相似匹配阈值（字符 n-gram 余弦相似度）
+    answer_cache_with_history: bool = False  # 有历史对话时是否也查缓存（追问通常依赖上下文，默认不查）
+    # 数字嘉庚预合成答案库：高频 FAQ 离线合成（models/tts_service/build_answer_bank.py），命中时零 LLM / 零 TTS
+    answer_bank_enabled: bool = True
+    answer_bank_path: str = "data/jiageng_answer_bank.json"
+    answer_bank_subdir: str = "answer_bank"  # 离线合成音频在上传目录下的子目录
+    answer_bank_similarity: float = 0.8
     
     # 日志配置
     log_level: str = "DEBUG"
@@ -242,6 +317,8 @@ def _load_settings() -> Settings:
         s.asr_service_url = os.getenv("ASR_SERVICE_URL")
     if os.getenv("TTS_MINNAN_SERVICE_URL"):
         s.tts_minnan_service_url = os.getenv("TTS_MINNAN_SERVICE_URL")
+        if not os.getenv("TTS_MINNAN_SERVICE_URLS"):
+            s.tts_minnan_service_urls = s.tts_minnan_service_url
     if os.getenv("TTS_CJG_SERVICE_URL"):
         s.tts_cjg_service_url = os.getenv("TTS_CJG_SERVICE_URL")
     
@@ -17,6 +17,9 @@ from app.routers import auth as auth_router
 from app.core.config import settings
 from app.core.config import configure_logging, refresh_llm_service_url
 from app.core.db import Base, engine
+from app.services import llm_service, tts_service
+from app.services.context_builder import context_builder
+from app.services.llm_clients import close_registry
 
 # 创建FastAPI应用实例
 configure_logging()
@@ -64,6 +67,13 @@ async def startup_probe_llm():
     """启动时刷新 LLM 服务地址，保证日志已初始化再输出"""
     refresh_llm_service_url()
 
+
+@app.on_event("shutdown")
+async def shutdown_clients():
+    """关闭 TTS / LLM 连接池与多节点健康检查"""
+    await tts_service._close_clients()
+    await close_registry()
+
 # 统一异常返回格式：将所有 HTTPException 和未捕获异常统一包装为 {success, message, data}
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
@@ -108,7 +118,11 @@ async def health_check():
     return {
         "status": "healthy",
         "message": "闽台方言大模型API服务运行正常",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "tts_backends": tts_service.backend_status(),
+        "llm_keys": llm_service.key_metrics(),
+        "llm_coalesce": llm_service.coalesce_metrics(),
+        "llm_context": context_builder.stats(),
     }
 
 @app.get("/api/info")
@@ -65,6 +65,8 @@ class TTSResponse(BaseModel):
     audio_duration: float = Field(..., description="音频时长(秒)")
     file_size: int = Field(..., description="文件大小(字节)")
     poj_text: Optional[str] = Field(None, description="用于合成的POJ文本")
+    poj_coverage: Optional[float] = Field(None, description="POJ词表覆盖率（词表直接给出读音的汉字占比）")
+    poj_source: Optional[str] = Field(None, description="POJ来源：lexicon / lexicon+llm")
     audio_format: AudioFormat = Field(default=AudioFormat.WAV, description="实际音频格式")
 
 # ============ 语音翻译相关模型 ============
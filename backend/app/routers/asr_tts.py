@@ -14,22 +14,14 @@ from app.models.schemas import (
 )
 from app.core.config import settings
 from app.core.exceptions import ValidationError, LLMServiceError, TTSServiceError, ASRServiceError
-from app.services import asr_service, tts_service, llm_service
-import json
-import re
+from app.services import asr_service, tts_service
 from pathlib import Path
 from app.services.audio_utils import get_duration_seconds, process_audio_file
+from app.services.poj_converter import poj_converter
 
 router = APIRouter(tags=["语音文本互转"])
 logger = logging.getLogger(__name__)
 
-# 预加载示例，避免每次请求读盘
-try:
-    _EXAMPLES = json.loads(Path(settings.minnan_examples_path).read_text(encoding="utf-8"))
-except Exception:
-    _EXAMPLES = []
-
-
 # ============ 语音识别 (ASR) 接口 ============
 @router.post(
     "/asr",
@@ -133,51 +125,20 @@ async def text_to_speech(
     if speed < 0.5 or speed > 2.0:
         raise ValidationError("语音速度必须在0.5-2.0之间")
 
-    # 1) LLM 转换 POJ
-    example_text = "\n".join(
-        [f'示例{i+1}：\nzh：{e.get("zh","")}\nPOJ：{e.get("POJ","")}' for i, e in enumerate(_EXAMPLES)]
-    )
-    sys_prompt = (
-        "你是闽南语 POJ 白话字助手。"
-        "任务：将输入文本逐句转换为 POJ 白话字注音。"
-        "严格输出 JSON，格式如下："
-        "{\"POJ\": \"对应的 POJ 注音字符串\"}。"
-
-        "规则："
-        "1. 输入文本中的标点符号（例如 。！？；，,.!?;）全部替换为空格，用于句子分割。"
-        "2. 每个句子内部的词语用 '-' 连接。"
-        "3. 多个句子之间用单个空格分隔。"
-        "4. 只输出 JSON，不要包含任何其他文字。"
-
-        f"示例：{example_text}"
-    )
-    user_prompt = f"用户文本：{text}"
-
-    def _parse_llm(raw: str) -> str:
-        try:
-            data = json.loads(raw)
-            poj = data.get("POJ", "")
-            logger.debug(f"[TTS][_parse_llm] JSON解析成功, POJ='{poj}'")
-            return poj
-        except Exception as e:
-            logger.warning(f"[TTS][_parse_llm] JSON解析失败: {str(e)}，退化解析原始文本")
-            return " "  # 避免空串导致 TTS 报错
-
+    # 1) 汉字 → POJ：词表最长匹配，仅未登录片段回退 LLM
+    start = time.perf_counter()
     try:
-        llm_out = await llm_service.chat_messages([
-            {"role": "system", "content": sys_prompt},
-            {"role": "user", "content": user_prompt},
-        ])
-        resp_text = llm_out.get("text", "")
-        logger.info(f"[TTS] LLM 返回文本长度={len(resp_text)}")
+        poj = await poj_converter.to_poj(text)
+    except LLMServiceError:
+        raise
     except Exception as e:
-        logger.exception(f"[TTS] LLM 服务调用失败: {str(e)}")
-        raise LLMServiceError(f"LLM 服务调用失败: {str(e)}")
-
-    poj_text = _parse_llm(resp_text) if resp_text else text
-    if not poj_text.strip():
-        logger.warning("[TTS] LLM 未返回 POJ，退化为原文")
-        poj_text = text
+        logger.exception(f"[TTS] POJ 转换失败: {str(e)}")
+        raise LLMServiceError(f"POJ 转换失败: {str(e)}")
+    poj_text = poj.poj_text
+    logger.info(
+        f"[TTS] POJ 转换完成, 来源={poj.source}, 覆盖率={poj.coverage:.2%}, "
+        f"OOV={len(poj.oov_spans)}, 耗时={(time.perf_counter() - start) * 1000:.1f}ms"
+    )
 
     # 2) 调用 TTS 服务
     if not settings.tts_service_url:
@@ -233,6 +194,8 @@ async def text_to_speech(
         audio_duration=estimated_duration,
         file_size=file_size,
         poj_text=poj_text,
+        poj_coverage=poj.coverage,
+        poj_source=poj.source,
         audio_format=audio_format_enum,
     )
 
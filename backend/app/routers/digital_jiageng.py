@@ -2,19 +2,28 @@
 数字嘉庚路由模块
 职责：只负责 HTTP 层参数接收与结果返回，业务全部下沉到 jiageng_service / conversation_service
 """
-from fastapi import APIRouter, File, UploadFile, Form, Request, HTTPException
+from fastapi import APIRouter, Depends, File, UploadFile, Form, Request, HTTPException
 from fastapi.responses import StreamingResponse
 from typing import Optional
+import asyncio
 import logging
 import time
 import json
+import re
+import uuid
 
 from ..models.schemas import BaseResponse, LanguageType, DigitalJiagengResponse
-from app.services import jiageng_service, conversation_service
+from app.services import jiageng_service, conversation_service, tts_service
+from app.services.answer_bank import answer_bank
+from app.services.answer_cache import answer_cache
+from .auth import _require_admin
 
 router = APIRouter(prefix="/api/digital-jiageng", tags=["数字嘉庚"])
 logger = logging.getLogger(__name__)
 
+# 与 TTS 服务端的请求 ID 格式一致
+REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{1,128}$")
+
 
 @router.post(
     "/chat",
@@ -117,7 +126,11 @@ async def chat_with_jiageng_stream(
         raise HTTPException(status_code=400, detail=f"参数验证失败: {str(e)}")
     
     start_time = time.time()
-    logger.info("[DJ-Stream] 收到 /chat/stream 请求")
+    # 请求 ID 透传给 TTS 服务，客户端中途断开时据此取消推理
+    request_id = request.headers.get(tts_service.REQUEST_ID_HEADER) or ""
+    if not REQUEST_ID_RE.match(request_id):
+        request_id = uuid.uuid4().hex
+    logger.info("[DJ-Stream] 收到 /chat/stream 请求: request_id=%s", request_id)
     logger.info("[DJ-Stream] 参数: session_id=%s, input_language=%s, output_language=%s, speaking_speed=%s, show_subtitles=%s, prompt_style=%s",
                 session_id, input_language, output_language, speaking_speed, show_subtitles, prompt_style)
     
@@ -148,6 +161,7 @@ async def chat_with_jiageng_stream(
                 speaking_speed=speaking_speed,
                 show_subtitles=show_subtitles,
                 prompt_style=prompt_style,
+                request_id=request_id,
             ):
                 # 将 Pydantic 模型转换为字典（处理 subtitles 中的 DigitalJiagengSubtitle）
                 def convert_to_dict(obj):
@@ -184,6 +198,12 @@ async def chat_with_jiageng_stream(
             elapsed_time = time.time() - start_time
             logger.info("[DJ-Stream] /chat/stream 请求完成，耗时: %.2f秒", elapsed_time)
             
+        except asyncio.CancelledError:
+            # 客户端断开：进行中的 HTTP 调用已随协程取消，再通知 TTS 服务停止推理并丢弃排队片段
+            logger.info("[DJ-Stream] 客户端已断开，取消请求: request_id=%s，耗时: %.2f秒",
+                        request_id, time.time() - start_time)
+            tts_service.cancel_cjg_request_in_background(request_id)
+            raise
         except Exception as e:
             logger.exception("[DJ-Stream] 流式处理异常: %s", e)
             # 发送错误信息
@@ -275,6 +295,52 @@ async def list_sessions():
     )
 
 
+@router.get(
+    "/answer-cache",
+    summary="管理员-回答缓存统计",
+    description="返回回答缓存的条目数、命中率与命中最多的问题"
+)
+async def answer_cache_stats(_: str = Depends(_require_admin)):
+    return BaseResponse(data=answer_cache.stats())
+
+
+@router.delete(
+    "/answer-cache",
+    summary="管理员-失效回答缓存",
+    description="不传 question 时清空全部缓存；传入时删除与该问题精确或相似匹配的条目（如更新了语料或回答有误）"
+)
+async def invalidate_answer_cache(question: Optional[str] = None, _: str = Depends(_require_admin)):
+    removed = answer_cache.invalidate(question)
+    logger.info("[DJ] 回答缓存失效: question=%s removed=%d", question, removed)
+    return BaseResponse(
+        message=f"已删除 {removed} 条缓存",
+        data={"removed": removed}
+    )
+
+
+@router.get(
+    "/answer-bank",
+    summary="管理员-预合成答案库统计",
+    description="返回已加载的答案条目、跳过的条目及原因（未合成 / 答案已修改 / 缺少音频）与命中情况"
+)
+async def answer_bank_stats(_: str = Depends(_require_admin)):
+    return BaseResponse(data=answer_bank.stats())
+
+
+@router.post(
+    "/answer-bank/reload",
+    summary="管理员-重新加载预合成答案库",
+    description="离线合成任务完成后重新读取答案库与 manifest，无需重启后端"
+)
+async def reload_answer_bank(_: str = Depends(_require_admin)):
+    loaded = answer_bank.reload()
+    logger.info("[DJ] 预合成答案库重新加载: entries=%d", loaded)
+    return BaseResponse(
+        message=f"已加载 {loaded} 条答案",
+        data=answer_bank.stats()
+    )
+
+
 @router.get(
     "/info",
     summary="数字嘉庚接口说明",
@@ -1,12 +1,19 @@
 """
 音色克隆API路由器 - 方言音色克隆功能
+
+参考音频先上传为声音档案（陈嘉庚TTS服务端计算 cond mel、GPT 条件向量和说话人向量），
+之后的克隆请求只需携带 profile_id，同一音色的重复克隆不再处理参考音频。
 """
 
 from fastapi import APIRouter, File, UploadFile, HTTPException, Form
-from typing import Optional, List
+from typing import Optional, List, Tuple
+import asyncio
+import io
+import logging
 import uuid
 import os
 import time
+import wave
 from pathlib import Path
 import json
 
@@ -15,15 +22,99 @@ from app.models.schemas import (
     BaseResponse, ErrorResponse, LanguageType, AudioFormat
 )
 from app.core.config import settings
+from app.services import asr_service, audio_utils, speaker_service, tts_service
+from app.services.scheduler import Priority
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 质量等级 -> 生成参数（low/medium 使用单束搜索，服务端开启投机解码时可加速）
+QUALITY_PRESETS = {
+    "low": {"num_beams": 1, "max_text_tokens_per_sentence": 80},
+    "medium": {"num_beams": 1},
+    "high": {"num_beams": 3},
+}
+# 各质量等级的标称质量评分
+QUALITY_SCORES = {"low": 0.7, "medium": 0.85, "high": 0.95}
+
+
+def _validate_quality(quality: str) -> None:
+    if quality not in QUALITY_PRESETS:
+        raise HTTPException(status_code=400, detail="质量参数必须是: low, medium, high")
+
+
+async def _read_reference_audio(reference_audio: UploadFile) -> bytes:
+    """校验并读取参考音频"""
+    if not reference_audio.filename:
+        raise HTTPException(status_code=400, detail="请提供参考音频文件")
+    file_extension = reference_audio.filename.split('.')[-1].lower()
+    if file_extension not in settings.allowed_audio_formats:
+        raise HTTPException(
+            status_code=400,
+            detail=f"不支持的音频格式: {file_extension}。支持的格式: {', '.join(settings.allowed_audio_formats)}"
+        )
+    contents = await reference_audio.read()
+    if len(contents) > settings.max_file_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"参考音频文件大小超过限制: {settings.max_file_size / 1024 / 1024:.1f}MB"
+        )
+    return contents
+
+
+async def _resolve_profile_id(reference_audio: Optional[UploadFile], profile_id: Optional[str]) -> str:
+    """优先使用已有的 profile_id，否则上传参考音频生成声音档案（同一音频内容复用同一档案）"""
+    if profile_id:
+        return profile_id
+    if reference_audio is None:
+        raise HTTPException(status_code=400, detail="请提供参考音频文件或 profile_id")
+    contents = await _read_reference_audio(reference_audio)
+    profile = await tts_service.create_voice_profile(contents)
+    return profile["profile_id"]
+
+
+def _save_cloned_audio(binary: bytes, suffix: str) -> Tuple[str, float]:
+    """保存克隆音频到上传目录，返回 (URL, 时长秒)"""
+    filename = f"{uuid.uuid4()}_{suffix}.wav"
+    with open(Path(settings.upload_dir) / filename, "wb") as f:
+        f.write(binary)
+    with wave.open(io.BytesIO(binary), "rb") as wf:
+        duration = wf.getnframes() / float(wf.getframerate())
+    return f"/uploads/{filename}", duration
+
+# ============ 声音档案 ============
+
+@router.post("/profiles", response_model=BaseResponse, summary="创建声音档案")
+async def create_voice_profile(
+    reference_audio: UploadFile = File(..., description="参考音频文件")
+):
+    """
+    上传参考音频，提取音色特征并保存为声音档案，返回 profile_id
+
+    - **reference_audio**: 参考音频文件，同一音频内容重复上传会返回同一个 profile_id
+    """
+    try:
+        contents = await _read_reference_audio(reference_audio)
+        profile = await tts_service.create_voice_profile(contents)
+        return BaseResponse(
+            success=True,
+            message="声音档案已存在" if profile.get("cached") else "声音档案创建完成",
+            data=profile
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("[VOICE-CLONING] 声音档案创建失败: %s", e)
+        raise HTTPException(status_code=500, detail=f"声音档案创建失败: {str(e)}")
+
 # ============ 文本驱动音色克隆 ============
 
 @router.post("/text-driven", response_model=BaseResponse, summary="文本驱动音色克隆")
 async def text_driven_cloning(
-    reference_audio: UploadFile = File(..., description="参考音频文件"),
+    reference_audio: Optional[UploadFile] = File(None, description="参考音频文件（与 profile_id 二选一）"),
     target_text: str = Form(..., description="目标文本"),
+    profile_id: Optional[str] = Form(default=None, description="已创建的声音档案ID"),
     language: LanguageType = Form(default=LanguageType.MINNAN, description="语言/方言"),
     quality: str = Form(default="high", description="生成质量: low, medium, high"),
     preserve_emotion: bool = Form(default=True, description="是否保持情感"),
@@ -31,36 +122,18 @@ async def text_driven_cloning(
     voice_pitch: float = Form(default=1.0, description="音调", ge=0.5, le=2.0)
 ):
     """
-    基于参考音频和目标文本进行音色克隆
+    基于参考音频（或声音档案）和目标文本进行音色克隆
     
     - **reference_audio**: 参考音频文件，用于提取音色特征
     - **target_text**: 要合成的目标文本内容
+    - **profile_id**: 已创建的声音档案ID，提供时无需再上传参考音频
     - **language**: 目标语言/方言类型
     - **quality**: 生成质量等级
-    - **preserve_emotion**: 是否保持参考音频中的情感
-    - **voice_speed**: 生成语音的速度
-    - **voice_pitch**: 生成语音的音调
+    - **preserve_emotion**: 是否保持参考音频中的情感（零样本克隆天然保留参考音频的情感与韵律）
+    - **voice_speed**: 生成语音的速度（暂未生效）
+    - **voice_pitch**: 生成语音的音调（暂未生效）
     """
     try:
-        # 验证参考音频文件
-        if not reference_audio.filename:
-            raise HTTPException(status_code=400, detail="请提供参考音频文件")
-        
-        file_extension = reference_audio.filename.split('.')[-1].lower()
-        if file_extension not in settings.allowed_audio_formats:
-            raise HTTPException(
-                status_code=400,
-                detail=f"不支持的音频格式: {file_extension}。支持的格式: {', '.join(settings.allowed_audio_formats)}"
-            )
-        
-        # 验证文件大小
-        ref_contents = await reference_audio.read()
-        if len(ref_contents) > settings.max_file_size:
-            raise HTTPException(
-                status_code=400,
-                detail=f"参考音频文件大小超过限制: {settings.max_file_size / 1024 / 1024:.1f}MB"
-            )
-        
         # 验证目标文本
         if len(target_text.strip()) == 0:
             raise HTTPException(status_code=400, detail="目标文本不能为空")
@@ -68,207 +141,135 @@ async def text_driven_cloning(
         if len(target_text) > 500:
             raise HTTPException(status_code=400, detail="目标文本长度不能超过500个字符")
         
-        # 验证质量参数
-        if quality not in ["low", "medium", "high"]:
-            raise HTTPException(status_code=400, detail="质量参数必须是: low, medium, high")
-        
-        # 保存参考音频文件
-        ref_file_id = str(uuid.uuid4())
-        ref_file_path = Path(settings.upload_dir) / f"{ref_file_id}_reference.{file_extension}"
-        
-        with open(ref_file_path, "wb") as f:
-            f.write(ref_contents)
-        
-        # TODO: 实际的音色克隆流程应该包括:
-        # 1. 音色特征提取 - 从参考音频中提取声纹特征
-        # 2. 情感分析 - 如果preserve_emotion为True，提取情感特征
-        # 3. 语音合成 - 使用提取的音色特征合成目标文本
-        
-        # 模拟音色克隆处理
+        _validate_quality(quality)
+
         processing_start = time.time()
-        
-        # 生成克隆音频文件
-        cloned_file_id = str(uuid.uuid4())
-        cloned_filename = f"{cloned_file_id}_cloned.wav"
-        cloned_file_path = Path(settings.upload_dir) / cloned_filename
-        
-        # 创建模拟的克隆音频文件
-        with open(cloned_file_path, "wb") as f:
-            # 写入WAV文件头
-            f.write(b'RIFF')
-            f.write(b'\x24\x08\x00\x00')
-            f.write(b'WAVE')
-            # TODO: 实际应该是克隆模型生成的音频数据
-        
+        resolved_profile_id = await _resolve_profile_id(reference_audio, profile_id)
+        results = await tts_service.synthesize_clone(
+            resolved_profile_id, [target_text.strip()], **QUALITY_PRESETS[quality], priority=Priority.INTERACTIVE
+        )
+        cloned_audio_url, audio_duration = _save_cloned_audio(results[0]["binary"], "cloned")
         processing_time = time.time() - processing_start
-        
-        # 计算模拟的相似度和质量评分
-        quality_multiplier = {"low": 0.7, "medium": 0.85, "high": 0.95}
-        base_similarity = 0.82
-        similarity_score = min(0.98, base_similarity * quality_multiplier[quality])
-        quality_score = quality_multiplier[quality]
-        
-        # 估算音频时长
-        estimated_duration = len(target_text) * 0.12  # 模拟：每个字符0.12秒
-        
-        cloned_audio_url = f"/uploads/{cloned_filename}"
-        
-        mock_response = VoiceCloningResponse(
+        logger.info("[VOICE-CLONING] 文本驱动克隆完成: profile=%s, %.2fs 音频, 耗时 %.2fs",
+                    resolved_profile_id, audio_duration, processing_time)
+
+        response = VoiceCloningResponse(
             cloned_audio_url=cloned_audio_url,
-            similarity_score=similarity_score,
-            quality_score=quality_score,
+            similarity_score=max(0.0, min(1.0, results[0]["similarity"])),
+            quality_score=QUALITY_SCORES[quality],
             processing_time=processing_time,
-            audio_duration=estimated_duration
+            audio_duration=audio_duration
         )
         
         return BaseResponse(
             success=True,
             message="文本驱动音色克隆完成",
-            data=mock_response
+            data={**response.model_dump(), "profile_id": resolved_profile_id}
         )
         
     except HTTPException:
         raise
     except Exception as e:
+        logger.exception("[VOICE-CLONING] 文本驱动音色克隆失败: %s", e)
         raise HTTPException(status_code=500, detail=f"文本驱动音色克隆处理失败: {str(e)}")
 
 # ============ 音频驱动音色克隆 ============
 
 @router.post("/audio-driven", response_model=BaseResponse, summary="音频驱动音色克隆")
 async def audio_driven_cloning(
-    reference_audio: UploadFile = File(..., description="参考音频文件"),
+    reference_audio: Optional[UploadFile] = File(None, description="参考音频文件（与 profile_id 二选一）"),
     target_audio: UploadFile = File(..., description="目标音频文件"),
+    profile_id: Optional[str] = Form(default=None, description="已创建的声音档案ID"),
+    language: LanguageType = Form(default=LanguageType.MANDARIN, description="目标音频的语言/方言（用于识别内容）"),
     quality: str = Form(default="high", description="生成质量: low, medium, high"),
     preserve_content: bool = Form(default=True, description="是否保持目标音频的内容"),
     preserve_emotion: bool = Form(default=True, description="是否保持情感"),
     blend_ratio: float = Form(default=0.8, description="音色混合比例", ge=0.0, le=1.0)
 ):
     """
-    基于参考音频和目标音频进行音色转换
+    基于参考音频和目标音频进行音色转换：先识别目标音频的内容，再用参考音色重新合成
     
     - **reference_audio**: 参考音频文件，提供目标音色
-    - **target_audio**: 目标音频文件，提供内容和结构
+    - **target_audio**: 目标音频文件，提供内容
+    - **profile_id**: 已创建的声音档案ID，提供时无需再上传参考音频
+    - **language**: 目标音频的语言/方言
     - **quality**: 生成质量等级
     - **preserve_content**: 是否保持目标音频的语音内容
     - **preserve_emotion**: 是否保持原始情感
-    - **blend_ratio**: 音色混合比例 (0=完全保持原音色, 1=完全转换为参考音色)
+    - **blend_ratio**: 音色混合比例（暂未生效，始终完全转换为参考音色）
     """
     try:
-        # 验证参考音频文件
-        if not reference_audio.filename or not target_audio.filename:
-            raise HTTPException(status_code=400, detail="请提供参考音频和目标音频文件")
+        if not target_audio.filename:
+            raise HTTPException(status_code=400, detail="请提供目标音频文件")
         
-        # 验证文件格式
-        ref_extension = reference_audio.filename.split('.')[-1].lower()
         target_extension = target_audio.filename.split('.')[-1].lower()
-        
-        if ref_extension not in settings.allowed_audio_formats:
-            raise HTTPException(
-                status_code=400,
-                detail=f"参考音频格式不支持: {ref_extension}"
-            )
-        
         if target_extension not in settings.allowed_audio_formats:
             raise HTTPException(
                 status_code=400,
                 detail=f"目标音频格式不支持: {target_extension}"
             )
         
-        # 验证文件大小
-        ref_contents = await reference_audio.read()
         target_contents = await target_audio.read()
-        
-        if len(ref_contents) > settings.max_file_size:
-            raise HTTPException(status_code=400, detail="参考音频文件大小超过限制")
-        
         if len(target_contents) > settings.max_file_size:
             raise HTTPException(status_code=400, detail="目标音频文件大小超过限制")
         
-        # 验证质量参数
-        if quality not in ["low", "medium", "high"]:
-            raise HTTPException(status_code=400, detail="质量参数必须是: low, medium, high")
-        
-        # 保存音频文件
-        ref_file_id = str(uuid.uuid4())
-        target_file_id = str(uuid.uuid4())
-        
-        ref_file_path = Path(settings.upload_dir) / f"{ref_file_id}_reference.{ref_extension}"
-        target_file_path = Path(settings.upload_dir) / f"{target_file_id}_target.{target_extension}"
-        
-        with open(ref_file_path, "wb") as f:
-            f.write(ref_contents)
-        
-        with open(target_file_path, "wb") as f:
-            f.write(target_contents)
-        
-        # TODO: 实际的音频驱动克隆流程应该包括:
-        # 1. 双音频特征提取 - 分别提取参考音频和目标音频的特征
-        # 2. 音色映射 - 将目标音频的音色映射到参考音频的音色
-        # 3. 内容保持 - 保持目标音频的语言内容和韵律
-        # 4. 情感转移 - 根据设置保持或转移情感特征
-        
-        # 模拟音频驱动克隆处理
+        _validate_quality(quality)
+
         processing_start = time.time()
-        
-        # 生成转换后的音频文件
-        converted_file_id = str(uuid.uuid4())
-        converted_filename = f"{converted_file_id}_converted.wav"
-        converted_file_path = Path(settings.upload_dir) / converted_filename
-        
-        # 创建模拟的转换音频文件
-        with open(converted_file_path, "wb") as f:
-            # 写入WAV文件头
-            f.write(b'RIFF')
-            f.write(b'\x24\x08\x00\x00')
-            f.write(b'WAVE')
-            # TODO: 实际应该是音色转换模型生成的音频数据
-        
+        resolved_profile_id = await _resolve_profile_id(reference_audio, profile_id)
+
+        # 识别目标音频内容，再以参考音色合成
+        asr_result = await asr_service.transcribe(
+            target_audio.filename, target_contents, source_language=language.value
+        )
+        target_text = (asr_result.get("text") or "").strip()
+        if not target_text:
+            raise HTTPException(status_code=400, detail="未能识别目标音频中的语音内容")
+
+        results = await tts_service.synthesize_clone(
+            resolved_profile_id, [target_text], **QUALITY_PRESETS[quality], priority=Priority.INTERACTIVE
+        )
+        converted_audio_url, audio_duration = _save_cloned_audio(results[0]["binary"], "converted")
         processing_time = time.time() - processing_start
-        
-        # 计算模拟的相似度和质量评分
-        quality_multiplier = {"low": 0.6, "medium": 0.8, "high": 0.92}
-        base_similarity = 0.75  # 音频驱动通常比文本驱动相似度稍低
-        similarity_score = min(0.95, base_similarity * quality_multiplier[quality] * blend_ratio)
-        quality_score = quality_multiplier[quality]
-        
-        # 估算音频时长（基于目标音频）
-        estimated_duration = len(target_contents) / 16000.0
-        
-        converted_audio_url = f"/uploads/{converted_filename}"
-        
-        mock_response = VoiceCloningResponse(
+        logger.info("[VOICE-CLONING] 音频驱动克隆完成: profile=%s, text_len=%d, 耗时 %.2fs",
+                    resolved_profile_id, len(target_text), processing_time)
+
+        response = VoiceCloningResponse(
             cloned_audio_url=converted_audio_url,
-            similarity_score=similarity_score,
-            quality_score=quality_score,
+            similarity_score=max(0.0, min(1.0, results[0]["similarity"])),
+            quality_score=QUALITY_SCORES[quality],
             processing_time=processing_time,
-            audio_duration=estimated_duration
+            audio_duration=audio_duration
         )
         
         return BaseResponse(
             success=True,
             message="音频驱动音色克隆完成",
-            data=mock_response
+            data={**response.model_dump(), "profile_id": resolved_profile_id, "recognized_text": target_text}
         )
         
     except HTTPException:
         raise
     except Exception as e:
+        logger.exception("[VOICE-CLONING] 音频驱动音色克隆失败: %s", e)
         raise HTTPException(status_code=500, detail=f"音频驱动音色克隆处理失败: {str(e)}")
 
 # ============ 批量音色克隆 ============
 
 @router.post("/batch-cloning", response_model=BaseResponse, summary="批量音色克隆")
 async def batch_voice_cloning(
-    reference_audio: UploadFile = File(..., description="参考音频文件"),
+    reference_audio: Optional[UploadFile] = File(None, description="参考音频文件（与 profile_id 二选一）"),
     target_texts: List[str] = Form(..., description="多个目标文本"),
+    profile_id: Optional[str] = Form(default=None, description="已创建的声音档案ID"),
     language: LanguageType = Form(default=LanguageType.MINNAN, description="语言/方言"),
     quality: str = Form(default="medium", description="生成质量")
 ):
     """
-    基于一个参考音频批量克隆多个文本
+    基于一个参考音频批量克隆多个文本（所有有效文本在服务端一次批量推理）
     
     - **reference_audio**: 参考音频文件
     - **target_texts**: 多个目标文本列表
+    - **profile_id**: 已创建的声音档案ID，提供时无需再上传参考音频
     - **language**: 语言/方言类型
     - **quality**: 生成质量等级
     """
@@ -286,84 +287,49 @@ async def batch_voice_cloning(
                 detail="请提供有效的目标文本"
             )
         
-        # 验证参考音频
-        file_extension = reference_audio.filename.split('.')[-1].lower()
-        if file_extension not in settings.allowed_audio_formats:
-            raise HTTPException(
-                status_code=400,
-                detail=f"不支持的音频格式: {file_extension}"
-            )
-        
-        ref_contents = await reference_audio.read()
-        if len(ref_contents) > settings.max_file_size:
-            raise HTTPException(
-                status_code=400,
-                detail="参考音频文件大小超过限制"
-            )
-        
-        # 保存参考音频
-        ref_file_id = str(uuid.uuid4())
-        ref_file_path = Path(settings.upload_dir) / f"{ref_file_id}_reference.{file_extension}"
-        
-        with open(ref_file_path, "wb") as f:
-            f.write(ref_contents)
-        
-        # 批量处理
-        results = []
+        _validate_quality(quality)
+
         processing_start = time.time()
-        
+        resolved_profile_id = await _resolve_profile_id(reference_audio, profile_id)
+
+        # 先过滤无效文本，有效文本一次性送入服务端批量合成
+        results: List[Optional[dict]] = [None] * len(target_texts)
+        valid_indices = []
         for i, text in enumerate(target_texts):
+            if len(text.strip()) == 0:
+                results[i] = {"index": i, "text": text, "success": False, "error": "文本为空"}
+            elif len(text) > 500:
+                results[i] = {"index": i, "text": text[:50] + "...", "success": False, "error": "文本长度超过限制"}
+            else:
+                valid_indices.append(i)
+
+        # 全部文本都未通过校验时不调用服务，直接返回逐条错误
+        clones = []
+        if valid_indices:
+            clones = await tts_service.synthesize_clone(
+                resolved_profile_id, [target_texts[i].strip() for i in valid_indices], **QUALITY_PRESETS[quality]
+            )
+        for i, clone in zip(valid_indices, clones):
+            text = target_texts[i]
             try:
-                if len(text.strip()) == 0:
-                    results.append({
-                        "index": i,
-                        "text": text,
-                        "success": False,
-                        "error": "文本为空"
-                    })
-                    continue
-                
-                if len(text) > 500:
-                    results.append({
-                        "index": i,
-                        "text": text[:50] + "...",
-                        "success": False,
-                        "error": "文本长度超过限制"
-                    })
-                    continue
-                
-                # TODO: 调用实际的音色克隆模型
-                # 生成克隆音频
-                cloned_file_id = str(uuid.uuid4())
-                cloned_filename = f"{cloned_file_id}_batch_{i}.wav"
-                cloned_file_path = Path(settings.upload_dir) / cloned_filename
-                
-                with open(cloned_file_path, "wb") as f:
-                    f.write(b'RIFF')
-                    f.write(b'\x24\x08\x00\x00')
-                    f.write(b'WAVE')
-                
-                cloned_audio_url = f"/uploads/{cloned_filename}"
-                estimated_duration = len(text) * 0.12
-                
-                results.append({
+                cloned_audio_url, audio_duration = _save_cloned_audio(clone["binary"], f"batch_{i}")
+                results[i] = {
                     "index": i,
                     "text": text[:50] + "..." if len(text) > 50 else text,
                     "success": True,
                     "result": {
                         "cloned_audio_url": cloned_audio_url,
-                        "similarity_score": 0.85,
-                        "audio_duration": estimated_duration
+                        "similarity_score": max(0.0, min(1.0, clone["similarity"])),
+                        "audio_duration": audio_duration
                     }
-                })
-                
+                }
             except Exception as e:
-                results.append({
+                results[i] = {
                     "index": i,
                     "text": text[:50] + "..." if len(text) > 50 else text,
                     "success": False,
                     "error": str(e)
-                })
+                }
         
         total_processing_time = time.time() - processing_start
         success_count = sum(1 for r in results if r["success"])
@@ -374,7 +340,8 @@ async def batch_voice_cloning(
             data={
                 "results": results,
                 "total_processing_time": total_processing_time,
-                "reference_audio": reference_audio.filename,
+                "profile_id": resolved_profile_id,
+                "reference_audio": reference_audio.filename if reference_audio is not None else None,
                 "language": language,
                 "quality": quality
             }
@@ -383,10 +350,41 @@ async def batch_voice_cloning(
     except HTTPException:
         raise
     except Exception as e:
+        logger.exception("[VOICE-CLONING] 批量音色克隆失败: %s", e)
         raise HTTPException(status_code=500, detail=f"批量音色克隆处理失败: {str(e)}")
 
 # ============ 音色相似度比较 ============
 
+# 近邻检索返回的已存声音数
+NEAREST_VOICES_K = 5
+# 短于该时长（秒）的音频，说话人向量置信度按比例降低
+CONFIDENT_DURATION = 3.0
+
+
+async def _read_analysis_audio(audio_file: UploadFile) -> bytes:
+    """校验并读取待分析的音频文件"""
+    file_extension = (audio_file.filename or "").split('.')[-1].lower()
+    if file_extension not in settings.allowed_audio_formats:
+        raise HTTPException(
+            status_code=400,
+            detail=f"不支持的音频格式: {file_extension}"
+        )
+    contents = await audio_file.read()
+    if len(contents) > settings.max_file_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"文件 {audio_file.filename} 大小超过限制"
+        )
+    return contents
+
+
+def _pitch_similarity(f0_a: Optional[float], f0_b: Optional[float]) -> Optional[float]:
+    """平均基频之比（较低/较高），任一音频无有声段时返回 None"""
+    if not f0_a or not f0_b:
+        return None
+    return min(f0_a, f0_b) / max(f0_a, f0_b)
+
+
 @router.post("/similarity-analysis", response_model=BaseResponse, summary="音色相似度分析")
 async def analyze_voice_similarity(
     audio1: UploadFile = File(..., description="音频文件1"),
@@ -395,75 +393,55 @@ async def analyze_voice_similarity(
 ):
     """
     分析两个音频文件的音色相似度
-    
+
     - **audio1**: 第一个音频文件
     - **audio2**: 第二个音频文件
-    - **analysis_type**: 分析类型 (basic: 基础分析, comprehensive: 全面分析)
+    - **analysis_type**: 分析类型 (basic: 基础分析, comprehensive: 全面分析，附带索引中最接近的已存声音)
+
+    音色相似度为 ECAPA-TDNN 说话人向量的余弦相似度；音调相似度由平均基频估计；
+    节奏相似度暂不支持，返回 null。
     """
     try:
-        # 验证文件格式
-        for audio_file in [audio1, audio2]:
-            file_extension = audio_file.filename.split('.')[-1].lower()
-            if file_extension not in settings.allowed_audio_formats:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"不支持的音频格式: {file_extension}"
-                )
-        
-        # 验证文件大小
-        contents1 = await audio1.read()
-        contents2 = await audio2.read()
-        
-        for contents, filename in [(contents1, audio1.filename), (contents2, audio2.filename)]:
-            if len(contents) > settings.max_file_size:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"文件 {filename} 大小超过限制"
-                )
-        
-        # TODO: 实际的相似度分析应该包括:
-        # 1. 声纹特征提取
-        # 2. 音色特征对比
-        # 3. 频谱分析
-        # 4. 韵律特征比较
-        
-        # 模拟相似度分析
+        contents1 = await _read_analysis_audio(audio1)
+        contents2 = await _read_analysis_audio(audio2)
         processing_start = time.time()
-        
-        # 基础相似度分析
-        overall_similarity = 0.73  # 模拟总体相似度
-        
+
+        files = [(audio1.filename, contents1), (audio2.filename, contents2)]
+        similarity = await speaker_service.similarity_matrix(files)
+        prosody1, prosody2 = await asyncio.gather(
+            asyncio.to_thread(audio_utils.extract_prosody_features, contents1),
+            asyncio.to_thread(audio_utils.extract_prosody_features, contents2),
+        )
+
+        timbre_similarity = min(max(float(similarity["matrix"][0][1]), 0.0), 1.0)
+        pitch_similarity = _pitch_similarity(prosody1["fundamental_frequency"], prosody2["fundamental_frequency"])
+        overall_similarity = timbre_similarity
+        confidence = min(1.0, min(similarity["durations"]) / CONFIDENT_DURATION)
+
         basic_analysis = {
             "overall_similarity": overall_similarity,
-            "pitch_similarity": 0.78,
-            "timbre_similarity": 0.69,
-            "rhythm_similarity": 0.71,
-            "confidence": 0.85
+            "pitch_similarity": pitch_similarity,
+            "timbre_similarity": timbre_similarity,
+            "rhythm_similarity": None,
+            "confidence": confidence
         }
-        
+
         comprehensive_analysis = None
         if analysis_type == "comprehensive":
+            matches = await speaker_service.search(files, k=NEAREST_VOICES_K)
             comprehensive_analysis = {
-                "spectral_analysis": {
-                    "formant_similarity": 0.74,
-                    "harmonics_similarity": 0.67,
-                    "noise_level_diff": 0.12
-                },
                 "prosodic_features": {
-                    "intonation_similarity": 0.76,
-                    "stress_pattern_similarity": 0.68,
-                    "speaking_rate_diff": 0.15
+                    "audio1": prosody1,
+                    "audio2": prosody2,
                 },
-                "voice_quality": {
-                    "breathiness_similarity": 0.82,
-                    "roughness_similarity": 0.59,
-                    "tenseness_similarity": 0.71
+                "nearest_voices": {
+                    "audio1": matches[0] if matches else [],
+                    "audio2": matches[1] if len(matches) > 1 else [],
                 },
-                "emotional_similarity": 0.64
             }
-        
+
         processing_time = time.time() - processing_start
-        
+
         # 相似度等级判断
         if overall_similarity >= 0.9:
             similarity_level = "极高"
@@ -475,7 +453,15 @@ async def analyze_voice_similarity(
             similarity_level = "较低"
         else:
             similarity_level = "低"
-        
+
+        recommendations = [f"两个音频的整体相似度为{similarity_level}"]
+        if overall_similarity >= 0.8:
+            recommendations.append("两段音频很可能来自同一说话人，适合作为音色克隆的参考音频")
+        elif overall_similarity < 0.6:
+            recommendations.append("两段音频的音色差异较大，不建议混用作为同一音色的参考")
+        if confidence < 1.0:
+            recommendations.append(f"音频时长不足 {CONFIDENT_DURATION:.0f} 秒，建议使用更长的音频以提高分析可信度")
+
         result_data = {
             "audio1_filename": audio1.filename,
             "audio2_filename": audio2.filename,
@@ -483,26 +469,33 @@ async def analyze_voice_similarity(
             "comprehensive_analysis": comprehensive_analysis,
             "similarity_level": similarity_level,
             "processing_time": processing_time,
-            "recommendations": [
-                f"两个音频的整体相似度为{similarity_level}",
-                "音调相似度较高，适合进行音色克隆",
-                "建议在实际应用中进行更多样本的对比验证"
-            ]
+            "recommendations": recommendations
         }
-        
+
         return BaseResponse(
             success=True,
             message="音色相似度分析完成",
             data=result_data
         )
-        
+
     except HTTPException:
         raise
     except Exception as e:
+        logger.exception("[VOICE-CLONING] 音色相似度分析失败: %s", e)
         raise HTTPException(status_code=500, detail=f"音色相似度分析失败: {str(e)}")
 
 # ============ 音色特征提取 ============
 
+# 平均基频低于该值（Hz）判为男声
+MALE_F0_THRESHOLD = 165.0
+
+
+def _predict_gender(f0: Optional[float]) -> str:
+    if not f0:
+        return "未知"
+    return "男性" if f0 < MALE_F0_THRESHOLD else "女性"
+
+
 @router.post("/extract-features", response_model=BaseResponse, summary="音色特征提取")
 async def extract_voice_features(
     audio_file: UploadFile = File(..., description="音频文件"),
@@ -510,80 +503,56 @@ async def extract_voice_features(
 ):
     """
     提取音频文件的音色特征
-    
+
     - **audio_file**: 要分析的音频文件
-    - **feature_type**: 特征提取类型
+    - **feature_type**: 特征提取类型 (advanced/all 时返回说话人向量与最接近的已存声音)
+
+    基础特征由基频与能量估计，无法估计的项返回 null；
+    音色描述目前只根据平均基频推断性别，其余项为"未知"。
     """
     try:
-        # 验证文件格式
-        file_extension = audio_file.filename.split('.')[-1].lower()
-        if file_extension not in settings.allowed_audio_formats:
-            raise HTTPException(
-                status_code=400,
-                detail=f"不支持的音频格式: {file_extension}"
-            )
-        
-        contents = await audio_file.read()
-        if len(contents) > settings.max_file_size:
-            raise HTTPException(
-                status_code=400,
-                detail="文件大小超过限制"
-            )
-        
-        # TODO: 实际的特征提取应该使用音频处理库和深度学习模型
-        
-        # 模拟特征提取
-        basic_features = {
-            "fundamental_frequency": 185.3,  # 基频 (Hz)
-            "pitch_range": 75.2,             # 音调范围
-            "speaking_rate": 178,            # 语速 (词/分钟)
-            "volume_mean": 0.68,             # 平均音量
-            "volume_variance": 0.15          # 音量方差
-        }
-        
+        contents = await _read_analysis_audio(audio_file)
+
+        files = [(audio_file.filename, contents)]
+        embedded = await speaker_service.embed(files)
+        basic_features = await asyncio.to_thread(audio_utils.extract_prosody_features, contents)
+
         advanced_features = None
         if feature_type in ["advanced", "all"]:
+            matches = await speaker_service.search(files, k=NEAREST_VOICES_K)
             advanced_features = {
-                "formants": [680, 1220, 2340, 3250],  # 共振峰频率
-                "spectral_centroid": 1850.7,          # 频谱质心
-                "spectral_bandwidth": 425.3,          # 频谱带宽
-                "spectral_rolloff": 3420.1,           # 频谱滚降点
-                "zero_crossing_rate": 0.089,          # 过零率
-                "mfcc": [                              # MFCC特征
-                    -12.34, 8.56, -3.21, 4.78, -1.92,
-                    2.45, -0.87, 3.12, -2.09, 1.34,
-                    -0.56, 2.78, -1.45
-                ],
-                "chroma": [0.12, 0.23, 0.18, 0.09, 0.15, 0.31, 0.07, 0.19, 0.26, 0.14, 0.08, 0.22],
-                "spectral_contrast": [15.2, 12.8, 18.9, 14.1, 16.7, 13.4, 19.3]
+                "speaker_embedding": embedded["embeddings"][0],
+                "nearest_voices": matches[0] if matches else [],
             }
-        
+
         # 音色描述
         voice_description = {
-            "gender_prediction": "女性",
-            "age_estimation": "25-35岁",
-            "voice_quality": "清晰",
-            "emotional_tone": "平静",
-            "accent_strength": "中等"
+            "gender_prediction": _predict_gender(basic_features["fundamental_frequency"]),
+            "age_estimation": "未知",
+            "voice_quality": "未知",
+            "emotional_tone": "未知",
+            "accent_strength": "未知"
         }
-        
+
+        duration = float(embedded["durations"][0])
         result_data = {
             "filename": audio_file.filename,
-            "duration": len(contents) / 16000.0,
+            "duration": duration,
             "basic_features": basic_features,
             "advanced_features": advanced_features,
             "voice_description": voice_description,
-            "feature_vector_size": 128 if feature_type == "all" else 64,
-            "extraction_confidence": 0.87
+            "feature_vector_size": int(embedded["dim"]),
+            "extraction_confidence": min(1.0, duration / CONFIDENT_DURATION)
         }
-        
+
         return BaseResponse(
             success=True,
             message="音色特征提取完成",
             data=result_data
         )
-        
+
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"音色特征提取失败: {str(e)}") 
\ No newline at end of file
+        logger.exception("[VOICE-CLONING] 音色特征提取失败: %s", e)
+        raise HTTPException(status_code=500, detail=f"音色特征提取失败: {str(e)}")
@@ -0,0 +1,146 @@
+"""
+数字嘉庚预合成答案库：高频 FAQ 的文本、音频与字幕离线生成，命中时零 LLM / 零 TTS 返回
+
+- 答案库：``settings.answer_bank_path``（JSON，每条含若干问法 ``questions`` 与用 '｜' 分段的答案 ``answer``）；
+- 音频：由 ``models/tts_service/build_answer_bank.py`` 离线批量合成到 ``settings.answer_bank_dir``，
+  ``manifest.json`` 记录每条答案的整段 / 分段音频、时长与字幕；
+- 匹配：复用回答缓存的问题归一化与相似度匹配（``AnswerCache``，条目不过期）；
+  作用域包含合成语速，只有请求语速与离线合成时的语速一致才命中（与回答缓存的语速隔离一致）。
+只有 manifest 中答案文本与答案库一致、且音频文件齐全的条目会被加载，答案改动后未重新合成的条目自动跳过。
+"""
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.answer_cache import AnswerCache, CacheHit
+
+logger = logging.getLogger(__name__)
+
+_BANK_SCOPE = "answer_bank"
+
+
+def _scope(speaking_speed: float) -> tuple:
+    return (_BANK_SCOPE, round(speaking_speed, 2))
+
+
+class AnswerBank:
+    def __init__(self, bank_path: str, audio_dir: str, url_prefix: str, threshold: float = 0.8):
+        """
+        Args:
+            bank_path: 答案库 JSON 路径
+            audio_dir: 离线合成的音频与 manifest 所在目录
+            url_prefix: 音频对外访问的 URL 前缀（对应 ``audio_dir``）
+            threshold: 相似匹配的余弦相似度阈值
+        """
+        self.bank_path = Path(bank_path)
+        self.audio_dir = Path(audio_dir)
+        self.url_prefix = url_prefix.rstrip("/")
+        self.threshold = threshold
+        self._matcher = AnswerCache(max_entries=10 ** 6, ttl=float("inf"), threshold=threshold)
+        self.loaded: List[str] = []
+        self.skipped: Dict[str, str] = {}
+        self.speeds: List[float] = []
+
+    def _url(self, name: str) -> str:
+        return f"{self.url_prefix}/{name}"
+
+    def _payload(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """同时包含整段（非流式）与分段（流式）两种形态，字段与回答缓存一致"""
+        return {
+            "text": record["answer"],
+            "audio_url": self._url(record["file"]),
+            "audio_duration": record["duration"],
+            "subtitles": record["subtitles"],
+            "segments": [
+                {
+                    "text": seg["text"],
+                    "audio_url": self._url(seg["file"]),
+                    "audio_duration": seg["duration"],
+                    "subtitles": seg["subtitles"],
+                }
+                for seg in record["segments"]
+            ],
+        }
+
+    def _usable(self, entry: Dict[str, Any], record: Optional[Dict[str, Any]]) -> Optional[str]:
+        """条目不可用时返回原因"""
+        if record is None:
+            return "未合成"
+        if record.get("answer") != entry["answer"]:
+            return "答案已修改，需重新合成"
+        files = [record["file"]] + [seg["file"] for seg in record["segments"]]
+        missing = [name for name in files if not (self.audio_dir / name).is_file()]
+        if missing:
+            return f"缺少音频文件: {missing[0]}"
+        return None
+
+    def reload(self) -> int:
+        """重新加载答案库与 manifest，返回可用条目数"""
+        matcher = AnswerCache(max_entries=10 ** 6, ttl=float("inf"), threshold=self.threshold)
+        loaded, skipped, speeds = [], {}, set()
+        try:
+            bank = json.loads(self.bank_path.read_text(encoding="utf-8"))
+        except Exception as e:
+            logger.warning(f"[ANSWER-BANK] 加载答案库失败: {e}")
+            bank = {"entries": []}
+        manifest_path = self.audio_dir / "manifest.json"
+        try:
+            manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            manifest = {"entries": {}}
+        except Exception as e:
+            logger.warning(f"[ANSWER-BANK] 加载 manifest 失败: {e}")
+            manifest = {"entries": {}}
+
+        for entry in bank.get("entries", []):
+            record = manifest.get("entries", {}).get(entry["id"])
+            reason = self._usable(entry, record)
+            if reason:
+                skipped[entry["id"]] = reason
+                continue
+            payload = self._payload(record)
+            # 旧 manifest 没有语速字段时按默认语速 1.0 处理
+            speed = round(float(record.get("speaking_speed", manifest.get("speaking_speed", 1.0))), 2)
+            for question in entry["questions"]:
+                matcher.store(question, _scope(speed), payload)
+            loaded.append(entry["id"])
+            speeds.add(speed)
+
+        self._matcher, self.loaded, self.skipped = matcher, loaded, skipped
+        self.speeds = sorted(speeds)
+        logger.info("[ANSWER-BANK] 已加载 %d 条答案（%d 个问法），跳过 %d 条",
+                    len(loaded), len(matcher), len(skipped))
+        for entry_id, reason in skipped.items():
+            logger.info("[ANSWER-BANK] 跳过 %s: %s", entry_id, reason)
+        return len(loaded)
+
+    def match(self, question: str, speaking_speed: float = 1.0) -> Optional[CacheHit]:
+        """只匹配按 ``speaking_speed`` 合成的音频；语速不一致时返回 None，由调用方走缓存 / LLM 路径"""
+        if not question or not self.loaded or round(speaking_speed, 2) not in self.speeds:
+            return None
+        return self._matcher.lookup(question, _scope(speaking_speed))
+
+    def stats(self) -> Dict[str, Any]:
+        matcher_stats = self._matcher.stats()
+        return {
+            "entries": len(self.loaded),
+            "questions": matcher_stats["entries"],
+            "skipped": dict(self.skipped),
+            "speaking_speeds": list(self.speeds),
+            "hits": matcher_stats["hits"],
+            "misses": matcher_stats["misses"],
+            "hit_rate": matcher_stats["hit_rate"],
+            "top": matcher_stats["top"],
+        }
+
+
+answer_bank = AnswerBank(
+    bank_path=settings.answer_bank_path,
+    audio_dir=str(Path(settings.upload_dir) / settings.answer_bank_subdir),
+    url_prefix=f"/uploads/{settings.answer_bank_subdir}",
+    threshold=settings.answer_bank_similarity,
+)
+if settings.answer_bank_enabled:
+    answer_bank.reload()
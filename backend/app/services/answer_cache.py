@@ -0,0 +1,185 @@
+"""
+数字嘉庚回答缓存：常见问题直接返回已生成的文本 + 音频 + 字幕，不再经过 LLM 与 TTS
+
+两级匹配：
+    1. 精确匹配：归一化后的问题（全角转半角、去标点空白、去掉“请问/陈嘉庚先生”等称呼和语气词）完全一致；
+    2. 相似匹配：字符 1-gram + 2-gram 词频向量的余弦相似度 ≥ ``threshold``（ASR 的同音字、
+       语序差异通常仍在阈值之上）。
+缓存按作用域隔离：提示词风格、是否有历史对话、语速、输出形态（整段 / 流式分段）不同的回答互不复用。
+条目有 TTL 与数量上限（LRU 淘汰），可按问题或整体失效。
+"""
+import logging
+import math
+import re
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Hashable, NamedTuple, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 不影响问题语义的称呼、客套话与语气词
+_FILLER_RE = re.compile(r"(陈嘉庚先生|嘉庚先生|陈嘉庚|陈老先生|校主|先生|您好|你好|请问|想问一下|想问|我想知道|能不能|可以|一下|吗|呢|吧|啊|呀|嘛|哦)")
+_PUNCT_RE = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+def normalize_question(text: str) -> str:
+    """问题归一化：全角转半角、小写、“您”统一为“你”、去称呼和语气词、去标点空白"""
+    text = unicodedata.normalize("NFKC", text or "").lower().replace("您", "你")
+    text = _FILLER_RE.sub("", text)
+    return _PUNCT_RE.sub("", text)
+
+
+def _vectorize(normalized: str) -> Tuple[Counter, float]:
+    grams = Counter(normalized)
+    grams.update(normalized[i:i + 2] for i in range(len(normalized) - 1))
+    norm = math.sqrt(sum(v * v for v in grams.values()))
+    return grams, norm
+
+
+def _cosine(a: Counter, a_norm: float, b: Counter, b_norm: float) -> float:
+    if not a_norm or not b_norm:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0) for k, v in a.items()) / (a_norm * b_norm)
+
+
+class CacheScope(NamedTuple):
+    prompt_style: str
+    history_empty: bool
+    speaking_speed: float
+    mode: str  # "full" 整段音频 / "stream" 流式分段
+
+
+class _Entry:
+    __slots__ = ("question", "normalized", "vector", "norm", "scope", "payload", "created", "hits")
+
+    def __init__(self, question: str, normalized: str, scope: Hashable, payload: Dict[str, Any]):
+        self.question = question
+        self.normalized = normalized
+        self.vector, self.norm = _vectorize(normalized)
+        self.scope = scope
+        self.payload = payload
+        self.created = time.monotonic()
+        self.hits = 0
+
+
+class CacheHit(NamedTuple):
+    payload: Dict[str, Any]
+    tier: str  # "exact" / "similar"
+    similarity: float
+    question: str  # 命中条目的原始问题
+
+
+class AnswerCache:
+    def __init__(self, max_entries: int = 500, ttl: float = 86400.0, threshold: float = 0.85, min_chars: int = 2):
+        """
+        Args:
+            max_entries: 条目数上限（超出时淘汰最久未命中的）
+            ttl: 条目有效期（秒）
+            threshold: 相似匹配的余弦相似度阈值
+            min_chars: 归一化后少于该字数的问题不缓存（如“嗯”“好的”）
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.min_chars = min_chars
+        self._entries: "OrderedDict[Tuple[Hashable, str], _Entry]" = OrderedDict()
+        self.hits = {"exact": 0, "similar": 0}
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expired(self, entry: _Entry) -> bool:
+        return time.monotonic() - entry.created > self.ttl
+
+    def lookup(self, question: str, scope: Hashable) -> Optional[CacheHit]:
+        normalized = normalize_question(question)
+        if len(normalized) < self.min_chars:
+            return None
+        entry = self._entries.get((scope, normalized))
+        tier, similarity = "exact", 1.0
+        if entry is None or self._expired(entry):
+            entry, similarity = self._most_similar(normalized, scope)
+            tier = "similar"
+        if entry is None or similarity < self.threshold:
+            self.misses += 1
+            return None
+        entry.hits += 1
+        self.hits[tier] += 1
+        self._entries.move_to_end((entry.scope, entry.normalized))
+        logger.info("[ANSWER-CACHE] %s 命中 (%.3f): %s -> %s", tier, similarity, question[:30], entry.question[:30])
+        return CacheHit(entry.payload, tier, similarity, entry.question)
+
+    def _most_similar(self, normalized: str, scope: Hashable) -> Tuple[Optional[_Entry], float]:
+        vector, norm = _vectorize(normalized)
+        best, best_sim = None, 0.0
+        expired = []
+        for key, entry in self._entries.items():
+            if entry.scope != scope:
+                continue
+            if self._expired(entry):
+                expired.append(key)
+                continue
+            sim = _cosine(vector, norm, entry.vector, entry.norm)
+            if sim > best_sim:
+                best, best_sim = entry, sim
+        for key in expired:
+            del self._entries[key]
+        return best, best_sim
+
+    def store(self, question: str, scope: Hashable, payload: Dict[str, Any]) -> bool:
+        normalized = normalize_question(question)
+        if len(normalized) < self.min_chars:
+            return False
+        key = (scope, normalized)
+        self._entries[key] = _Entry(question, normalized, scope, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return True
+
+    def invalidate(self, question: Optional[str] = None) -> int:
+        """
+        失效缓存：不传问题时清空全部；传入问题时删除与其精确或相似匹配的条目（所有作用域）
+        Returns:
+            删除的条目数
+        """
+        if question is None:
+            removed = len(self._entries)
+            self._entries.clear()
+            return removed
+        normalized = normalize_question(question)
+        vector, norm = _vectorize(normalized)
+        keys = [
+            key for key, entry in self._entries.items()
+            if entry.normalized == normalized or _cosine(vector, norm, entry.vector, entry.norm) >= self.threshold
+        ]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.misses + sum(self.hits.values())
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "hit_rate": round(sum(self.hits.values()) / lookups, 4) if lookups else 0.0,
+            "top": [
+                {"question": e.question, "hits": e.hits}
+                for e in sorted(self._entries.values(), key=lambda e: e.hits, reverse=True)[:10]
+            ],
+        }
+
+
+answer_cache = AnswerCache(
+    max_entries=settings.answer_cache_max_entries,
+    ttl=settings.answer_cache_ttl,
+    threshold=settings.answer_cache_similarity,
+)
@@ -4,9 +4,13 @@ import logging
 import httpx
 from app.core.config import settings
 from app.core.exceptions import ASRServiceError
+from app.services.resilience import Resilience, attempt_timeout, timeout_headers
 
 logger = logging.getLogger(__name__)
 
+# 只重试连接失败、429、502/503/504；ASR 服务连续故障时熔断，避免每个请求都等到超时
+_resilience = Resilience("ASR")
+
 
 async def transcribe(audio_filename: str, audio_bytes: bytes, *, source_language: str) -> Dict[str, Any]:
     """
@@ -17,20 +21,20 @@ async def transcribe(audio_filename: str, audio_bytes: bytes, *, source_language
     if not settings.asr_service_url:
         raise ASRServiceError("ASR 服务未配置 (asr_service_url 为空)")
 
-    # 简单重试 3 次
-    last_exc: Exception | None = None
-    for attempt in range(1, 4):
-        try:
-            start_ts = time.monotonic()
-            async with httpx.AsyncClient(timeout=settings.model_request_timeout) as client:
-                # 兼容两种字段名：大多数服务用 "file"，也有后端使用 "audio_file"
-                files = {
-                    "file": (audio_filename, audio_bytes),
-                    "audio_file": (audio_filename, audio_bytes),
-                }
-                data = {
-                    "source_language": source_language,
-                }
+    # 整个调用（含重试）不超过 model_request_timeout，剩余时间透传给 ASR 服务
+    deadline = time.monotonic() + settings.model_request_timeout
+    # 兼容两种字段名：大多数服务用 "file"，也有后端使用 "audio_file"
+    files = {
+        "file": (audio_filename, audio_bytes),
+        "audio_file": (audio_filename, audio_bytes),
+    }
+    data = {
+        "source_language": source_language,
+    }
+
+    async def _attempt(attempt: int) -> httpx.Response:
+        async with _resilience.guard(settings.asr_service_url):
+            async with httpx.AsyncClient(timeout=attempt_timeout(settings.model_request_timeout, deadline)) as client:
                 # 兼容我们当前 asr_service 的 FastAPI 端点（POST /asr，接收 multipart）
                 logger.debug(
                     "[ASR] attempt=%d POST %s/asr, bytes=%d, data=%s",
@@ -41,22 +45,25 @@ async def transcribe(audio_filename: str, audio_bytes: bytes, *, source_language
                     files=files,
                     data=data,
                     headers={
-                        "Authorization": f"Bearer {settings.provider_api_key}" if settings.provider_api_key else ""
+                        "Authorization": f"Bearer {settings.provider_api_key}" if settings.provider_api_key else "",
+                        **timeout_headers(deadline),
                     },
                 )
                 resp.raise_for_status()
-                js = resp.json()
-                dur = (time.monotonic() - start_ts) * 1000
-                logger.info("[ASR] status=%d time=%.1fms text_preview=%s",
-                            resp.status_code, dur,
-                            (js.get("text", "")[:80] + "...") if (js.get("text") and len(js.get("text")) > 80) else js.get("text"))
-                return {
-                    "text": js.get("text") or (js.get("data") or {}).get("text"),
-                    "raw": js,
-                }
-        except Exception as e:
-            last_exc = e
-            logger.warning("[ASR] attempt=%d failed: %s", attempt, e)
-    raise ASRServiceError(f"ASR 服务重试失败: {last_exc}")
-
+                return resp
 
+    start_ts = time.monotonic()
+    try:
+        resp = await _resilience.retry(_attempt, deadline=deadline)
+        js = resp.json()
+    except Exception as e:
+        logger.warning("[ASR] 请求失败: %s", e)
+        raise ASRServiceError(f"ASR 服务调用失败: {e}")
+    dur = (time.monotonic() - start_ts) * 1000
+    logger.info("[ASR] status=%d time=%.1fms text_preview=%s",
+                resp.status_code, dur,
+                (js.get("text", "")[:80] + "...") if (js.get("text") and len(js.get("text")) > 80) else js.get("text"))
+    return {
+        "text": js.get("text") or (js.get("data") or {}).get("text"),
+        "raw": js,
+    }
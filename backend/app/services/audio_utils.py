@@ -2,6 +2,7 @@ import io
 import logging
 import os
 import shutil
+import struct
 import subprocess
 import tempfile
 import uuid
@@ -70,6 +71,30 @@ def get_duration_seconds(filename: str, contents: bytes) -> float | None:
     return None
 
 
+def fix_streamed_wav_header(contents: bytes) -> bytes:
+    """
+    修正流式 WAV 的长度字段。
+    流式输出时总长度未知，RIFF / data 块长度按惯例填 0xFFFFFFFF；完整接收后按实际字节数改写，
+    否则 ``wave`` 等解析器会得到错误的帧数与时长。非 WAV 或长度已正确时原样返回。
+    """
+    if len(contents) < 12 or contents[:4] != b"RIFF" or contents[8:12] != b"WAVE":
+        return contents
+    offset = 12
+    while offset + 8 <= len(contents):
+        chunk_id = contents[offset:offset + 4]
+        chunk_size = struct.unpack_from("<I", contents, offset + 4)[0]
+        if chunk_id == b"data":
+            actual = len(contents) - offset - 8
+            if chunk_size == actual and struct.unpack_from("<I", contents, 4)[0] == len(contents) - 8:
+                return contents
+            fixed = bytearray(contents)
+            struct.pack_into("<I", fixed, 4, len(contents) - 8)
+            struct.pack_into("<I", fixed, offset + 4, actual)
+            return bytes(fixed)
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return contents
+
+
 def convert_format(raw_audio: bytes, source_format: str | None, target_format: str | None) -> bytes:
     """
     音频格式转换
@@ -177,6 +202,35 @@ def process_audio_file(file, contents: bytes) -> Tuple[bytes, str]:
     return processed_audio_bytes, processed_filename
 
 
+def extract_prosody_features(contents: bytes) -> dict:
+    """
+    基础声学特征（torchaudio，CPU）：
+    - fundamental_frequency: 有声帧基频均值 (Hz)
+    - pitch_range: 基频 5%~95% 分位差 (Hz)
+    - volume_mean / volume_variance: 帧 RMS 能量的均值与方差（满幅为 1）
+    无法估计的项返回 None。
+    """
+    wav, sr = torchaudio.load(io.BytesIO(contents))
+    wav = wav.mean(dim=0, keepdim=True)
+
+    # 25ms 帧长的 RMS 能量
+    frame = max(int(sr * 0.025), 1)
+    usable = wav[:, : wav.shape[-1] // frame * frame]
+    rms = usable.reshape(-1, frame).pow(2).mean(dim=1).sqrt() if usable.numel() else torch.zeros(0)
+
+    f0 = torchaudio.functional.detect_pitch_frequency(wav, sr).flatten()
+    # 只保留人声基频范围内的帧
+    voiced = f0[(f0 >= 60) & (f0 <= 500)]
+    result = {
+        "fundamental_frequency": float(voiced.mean()) if voiced.numel() else None,
+        "pitch_range": float(torch.quantile(voiced, 0.95) - torch.quantile(voiced, 0.05)) if voiced.numel() > 1 else None,
+        "speaking_rate": None,
+        "volume_mean": float(rms.mean()) if rms.numel() else None,
+        "volume_variance": float(rms.var()) if rms.numel() > 1 else None,
+    }
+    return result
+
+
 def _concatenate_audio_segments_torchaudio(audio_segments: list[bytes]) -> bytes:
     """
     使用 torchaudio 合并多个音频片段
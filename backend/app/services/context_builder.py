@@ -0,0 +1,303 @@
+"""
+LLM 提示词预算：按 token 预算组装「系统提示词 + 历史摘要 + 近期对话 + 当前问题」
+
+- 计数：配置了 ``settings.llm_tokenizer`` 且装有 transformers 时用目标模型的分词器，
+  否则按“汉字 1 token、其余约 4 字符 1 token”估算；文本计数带 LRU 缓存（系统提示词每轮都一样）；
+- 系统提示词原样放在第一条，不掺入任何随会话变化的内容，便于推理服务复用前缀缓存；
+- 历史压缩：近期对话超出预算或轮数上限时，一次性把较早的轮次折叠进该会话的滚动摘要，
+  只保留最近 ``keep_recent_turns`` 轮（带滞回，窗口起点在两次压缩之间保持不变，前缀缓存也能命中）；
+  摘要先用抽取式（逐条保留用户问题与回答开头）立即生效，开启 ``summary_with_llm`` 时
+  再在后台用 LLM 改写，结果按会话缓存，下次组装时直接使用；
+- 兜底：``fit_messages`` 对任意消息列表按预算从最早的非系统消息开始裁剪，供 LLM 调用前最后把关。
+提示词 token 数因此只随单轮长度变化，不随对话轮数增长。
+"""
+import asyncio
+import logging
+import re
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_CJK_RE = re.compile(r"[　-〿㐀-鿿豈-﫿＀-￯]")
+_MESSAGE_OVERHEAD = 4  # 每条消息的角色标记等额外开销（估算）
+_SUMMARY_PREFIX = "此前对话摘要（更早的对话已省略，回答时可参考）：\n"
+
+_tokenizer = None
+_tokenizer_loaded = False
+
+
+def _get_tokenizer():
+    global _tokenizer, _tokenizer_loaded
+    if not _tokenizer_loaded:
+        _tokenizer_loaded = True
+        if settings.llm_tokenizer:
+            try:
+                from transformers import AutoTokenizer
+
+                _tokenizer = AutoTokenizer.from_pretrained(settings.llm_tokenizer)
+                logger.info(f"[CTX] 使用分词器计数: {settings.llm_tokenizer}")
+            except Exception as e:
+                logger.warning(f"[CTX] 分词器加载失败，改用估算: {e}")
+    return _tokenizer
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """文本的 token 数（目标模型分词器，不可用时估算）"""
+    if not text:
+        return 0
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    return count_tokens(message.get("content") or "") + _MESSAGE_OVERHEAD
+
+
+def messages_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(message_tokens(m) for m in messages)
+
+
+def _clip(text: str, max_tokens: int, keep: str = "head") -> str:
+    """按 token 数截断文本（保留开头或结尾）"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        part = text[:mid] if keep == "head" else text[-mid:]
+        if count_tokens(part) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo] if keep == "head" else text[-lo:]
+
+
+def fit_messages(messages: List[Dict[str, str]], max_tokens: int) -> List[Dict[str, str]]:
+    """
+    超出预算时从最早的非系统消息开始丢弃，始终保留系统消息与最后一条消息；
+    仍超出时截断最后一条消息的开头部分。
+    """
+    if max_tokens <= 0 or messages_tokens(messages) <= max_tokens:
+        return messages
+    head = [m for m in messages[:-1] if m.get("role") == "system"]
+    middle = [m for m in messages[:-1] if m.get("role") != "system"]
+    last = messages[-1]
+    while middle and messages_tokens(head + middle + [last]) > max_tokens:
+        middle.pop(0)
+    fitted = head + middle + [last]
+    overflow = messages_tokens(fitted) - max_tokens
+    if overflow > 0:
+        keep = max(count_tokens(last.get("content") or "") - overflow, 0)
+        fitted[-1] = {**last, "content": _clip(last.get("content") or "", keep, keep="tail")}
+    logger.warning("[CTX] 提示词超出预算 %d tokens，丢弃 %d 条较早消息",
+                   max_tokens, len(messages) - len(fitted) + (overflow > 0))
+    return fitted
+
+
+def _strip(message: Dict[str, Any]) -> Dict[str, str]:
+    """历史记录里带有时间戳等字段，只保留 role / content 发给 LLM"""
+    return {"role": message.get("role", "user"), "content": message.get("content") or ""}
+
+
+def extractive_summary(previous: str, messages: List[Dict[str, str]], max_tokens: int,
+                       answer_chars: int = 30) -> str:
+    """抽取式摘要：在旧摘要后追加每轮的用户问题与回答开头，超长时丢弃最早的条目"""
+    lines = [line for line in previous.splitlines() if line]
+    for msg in messages:
+        content = re.sub(r"\s+", " ", msg["content"]).strip()
+        if not content:
+            continue
+        if msg["role"] == "user":
+            lines.append(f"- 用户问：{content}")
+        else:
+            short = content[:answer_chars] + ("…" if len(content) > answer_chars else "")
+            lines.append(f"  我答：{short}")
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return _clip("\n".join(lines), max_tokens, keep="tail")
+
+
+@dataclass
+class _SessionState:
+    covered: int = 0  # 已折叠进摘要的历史消息条数
+    summary: str = ""
+    version: int = 0
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+
+class ContextBuilder:
+    def __init__(self, max_prompt_tokens: int, max_turns: int, keep_recent_turns: int,
+                 summary_max_tokens: int, summary_with_llm: bool = True, max_sessions: int = 1000):
+        """
+        Args:
+            max_prompt_tokens: 提示词（不含回复）的 token 上限
+            max_turns: 摘要之后最多保留的原文轮数（一问一答为一轮）
+            keep_recent_turns: 触发压缩后保留的最近轮数
+            summary_max_tokens: 滚动摘要的 token 上限
+            summary_with_llm: 是否在后台用 LLM 改写抽取式摘要
+            max_sessions: 缓存摘要的会话数上限（LRU）
+        """
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_turns = max_turns
+        self.keep_recent_turns = min(keep_recent_turns, max_turns)
+        self.summary_max_tokens = summary_max_tokens
+        self.summary_with_llm = summary_with_llm
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, _SessionState]" = OrderedDict()
+        self._builds = 0
+        self._compactions = 0
+        self._llm_summaries = 0
+        self._llm_summary_failures = 0
+        self._prompt_tokens_total = 0
+        self._prompt_tokens_max = 0
+
+    def _state(self, session_id: str) -> _SessionState:
+        state = self._sessions.get(session_id)
+        if state is None:
+            state = self._sessions[session_id] = _SessionState()
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            _, evicted = self._sessions.popitem(last=False)
+            if evicted.task and not evicted.task.done():
+                evicted.task.cancel()
+        return state
+
+    def _summary_message(self, state: _SessionState) -> List[Dict[str, str]]:
+        if not state.summary:
+            return []
+        return [{"role": "system", "content": _SUMMARY_PREFIX + state.summary}]
+
+    def _compact(self, session_id: str, state: _SessionState, history: List[Dict[str, str]],
+                 cut: int) -> None:
+        """把 history[state.covered:cut] 折叠进摘要"""
+        folded = history[state.covered:cut]
+        previous = state.summary
+        state.summary = extractive_summary(previous, folded, self.summary_max_tokens)
+        state.covered = cut
+        state.version += 1
+        self._compactions += 1
+        logger.info("[CTX] 会话 %s 折叠 %d 条历史消息进摘要（累计 %d 条），摘要 %d tokens",
+                    session_id, len(folded), cut, count_tokens(state.summary))
+        if self.summary_with_llm:
+            if state.task and not state.task.done():
+                state.task.cancel()
+            try:
+                state.task = asyncio.get_running_loop().create_task(
+                    self._refine_summary(session_id, state, state.version, previous, folded)
+                )
+            except RuntimeError:
+                state.task = None
+
+    async def _refine_summary(self, session_id: str, state: _SessionState, version: int,
+                              previous: str, folded: List[Dict[str, str]]) -> None:
+        """后台用 LLM 改写摘要；期间会话又被压缩过（版本变化）则放弃结果"""
+        from app.services import llm_service
+
+        dialogue = "\n".join(
+            f"{'用户' if m['role'] == 'user' else '陈嘉庚'}：{m['content']}" for m in folded
+        )
+        prompt = (
+            f"请把下面的对话压缩成不超过 {self.summary_max_tokens} 字的摘要，"
+            "保留用户关心的问题、已经给出的关键事实和用户的个人信息，使用第三人称，只输出摘要正文。\n"
+            + (f"已有摘要：\n{previous}\n" if previous else "")
+            + f"新增对话：\n{dialogue}"
+        )
+        try:
+            llm_out = await llm_service.chat_messages([{"role": "user", "content": prompt}])
+            summary = (llm_out.get("text") or "").strip()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._llm_summary_failures += 1
+            logger.warning(f"[CTX] 会话 {session_id} LLM 摘要失败，保留抽取式摘要: {e}")
+            return
+        if not summary or state.version != version:
+            return
+        state.summary = _clip(summary, self.summary_max_tokens)
+        self._llm_summaries += 1
+        logger.info("[CTX] 会话 %s 摘要已由 LLM 改写: %d tokens", session_id, count_tokens(state.summary))
+
+    def build(self, session_id: str, system_prompt: Optional[str], history: List[Dict[str, Any]],
+              user_prompt: str) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """
+        组装一次 LLM 调用的消息列表。
+
+        Returns:
+            (messages, 统计信息)
+        """
+        history = [_strip(m) for m in history]
+        state = self._state(session_id)
+        if state.covered > len(history):
+            # 历史被清空或替换，摘要作废
+            self._sessions[session_id] = state = _SessionState()
+
+        system = [{"role": "system", "content": system_prompt}] if system_prompt else []
+        user = [{"role": "user", "content": user_prompt}]
+        fixed = messages_tokens(system) + messages_tokens(user)
+
+        window = history[state.covered:]
+        over_budget = fixed + messages_tokens(self._summary_message(state)) + messages_tokens(window) \
+            > self.max_prompt_tokens
+        if over_budget or len(window) > self.max_turns * 2:
+            cut = max(len(history) - self.keep_recent_turns * 2, state.covered)
+            if cut > state.covered:
+                self._compact(session_id, state, history, cut)
+
+        summary = self._summary_message(state)
+        window = history[state.covered:]
+        # 压缩后仍超出（单轮极长）：临时丢弃窗口里最早的消息，不改动摘要状态
+        dropped = 0
+        budget = self.max_prompt_tokens - fixed - messages_tokens(summary)
+        while window and messages_tokens(window) > budget:
+            window = window[2:] if len(window) >= 2 else []
+            dropped += 2
+        messages = fit_messages(system + summary + window + user, self.max_prompt_tokens)
+
+        prompt_tokens = messages_tokens(messages)
+        self._builds += 1
+        self._prompt_tokens_total += prompt_tokens
+        self._prompt_tokens_max = max(self._prompt_tokens_max, prompt_tokens)
+        info = {
+            "prompt_tokens": prompt_tokens,
+            "history_messages": len(window),
+            "summarized_messages": state.covered,
+            "dropped_messages": dropped,
+            "summary_tokens": count_tokens(state.summary),
+        }
+        return messages, info
+
+    def forget(self, session_id: str) -> None:
+        state = self._sessions.pop(session_id, None)
+        if state and state.task and not state.task.done():
+            state.task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "builds": self._builds,
+            "compactions": self._compactions,
+            "llm_summaries": self._llm_summaries,
+            "llm_summary_failures": self._llm_summary_failures,
+            "avg_prompt_tokens": round(self._prompt_tokens_total / self._builds, 1) if self._builds else 0.0,
+            "max_prompt_tokens": self._prompt_tokens_max,
+            "tokenizer": settings.llm_tokenizer if _get_tokenizer() is not None else "estimate",
+        }
+
+
+context_builder = ContextBuilder(
+    max_prompt_tokens=settings.llm_max_prompt_tokens,
+    max_turns=settings.context_max_turns,
+    keep_recent_turns=settings.context_keep_recent_turns,
+    summary_max_tokens=settings.context_summary_max_tokens,
+    summary_with_llm=settings.context_summary_with_llm,
+    max_sessions=settings.context_max_sessions,
+)
@@ -0,0 +1,144 @@
+"""
+对冲请求（hedged requests）：降低 TTS 片段调用的尾延迟
+
+慢而未失败的请求不会触发重试，却会拖住 ``asyncio.gather`` 中所有片段。``HedgePolicy`` 在请求超过
+近期延迟的某个分位数（默认 P95）仍未返回时，向另一个节点发出一份相同的请求，取先完成的结果并取消另一份。
+
+- 延迟按“每单位工作量”（如每字）统计，不同长度的片段可以共用一个分位数；
+- 全局对冲预算：每个主请求积累 ``budget`` 个令牌（默认 0.05，即最多约 5% 的额外负载），
+  每次对冲消耗 1 个，令牌上限 ``burst`` 防止长时间空闲后集中对冲；
+- 样本数不足 ``min_samples`` 时不对冲（冷启动阶段的分位数不可信）。
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def _consume_result(task: asyncio.Task) -> None:
+    """被放弃的一方稍后失败时，避免 "exception was never retrieved" 警告"""
+    if not task.cancelled():
+        task.exception()
+
+
+class HedgePolicy:
+    def __init__(
+        self,
+        name: str,
+        percentile: float = 0.95,
+        budget: float = 0.05,
+        burst: float = 10.0,
+        min_delay: float = 0.5,
+        min_samples: int = 20,
+        window: int = 500,
+    ):
+        """
+        Args:
+            name: 日志标签
+            percentile: 超过近期延迟的该分位数仍未返回时发出对冲请求
+            budget: 每个主请求可换取的对冲次数（全局额外负载比例）
+            min_delay: 对冲等待时间下限（秒）
+            window: 参与分位数计算的最近样本数
+        """
+        if not 0 < percentile < 1:
+            raise ValueError(f"percentile must be in (0, 1), got {percentile}")
+        self.name = name
+        self.percentile = percentile
+        self.budget = budget
+        self.burst = burst
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._tokens = 0.0
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.skipped_budget = 0
+        self.skipped_no_target = 0
+
+    def record(self, latency: float, work: float = 1.0) -> None:
+        """记录一次成功请求的延迟（秒）及其工作量（如字数）"""
+        self._samples.append(latency / max(work, 1.0))
+
+    def _per_unit_percentile(self) -> Optional[float]:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(int(self.percentile * len(ordered)), len(ordered) - 1)]
+
+    def delay_for(self, work: float = 1.0) -> Optional[float]:
+        """对冲等待时间（秒）；样本不足时返回 None（不对冲）"""
+        per_unit = self._per_unit_percentile()
+        if per_unit is None:
+            return None
+        return max(per_unit * max(work, 1.0), self.min_delay)
+
+    async def run(self, call: Callable[[bool], Awaitable[T]], delay: Optional[float],
+                  can_hedge: Optional[Callable[[], bool]] = None) -> T:
+        """
+        执行 ``call(False)``；``delay`` 秒后仍未完成且预算允许时，再执行 ``call(True)``（对冲请求），
+        返回先成功的结果并取消另一份。两份都失败时抛出后失败的异常。``delay`` 为 None 时不对冲。
+        ``can_hedge`` 在准备发出对冲时检查（如是否还有主请求以外的可用节点），返回 False 则不对冲。
+        """
+        self.requests += 1
+        self._tokens = min(self.burst, self._tokens + self.budget)
+        primary = asyncio.ensure_future(call(False))
+        if delay is None:
+            return await primary
+
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if done:
+            return primary.result()
+        if self._tokens < 1.0:
+            self.skipped_budget += 1
+            return await primary
+        if can_hedge is not None and not can_hedge():
+            self.skipped_no_target += 1
+            return await primary
+
+        self._tokens -= 1.0
+        self.hedges += 1
+        logger.info("[%s] 请求超过 %.2fs 未返回，发出对冲请求", self.name, delay)
+        hedge = asyncio.ensure_future(call(True))
+        pending = {primary, hedge}
+        last_exc: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    if task.exception() is not None:
+                        last_exc = task.exception()
+                        continue
+                    if task is hedge:
+                        self.hedge_wins += 1
+                        logger.info("[%s] 对冲请求先返回", self.name)
+                    return task.result()
+            raise last_exc or asyncio.CancelledError()
+        finally:
+            for task in (primary, hedge):
+                if not task.done():
+                    task.cancel()
+                    task.add_done_callback(_consume_result)
+
+    def metrics(self) -> Dict[str, Any]:
+        per_unit = self._per_unit_percentile()
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "skipped_budget": self.skipped_budget,
+            "skipped_no_target": self.skipped_no_target,
+            "hedge_rate": round(self.hedges / self.requests, 4) if self.requests else 0.0,
+            "win_rate": round(self.hedge_wins / self.hedges, 4) if self.hedges else 0.0,
+            "percentile_per_unit_ms": None if per_unit is None else round(per_unit * 1000, 2),
+        }
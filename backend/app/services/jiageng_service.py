@@ -19,6 +19,10 @@ from app.core.config import settings
 from app.models.schemas import DigitalJiagengSubtitle, LanguageType
 from app.services import asr_service, llm_service, tts_service, mock_service
 from app.services import conversation_service
+from app.services.answer_bank import answer_bank
+from app.services.answer_cache import CacheHit, CacheScope, answer_cache
+from app.services.context_builder import context_builder
+from app.services.scheduler import Priority, deadline_after
 from app.services.subtitle_service import segment_text_to_subtitles
 from app.services.audio_utils import get_duration_seconds, process_audio_file
 from app.core.exceptions import LLMServiceError, TTSServiceError, ASRServiceError
@@ -179,22 +183,15 @@ async def _generate_jiageng_text(
     # 1. 构建消息列表
     prompt_builder = PROMPT_BUILDERS.get(prompt_style, build_jiageng_prompt_normal)
     system_prompt = prompt_builder()
-    messages: List[Dict[str, str]] = []
-    if system_prompt:
-        messages.append({"role": "system", "content": system_prompt})
-    
     logger.info("[JGS] 使用提示词格式: %s", prompt_style)
 
-    # 添加历史对话（最多保留最近 20 条消息）
-    history = conversation_service.get_conversation_history(session_id)
-    if history:
-        recent_history = history[-20:] if len(history) > 20 else history
-        messages.extend(recent_history)
-        logger.info("[JGS] 添加历史对话: %d 条消息", len(recent_history))
-
-    # 添加当前用户输入
+    # 系统提示词 + 历史摘要 + 近期对话 + 当前输入，按 token 预算组装（见 context_builder）
     user_prompt = f"用户问题：{user_input}"
-    messages.append({"role": "user", "content": user_prompt})
+    messages, ctx = context_builder.build(
+        session_id, system_prompt, conversation_service.get_conversation_history(session_id), user_prompt
+    )
+    logger.info("[JGS] 提示词 %d tokens: 近期 %d 条消息，摘要覆盖 %d 条，丢弃 %d 条",
+                ctx["prompt_tokens"], ctx["history_messages"], ctx["summarized_messages"], ctx["dropped_messages"])
 
     # 2. 调用 LLM
     try:
@@ -239,22 +236,15 @@ async def _generate_jiageng_text_stream(
     # 1. 构建消息列表（与非流式版本相同）
     prompt_builder = PROMPT_BUILDERS.get(prompt_style, build_jiageng_prompt_normal)
     system_prompt = prompt_builder()
-    messages: List[Dict[str, str]] = []
-    if system_prompt:
-        messages.append({"role": "system", "content": system_prompt})
-    
     logger.info("[JGS-Stream] 使用提示词格式: %s", prompt_style)
 
-    # 添加历史对话（最多保留最近 20 条消息）
-    history = conversation_service.get_conversation_history(session_id)
-    if history:
-        recent_history = history[-20:] if len(history) > 20 else history
-        messages.extend(recent_history)
-        logger.info("[JGS-Stream] 添加历史对话: %d 条消息", len(recent_history))
-
-    # 添加当前用户输入
+    # 系统提示词 + 历史摘要 + 近期对话 + 当前输入，按 token 预算组装（见 context_builder）
     user_prompt = f"用户问题：{user_input}"
-    messages.append({"role": "user", "content": user_prompt})
+    messages, ctx = context_builder.build(
+        session_id, system_prompt, conversation_service.get_conversation_history(session_id), user_prompt
+    )
+    logger.info("[JGS-Stream] 提示词 %d tokens: 近期 %d 条消息，摘要覆盖 %d 条，丢弃 %d 条",
+                ctx["prompt_tokens"], ctx["history_messages"], ctx["summarized_messages"], ctx["dropped_messages"])
 
     # 2. 流式调用 LLM
     accumulated_text = ""
@@ -330,6 +320,7 @@ async def _synthesize_segment_stream(
     segment_index: int,
     speaking_speed: float,
     show_subtitles: bool,
+    request_id: Optional[str] = None,
 ) -> Dict[str, Any]:
     """
     单个片段的 TTS 合成（立即返回，不等待其他片段）。
@@ -339,6 +330,7 @@ async def _synthesize_segment_stream(
         segment_index: 片段索引（用于排序）
         speaking_speed: 语速
         show_subtitles: 是否生成字幕
+        request_id: 请求 ID，透传给 TTS 服务（客户端断开时据此取消推理）
     
     Returns:
         {
@@ -362,12 +354,21 @@ async def _synthesize_segment_stream(
     audio_url: Optional[str] = None
     audio_duration: Optional[float] = None
     
+    # 首个片段决定用户听到声音的时间，调度上优先于后续片段和批量合成
+    if segment_index == 0:
+        priority, deadline = Priority.INTERACTIVE_FIRST, deadline_after(settings.tts_first_segment_deadline)
+    else:
+        priority, deadline = Priority.INTERACTIVE, deadline_after(settings.tts_interactive_deadline)
+
     try:
         # 调用单个片段的 TTS
         tts_res = await tts_service.synthesize(
             text=text_segment,
             target_language="cjg",
             speaking_rate=speaking_speed,
+            request_id=request_id,
+            priority=priority,
+            deadline=deadline,
         )
         
         if not tts_res.get("binary"):
@@ -531,6 +532,54 @@ async def _synthesize_jiageng_audio(
     }
 
 
+# ================== 回答缓存 ==================
+
+def _answer_cache_scope(session_id: str, prompt_style: str, speaking_speed: float, mode: str) -> Optional[CacheScope]:
+    """当前请求的缓存作用域；不查缓存时返回 None（缓存关闭，或有历史对话且未允许带历史缓存）"""
+    if not settings.answer_cache_enabled:
+        return None
+    history_empty = not conversation_service.get_conversation_history(session_id)
+    if not history_empty and not settings.answer_cache_with_history:
+        return None
+    return CacheScope(prompt_style, history_empty, round(speaking_speed, 2), mode)
+
+
+def _lookup_answer(user_input: str, scope: Optional[CacheScope]) -> Optional[CacheHit]:
+    """查缓存，并确认缓存的音频文件仍然存在（上传目录被清理后条目作废）"""
+    if scope is None or not user_input:
+        return None
+    hit = answer_cache.lookup(user_input, scope)
+    if hit is None:
+        return None
+    urls = [hit.payload.get("audio_url")] if "segments" not in hit.payload else [
+        seg.get("audio_url") for seg in hit.payload["segments"]
+    ]
+    uploads_dir = Path(settings.upload_dir)
+    if not urls or not all(url and (uploads_dir / Path(url).name).exists() for url in urls):
+        logger.warning("[JGS] 缓存的音频文件已不存在，缓存作废: %s", hit.question[:30])
+        answer_cache.invalidate(hit.question)
+        return None
+    return hit
+
+
+def _match_answer_bank(user_input: str, speaking_speed: float) -> Optional[CacheHit]:
+    """查预合成答案库（与历史无关，只在请求语速与合成语速一致时命中；答案库关闭时不查）"""
+    if not settings.answer_bank_enabled or not user_input:
+        return None
+    return answer_bank.match(user_input, speaking_speed)
+
+
+def _subtitle_dicts(text: str, audio_duration: Optional[float]) -> List[Dict[str, Any]]:
+    """缓存用的字幕（无论本次是否显示字幕都生成，命中时按需返回）"""
+    base_text = (text or "").strip()
+    total_dur = audio_duration if audio_duration and audio_duration > 0 else (len(base_text) or 1) * 0.08
+    return segment_text_to_subtitles(base_text, total_dur)
+
+
+def _cached_subtitles(stored: List[Dict[str, Any]], show_subtitles: bool) -> List[DigitalJiagengSubtitle]:
+    return [DigitalJiagengSubtitle(**s) for s in stored] if show_subtitles else []
+
+
 # ================== 对外：从音频请求到完整结果 ==================
 
 async def chat_with_audio(
@@ -577,6 +626,19 @@ async def chat_with_audio(
     
     # user_input = "详细介绍一下你的生平"
     prompt_style = "pause_format"
+
+    # 高频问题命中预合成答案库，或常见问题命中回答缓存时直接返回，不经过 LLM 与 TTS
+    cache_scope = _answer_cache_scope(session_id, prompt_style, speaking_speed, "full")
+    cached = _match_answer_bank(user_input, speaking_speed) or _lookup_answer(user_input, cache_scope)
+    if cached is not None:
+        payload = cached.payload
+        conversation_service.add_to_conversation_history(session_id, user_input, payload["text"])
+        return {
+            "text": payload["text"],
+            "audio_url": payload["audio_url"],
+            "audio_duration": payload["audio_duration"],
+            "subtitles": _cached_subtitles(payload["subtitles"], show_subtitles),
+        }
     
     # 3) LLM：根据用户文本生成嘉庚回答
     text_result = await _generate_jiageng_text(
@@ -601,6 +663,14 @@ async def chat_with_audio(
     # 5) 记录对话历史（只记录文本轮次）
     conversation_service.add_to_conversation_history(session_id, user_input, response_text)
 
+    if cache_scope is not None and tts_result.get("audio_url"):
+        answer_cache.store(user_input, cache_scope, {
+            "text": response_text,
+            "audio_url": tts_result.get("audio_url"),
+            "audio_duration": tts_result.get("audio_duration"),
+            "subtitles": _subtitle_dicts(response_text, tts_result.get("audio_duration")),
+        })
+
     # 6) 汇总结果
     return {
         "text": response_text,
@@ -618,6 +688,7 @@ async def chat_with_audio_stream(
     speaking_speed: float,
     show_subtitles: bool,
     prompt_style: str = "pause_format",
+    request_id: Optional[str] = None,
 ) -> AsyncGenerator[Dict[str, Any], None]:
     """
     流式处理完整流程：
@@ -635,6 +706,7 @@ async def chat_with_audio_stream(
         speaking_speed: 语速
         show_subtitles: 是否显示字幕
         prompt_style: 提示词风格，默认为 "pause_format"
+        request_id: 请求 ID，所有片段的 TTS 调用共用（客户端断开时据此取消推理）
     
     Yields:
         每个片段的结果字典：
@@ -649,6 +721,7 @@ async def chat_with_audio_stream(
     segment_results: List[Dict[str, Any]] = []
     full_text = ""
     history_saved = False
+    segment_failed = False
     
     try:
         # 1) 音频预处理（大小/格式校验及必要转换）
@@ -670,6 +743,32 @@ async def chat_with_audio_stream(
         # 临时硬编码（用于测试）
         # user_input = "详细介绍一下你的生平"
         prompt_style = "pause_format"
+
+        # 高频问题命中预合成答案库，或常见问题命中回答缓存时直接按片段返回，不经过 LLM 与 TTS
+        cache_scope = _answer_cache_scope(session_id, prompt_style, speaking_speed, "stream")
+        cached = _match_answer_bank(user_input, speaking_speed) or _lookup_answer(user_input, cache_scope)
+        if cached is not None:
+            full_text = cached.payload["text"]
+            for index, seg in enumerate(cached.payload["segments"]):
+                segment_result = {
+                    "type": "segment",
+                    "segment_index": index,
+                    "text": seg["text"],
+                    "audio_url": seg["audio_url"],
+                    "audio_duration": seg["audio_duration"],
+                    "subtitles": _cached_subtitles(seg["subtitles"], show_subtitles),
+                }
+                segment_results.append(segment_result)
+                yield segment_result
+            conversation_service.add_to_conversation_history(session_id, user_input, full_text)
+            history_saved = True
+            yield {
+                "type": "complete",
+                "text": full_text,
+                "all_segments": segment_results,
+                "cached": True,
+            }
+            return
         
         # 3) 流式 LLM：根据用户文本生成嘉庚回答
         segment_index = 0
@@ -694,6 +793,7 @@ async def chat_with_audio_stream(
                         segment_index=segment_index,
                         speaking_speed=speaking_speed,
                         show_subtitles=show_subtitles,
+                        request_id=request_id,
                     )
                     
                     segment_result = {
@@ -712,6 +812,7 @@ async def chat_with_audio_stream(
                     yield segment_result
                     
                 except Exception as e:
+                    segment_failed = True
                     logger.exception("[JGS-Stream] 片段 %d TTS 失败: %s", segment_index, e)
                     # 即使 TTS 失败，也继续处理后续片段
                     yield {
@@ -742,6 +843,7 @@ async def chat_with_audio_stream(
                                 segment_index=segment_index,
                                 speaking_speed=speaking_speed,
                                 show_subtitles=show_subtitles,
+                                request_id=request_id,
                             )
                             
                             segment_result = {
@@ -757,6 +859,7 @@ async def chat_with_audio_stream(
                             yield segment_result
                             
                         except Exception as e:
+                            segment_failed = True
                             logger.exception("[JGS-Stream] 最后片段 TTS 失败: %s", e)
                 
                 # 记录对话历史
@@ -765,6 +868,22 @@ async def chat_with_audio_stream(
                     history_saved = True
                 except Exception as conv_err:
                     logger.exception("[JGS-Stream] 会话历史保存失败: %s", conv_err)
+
+                # 所有片段都合成成功时写入回答缓存
+                if (cache_scope is not None and segment_results and not segment_failed
+                        and all(seg["audio_url"] for seg in segment_results)):
+                    answer_cache.store(user_input, cache_scope, {
+                        "text": full_text,
+                        "segments": [
+                            {
+                                "text": seg["text"],
+                                "audio_url": seg["audio_url"],
+                                "audio_duration": seg["audio_duration"],
+                                "subtitles": _subtitle_dicts(seg["text"], seg["audio_duration"]),
+                            }
+                            for seg in segment_results
+                        ],
+                    })
                 
                 # 返回完整结果（确保一定会发送）
                 complete_message = {
@@ -0,0 +1,248 @@
+"""
+Provider Key 调度：按余量选 Key，替代简单轮询
+
+轮询时被限流的 Key 仍会分到 1/N 的流量并持续失败。``KeyScheduler`` 为每把 Key 维护：
+    - RPM / TPM 令牌桶（按配置的每分钟请求数、token 数匀速补充，0 表示不限）；
+      请求前按估算 token 预扣，收到响应后按 ``usage`` 中的实际用量校正；
+    - 在途请求数（不超过 ``max_in_flight``）；
+    - 429 冷却：优先使用 ``Retry-After``，否则按连续 429 次数指数退避。
+每次选择余量最大（令牌桶剩余比例 × 空闲并发比例）的可用 Key，余量相同时选最久未用的；
+暂无可用 Key 时等待到最早可用的时刻（不超过截止时间）。
+"""
+import asyncio
+import email.utils
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class NoKeyAvailable(Exception):
+    """截止时间前没有可用的 Key"""
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        """per_minute <= 0 表示不限"""
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def fraction(self) -> float:
+        """剩余比例（0~1），不限时为 1"""
+        if self.unlimited:
+            return 1.0
+        self._refill()
+        return max(self.tokens, 0.0) / self.capacity
+
+    def wait_time(self, amount: float) -> float:
+        """还需等待多久才能扣除 ``amount``（超过容量时按容量计，避免永远等不到）"""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        need = min(amount, self.capacity) - self.tokens
+        return 0.0 if need <= 0 else need / self.rate
+
+    def take(self, amount: float) -> None:
+        """扣除（允许透支，透支部分由后续补充抵消）"""
+        if self.unlimited:
+            return
+        self._refill()
+        self.tokens -= amount
+
+    def drain(self) -> None:
+        if not self.unlimited:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0)
+
+
+class KeyState:
+    def __init__(self, index: int, key: str, rpm: int, tpm: int):
+        self.index = index
+        self.key = key
+        self.rpm = TokenBucket(rpm)
+        self.tpm = TokenBucket(tpm)
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.consecutive_429 = 0
+        self.last_used = 0.0
+        self.requests = 0
+        self.rate_limited = 0
+        self.tokens_used = 0
+
+    def wait_time(self, estimated_tokens: float) -> float:
+        """除并发上限外，距离可用还需等待的时间（秒）"""
+        return max(self.cooldown_until - time.monotonic(), self.rpm.wait_time(1), self.tpm.wait_time(estimated_tokens), 0.0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "tokens_used": self.tokens_used,
+            "rpm_headroom": round(self.rpm.fraction(), 3),
+            "tpm_headroom": round(self.tpm.fraction(), 3),
+            "cooldown_ms": max(int((self.cooldown_until - time.monotonic()) * 1000), 0),
+        }
+
+
+class KeyLease:
+    """一次请求占用的 Key；``release`` 前需按结果调用 ``record_usage`` / ``record_rate_limited``"""
+
+    def __init__(self, scheduler: "KeyScheduler", state: KeyState, estimated_tokens: int):
+        self.scheduler = scheduler
+        self.state = state
+        self.estimated_tokens = estimated_tokens
+        self.released = False
+
+    @property
+    def index(self) -> int:
+        return self.state.index
+
+    @property
+    def key(self) -> str:
+        return self.state.key
+
+    def record_usage(self, total_tokens: Optional[int]) -> None:
+        self.scheduler.record_usage(self, total_tokens)
+
+    def record_rate_limited(self, retry_after: Optional[float] = None) -> None:
+        self.scheduler.record_rate_limited(self, retry_after)
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.scheduler.release(self)
+
+
+class KeyScheduler:
+    def __init__(
+        self,
+        keys: List[str],
+        rpm: int = 0,
+        tpm: int = 0,
+        max_in_flight: int = 8,
+        cooldown: float = 10.0,
+        max_cooldown: float = 120.0,
+    ):
+        """
+        Args:
+            keys: Key 列表（编号从 1 开始，与日志中的 API#n 对应）
+            rpm / tpm: 每把 Key 的每分钟请求数 / token 数上限，0 表示不限
+            max_in_flight: 每把 Key 同时在途的请求数上限
+            cooldown: 429 且无 ``Retry-After`` 时的首次冷却时长（秒），连续 429 时翻倍，最长 ``max_cooldown``
+        """
+        self.keys = [KeyState(i, k, rpm, tpm) for i, k in enumerate(keys, start=1)]
+        self.max_in_flight = max_in_flight
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._released = asyncio.Event()
+
+    def __bool__(self) -> bool:
+        return bool(self.keys)
+
+    def _headroom(self, state: KeyState) -> float:
+        idle = 1.0 - state.in_flight / self.max_in_flight
+        return min(state.rpm.fraction(), state.tpm.fraction()) * idle
+
+    def _candidates(self, estimated_tokens: int) -> List[KeyState]:
+        return [
+            s for s in self.keys
+            if s.in_flight < self.max_in_flight and s.wait_time(estimated_tokens) <= 0
+        ]
+
+    def best(self, estimated_tokens: int = 0) -> Optional[KeyState]:
+        """余量最大的可用 Key（不占用）；全部不可用时返回 None"""
+        candidates = self._candidates(estimated_tokens)
+        if not candidates:
+            return None
+        return max(candidates, key=lambda s: (self._headroom(s), -s.last_used))
+
+    async def acquire(self, estimated_tokens: int = 0, deadline: Optional[float] = None) -> KeyLease:
+        """
+        占用一把 Key；暂无可用 Key 时等待
+        Raises:
+            NoKeyAvailable: 截止时间前没有可用的 Key
+        """
+        if not self.keys:
+            raise NoKeyAvailable("未配置 Provider Key")
+        while True:
+            # 先清除事件再检查：检查之后的释放会唤醒下面的等待
+            self._released.clear()
+            state = self.best(estimated_tokens)
+            if state is not None:
+                state.in_flight += 1
+                state.requests += 1
+                state.last_used = time.monotonic()
+                state.rpm.take(1)
+                state.tpm.take(estimated_tokens)
+                return KeyLease(self, state, estimated_tokens)
+            # 等到最早可用的时刻，或有请求释放并发名额
+            waits = [s.wait_time(estimated_tokens) for s in self.keys if s.in_flight < self.max_in_flight]
+            wait = min(waits) if waits else None
+            if deadline is not None:
+                left = deadline - time.monotonic()
+                if left <= 0 or (wait is not None and wait > left):
+                    hint = f"（最早 {wait:.1f}s 后可用）" if wait else ""
+                    raise NoKeyAvailable(f"所有 Key 均已限流或满载{hint}")
+                wait = left if wait is None else wait
+            try:
+                await asyncio.wait_for(self._released.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def record_usage(self, lease: KeyLease, total_tokens: Optional[int]) -> None:
+        """按响应中的实际 token 用量校正预扣的 TPM"""
+        state = lease.state
+        state.consecutive_429 = 0
+        if total_tokens is None:
+            state.tokens_used += lease.estimated_tokens
+            return
+        state.tokens_used += total_tokens
+        state.tpm.take(total_tokens - lease.estimated_tokens)
+
+    def record_rate_limited(self, lease: KeyLease, retry_after: Optional[float] = None) -> None:
+        state = lease.state
+        state.rate_limited += 1
+        state.consecutive_429 += 1
+        if retry_after is None:
+            retry_after = min(self.cooldown * (2 ** (state.consecutive_429 - 1)), self.max_cooldown)
+        state.cooldown_until = max(state.cooldown_until, time.monotonic() + retry_after)
+        # 服务端限流说明实际配额低于配置，清空令牌桶，避免冷却结束后立即打满
+        state.rpm.drain()
+        state.tpm.drain()
+        logger.warning("[KEY-SCHEDULER] API#%d 被限流，冷却 %.1fs (连续 %d 次)",
+                       state.index, retry_after, state.consecutive_429)
+
+    def release(self, lease: KeyLease) -> None:
+        lease.state.in_flight -= 1
+        self._released.set()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {f"API#{s.index}": s.snapshot() for s in self.keys}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 ``Retry-After``：秒数或 HTTP 日期"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
@@ -0,0 +1,115 @@
+"""
+LLM Provider 客户端注册表：复用连接池，避免每次调用重新建立 TCP/TLS 连接
+
+- 每个 Provider 一个 ``httpx.AsyncClient`` 连接池（调优的连接数上限与 keep-alive，装有 ``h2`` 时启用 HTTP/2）；
+  同一 Provider 的多把 Key 只是请求头不同，共用连接池以最大化连接复用；
+- 每个 (Provider, Key) 一个 ``AsyncOpenAI`` 客户端，底层使用上述连接池，不再每次流式调用新建；
+- ``aclose`` 在应用关闭时统一释放连接。
+
+Provider 地址可通过 ``LLM_PROVIDER_BASE_URL`` 覆盖，指向本地 OpenAI 兼容桩服务
+（``test_single/mock_openai_server.py``）即可在离线环境中测试。
+"""
+import importlib.util
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _http2_available() -> bool:
+    """httpx 的 HTTP/2 支持依赖可选包 h2（pip install httpx[http2]）"""
+    return importlib.util.find_spec("h2") is not None
+
+
+class ProviderClientRegistry:
+    def __init__(
+        self,
+        timeout: float = 60.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 120.0,
+        http2: bool = True,
+    ):
+        """
+        Args:
+            timeout: 单次请求超时（秒）
+            max_connections / max_keepalive_connections: 每个 Provider 连接池的连接数上限
+            keepalive_expiry: 空闲连接保活时长（秒），需长于两轮对话之间的间隔，首个 token 才不必等待握手
+            http2: 是否启用 HTTP/2（未安装 h2 时自动回退到 HTTP/1.1）
+        """
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2 and _http2_available()
+        if http2 and not self.http2:
+            logger.info("[LLM-CLIENTS] 未安装 h2，Provider 连接使用 HTTP/1.1")
+        self._http: Dict[str, httpx.AsyncClient] = {}
+        self._openai: Dict[Tuple[str, int], AsyncOpenAI] = {}
+
+    def http(self, provider: str) -> httpx.AsyncClient:
+        """获取或创建 Provider 的连接池"""
+        client = self._http.get(provider)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits, http2=self.http2)
+            self._http[provider] = client
+            logger.info("[LLM-CLIENTS] 创建连接池: provider=%s http2=%s", provider, self.http2)
+        return client
+
+    def openai(self, provider: str, key_index: int, api_key: str, base_url: str) -> AsyncOpenAI:
+        """获取或创建 (Provider, Key) 的 OpenAI 兼容客户端；重试由调用方的容错层负责，关闭 SDK 自带重试"""
+        cache_key = (provider, key_index)
+        client = self._openai.get(cache_key)
+        if client is None or str(client.base_url).rstrip("/") != base_url.rstrip("/"):
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                max_retries=0,
+                http_client=self.http(provider),
+            )
+            self._openai[cache_key] = client
+        return client
+
+    async def aclose(self) -> None:
+        for provider, client in self._http.items():
+            await client.aclose()
+            logger.info("[LLM-CLIENTS] 关闭连接池: provider=%s", provider)
+        self._http.clear()
+        self._openai.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "http2": self.http2,
+            "pools": sorted(p for p, c in self._http.items() if not c.is_closed),
+        }
+
+
+_registry: Optional[ProviderClientRegistry] = None
+
+
+def get_registry() -> ProviderClientRegistry:
+    """全局注册表（首次使用时按配置创建）"""
+    global _registry
+    if _registry is None:
+        _registry = ProviderClientRegistry(
+            timeout=settings.model_request_timeout,
+            max_connections=settings.llm_max_connections,
+            max_keepalive_connections=settings.llm_max_keepalive_connections,
+            keepalive_expiry=settings.llm_keepalive_expiry,
+            http2=settings.llm_http2,
+        )
+    return _registry
+
+
+async def close_registry() -> None:
+    global _registry
+    if _registry is not None:
+        await _registry.aclose()
+        _registry = None
@@ -3,14 +3,21 @@ from typing import Any, Dict, List, Callable, Awaitable, AsyncGenerator
 import time
 import logging
 import httpx
-import itertools
+from contextlib import asynccontextmanager
 import os
-from openai import AsyncOpenAI
 from app.core.config import settings
 from app.core.exceptions import LLMServiceError
+from app.services.context_builder import fit_messages, messages_tokens
+from app.services.key_scheduler import KeyLease, KeyScheduler, parse_retry_after
+from app.services.llm_clients import get_registry
+from app.services.resilience import Resilience
+from app.services.single_flight import SingleFlight, request_key
 
 logger = logging.getLogger(__name__)
 
+# 只重试连接失败、429、502/503/504（带抖动退避与重试预算）；每个 Provider 一个熔断器
+_llm_resilience = Resilience("LLM")
+
 # ======================================================
 # 工具函数
 # ======================================================
@@ -24,14 +31,9 @@ def safe_extract(js: dict, *path, default: str = "") -> str:
         return default
 
 
-# 复用 httpx 客户端
-_shared_client: httpx.AsyncClient | None = None
-
+# 复用 httpx 客户端（本地 LLM 连接池，见 llm_clients）
 async def get_client() -> httpx.AsyncClient:
-    global _shared_client
-    if _shared_client is None:
-        _shared_client = httpx.AsyncClient(timeout=settings.model_request_timeout)
-    return _shared_client
+    return get_registry().http("local")
 
 
 # ======================================================
@@ -58,24 +60,89 @@ def _parse_provider_keys(raw: str | None) -> List[str]:
 
 
 _PROVIDER_KEYS = _parse_provider_keys(settings.provider_api_key)
-_PROVIDER_KEY_POOL = list(enumerate(_PROVIDER_KEYS, start=1))
-_provider_key_cycle = itertools.cycle(_PROVIDER_KEY_POOL) if _PROVIDER_KEY_POOL else None
+# 按 RPM/TPM 余量、在途请求数与 429 冷却选 Key（见 key_scheduler）
+_key_scheduler = KeyScheduler(
+    _PROVIDER_KEYS,
+    rpm=settings.provider_key_rpm,
+    tpm=settings.provider_key_tpm,
+    max_in_flight=settings.llm_per_key_concurrency,
+    cooldown=settings.provider_key_cooldown,
+)
 
 
 def _acquire_provider_key() -> tuple[int, str]:
     """
-    轮询获取下一把 Provider Key。
-    所有依赖云端/HTTP Provider 的调用都应统一走这里，以便多 Key 均匀使用。
+    当前余量最大的 Provider Key（不占用，用于本地服务鉴权等不计配额的场景）。
+    云端 Provider 调用应通过 ``_lease_provider_key`` 占用 Key，以便计入限流与用量统计。
     """
-    if _provider_key_cycle is None:
+    if not _key_scheduler:
         raise LLMServiceError("未配置 PROVIDER_API_KEY，请至少提供一把 Key")
-    return next(_provider_key_cycle)
+    state = _key_scheduler.best() or min(_key_scheduler.keys, key=lambda s: s.in_flight)
+    return state.index, state.key
 
 
 def _has_provider_key() -> bool:
     return bool(_PROVIDER_KEYS)
 
 
+def _estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    """预扣 TPM 用的 token 估算：提示词 token 数（见 context_builder）加预期的回复长度"""
+    return messages_tokens(messages) + settings.llm_expected_output_tokens
+
+
+def _note_rate_limit(lease: KeyLease, exc: BaseException) -> None:
+    """429 时让该 Key 冷却（遵循 Retry-After）"""
+    response = getattr(exc, "response", None)
+    if response is not None and getattr(response, "status_code", None) == 429:
+        lease.record_rate_limited(parse_retry_after(response.headers.get("retry-after")))
+
+
+@asynccontextmanager
+async def _lease_provider_key(estimated_tokens: int, deadline: float | None):
+    """
+    占用一把 Key 完成一次请求，用法::
+
+        async with _lease_provider_key(tokens, deadline) as lease:
+            resp = await client.post(url, headers={"Authorization": f"Bearer {lease.key}"})
+            lease.record_usage(total_tokens)
+    """
+    lease = await _key_scheduler.acquire(estimated_tokens, deadline)
+    try:
+        yield lease
+    except Exception as e:
+        _note_rate_limit(lease, e)
+        raise
+    finally:
+        lease.release()
+
+
+def key_metrics() -> Dict[str, Any]:
+    """各 Provider Key 的请求数、限流次数、token 用量与余量"""
+    return _key_scheduler.metrics()
+
+
+# ======================================================
+# 在途请求合并
+# ======================================================
+# 多台终端同时提出相同问题时只调用一次上游（见 single_flight）
+_single_flight = SingleFlight("LLM")
+
+
+def _coalesce_key(messages: List[Dict[str, str]], model_hint: str | None, *, stream: bool) -> str:
+    """消息列表 + 模型参数 + 实际通道；通道不同（本地 / Provider）的请求不合并"""
+    return request_key(
+        messages,
+        model=model_hint or settings.llm_model_name,
+        channel=settings.llm_service_url or settings.provider_name,
+        stream=stream,
+    )
+
+
+def coalesce_metrics() -> Dict[str, Any]:
+    """合并的请求数、晚加入的流式订阅者与重放块数等"""
+    return _single_flight.metrics()
+
+
 # ======================================================
 # Gemini Provider
 # ======================================================
@@ -84,7 +151,8 @@ async def call_gemini(messages: List[Dict[str, str]], model_hint: str | None):
     model = model_hint or settings.llm_model_name or "gemini-2.5-flash"
     prompt = "\n".join([m.get("content", "") for m in messages])
 
-    api_index, api_key = _acquire_provider_key()
+    if not _has_provider_key():
+        raise LLMServiceError("未配置 PROVIDER_API_KEY，请至少提供一把 Key")
 
     payload = {
         "contents": [{"parts": [{"text": prompt}]}],
@@ -92,14 +160,26 @@ async def call_gemini(messages: List[Dict[str, str]], model_hint: str | None):
     }
 
     url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
-    headers = {"Content-Type": "application/json", "x-goog-api-key": api_key}
 
-    client = await get_client()
+    client = get_registry().http("gemini")
     start = time.monotonic()
+    deadline = start + settings.model_request_timeout
+    estimated_tokens = _estimate_tokens(messages)
+    api_index = None
+
+    # 每次尝试重新选 Key：被限流的 Key 进入冷却，重试自然落到其他 Key 上
+    async def _post(attempt: int) -> httpx.Response:
+        nonlocal api_index
+        async with _lease_provider_key(estimated_tokens, deadline) as lease, _llm_resilience.guard("gemini"):
+            api_index = lease.index
+            headers = {"Content-Type": "application/json", "x-goog-api-key": lease.key}
+            resp = await client.post(url, json=payload, headers=headers)
+            resp.raise_for_status()
+            lease.record_usage(resp.json().get("usageMetadata", {}).get("totalTokenCount"))
+            return resp
 
     try:
-        resp = await client.post(url, json=payload, headers=headers)
-        resp.raise_for_status()
+        resp = await _llm_resilience.retry(_post, deadline=deadline)
     except httpx.HTTPStatusError as e:
         dur = (time.monotonic() - start) * 1000
         body = e.response.text[:300] if e.response is not None else ""
@@ -139,10 +219,11 @@ async def call_gemini(messages: List[Dict[str, str]], model_hint: str | None):
 @register_provider("qwen")
 async def call_qwen(messages: List[Dict[str, str]], model_hint: str | None):
     model = model_hint or settings.llm_model_name or "qwen-plus"
-    base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+    base_url = settings.llm_provider_base_url or "https://dashscope.aliyuncs.com/compatible-mode/v1"
     url = f"{base_url}/chat/completions"
 
-    api_index, api_key = _acquire_provider_key()
+    if not _has_provider_key():
+        raise LLMServiceError("未配置 PROVIDER_API_KEY，请至少提供一把 Key")
 
     payload = {
         "model": model,
@@ -150,17 +231,28 @@ async def call_qwen(messages: List[Dict[str, str]], model_hint: str | None):
         "stream": False,
     }
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
-
-    client = await get_client()
+    client = get_registry().http("qwen")
     start = time.monotonic()
+    deadline = start + settings.model_request_timeout
+    estimated_tokens = _estimate_tokens(messages)
+    api_index = None
+
+    # 每次尝试重新选 Key：被限流的 Key 进入冷却，重试自然落到其他 Key 上
+    async def _post(attempt: int) -> httpx.Response:
+        nonlocal api_index
+        async with _lease_provider_key(estimated_tokens, deadline) as lease, _llm_resilience.guard("qwen"):
+            api_index = lease.index
+            headers = {
+                "Authorization": f"Bearer {lease.key}",
+                "Content-Type": "application/json",
+            }
+            resp = await client.post(url, json=payload, headers=headers)
+            resp.raise_for_status()
+            lease.record_usage((resp.json().get("usage") or {}).get("total_tokens"))
+            return resp
 
     try:
-        resp = await client.post(url, json=payload, headers=headers)
-        resp.raise_for_status()
+        resp = await _llm_resilience.retry(_post, deadline=deadline)
     except httpx.HTTPStatusError as e:
         dur = (time.monotonic() - start) * 1000
         body = e.response.text[:300] if e.response is not None else ""
@@ -215,30 +307,48 @@ async def call_qwen_stream(
         - "done": 是否完成（最后一个 chunk 为 True）
     """
     model = model_hint or settings.llm_model_name or "qwen-plus"
-    base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1"
-    
-    api_index, api_key = _acquire_provider_key()
+    base_url = settings.llm_provider_base_url or "https://dashscope.aliyuncs.com/compatible-mode/v1"
     
-    # 创建 OpenAI 客户端（使用 DashScope 兼容模式）
-    client = AsyncOpenAI(
-        api_key=api_key,
-        base_url=base_url,
-    )
+    if not _has_provider_key():
+        raise LLMServiceError("未配置 PROVIDER_API_KEY，请至少提供一把 Key")
     
+    registry = get_registry()
     start = time.monotonic()
+    deadline = start + settings.model_request_timeout
+    estimated_tokens = _estimate_tokens(messages)
     accumulated_text = ""
-    
+    # 整个流式输出期间占用选中的 Key（计入其在途请求数），结束后释放
+    lease: KeyLease | None = None
+    api_index = None
+
     try:
-        # 发起流式请求
-        completion = await client.chat.completions.create(
-            model=model,
-            messages=messages,
-            stream=True,
-            stream_options={"include_usage": True}
-        )
-        
-        # 逐步返回每个 chunk
+        # 发起流式请求（只在收到首个 chunk 之前重试，已输出的内容不会重复；每次尝试重新选 Key）
+        async def _create(attempt: int):
+            nonlocal lease, api_index
+            lease = await _key_scheduler.acquire(estimated_tokens, deadline)
+            api_index = lease.index
+            # 复用该 Key 的 OpenAI 客户端（DashScope 兼容模式，底层为共享连接池；重试统一由 _llm_resilience 负责）
+            client = registry.openai("qwen", lease.index, lease.key, base_url)
+            try:
+                async with _llm_resilience.guard("qwen"):
+                    return await client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        stream=True,
+                        stream_options={"include_usage": True}
+                    )
+            except Exception as e:
+                _note_rate_limit(lease, e)
+                lease.release()
+                raise
+
+        completion = await _llm_resilience.retry(_create, deadline=deadline)
+    
+        # 逐步返回每个 chunk（include_usage 时最后一个 chunk 带有 usage）
+        usage_tokens = None
         async for chunk in completion:
+            if getattr(chunk, "usage", None) is not None:
+                usage_tokens = chunk.usage.total_tokens
             # 提取增量文本
             delta_text = ""
             if chunk.choices and len(chunk.choices) > 0:
@@ -246,7 +356,7 @@ async def call_qwen_stream(
                 if delta and delta.content:
                     delta_text = delta.content
                     accumulated_text += delta_text
-            
+        
             # 转换为字典格式（兼容多种方式）
             try:
                 if hasattr(chunk, 'model_dump'):
@@ -274,24 +384,25 @@ async def call_qwen_stream(
             except Exception as e:
                 logger.warning(f"[Qwen Stream] 转换 chunk 为字典失败: {e}")
                 chunk_dict = {"error": f"转换失败: {str(e)}"}
-            
+        
             # 判断是否完成（检查 finish_reason）
             is_done = False
             if chunk.choices and len(chunk.choices) > 0:
                 finish_reason = chunk.choices[0].finish_reason
                 if finish_reason is not None:
                     is_done = True
-            
+        
             yield {
                 "text": delta_text,
                 "accumulated_text": accumulated_text,
                 "raw": chunk_dict,
                 "done": is_done
             }
-        
+    
+        lease.record_usage(usage_tokens)
         dur = (time.monotonic() - start) * 1000
         logger.info(f"[Qwen Stream] 成功 (API#{api_index}) {dur:.1f}ms 总长度: {len(accumulated_text)}")
-        
+    
     except Exception as e:
         dur = (time.monotonic() - start) * 1000
         logger.exception(f"[Qwen Stream] 调用失败 (API#{api_index}) ({dur:.1f}ms)")
@@ -306,6 +417,9 @@ async def call_qwen_stream(
             },
             "done": True
         }
+    finally:
+        if lease is not None:
+            lease.release()
 
 
 # ======================================================
@@ -317,6 +431,8 @@ async def _call_local_llm(messages: List[Dict[str, str]], model_hint: str | None
 
     client = await get_client()
     start = time.monotonic()
+    # 调用方未做预算时的兜底：超出提示词上限则丢弃最早的非系统消息
+    messages = fit_messages(messages, settings.llm_max_prompt_tokens)
 
     # 判断本地 vLLM（9020端口）
     is_vllm = any(tag in settings.llm_service_url for tag in [
@@ -336,36 +452,40 @@ async def _call_local_llm(messages: List[Dict[str, str]], model_hint: str | None
     context = []
     for msg in messages[:-1]:
         r, c = msg["role"], msg["content"]
-        prefix = "用户" if r == "user" else "助手"
+        prefix = {"user": "用户", "system": "系统"}.get(r, "助手")
         context.append(f"{prefix}: {c}")
     context_str = "\n".join(context)
 
+    headers: Dict[str, str] = {}
+    if not is_vllm and _has_provider_key():
+        _, bearer_key = _acquire_provider_key()
+        headers["Authorization"] = f"Bearer {bearer_key}"
+
+    async def _post(attempt: int) -> httpx.Response:
+        async with _llm_resilience.guard(settings.llm_service_url):
+            if is_vllm:
+                # 本地 vLLM
+                resp = await client.post(
+                    f"{settings.llm_service_url}/chat",
+                    json={
+                        "message": user_message,
+                        "context": context_str,
+                        "max_length": 512,
+                        "temperature": 0.7
+                    }
+                )
+            else:
+                # 其他本地 LLM
+                resp = await client.post(
+                    f"{settings.llm_service_url}/chat-messages",
+                    json={"messages": messages, "model": model_hint},
+                    headers=headers
+                )
+            resp.raise_for_status()
+            return resp
+
     try:
-        if is_vllm:
-            # 本地 vLLM
-            resp = await client.post(
-                f"{settings.llm_service_url}/chat",
-                json={
-                    "message": user_message,
-                    "context": context_str,
-                    "max_length": 512,
-                    "temperature": 0.7
-                }
-            )
-        else:
-            # 其他本地 LLM
-            headers: Dict[str, str] = {}
-            if _has_provider_key():
-                _, bearer_key = _acquire_provider_key()
-                headers["Authorization"] = f"Bearer {bearer_key}"
-
-            resp = await client.post(
-                f"{settings.llm_service_url}/chat-messages",
-                json={"messages": messages, "model": model_hint},
-                headers=headers
-            )
-
-        resp.raise_for_status()
+        resp = await _llm_resilience.retry(_post, deadline=start + settings.model_request_timeout)
     except Exception as e:
         logger.exception("[Local LLM] 调用失败")
         raise LLMServiceError(f"本地 LLM 调用失败: {e}")
@@ -526,6 +646,18 @@ async def chat_messages_api_stream(
         yield chunk
 
 
+async def _route_chat_messages_stream(
+    messages: List[Dict[str, str]],
+    model_hint: str | None,
+) -> AsyncGenerator[Dict[str, Any], None]:
+    if settings.llm_service_url:
+        async for chunk in chat_messages_local_stream(messages, model_hint=model_hint):
+            yield chunk
+    else:
+        async for chunk in chat_messages_api_stream(messages, model_hint=model_hint):
+            yield chunk
+
+
 async def chat_messages_stream(
     messages: List[Dict[str, str]], 
     *, 
@@ -535,15 +667,17 @@ async def chat_messages_stream(
     智能选择 LLM 通道（流式版本）：
     - 若检测到本地 llm_service_url，优先走本地（低时延、可离线）
     - 否则回退到云端 Provider（依据 provider_name）
+    - 相同请求在途时订阅同一条流（先重放已产生的块），不重复调用上游
     
     返回异步生成器，逐块返回文本
     """
-    if settings.llm_service_url:
-        async for chunk in chat_messages_local_stream(messages, model_hint=model_hint):
-            yield chunk
-    else:
-        async for chunk in chat_messages_api_stream(messages, model_hint=model_hint):
+    if not settings.llm_coalesce_enabled:
+        async for chunk in _route_chat_messages_stream(messages, model_hint):
             yield chunk
+        return
+    key = _coalesce_key(messages, model_hint, stream=True)
+    async for chunk in _single_flight.stream(key, lambda: _route_chat_messages_stream(messages, model_hint)):
+        yield chunk
 
 
 # ======================================================
@@ -564,12 +698,20 @@ async def chat_messages_api(messages: List[Dict[str, str]], *, model_hint: str |
     return await handler(messages, model_hint)
 
 
+async def _route_chat_messages(messages: List[Dict[str, str]], model_hint: str | None):
+    if settings.llm_service_url:
+        return await chat_messages_local(messages, model_hint=model_hint)
+    return await chat_messages_api(messages, model_hint=model_hint)
+
+
 async def chat_messages(messages: List[Dict[str, str]], *, model_hint: str | None = None):
     """
     智能选择 LLM 通道：
     - 若检测到本地 llm_service_url，优先走本地（低时延、可离线）
     - 否则回退到云端 Provider（依据 provider_name）
+    - 相同请求在途时等待同一次调用的结果，不重复调用上游
     """
-    if settings.llm_service_url:
-        return await chat_messages_local(messages, model_hint=model_hint)
-    return await chat_messages_api(messages, model_hint=model_hint)
+    if not settings.llm_coalesce_enabled:
+        return await _route_chat_messages(messages, model_hint)
+    key = _coalesce_key(messages, model_hint, stream=False)
+    return await _single_flight.do(key, lambda: _route_chat_messages(messages, model_hint))
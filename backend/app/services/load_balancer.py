@@ -0,0 +1,225 @@
+"""
+TTS 多节点客户端负载均衡
+
+同一音色可以部署在多台 GPU 机器上（config/services.json 中 ``endpoints``，或环境变量
+``TTS_CJG_SERVICE_URLS`` 逗号分隔）。``LoadBalancer`` 为每个节点记录：
+    - 在途请求数（本进程发出、尚未返回）
+    - 延迟的指数滑动平均（EWMA）
+    - 健康检查上报的排队数（``/health`` 返回的 ``queued``）
+选路策略：
+    - ``least``：在途请求最少（相同时取 EWMA 更低）的节点；
+    - ``p2c``  ：随机取两个节点，选负载评分更低的一个（节点多时避免所有请求同时涌向同一节点）。
+每个节点一个熔断器（``app.services.resilience.CircuitBreaker``）：连续失败 ``eject_after`` 次的节点被摘除，
+摘除时间按次数指数退避；摘除到期或后台健康检查通过后进入半开状态，下一个请求成功即重新加入。
+所有节点都不可用时抛出 ``CircuitOpenError``，不再向已经故障的节点施压。
+"""
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+import httpx
+
+from app.services.resilience import CircuitBreaker, CircuitOpenError, is_failure
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("least", "p2c")
+
+
+class Endpoint:
+    def __init__(self, url: str, breaker: CircuitBreaker, initial_latency: float = 1.0):
+        self.url = url.rstrip("/")
+        self.breaker = breaker
+        self.in_flight = 0
+        self.ewma_latency = initial_latency
+        self.reported_queue = 0
+        self.healthy = True
+        self.requests = 0
+        self.failures = 0
+
+    def available(self) -> bool:
+        return self.healthy and self.breaker.allows()
+
+    def score(self) -> float:
+        """负载评分：(在途 + 服务端排队 + 1) × 平均延迟，越小越好"""
+        return (self.in_flight + self.reported_queue + 1) * self.ewma_latency
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "breaker": self.breaker.state,
+            "in_flight": self.in_flight,
+            "reported_queue": self.reported_queue,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 1),
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class LoadBalancer:
+    def __init__(
+        self,
+        name: str,
+        urls: Iterable[str],
+        strategy: str = "least",
+        health_path: str = "/health",
+        probe_interval: float = 5.0,
+        probe_timeout: float = 2.0,
+        eject_after: int = 3,
+        eject_base_seconds: float = 5.0,
+        eject_max_seconds: float = 120.0,
+        ewma_alpha: float = 0.3,
+    ):
+        """
+        Args:
+            name: 日志标签（如 ``TTS-CJG``）
+            urls: 节点根地址列表
+            strategy: ``least``（最少在途请求）或 ``p2c``（二选一）
+            eject_after: 连续失败多少次后摘除节点
+            eject_base_seconds: 首次摘除时长，之后每次翻倍，最长 ``eject_max_seconds``
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown strategy: {strategy}, expected one of {STRATEGIES}")
+        seen = []
+        for url in urls:
+            url = url.strip().rstrip("/")
+            if url and url not in seen:
+                seen.append(url)
+        if not seen:
+            raise ValueError(f"[{name}] 未配置任何节点")
+        self.name = name
+        self.endpoints = [
+            Endpoint(url, CircuitBreaker(f"{name}:{url}", eject_after, eject_base_seconds, eject_max_seconds))
+            for url in seen
+        ]
+        self.strategy = strategy
+        self.health_path = health_path
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.ewma_alpha = ewma_alpha
+        self._probe_task: Optional[asyncio.Task] = None
+        self._rng = random.Random()
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    @property
+    def primary(self) -> Endpoint:
+        """第一个节点：有状态的接口（声音档案、说话人索引）固定发往这里"""
+        return self.endpoints[0]
+
+    # ------------------------------
+    # 选路
+    # ------------------------------
+    def pick(self, exclude: Iterable[str] = ()) -> Endpoint:
+        """
+        选择一个节点；``exclude`` 为本次请求已用过的节点（重试、对冲时尽量换节点，没有其他可用节点时仍可复用）
+        Raises:
+            CircuitOpenError: 所有节点都不可用
+        """
+        self._ensure_probing()
+        available = [ep for ep in self.endpoints if ep.available()]
+        if not available:
+            raise CircuitOpenError(f"[{self.name}] 所有节点均不可用")
+        excluded = set(exclude)
+        candidates = [ep for ep in available if ep.url not in excluded] or available
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.strategy == "p2c":
+            a, b = self._rng.sample(candidates, 2)
+            return a if a.score() <= b.score() else b
+        return min(candidates, key=lambda ep: (ep.in_flight + ep.reported_queue, ep.ewma_latency))
+
+    def has_alternative(self, exclude: Iterable[str] = ()) -> bool:
+        """除 ``exclude`` 外是否还有可用节点（``pick`` 在没有其他节点时会复用已用过的节点）"""
+        excluded = set(exclude)
+        return any(ep.available() and ep.url not in excluded for ep in self.endpoints)
+
+    @asynccontextmanager
+    async def endpoint(self, exclude: Iterable[str] = ()):
+        """
+        选择节点并记录在途请求与延迟，用法::
+
+            async with balancer.endpoint() as ep:
+                resp = await client.post(f"{ep.url}/tts", ...)
+                resp.raise_for_status()
+        """
+        ep = self.pick(exclude)
+        ep.in_flight += 1
+        ep.requests += 1
+        start = time.monotonic()
+        try:
+            yield ep
+        except BaseException as e:
+            if is_failure(e):
+                self.record_failure(ep, e)
+            raise
+        else:
+            self.record_success(ep, time.monotonic() - start)
+        finally:
+            ep.in_flight -= 1
+
+    def record_success(self, ep: Endpoint, latency: float) -> None:
+        ep.ewma_latency = (1 - self.ewma_alpha) * ep.ewma_latency + self.ewma_alpha * latency
+        ep.breaker.record_success()
+
+    def record_failure(self, ep: Endpoint, exc: BaseException) -> None:
+        ep.failures += 1
+        ep.breaker.record_failure(exc)
+
+    # ------------------------------
+    # 健康检查
+    # ------------------------------
+    def _ensure_probing(self) -> None:
+        """单节点无需探测；多节点时在首次选路时启动后台健康检查"""
+        if len(self.endpoints) < 2 or self.probe_interval <= 0:
+            return
+        if self._probe_task is not None and not self._probe_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._probe_task = loop.create_task(self._probe_loop())
+        logger.info("[%s] 启动健康检查: %d 个节点, 间隔 %.1fs, 策略 %s",
+                    self.name, len(self.endpoints), self.probe_interval, self.strategy)
+
+    async def _probe_loop(self) -> None:
+        async with httpx.AsyncClient(timeout=self.probe_timeout) as client:
+            while True:
+                await asyncio.gather(*[self._probe(client, ep) for ep in self.endpoints])
+                await asyncio.sleep(self.probe_interval)
+
+    async def _probe(self, client: httpx.AsyncClient, ep: Endpoint) -> None:
+        try:
+            resp = await client.get(f"{ep.url}{self.health_path}")
+            resp.raise_for_status()
+            data = resp.json() if resp.headers.get("content-type", "").startswith("application/json") else {}
+        except Exception as e:
+            if ep.healthy:
+                logger.warning("[%s] 健康检查失败，标记为不可用: %s, %s", self.name, ep.url, e)
+            ep.healthy = False
+            return
+        queued = data.get("queued") if isinstance(data, dict) else None
+        ep.reported_queue = sum(queued.values()) if isinstance(queued, dict) else 0
+        if not ep.healthy:
+            logger.info("[%s] 健康检查通过，节点重新加入: %s", self.name, ep.url)
+        ep.healthy = True
+        if ep.breaker.state == CircuitBreaker.OPEN:
+            ep.breaker.allow_trial()
+
+    async def close(self) -> None:
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._probe_task = None
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [ep.snapshot() for ep in self.endpoints]
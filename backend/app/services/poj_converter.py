@@ -0,0 +1,292 @@
+"""
+汉字 → POJ 白话字的确定性转换：绝大多数 TTS 请求无需再经过 LLM
+
+- 词表：``settings.minnan_poj_lexicon_path``（``phrases`` 词语读音 + ``chars`` 单字兜底读音），
+  另把 ``settings.minnan_lexicon_path`` 中闽南语词的普通话释义（如“睡觉”→“困觉”）作为别名挂到同一读音上；
+- 切分：按标点分句，句内在前缀树上做最长匹配，词内音节用 '-' 连接，句间用空格分隔（与原 LLM 提示词的输出格式一致）；
+- 未登录片段（OOV）：连续的无读音汉字合并成一个片段，所有片段一次性交给 LLM 转写，结果写入有界 LRU，
+  下次遇到同一片段不再调用 LLM；LLM 不可用时丢弃这些片段，只要还有可读内容就继续合成；
+- 分句转换结果带 LRU 缓存，重复文本直接命中。
+返回值附带覆盖率（词表直接给出读音的汉字占比）与来源（lexicon / lexicon+llm），便于观察 LLM 回退的比例。
+"""
+import json
+import logging
+import re
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from app.core.config import settings
+from app.core.exceptions import LLMServiceError
+
+logger = logging.getLogger(__name__)
+
+_CLAUSE_SPLIT_RE = re.compile(r"[\s，。！？；：、,.!?;:…—～~“”\"'‘’（）()《》【】\[\]·｜|]+")
+_HAN_RE = re.compile(r"[㐀-鿿]")
+_MEANING_SPLIT_RE = re.compile(r"[、，,/；;]")
+
+
+def _is_han(ch: str) -> bool:
+    return bool(_HAN_RE.match(ch))
+
+
+class PojResult(NamedTuple):
+    poj_text: str
+    coverage: float  # 由词表直接给出读音的汉字占比
+    oov_spans: List[str]  # 词表未覆盖的汉字片段（去重，按出现顺序）
+    source: str  # "lexicon" / "lexicon+llm"
+
+
+class _Trie:
+    __slots__ = ("root", "max_len")
+
+    def __init__(self):
+        self.root: Dict[str, Any] = {}
+        self.max_len = 0
+
+    def insert(self, word: str, reading: str) -> None:
+        node = self.root
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = reading
+        self.max_len = max(self.max_len, len(word))
+
+    def longest(self, text: str, start: int) -> Tuple[int, Optional[str]]:
+        """返回从 ``start`` 起最长匹配的 (长度, 读音)，无匹配时为 (0, None)"""
+        node, best_len, best = self.root, 0, None
+        for i in range(start, len(text)):
+            node = node.get(text[i])
+            if node is None:
+                break
+            if "" in node:
+                best_len, best = i - start + 1, node[""]
+        return best_len, best
+
+
+class PojConverter:
+    def __init__(self, poj_lexicon_path: str, minnan_lexicon_path: Optional[str] = None,
+                 cache_size: int = 2048, learned_size: int = 4096):
+        """
+        Args:
+            poj_lexicon_path: POJ 词表 JSON 路径（``phrases`` / ``chars``）
+            minnan_lexicon_path: 闽南语词汇表路径，其普通话释义作为词语别名
+            cache_size: 分句转换结果的 LRU 容量
+            learned_size: LLM 转写过的 OOV 片段的 LRU 容量
+        """
+        self.poj_lexicon_path = Path(poj_lexicon_path)
+        self.minnan_lexicon_path = Path(minnan_lexicon_path) if minnan_lexicon_path else None
+        self.cache_size = cache_size
+        self.learned_size = learned_size
+        self._learned: "OrderedDict[str, str]" = OrderedDict()
+        self._requests = 0
+        self._llm_calls = 0
+        self._llm_failures = 0
+        self._chars_total = 0
+        self._chars_covered = 0
+        self.reload()
+
+    # ---------------- 词表 ----------------
+    def reload(self) -> int:
+        """重新加载词表并清空分句缓存，返回词语数"""
+        trie = _Trie()
+        try:
+            data = json.loads(self.poj_lexicon_path.read_text(encoding="utf-8"))
+        except Exception as e:
+            logger.warning(f"[POJ] 加载 POJ 词表失败: {e}")
+            data = {}
+        phrases: Dict[str, str] = data.get("phrases", {})
+        chars: Dict[str, str] = data.get("chars", {})
+        for word, reading in phrases.items():
+            trie.insert(word, reading)
+
+        aliases, unread = 0, []
+        if self.minnan_lexicon_path:
+            try:
+                lexicon = json.loads(self.minnan_lexicon_path.read_text(encoding="utf-8"))
+            except Exception as e:
+                logger.warning(f"[POJ] 加载闽南语词汇表失败: {e}")
+                lexicon = {}
+            for words in lexicon.values():
+                for word, meaning in words.items():
+                    reading = phrases.get(word)
+                    if reading is None:
+                        unread.append(word)
+                        continue
+                    for alias in _MEANING_SPLIT_RE.split(meaning):
+                        alias = alias.strip()
+                        if len(alias) >= 2 and alias not in phrases and trie.longest(alias, 0)[0] != len(alias):
+                            trie.insert(alias, reading)
+                            aliases += 1
+
+        self._trie, self._chars = trie, chars
+        self._convert_clause = lru_cache(maxsize=self.cache_size)(self._convert_clause_uncached)
+        logger.info("[POJ] 已加载 %d 个词语、%d 个单字读音、%d 个释义别名", len(phrases), len(chars), aliases)
+        if unread:
+            logger.info("[POJ] 闽南语词汇表中 %d 个词缺少 POJ 读音: %s", len(unread), "、".join(unread[:10]))
+        return len(phrases)
+
+    # ---------------- 切分 ----------------
+    def _convert_clause_uncached(self, clause: str) -> Tuple[Tuple[Tuple[str, bool], ...], int, int]:
+        """
+        单句最长匹配。
+
+        Returns:
+            (片段序列, 汉字数, 已覆盖汉字数)；片段为 (文本, 是否 OOV)，非 OOV 片段已是 POJ
+        """
+        pieces: List[Tuple[str, bool]] = []
+        han_total = han_covered = 0
+        i, n = 0, len(clause)
+        while i < n:
+            length, reading = self._trie.longest(clause, i)
+            if length:
+                pieces.append((reading, False))
+                han_total += length
+                han_covered += length
+                i += length
+                continue
+            ch = clause[i]
+            if ch in self._chars:
+                pieces.append((self._chars[ch], False))
+                han_total += _is_han(ch)
+                han_covered += _is_han(ch)
+                i += 1
+            elif _is_han(ch):
+                j = i + 1
+                while j < n and _is_han(clause[j]) and clause[j] not in self._chars \
+                        and not self._trie.longest(clause, j)[0]:
+                    j += 1
+                pieces.append((clause[i:j], True))
+                han_total += j - i
+                i = j
+            else:
+                # 拉丁字母 / 已有 POJ 等非汉字内容原样保留
+                j = i + 1
+                while j < n and not _is_han(clause[j]) and clause[j] not in self._chars:
+                    j += 1
+                pieces.append((clause[i:j], False))
+                i = j
+        return tuple(pieces), han_total, han_covered
+
+    def _split(self, text: str) -> List[str]:
+        text = unicodedata.normalize("NFKC", text or "")
+        return [c for c in _CLAUSE_SPLIT_RE.split(text) if c]
+
+    def segment(self, text: str) -> Tuple[List[Tuple[Tuple[str, bool], ...]], int, int]:
+        clauses, total, covered = [], 0, 0
+        for clause in self._split(text):
+            pieces, han_total, han_covered = self._convert_clause(clause)
+            clauses.append(pieces)
+            total += han_total
+            covered += han_covered
+        return clauses, total, covered
+
+    # ---------------- LLM 回退 ----------------
+    def _remember(self, span: str, reading: str) -> None:
+        self._learned[span] = reading
+        self._learned.move_to_end(span)
+        while len(self._learned) > self.learned_size:
+            self._learned.popitem(last=False)
+
+    async def _transliterate(self, spans: List[str]) -> Dict[str, str]:
+        """一次 LLM 调用转写所有 OOV 片段；失败时返回空字典"""
+        from app.services import llm_service
+
+        sys_prompt = (
+            "你是闽南语 POJ 白话字助手。"
+            "任务：把 JSON 数组中的每个汉字词语转写为闽南语 POJ 白话字，音节之间用 '-' 连接。"
+            "严格输出 JSON，格式如下：{\"POJ\": [\"与输入一一对应的 POJ\"]}，数组长度必须与输入相同。"
+            "只输出 JSON，不要包含任何其他文字。"
+            "示例：输入 [\"食饭\", \"厦门\"] 输出 {\"POJ\": [\"chia̍h-pn̄g\", \"Ē-mn̂g\"]}"
+        )
+        self._llm_calls += 1
+        try:
+            llm_out = await llm_service.chat_messages([
+                {"role": "system", "content": sys_prompt},
+                {"role": "user", "content": json.dumps(spans, ensure_ascii=False)},
+            ])
+            readings = json.loads(llm_out.get("text", "")).get("POJ", [])
+        except Exception as e:
+            self._llm_failures += 1
+            logger.warning(f"[POJ] LLM 转写 OOV 片段失败: {e}")
+            return {}
+        if not isinstance(readings, list) or len(readings) != len(spans):
+            self._llm_failures += 1
+            logger.warning(f"[POJ] LLM 返回数量不符: 期望 {len(spans)}，实际 {readings!r}")
+            return {}
+        result = {}
+        for span, reading in zip(spans, readings):
+            reading = str(reading).strip()
+            if reading:
+                result[span] = reading
+                self._remember(span, reading)
+        return result
+
+    # ---------------- 对外接口 ----------------
+    async def to_poj(self, text: str, *, llm_fallback: Optional[bool] = None) -> PojResult:
+        """
+        将汉字文本转换为 POJ。
+
+        Raises:
+            LLMServiceError: 文本中没有任何可读内容（全部 OOV 且 LLM 回退失败或被关闭）
+        """
+        if llm_fallback is None:
+            llm_fallback = settings.poj_llm_fallback
+        self._requests += 1
+        clauses, total, covered = self.segment(text)
+        self._chars_total += total
+        self._chars_covered += covered
+
+        oov: List[str] = []
+        for pieces in clauses:
+            for piece, is_oov in pieces:
+                if is_oov and piece not in self._learned and piece not in oov:
+                    oov.append(piece)
+        fresh = await self._transliterate(oov) if oov and llm_fallback else {}
+
+        parts, used_llm = [], False
+        for pieces in clauses:
+            syllables = []
+            for piece, is_oov in pieces:
+                if not is_oov:
+                    syllables.append(piece)
+                    continue
+                reading = fresh.get(piece) or self._learned.get(piece)
+                if reading:
+                    self._learned.move_to_end(piece)
+                    syllables.append(reading)
+                    used_llm = True
+            if syllables:
+                parts.append("-".join(syllables))
+
+        poj_text = " ".join(parts)
+        if not poj_text.strip():
+            raise LLMServiceError("文本无法转换为 POJ：词表未覆盖且 LLM 转写失败")
+        coverage = covered / total if total else 1.0
+        spans = [piece for pieces in clauses for piece, is_oov in pieces if is_oov]
+        return PojResult(
+            poj_text=poj_text,
+            coverage=round(coverage, 4),
+            oov_spans=list(dict.fromkeys(spans)),
+            source="lexicon+llm" if used_llm else "lexicon",
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        info = self._convert_clause.cache_info()
+        return {
+            "requests": self._requests,
+            "llm_calls": self._llm_calls,
+            "llm_failures": self._llm_failures,
+            "llm_call_rate": round(self._llm_calls / self._requests, 4) if self._requests else 0.0,
+            "coverage": round(self._chars_covered / self._chars_total, 4) if self._chars_total else 1.0,
+            "clause_cache": {"hits": info.hits, "misses": info.misses, "size": info.currsize},
+            "learned_spans": len(self._learned),
+        }
+
+
+poj_converter = PojConverter(
+    poj_lexicon_path=settings.minnan_poj_lexicon_path,
+    minnan_lexicon_path=settings.minnan_lexicon_path,
+    cache_size=settings.poj_cache_size,
+)
@@ -0,0 +1,258 @@
+"""
+模型服务客户端的统一容错层：错误分类 + 熔断 + 抖动退避重试 + 重试预算 + 截止时间透传
+
+- 错误分类：
+    * ``is_failure``   ：说明节点有问题（连接失败、超时、429、5xx），计入熔断器；
+    * ``is_retryable`` ：请求大概率没有被处理、换个时机或节点可能成功（连接失败、连接池超时、429、502/503/504）。
+      读超时与 4xx 不重试：前者说明服务端正在处理（重试只会让过载的服务雪上加霜），后者是请求本身的问题。
+- ``CircuitBreaker``：连续失败 ``failure_threshold`` 次后熔断，熔断时长按次数指数增长；
+  到期后进入半开状态放行请求，成功则恢复、失败则再次熔断。
+- ``RetryBudget``：每个请求积累 ``ratio`` 个重试令牌，重试消耗 1 个，服务整体故障时重试量不超过正常流量的 ``ratio``。
+- ``Resilience.retry``：在预算和截止时间内按全抖动指数退避重试；``Resilience.guard`` 为单个节点记录熔断状态。
+"""
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+import openai
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 剩余时间预算（毫秒）请求头，与优先级调度共用
+TIMEOUT_HEADER = "X-Deadline-Ms"
+
+RETRYABLE_STATUS = (429, 502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+    """节点处于熔断状态，请求未发出"""
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code
+    return None
+
+
+def is_failure(exc: BaseException) -> bool:
+    """节点故障：传输错误（含超时，不含本地连接池排队超时）、429、5xx"""
+    status = _status_code(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(exc, httpx.PoolTimeout):
+        return False
+    return isinstance(exc, (httpx.TransportError, openai.APIConnectionError, OSError))
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """请求大概率未被处理、可以重试的错误"""
+    status = _status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    if isinstance(exc, openai.APITimeoutError):
+        return False
+    return isinstance(exc, openai.APIConnectionError)
+
+
+def backoff_delay(attempt: int, base: float = 0.2, cap: float = 2.0) -> float:
+    """全抖动指数退避：[0, min(cap, base × 2^(attempt-1))] 内均匀取值"""
+    return random.uniform(0.0, min(cap, base * (2 ** (attempt - 1))))
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """距 ``time.monotonic()`` 截止时间的剩余秒数（不小于 0），None 表示不限"""
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.0)
+
+
+def attempt_timeout(default: float, deadline: Optional[float]) -> float:
+    """单次请求超时：默认超时与剩余时间取小"""
+    left = remaining(deadline)
+    return default if left is None else min(default, left)
+
+
+def timeout_headers(deadline: Optional[float]) -> Dict[str, str]:
+    """把剩余时间透传给下游服务（毫秒，避免跨机器时钟偏差）"""
+    left = remaining(deadline)
+    return {} if left is None else {TIMEOUT_HEADER: str(int(left * 1000))}
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 5.0,
+                 max_recovery_timeout: float = 120.0):
+        """
+        Args:
+            failure_threshold: 连续失败多少次后熔断
+            recovery_timeout: 首次熔断时长（秒），之后每次连续熔断翻倍，最长 ``max_recovery_timeout``
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.max_recovery_timeout = max_recovery_timeout
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+
+    @property
+    def state(self) -> str:
+        if self.consecutive_failures < self.failure_threshold:
+            return self.CLOSED
+        return self.OPEN if time.monotonic() < self.open_until else self.HALF_OPEN
+
+    def allows(self) -> bool:
+        """关闭或半开（熔断到期）时放行"""
+        return self.state != self.OPEN
+
+    def record_success(self) -> None:
+        if self.consecutive_failures >= self.failure_threshold:
+            logger.info("[BREAKER] %s 恢复", self.name)
+        self.reset()
+
+    def record_failure(self, exc: Optional[BaseException] = None) -> None:
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold and time.monotonic() >= self.open_until:
+            duration = min(self.recovery_timeout * (2 ** self.trips), self.max_recovery_timeout)
+            self.trips += 1
+            self.open_until = time.monotonic() + duration
+            logger.warning("[BREAKER] %s 连续失败 %d 次，熔断 %.1fs, 最近错误: %s",
+                           self.name, self.consecutive_failures, duration, exc)
+
+    def allow_trial(self) -> None:
+        """提前结束熔断、进入半开状态（如健康检查已通过），由下一个请求决定是否恢复"""
+        self.open_until = 0.0
+
+    def reset(self) -> None:
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.consecutive_failures, "trips": self.trips}
+
+
+class RetryBudget:
+    def __init__(self, ratio: float = 0.2, min_tokens: float = 3.0, max_tokens: float = 20.0):
+        """
+        Args:
+            ratio: 每个请求积累的重试令牌
+            min_tokens: 初始令牌（低流量时也允许少量重试）
+            max_tokens: 令牌上限
+        """
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = min_tokens
+
+    def deposit(self) -> None:
+        self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        return True
+
+
+class Resilience:
+    def __init__(
+        self,
+        name: str,
+        max_attempts: int = 3,
+        base_delay: float = 0.2,
+        max_delay: float = 2.0,
+        budget_ratio: float = 0.2,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 5.0,
+    ):
+        """
+        Args:
+            name: 日志标签（如 ``ASR``、``LLM``）
+            max_attempts: 最多尝试次数（含首次）
+            base_delay / max_delay: 退避基数与上限（秒）
+            budget_ratio: 重试预算比例（见 ``RetryBudget``）
+            failure_threshold / recovery_timeout: 每个节点熔断器的参数
+        """
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = RetryBudget(budget_ratio)
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.retries = 0
+        self.budget_exhausted = 0
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        if key not in self._breakers:
+            self._breakers[key] = CircuitBreaker(f"{self.name}:{key}", self.failure_threshold, self.recovery_timeout)
+        return self._breakers[key]
+
+    @asynccontextmanager
+    async def guard(self, key: str):
+        """
+        按节点熔断：熔断中直接抛出 ``CircuitOpenError``；请求结果计入熔断器。用法::
+
+            async with resilience.guard(url):
+                resp = await client.post(url, ...)
+                resp.raise_for_status()
+        """
+        breaker = self.breaker(key)
+        if not breaker.allows():
+            raise CircuitOpenError(f"[{self.name}] {key} 熔断中")
+        try:
+            yield breaker
+        except BaseException as e:
+            if is_failure(e):
+                breaker.record_failure(e)
+            raise
+        else:
+            breaker.record_success()
+
+    async def retry(self, fn: Callable[[int], Awaitable[T]], *, deadline: Optional[float] = None) -> T:
+        """
+        调用 ``fn(attempt)``（attempt 从 1 开始），可重试的错误在预算和截止时间内退避后重试，
+        其余错误与最后一次的错误原样抛出。
+        """
+        self.budget.deposit()
+        attempt = 1
+        while True:
+            try:
+                return await fn(attempt)
+            except Exception as e:
+                if attempt >= self.max_attempts or not is_retryable(e):
+                    raise
+                delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                left = remaining(deadline)
+                if left is not None and left <= delay:
+                    logger.warning("[%s] attempt=%d failed, 剩余时间 %.2fs 不足以重试: %s", self.name, attempt, left, e)
+                    raise
+                if not self.budget.withdraw():
+                    self.budget_exhausted += 1
+                    logger.warning("[%s] attempt=%d failed, 重试预算耗尽，不再重试: %s", self.name, attempt, e)
+                    raise
+                self.retries += 1
+                logger.warning("[%s] attempt=%d failed, %.2fs 后重试: %s", self.name, attempt, delay, e)
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "retries": self.retries,
+            "budget_exhausted": self.budget_exhausted,
+            "breakers": {key: b.snapshot() for key, b in self._breakers.items()},
+        }
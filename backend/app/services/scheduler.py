@@ -0,0 +1,109 @@
+"""
+TTS 请求的优先级 + 截止时间调度（后端客户端层）
+
+所有陈嘉庚TTS调用共用一个连接池，连接池排队是先来先服务的。``PriorityGate`` 在连接池之前限制并发，
+名额空出时按 (优先级, 截止时间, 到达顺序) 分配给等待者，使实时对话的首个片段总是先于批量合成发出。
+优先级与剩余时间预算同时通过请求头透传给模型服务，由其线程池按同样的规则排队。
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Dict, List, Optional, Tuple
+
+PRIORITY_HEADER = "X-Priority"
+DEADLINE_HEADER = "X-Deadline-Ms"
+
+
+class Priority(IntEnum):
+    INTERACTIVE_FIRST = 0  # 实时对话的首个音频片段
+    INTERACTIVE = 1        # 实时对话的后续片段、单次合成
+    BULK = 2               # 批量合成、音色克隆批处理
+
+    @property
+    def header_value(self) -> str:
+        return self.name.lower().replace("_", "-")
+
+
+class DeadlineExceeded(Exception):
+    """请求在截止时间前未能发出"""
+
+
+def deadline_after(seconds: Optional[float]) -> Optional[float]:
+    """剩余时间（秒）转换为 ``time.monotonic()`` 时钟上的截止时间"""
+    if seconds is None:
+        return None
+    return time.monotonic() + seconds
+
+
+def schedule_headers(priority: Priority, deadline: Optional[float] = None) -> Dict[str, str]:
+    """透传给模型服务的调度请求头：优先级名称与剩余时间预算（毫秒，避免跨机器时钟偏差）"""
+    headers = {PRIORITY_HEADER: priority.header_value}
+    if deadline is not None:
+        headers[DEADLINE_HEADER] = str(max(int((deadline - time.monotonic()) * 1000), 0))
+    return headers
+
+
+class PriorityGate:
+    def __init__(self, max_concurrency: int):
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be >= 1, got {max_concurrency}")
+        self.max_concurrency = max_concurrency
+        self._active = 0
+        self._waiters: List[Tuple[int, float, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for *_, fut in self._waiters if not fut.done())
+
+    async def acquire(self, priority: Priority, deadline: Optional[float] = None) -> None:
+        """
+        获取一个并发名额；截止时间前未获取到时抛出 ``DeadlineExceeded``
+        """
+        if deadline is not None and time.monotonic() >= deadline:
+            raise DeadlineExceeded(f"Deadline exceeded before dispatch (priority={priority.name})")
+        # 有存活的等待者时名额必然已满（release 总是先把名额交给等待者），这里无需再检查队列
+        if self._active < self.max_concurrency:
+            self._active += 1
+            return
+        timeout = None if deadline is None else deadline - time.monotonic()
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (
+            int(priority),
+            deadline if deadline is not None else float("inf"),
+            next(self._counter),
+            fut,
+        ))
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                # 名额已分配但等待方已放弃，转给下一个等待者
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                raise DeadlineExceeded(f"Deadline exceeded before dispatch (priority={priority.name})") from None
+            raise
+
+    def release(self) -> None:
+        self._active -= 1
+        while self._waiters:
+            fut = heapq.heappop(self._waiters)[-1]
+            if not fut.done():
+                self._active += 1
+                fut.set_result(None)
+                return
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority, deadline: Optional[float] = None):
+        await self.acquire(priority, deadline)
+        try:
+            yield
+        finally:
+            self.release()
@@ -0,0 +1,188 @@
+"""
+在途请求合并（single-flight）：相同的 LLM 请求同时到达时只向上游发出一次
+
+参观团高峰时多台终端常在一秒内提出同一个开场问题（历史为空、系统提示词相同），消息列表完全一致。
+``SingleFlight`` 以「消息列表 + 模型参数」的哈希为键：
+
+- 非流式：第一个请求（leader）发起调用，其余请求等待同一个 Task，结果各自拿到一份浅拷贝；
+- 流式：leader 的生成器在后台 Task 中被消费，每个块追加到广播缓冲区，
+  订阅者先按顺序重放已产生的块，再跟随后续块，晚加入者看到的块序列与 leader 完全相同；
+- 请求结束（成功、失败或取消）即移出在途表，不做结果缓存，之后的相同请求会重新调用；
+- 所有等待者都放弃（取消 / 断开）时取消上游调用，不白白消耗配额。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def request_key(messages: List[Dict[str, Any]], **params: Any) -> str:
+    """消息列表（只取 role / content）与模型参数的稳定哈希"""
+    payload = {
+        "messages": [[m.get("role"), m.get("content")] for m in messages],
+        "params": params,
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _copy(value: Any) -> Any:
+    return dict(value) if isinstance(value, dict) else value
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _Broadcast:
+    """流式广播：缓存已产生的块供晚加入者重放，新块到达时唤醒所有订阅者"""
+
+    __slots__ = ("chunks", "done", "error", "subscribers", "task", "_changed")
+
+    def __init__(self):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def publish(self, chunk: Any) -> None:
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.done, self.error = True, error
+        self._notify()
+
+    async def subscribe(self) -> AsyncGenerator[Any, None]:
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield _copy(self.chunks[index])
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self._leaders = 0
+        self._coalesced = 0
+        self._stream_leaders = 0
+        self._stream_coalesced = 0
+        self._late_joiners = 0
+        self._replayed_chunks = 0
+        self._upstream_cancelled = 0
+        self._max_fanout = 0
+
+    # ---------------- 非流式 ----------------
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.get_running_loop().create_task(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _t, k=key, c=call: self._forget_call(k, c))
+            self._leaders += 1
+        else:
+            self._coalesced += 1
+            logger.info("[SINGLE-FLIGHT][%s] 合并相同请求（在途等待者 %d）", self.name, call.waiters + 1)
+        call.waiters += 1
+        self._max_fanout = max(self._max_fanout, call.waiters)
+        try:
+            return _copy(await asyncio.shield(call.task))
+        except asyncio.CancelledError:
+            if not call.task.done() and call.waiters == 1:
+                # 最后一个等待者也放弃了：取消上游调用，并立即移出在途表，之后的相同请求重新发起
+                self._calls.pop(key, None)
+                call.task.cancel()
+                self._upstream_cancelled += 1
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget_call(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.task.cancelled():
+            call.task.exception()  # 避免无人等待时出现 "exception was never retrieved"
+
+    # ---------------- 流式 ----------------
+    async def stream(self, key: str, fn: Callable[[], AsyncGenerator[Any, None]]) -> AsyncGenerator[Any, None]:
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            broadcast.task = asyncio.get_running_loop().create_task(self._pump(key, broadcast, fn))
+            self._stream_leaders += 1
+        else:
+            self._stream_coalesced += 1
+            if broadcast.chunks:
+                self._late_joiners += 1
+                self._replayed_chunks += len(broadcast.chunks)
+            logger.info("[SINGLE-FLIGHT][%s] 合并相同流式请求（订阅者 %d，重放 %d 块）",
+                        self.name, broadcast.subscribers + 1, len(broadcast.chunks))
+        broadcast.subscribers += 1
+        self._max_fanout = max(self._max_fanout, broadcast.subscribers)
+        try:
+            async for chunk in broadcast.subscribe():
+                yield chunk
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.done and broadcast.task is not None:
+                # 所有订阅者都已断开：停止上游生成，不再占用连接与配额
+                if self._streams.get(key) is broadcast:
+                    del self._streams[key]
+                broadcast.task.cancel()
+                self._upstream_cancelled += 1
+
+    async def _pump(self, key: str, broadcast: _Broadcast, fn: Callable[[], AsyncGenerator[Any, None]]) -> None:
+        error: Optional[BaseException] = None
+        try:
+            async for chunk in fn():
+                broadcast.publish(chunk)
+        except asyncio.CancelledError as e:
+            error = e
+            raise
+        except Exception as e:
+            logger.exception("[SINGLE-FLIGHT][%s] 上游流式调用失败", self.name)
+            error = e
+        finally:
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+            broadcast.finish(error)
+
+    def metrics(self) -> Dict[str, Any]:
+        total = self._leaders + self._coalesced
+        stream_total = self._stream_leaders + self._stream_coalesced
+        return {
+            "in_flight": len(self._calls),
+            "streams_in_flight": len(self._streams),
+            "leaders": self._leaders,
+            "coalesced": self._coalesced,
+            "coalesce_rate": round(self._coalesced / total, 4) if total else 0.0,
+            "stream_leaders": self._stream_leaders,
+            "stream_coalesced": self._stream_coalesced,
+            "stream_coalesce_rate": round(self._stream_coalesced / stream_total, 4) if stream_total else 0.0,
+            "late_joiners": self._late_joiners,
+            "replayed_chunks": self._replayed_chunks,
+            "upstream_cancelled": self._upstream_cancelled,
+            "max_fanout": self._max_fanout,
+        }
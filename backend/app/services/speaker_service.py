@@ -0,0 +1,68 @@
+from typing import Any, Dict, List, Tuple
+import time
+import logging
+from app.core.config import settings
+from app.core.exceptions import TTSServiceError
+from app.services.tts_service import _get_cjg_client
+
+logger = logging.getLogger(__name__)
+
+# 说话人向量服务部署在陈嘉庚TTS服务中（ECAPA-TDNN，CPU 推理），复用其全局HTTP客户端
+
+UploadItem = Tuple[str, bytes]
+
+
+async def _post_files(path: str, files: List[UploadItem], data: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    if not settings.tts_cjg_service_url:
+        raise TTSServiceError("陈嘉庚TTS服务未配置 (tts_cjg_service_url 为空)")
+
+    client = _get_cjg_client()
+    start_ts = time.monotonic()
+    try:
+        resp = await client.post(
+            f"{settings.tts_cjg_service_url}{path}",
+            files=[("files", (name, contents)) for name, contents in files],
+            data=data,
+            headers={"Authorization": f"Bearer {settings.provider_api_key}"} if settings.provider_api_key else {},
+        )
+        resp.raise_for_status()
+        js = resp.json()
+    except Exception as e:
+        logger.exception("[SPEAKER] 请求 %s 失败: %s", path, e)
+        raise TTSServiceError(f"说话人向量服务调用失败: {str(e)}")
+
+    if "error" in js:
+        raise TTSServiceError(f"说话人向量服务返回错误: {js['error']}")
+    logger.info("[SPEAKER] %s files=%d in %.1fms", path, len(files), (time.monotonic() - start_ts) * 1000)
+    return js
+
+
+async def embed(files: List[UploadItem]) -> Dict[str, Any]:
+    """
+    批量提取说话人向量。
+    返回值：{"dim": int, "embeddings": [[float]], "durations": [float]}
+    """
+    return await _post_files("/speaker/embed", files)
+
+
+async def similarity_matrix(files: List[UploadItem]) -> Dict[str, Any]:
+    """
+    多段音频两两之间的说话人余弦相似度。
+    返回值：{"matrix": [[float]], "durations": [float]}
+    """
+    return await _post_files("/speaker/similarity", files)
+
+
+async def search(files: List[UploadItem], k: int = 5) -> List[List[Dict[str, Any]]]:
+    """
+    在说话人索引中检索最接近的已存声音。
+    返回值：每段音频一个 [{"id": str, "score": float}] 列表
+    """
+    js = await _post_files("/speaker/search", files, data={"k": str(k)})
+    return js.get("matches", [])
+
+
+async def enroll(files: List[UploadItem], ids: List[str]) -> int:
+    """把音频的说话人向量写入索引，返回索引中的声音总数"""
+    js = await _post_files("/speaker/enroll", files, data={"ids": ids})
+    return int(js.get("count", 0))
@@ -1,11 +1,17 @@
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
+import base64
 import time
 import logging
 import asyncio
 import httpx
+from starlette.status import HTTP_504_GATEWAY_TIMEOUT
 from app.core.config import settings
 from app.core.exceptions import TTSServiceError
-from app.services.audio_utils import convert_format, concatenate_audio_segments
+from app.services.audio_utils import convert_format, concatenate_audio_segments, fix_streamed_wav_header
+from app.services.hedging import HedgePolicy
+from app.services.load_balancer import LoadBalancer
+from app.services.resilience import Resilience
+from app.services.scheduler import DeadlineExceeded, Priority, PriorityGate, schedule_headers
 
 logger = logging.getLogger(__name__)
 
@@ -15,34 +21,109 @@ logger = logging.getLogger(__name__)
 _cjg_client: Optional[httpx.AsyncClient] = None
 _minnan_client: Optional[httpx.AsyncClient] = None
 
+# 请求 ID 头：陈嘉庚TTS服务按请求 ID 取消推理
+REQUEST_ID_HEADER = "X-Request-ID"
+# 后台取消任务的引用（避免任务未完成就被回收）
+_background_tasks: set = set()
+# 陈嘉庚TTS请求的优先级闸门（实时对话首个片段优先于批量合成）
+_cjg_gate: Optional[PriorityGate] = None
+# 多节点负载均衡（无状态的合成接口在节点间分摊；声音档案、说话人索引等有状态接口固定使用 tts_cjg_service_url）
+_cjg_balancer: Optional[LoadBalancer] = None
+_minnan_balancer: Optional[LoadBalancer] = None
+# 陈嘉庚TTS片段请求的对冲策略（延迟按字数归一化）
+_cjg_hedge: Optional[HedgePolicy] = None
+# 重试策略：只重试连接失败、429、502/503/504，带抖动退避和全局重试预算（节点熔断由负载均衡器负责）
+_cjg_resilience = Resilience("TTS-CJG")
+_minnan_resilience = Resilience("TTS-MINNAN")
+
+
+def _service_urls(urls: str, single_url: str) -> List[str]:
+    return [u.strip() for u in (urls or "").split(",") if u.strip()] or [single_url]
+
+
+def _get_cjg_balancer() -> LoadBalancer:
+    """获取或创建陈嘉庚TTS服务的多节点负载均衡器"""
+    global _cjg_balancer
+    if _cjg_balancer is None:
+        _cjg_balancer = LoadBalancer(
+            "TTS-CJG",
+            _service_urls(settings.tts_cjg_service_urls, settings.tts_cjg_service_url),
+            strategy=settings.tts_load_balance_strategy,
+            probe_interval=settings.tts_health_probe_interval,
+        )
+        logger.info("[TTS] 陈嘉庚TTS节点: %s", [ep.url for ep in _cjg_balancer.endpoints])
+    return _cjg_balancer
+
+
+def _get_minnan_balancer() -> LoadBalancer:
+    """获取或创建闽南语TTS服务的多节点负载均衡器"""
+    global _minnan_balancer
+    if _minnan_balancer is None:
+        _minnan_balancer = LoadBalancer(
+            "TTS-MINNAN",
+            _service_urls(settings.tts_minnan_service_urls, settings.tts_minnan_service_url),
+            strategy=settings.tts_load_balance_strategy,
+            probe_interval=settings.tts_health_probe_interval,
+        )
+        logger.info("[TTS] 闽南语TTS节点: %s", [ep.url for ep in _minnan_balancer.endpoints])
+    return _minnan_balancer
+
+
+def _get_cjg_hedge() -> HedgePolicy:
+    """获取或创建陈嘉庚TTS片段请求的对冲策略"""
+    global _cjg_hedge
+    if _cjg_hedge is None:
+        _cjg_hedge = HedgePolicy(
+            "TTS-CJG-HEDGE",
+            percentile=settings.tts_hedge_percentile,
+            budget=settings.tts_hedge_budget,
+            min_delay=settings.tts_hedge_min_delay,
+        )
+    return _cjg_hedge
+
 
 def _get_cjg_client() -> httpx.AsyncClient:
-    """获取或创建陈嘉庚TTS服务的全局HTTP客户端"""
+    """获取或创建陈嘉庚TTS服务的全局HTTP客户端（连接数上限按节点数放大）"""
     global _cjg_client
     if _cjg_client is None:
+        nodes = len(_get_cjg_balancer())
         _cjg_client = httpx.AsyncClient(
             timeout=settings.model_request_timeout,
-            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            limits=httpx.Limits(max_connections=20 * nodes, max_keepalive_connections=10 * nodes),
         )
         logger.info("[TTS] 创建全局HTTP客户端连接池 (CJG)")
     return _cjg_client
 
 
+def _get_cjg_gate() -> PriorityGate:
+    """获取或创建陈嘉庚TTS请求的优先级闸门"""
+    global _cjg_gate
+    if _cjg_gate is None:
+        limit = settings.tts_cjg_max_concurrency * len(_get_cjg_balancer())
+        _cjg_gate = PriorityGate(limit)
+        logger.info("[TTS] 创建优先级闸门 (CJG), 并发上限=%d", limit)
+    return _cjg_gate
+
+
 def _get_minnan_client() -> httpx.AsyncClient:
     """获取或创建闽南语TTS服务的全局HTTP客户端"""
     global _minnan_client
     if _minnan_client is None:
+        nodes = len(_get_minnan_balancer())
         _minnan_client = httpx.AsyncClient(
             timeout=settings.model_request_timeout,
-            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            limits=httpx.Limits(max_connections=20 * nodes, max_keepalive_connections=10 * nodes),
         )
         logger.info("[TTS] 创建全局HTTP客户端连接池 (MINNAN)")
     return _minnan_client
 
 
 async def _close_clients():
-    """关闭全局HTTP客户端（用于应用关闭时清理资源）"""
+    """关闭全局HTTP客户端及负载均衡健康检查（用于应用关闭时清理资源）"""
     global _cjg_client, _minnan_client
+    for balancer in (_cjg_balancer, _minnan_balancer):
+        if balancer is not None:
+            await balancer.close()
     if _cjg_client:
         await _cjg_client.aclose()
         _cjg_client = None
@@ -52,6 +133,69 @@ async def _close_clients():
         _minnan_client = None
         logger.info("[TTS] 关闭全局HTTP客户端 (MINNAN)")
 
+
+def backend_status() -> Dict[str, Any]:
+    """各 TTS 节点的健康状态与负载（仅包含已创建的负载均衡器），以及对冲与重试统计"""
+    status: Dict[str, Any] = {
+        balancer.name: balancer.snapshot()
+        for balancer in (_cjg_balancer, _minnan_balancer)
+        if balancer is not None
+    }
+    if _cjg_hedge is not None:
+        status[_cjg_hedge.name] = _cjg_hedge.metrics()
+    for resilience in (_cjg_resilience, _minnan_resilience):
+        status[f"{resilience.name}-RETRY"] = resilience.snapshot()
+    return status
+
+def _cjg_headers(
+    request_id: Optional[str] = None,
+    priority: Optional[Priority] = None,
+    deadline: Optional[float] = None,
+) -> Dict[str, str]:
+    headers = {"Authorization": f"Bearer {settings.provider_api_key}"} if settings.provider_api_key else {}
+    if request_id:
+        headers[REQUEST_ID_HEADER] = request_id
+    if priority is not None:
+        headers.update(schedule_headers(priority, deadline))
+    return headers
+
+
+def _schedule_of(kwargs: Dict[str, Any], default: Priority) -> Tuple[Priority, Optional[float]]:
+    """从调用参数中取 (优先级, 截止时间)：priority 为 Priority，deadline 为 time.monotonic() 时钟上的时间点"""
+    return Priority(kwargs.get("priority", default)), kwargs.get("deadline")
+
+
+def _deadline_error(tag: str, priority: Priority, e: Exception) -> TTSServiceError:
+    logger.warning("[%s] 请求排队超过截止时间，已放弃: priority=%s, %s", tag, priority.name, e)
+    return TTSServiceError(f"TTS 请求超过截止时间: {e}", status_code=HTTP_504_GATEWAY_TIMEOUT)
+
+
+async def cancel_cjg_request(request_id: str) -> None:
+    """
+    通知陈嘉庚TTS服务取消该请求 ID 下正在推理和排队中的片段（尽力而为，失败只记录日志）。
+    同一请求的片段可能分散在多个节点上，取消通知发往所有节点。
+    """
+    if not settings.tts_cjg_service_url or not request_id:
+        return
+
+    async def _cancel(url: str) -> None:
+        try:
+            resp = await _get_cjg_client().post(f"{url}/cancel/{request_id}", headers=_cjg_headers(), timeout=5.0)
+            resp.raise_for_status()
+            logger.info("[TTS-CJG] 已取消请求: %s @ %s", request_id, url)
+        except Exception as e:
+            logger.warning("[TTS-CJG] 取消请求失败: %s @ %s, %s", request_id, url, e)
+
+    await asyncio.gather(*[_cancel(ep.url) for ep in _get_cjg_balancer().endpoints])
+
+
+def cancel_cjg_request_in_background(request_id: str) -> None:
+    """在后台发送取消通知，可在已被取消的协程中调用（不 await）"""
+    task = asyncio.get_running_loop().create_task(cancel_cjg_request(request_id))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
 def _maybe_convert_audio(raw_audio: bytes, source_format: str, target_format: str) -> bytes:
     """
     占位：根据目标格式进行音频转封装/转码。
@@ -80,53 +224,59 @@ async def synthesize_minnan(
     if not settings.tts_minnan_service_url:
         raise TTSServiceError("闽南语TTS服务未配置 (tts_minnan_service_url 为空)")
 
-    last_exc: Exception | None = None
     # 使用全局HTTP客户端（优先级3优化）
     client = _get_minnan_client()
-    
-    for attempt in range(1, 4):
-        try:
-            start_ts = time.monotonic()
-            payload = {
-                "text": text,
-                "target_language": target_language,
-                "speaking_rate": speaking_rate,
-                "audio_format": audio_format,
-            }
-            logger.debug("[TTS-MINNAN] 请求: url=%s payload={len(text)=%d, target_language=%s, speaking_rate=%s, audio_format=%s}",
-                         f"{settings.tts_minnan_service_url}/tts", len(text or ""), target_language, str(speaking_rate), audio_format)
+    balancer = _get_minnan_balancer()
+    # 用过的节点，重试时优先换节点
+    used_urls: List[str] = []
+    payload = {
+        "text": text,
+        "target_language": target_language,
+        "speaking_rate": speaking_rate,
+        "audio_format": audio_format,
+    }
+
+    async def _attempt(attempt: int) -> Tuple[httpx.Response, str]:
+        async with balancer.endpoint(exclude=used_urls) as ep:
+            used_urls.append(ep.url)
+            logger.debug("[TTS-MINNAN] attempt=%d 请求: url=%s payload={len(text)=%d, target_language=%s, speaking_rate=%s, audio_format=%s}",
+                         attempt, f"{ep.url}/tts", len(text or ""), target_language, str(speaking_rate), audio_format)
             resp = await client.post(
-                f"{settings.tts_minnan_service_url}/tts",
+                f"{ep.url}/tts",
                 json=payload,
                 headers={"Authorization": f"Bearer {settings.provider_api_key}"} if settings.provider_api_key else {},
             )
             resp.raise_for_status()
+            return resp, ep.url
 
-            logger.debug("[TTS-MINNAN] 响应: status=%s content-type=%s length=%d", resp.status_code, resp.headers.get("content-type"), len(resp.content or b""))
-            if resp.headers.get("content-type", "").startswith("audio/"):
-                dur = (time.monotonic() - start_ts) * 1000
-                logger.info("[TTS-MINNAN] attempt=%d success: %d bytes in %.1fms", attempt, len(resp.content), dur)
-                # 假设服务默认返回 wav，如需其他格式则转换
-                if audio_format and audio_format.lower() != "wav":
-                    out_bytes = convert_format(resp.content, "wav", audio_format)
-                    # 检查转换是否成功（通过字节数变化判断）
-                    if len(out_bytes) != len(resp.content):
-                        logger.info("[TTS-MINNAN] 格式转换成功: wav -> %s", audio_format)
-                        return {"binary": out_bytes, "content_type": f"audio/{audio_format}"}
-                    else:
-                        logger.warning("[TTS-MINNAN] 格式转换失败，返回原始 wav 格式")
-                        return {"binary": resp.content, "content_type": "audio/wav"}
-                else:
-                    return {"binary": resp.content, "content_type": "audio/wav"}
-
-            logger.warning("[TTS-MINNAN] attempt=%d unexpected response: %s", attempt, resp.headers.get("content-type"))
-            return {"raw": resp.text}
+    start_ts = time.monotonic()
+    try:
+        resp, node_url = await _minnan_resilience.retry(_attempt)
+    except Exception as e:
+        logger.warning("[TTS-MINNAN] 请求失败 (%s): %s", ",".join(used_urls), e)
+        raise TTSServiceError(f"闽南语TTS服务调用失败: {e}")
 
-        except Exception as e:
-            last_exc = e
-            logger.warning("[TTS-MINNAN] attempt=%d failed: %s", attempt, e)
+    logger.debug("[TTS-MINNAN] 响应: status=%s content-type=%s length=%d", resp.status_code, resp.headers.get("content-type"), len(resp.content or b""))
+    if resp.headers.get("content-type", "").startswith("audio/"):
+        dur = (time.monotonic() - start_ts) * 1000
+        logger.info("[TTS-MINNAN] success (%s): %d bytes in %.1fms", node_url, len(resp.content), dur)
+        # 服务端流式输出 WAV，接收完整后修正头部长度字段
+        wav_bytes = fix_streamed_wav_header(resp.content)
+        # 假设服务默认返回 wav，如需其他格式则转换
+        if audio_format and audio_format.lower() != "wav":
+            out_bytes = convert_format(wav_bytes, "wav", audio_format)
+            # 检查转换是否成功（通过字节数变化判断）
+            if len(out_bytes) != len(wav_bytes):
+                logger.info("[TTS-MINNAN] 格式转换成功: wav -> %s", audio_format)
+                return {"binary": out_bytes, "content_type": f"audio/{audio_format}"}
+            else:
+                logger.warning("[TTS-MINNAN] 格式转换失败，返回原始 wav 格式")
+                return {"binary": wav_bytes, "content_type": "audio/wav"}
+        else:
+            return {"binary": wav_bytes, "content_type": "audio/wav"}
 
-    raise TTSServiceError(f"闽南语TTS服务重试失败: {last_exc}")
+    logger.warning("[TTS-MINNAN] unexpected response: %s", resp.headers.get("content-type"))
+    return {"raw": resp.text}
 
 
 async def synthesize(
@@ -145,7 +295,8 @@ async def synthesize(
         target_language: 目标语言，默认为"cjg"（陈嘉庚），支持"minnan"（闽南语）
         speaking_rate: 语速
         audio_format: 音频格式
-        **kwargs: 其他参数，传递给具体的TTS服务
+        **kwargs: 其他参数，传递给具体的TTS服务（request_id: 透传给陈嘉庚TTS服务，用于取消；
+            priority / deadline: 陈嘉庚TTS调度优先级与截止时间，见 app.services.scheduler）
     """
     logger.info("[TTS] 开始合成语音: language=%s, text_len=%d", target_language, len(text or ""))
     
@@ -168,67 +319,89 @@ async def synthesize_cjg(
 ) -> Dict[str, Any]:
     """
     调用陈嘉庚TTS服务将文本转为语音。
+    交互式请求超过近期延迟分位数仍未返回时，向另一个节点发出对冲请求，取先返回的一份。
     返回值：{"binary": bytes, "content_type": "audio/wav"}
     """
     if not settings.tts_cjg_service_url:
         raise TTSServiceError("陈嘉庚TTS服务未配置 (tts_cjg_service_url 为空)")
 
-    last_exc: Exception | None = None
     # 使用全局HTTP客户端（优先级3优化）
     client = _get_cjg_client()
-    
-    for attempt in range(1, 4):
-        try:
-            start_ts = time.monotonic()
-            payload = {
-                "text": text,
-                "speaker": speaker,
-                "do_sample": kwargs.get("do_sample", True),
-                "top_p": kwargs.get("top_p", 0.8),
-                "top_k": kwargs.get("top_k", 30),
-                "temperature": kwargs.get("temperature", 1.0),
-                "length_penalty": kwargs.get("length_penalty", 0.0),
-                "num_beams": kwargs.get("num_beams", 3),
-                "repetition_penalty": kwargs.get("repetition_penalty", 10.0),
-                "max_mel_tokens": kwargs.get("max_mel_tokens", 600),
-                "max_text_tokens_per_sentence": kwargs.get("max_text_tokens_per_sentence", 120),
-                "sentences_bucket_max_size": kwargs.get("sentences_bucket_max_size", 4),
-                "infer_mode": kwargs.get("infer_mode", "普通推理"),
-            }
-            logger.debug("[TTS-CJG] 请求: url=%s payload={len(text)=%d, speaker=%s, speaking_rate=%s, audio_format=%s}",
-                         f"{settings.tts_cjg_service_url}/tts", len(text or ""), speaker, str(speaking_rate), audio_format)
-            resp = await client.post(
-                f"{settings.tts_cjg_service_url}/tts",
-                json=payload,
-                headers={"Authorization": f"Bearer {settings.provider_api_key}"} if settings.provider_api_key else {},
-            )
-            resp.raise_for_status()
+    balancer = _get_cjg_balancer()
+    hedge = _get_cjg_hedge()
+    priority, deadline = _schedule_of(kwargs, Priority.INTERACTIVE)
+    # 只有多节点时对冲才有意义（对冲请求发往另一个节点）；批量任务不追求尾延迟，不对冲
+    hedging = settings.tts_hedge_enabled and len(balancer) > 1 and priority <= Priority.INTERACTIVE
+    # 用过的节点（主请求 + 对冲请求），重试时优先换节点
+    used_urls: List[str] = []
+    payload = {
+        "text": text,
+        "speaker": speaker,
+        "do_sample": kwargs.get("do_sample", True),
+        "top_p": kwargs.get("top_p", 0.8),
+        "top_k": kwargs.get("top_k", 30),
+        "temperature": kwargs.get("temperature", 1.0),
+        "length_penalty": kwargs.get("length_penalty", 0.0),
+        "num_beams": kwargs.get("num_beams", 3),
+        "repetition_penalty": kwargs.get("repetition_penalty", 10.0),
+        "max_mel_tokens": kwargs.get("max_mel_tokens", 600),
+        "max_text_tokens_per_sentence": kwargs.get("max_text_tokens_per_sentence", 120),
+        "sentences_bucket_max_size": kwargs.get("sentences_bucket_max_size", 4),
+        "max_batch_tokens": kwargs.get("max_batch_tokens"),
+        "infer_mode": kwargs.get("infer_mode", "普通推理"),
+    }
+
+    async def _send(is_hedge: bool) -> Tuple[httpx.Response, str]:
+        async with _get_cjg_gate().slot(priority, deadline):
+            # 对冲请求避开主请求所在节点。对冲与主请求共用 X-Request-ID：后端 /cancel 能同时停止两份，
+            # 而输掉的一方断开连接时，TTS 节点只取消该连接自己的推理，不会波及同一回答的其他片段
+            async with balancer.endpoint(exclude=used_urls) as ep:
+                used_urls.append(ep.url)
+                logger.debug("[TTS-CJG] 请求: url=%s hedge=%s payload={len(text)=%d, speaker=%s, speaking_rate=%s, audio_format=%s}",
+                             f"{ep.url}/tts", is_hedge, len(text or ""), speaker, str(speaking_rate), audio_format)
+                send_ts = time.monotonic()
+                resp = await client.post(
+                    f"{ep.url}/tts",
+                    json=payload,
+                    headers=_cjg_headers(kwargs.get("request_id"), priority, deadline),
+                )
+                resp.raise_for_status()
+                hedge.record(time.monotonic() - send_ts, len(text or ""))
+                return resp, ep.url
 
-            logger.debug("[TTS-CJG] 响应: status=%s content-type=%s length=%d", resp.status_code, resp.headers.get("content-type"), len(resp.content or b""))
-            if resp.headers.get("content-type", "").startswith("audio/"):
-                dur = (time.monotonic() - start_ts) * 1000
-                logger.info("[TTS-CJG] attempt=%d success: %d bytes in %.1fms", attempt, len(resp.content), dur)
-                # 假设服务默认返回 wav，如需其他格式则转换
-                if audio_format and audio_format.lower() != "wav":
-                    out_bytes = convert_format(resp.content, "wav", audio_format)
-                    # 检查转换是否成功（通过字节数变化判断）
-                    if len(out_bytes) != len(resp.content):
-                        logger.info("[TTS-CJG] 格式转换成功: wav -> %s", audio_format)
-                        return {"binary": out_bytes, "content_type": f"audio/{audio_format}"}
-                    else:
-                        logger.warning("[TTS-CJG] 格式转换失败，返回原始 wav 格式")
-                        return {"binary": resp.content, "content_type": "audio/wav"}
-                else:
-                    return {"binary": resp.content, "content_type": "audio/wav"}
-
-            logger.warning("[TTS-CJG] attempt=%d unexpected response: %s", attempt, resp.headers.get("content-type"))
-            return {"raw": resp.text}
+    async def _attempt(attempt: int) -> Tuple[httpx.Response, str]:
+        delay = hedge.delay_for(len(text or "")) if hedging else None
+        # 没有主请求以外的可用节点时不对冲（否则对冲会落回同一节点，只增加负载）
+        return await hedge.run(_send, delay, can_hedge=lambda: balancer.has_alternative(used_urls[-1:]))
 
-        except Exception as e:
-            last_exc = e
-            logger.warning("[TTS-CJG] attempt=%d failed: %s", attempt, e)
+    start_ts = time.monotonic()
+    try:
+        resp, node_url = await _cjg_resilience.retry(_attempt, deadline=deadline)
+    except DeadlineExceeded as e:
+        raise _deadline_error("TTS-CJG", priority, e)
+    except Exception as e:
+        logger.warning("[TTS-CJG] 请求失败 (%s): %s", ",".join(used_urls), e)
+        raise TTSServiceError(f"陈嘉庚TTS服务调用失败: {e}")
+
+    logger.debug("[TTS-CJG] 响应: status=%s content-type=%s length=%d", resp.status_code, resp.headers.get("content-type"), len(resp.content or b""))
+    if resp.headers.get("content-type", "").startswith("audio/"):
+        dur = (time.monotonic() - start_ts) * 1000
+        logger.info("[TTS-CJG] success (%s): %d bytes in %.1fms", node_url, len(resp.content), dur)
+        # 假设服务默认返回 wav，如需其他格式则转换
+        if audio_format and audio_format.lower() != "wav":
+            out_bytes = convert_format(resp.content, "wav", audio_format)
+            # 检查转换是否成功（通过字节数变化判断）
+            if len(out_bytes) != len(resp.content):
+                logger.info("[TTS-CJG] 格式转换成功: wav -> %s", audio_format)
+                return {"binary": out_bytes, "content_type": f"audio/{audio_format}"}
+            else:
+                logger.warning("[TTS-CJG] 格式转换失败，返回原始 wav 格式")
+                return {"binary": resp.content, "content_type": "audio/wav"}
+        else:
+            return {"binary": resp.content, "content_type": "audio/wav"}
 
-    raise TTSServiceError(f"陈嘉庚TTS服务重试失败: {last_exc}")
+    logger.warning("[TTS-CJG] unexpected response: %s", resp.headers.get("content-type"))
+    return {"raw": resp.text}
 
 
 async def synthesize_cjg_batch_client(
@@ -241,7 +414,8 @@ async def synthesize_cjg_batch_client(
     """
     批处理调用陈嘉庚TTS服务（客户端并发方式）
     在客户端切分文本后并发发起多个请求，然后合并音频。
-    用于 pause_format 模式，可以真正利用多 GPU/多 Worker 进行并行处理。
+    用于 pause_format 模式，可以真正利用多 GPU/多 Worker 进行并行处理；
+    配置了多个节点时，各片段由负载均衡器按在途请求数分散到不同机器上。
     
     参数与 synthesize_cjg 完全一致，便于替换使用。
     返回值：{"binary": bytes, "content_type": "audio/wav"}
@@ -353,7 +527,7 @@ async def synthesize_cjg_batch_server(
     if not text_segments:
         raise TTSServiceError("文本内容为空，无法合成音频")
     
-    # 如果只有一个片段，直接调用单次接口
+    # 如果只有一个片段，直接调用单次接口（未指定优先级时仍按批量任务调度）
     if len(text_segments) == 1:
         logger.info("[TTS-CJG-BATCH-SERVER] 只有一个片段，使用单次接口")
         return await synthesize_cjg(
@@ -361,7 +535,7 @@ async def synthesize_cjg_batch_server(
             speaker=speaker,
             speaking_rate=speaking_rate,
             audio_format=audio_format,
-            **kwargs
+            **{"priority": Priority.BULK, **kwargs}
         )
     
     logger.info("[TTS-CJG-BATCH-SERVER] 开始批处理合成: %d 个片段（服务端批处理接口）", len(text_segments))
@@ -369,59 +543,144 @@ async def synthesize_cjg_batch_server(
     
     # 使用全局HTTP客户端（优先级3优化）
     client = _get_cjg_client()
-    
-    last_exc: Exception | None = None
-    for attempt in range(1, 4):
-        try:
-            # 调用服务端的批处理接口
-            payload = {
-                "segments": text_segments,
-                "speaker": speaker,
-                "do_sample": kwargs.get("do_sample", True),
-                "top_p": kwargs.get("top_p", 0.8),
-                "top_k": kwargs.get("top_k", 30),
-                "temperature": kwargs.get("temperature", 1.0),
-                "length_penalty": kwargs.get("length_penalty", 0.0),
-                "num_beams": kwargs.get("num_beams", 3),
-                "repetition_penalty": kwargs.get("repetition_penalty", 10.0),
-                "max_mel_tokens": kwargs.get("max_mel_tokens", 600),
-                "max_text_tokens_per_sentence": kwargs.get("max_text_tokens_per_sentence", 120),
-                "sentences_bucket_max_size": kwargs.get("sentences_bucket_max_size", 4),
-                "infer_mode": kwargs.get("infer_mode", "普通推理"),
-            }
-            
-            logger.debug("[TTS-CJG-BATCH-SERVER] 请求批处理接口: url=%s/batch segments=%d", 
-                        settings.tts_cjg_service_url, len(text_segments))
-            
+    balancer = _get_cjg_balancer()
+    priority, deadline = _schedule_of(kwargs, Priority.BULK)
+    used_urls: List[str] = []
+    # 调用服务端的批处理接口
+    payload = {
+        "segments": text_segments,
+        "speaker": speaker,
+        "do_sample": kwargs.get("do_sample", True),
+        "top_p": kwargs.get("top_p", 0.8),
+        "top_k": kwargs.get("top_k", 30),
+        "temperature": kwargs.get("temperature", 1.0),
+        "length_penalty": kwargs.get("length_penalty", 0.0),
+        "num_beams": kwargs.get("num_beams", 3),
+        "repetition_penalty": kwargs.get("repetition_penalty", 10.0),
+        "max_mel_tokens": kwargs.get("max_mel_tokens", 600),
+        "max_text_tokens_per_sentence": kwargs.get("max_text_tokens_per_sentence", 120),
+        "sentences_bucket_max_size": kwargs.get("sentences_bucket_max_size", 4),
+        "max_batch_tokens": kwargs.get("max_batch_tokens"),
+        "infer_mode": kwargs.get("infer_mode", "普通推理"),
+    }
+
+    async def _attempt(attempt: int) -> httpx.Response:
+        async with _get_cjg_gate().slot(priority, deadline):
+            async with balancer.endpoint(exclude=used_urls) as ep:
+                used_urls.append(ep.url)
+                logger.debug("[TTS-CJG-BATCH-SERVER] attempt=%d 请求批处理接口: url=%s/tts/batch segments=%d",
+                             attempt, ep.url, len(text_segments))
+                resp = await client.post(
+                    f"{ep.url}/tts/batch",
+                    json=payload,
+                    headers=_cjg_headers(kwargs.get("request_id"), priority, deadline),
+                )
+                resp.raise_for_status()
+                return resp
+
+    try:
+        resp = await _cjg_resilience.retry(_attempt, deadline=deadline)
+    except DeadlineExceeded as e:
+        raise _deadline_error("TTS-CJG-BATCH-SERVER", priority, e)
+    except Exception as e:
+        logger.warning("[TTS-CJG-BATCH-SERVER] 请求失败 (%s): %s", ",".join(used_urls), e)
+        raise TTSServiceError(f"批处理TTS服务调用失败: {e}")
+
+    # 检查响应类型
+    content_type = resp.headers.get("content-type", "")
+    if content_type.startswith("audio/"):
+        elapsed_time = (time.monotonic() - start_time) * 1000
+        logger.info(
+            "[TTS-CJG-BATCH-SERVER] 批处理成功: %d 个片段 -> %d bytes, 耗时: %.1fms",
+            len(text_segments),
+            len(resp.content),
+            elapsed_time,
+        )
+        return {"binary": resp.content, "content_type": "audio/wav"}
+    # 可能是错误响应
+    logger.warning("[TTS-CJG-BATCH-SERVER] unexpected response: %s", content_type)
+    error_data = resp.json() if content_type.startswith("application/json") else {"error": resp.text}
+    raise TTSServiceError(f"批处理接口返回错误: {error_data.get('error', 'unknown error')}")
+
+
+async def create_voice_profile(audio_bytes: bytes) -> Dict[str, Any]:
+    """
+    上传参考音频到陈嘉庚TTS服务，生成（或复用）声音档案。
+    返回值：{"profile_id": str, "duration": float, "cached": bool}
+    """
+    if not settings.tts_cjg_service_url:
+        raise TTSServiceError("陈嘉庚TTS服务未配置 (tts_cjg_service_url 为空)")
+
+    client = _get_cjg_client()
+    start_ts = time.monotonic()
+    try:
+        resp = await client.post(
+            f"{settings.tts_cjg_service_url}/voice-profiles",
+            content=audio_bytes,
+            headers={"Content-Type": "application/octet-stream",
+                     **({"Authorization": f"Bearer {settings.provider_api_key}"} if settings.provider_api_key else {})},
+        )
+        resp.raise_for_status()
+        data = resp.json()
+    except Exception as e:
+        logger.exception("[TTS-CLONE] 声音档案创建请求失败: %s", e)
+        raise TTSServiceError(f"声音档案创建失败: {str(e)}")
+
+    if "error" in data:
+        raise TTSServiceError(f"声音档案创建失败: {data['error']}")
+    logger.info("[TTS-CLONE] 声音档案 %s (cached=%s) in %.1fms",
+                data.get("profile_id"), data.get("cached"), (time.monotonic() - start_ts) * 1000)
+    return data
+
+
+async def synthesize_clone(profile_id: str, texts: List[str], **kwargs) -> List[Dict[str, Any]]:
+    """
+    使用声音档案进行零样本音色克隆，多个文本在服务端一次批量推理。
+    默认按批量任务调度，交互式的单条克隆应传入 priority=Priority.INTERACTIVE。
+    返回值：与 texts 一一对应的 [{"binary": bytes, "similarity": float}]
+    """
+    if not settings.tts_cjg_service_url:
+        raise TTSServiceError("陈嘉庚TTS服务未配置 (tts_cjg_service_url 为空)")
+
+    client = _get_cjg_client()
+    payload = {
+        "profile_id": profile_id,
+        "texts": texts,
+        "do_sample": kwargs.get("do_sample", True),
+        "top_p": kwargs.get("top_p", 0.8),
+        "top_k": kwargs.get("top_k", 30),
+        "temperature": kwargs.get("temperature", 1.0),
+        "length_penalty": kwargs.get("length_penalty", 0.0),
+        "num_beams": kwargs.get("num_beams", 3),
+        "repetition_penalty": kwargs.get("repetition_penalty", 10.0),
+        "max_mel_tokens": kwargs.get("max_mel_tokens", 600),
+        "max_text_tokens_per_sentence": kwargs.get("max_text_tokens_per_sentence", 120),
+        "sentences_bucket_max_size": kwargs.get("sentences_bucket_max_size", 4),
+        "max_batch_tokens": kwargs.get("max_batch_tokens"),
+    }
+    priority, deadline = _schedule_of(kwargs, Priority.BULK)
+    start_ts = time.monotonic()
+    try:
+        async with _get_cjg_gate().slot(priority, deadline):
             resp = await client.post(
-                f"{settings.tts_cjg_service_url}/tts/batch",
+                f"{settings.tts_cjg_service_url}/tts/clone",
                 json=payload,
-                headers={"Authorization": f"Bearer {settings.provider_api_key}"} if settings.provider_api_key else {},
+                headers=_cjg_headers(kwargs.get("request_id"), priority, deadline),
             )
-            resp.raise_for_status()
-            
-            # 检查响应类型
-            content_type = resp.headers.get("content-type", "")
-            if content_type.startswith("audio/"):
-                elapsed_time = (time.monotonic() - start_time) * 1000
-                logger.info(
-                    "[TTS-CJG-BATCH-SERVER] 批处理成功: %d 个片段 -> %d bytes, 耗时: %.1fms",
-                    len(text_segments),
-                    len(resp.content),
-                    elapsed_time,
-                )
-                return {"binary": resp.content, "content_type": "audio/wav"}
-            else:
-                # 可能是错误响应
-                logger.warning("[TTS-CJG-BATCH-SERVER] attempt=%d unexpected response: %s", attempt, content_type)
-                error_data = resp.json() if resp.headers.get("content-type", "").startswith("application/json") else {"error": resp.text}
-                raise TTSServiceError(f"批处理接口返回错误: {error_data.get('error', 'unknown error')}")
-        
-        except Exception as e:
-            last_exc = e
-            logger.warning("[TTS-CJG-BATCH-SERVER] attempt=%d failed: %s", attempt, e)
-            if attempt < 3:
-                # 等待一小段时间再重试
-                await asyncio.sleep(0.5)
-    
-    raise TTSServiceError(f"批处理TTS服务重试失败: {last_exc}")
+        resp.raise_for_status()
+        data = resp.json()
+    except DeadlineExceeded as e:
+        raise _deadline_error("TTS-CLONE", priority, e)
+    except Exception as e:
+        logger.exception("[TTS-CLONE] 克隆合成请求失败: %s", e)
+        raise TTSServiceError(f"音色克隆服务调用失败: {str(e)}")
+
+    if "error" in data:
+        raise TTSServiceError(f"音色克隆失败: {data['error']}")
+    audios = [base64.b64decode(a) for a in data.get("audios", [])]
+    if len(audios) != len(texts):
+        raise TTSServiceError(f"音色克隆返回数量不匹配: {len(audios)} vs {len(texts)}")
+    similarities = data.get("similarities") or [0.0] * len(audios)
+    logger.info("[TTS-CLONE] profile=%s texts=%d -> %d bytes in %.1fms",
+                profile_id, len(texts), sum(len(a) for a in audios), (time.monotonic() - start_ts) * 1000)
+    return [{"binary": a, "similarity": float(sim)} for a, sim in zip(audios, similarities)]
@@ -47,9 +47,9 @@ interface SimilarityResult {
   audio2_filename: string
   basic_analysis: {
     overall_similarity: number
-    pitch_similarity: number
+    pitch_similarity: number | null
     timbre_similarity: number
-    rhythm_similarity: number
+    rhythm_similarity: number | null
     confidence: number
   }
   comprehensive_analysis?: any
@@ -61,11 +61,11 @@ interface VoiceFeatures {
   filename: string
   duration: number
   basic_features: {
-    fundamental_frequency: number
-    pitch_range: number
-    speaking_rate: number
-    volume_mean: number
-    volume_variance: number
+    fundamental_frequency: number | null
+    pitch_range: number | null
+    speaking_rate: number | null
+    volume_mean: number | null
+    volume_variance: number | null
   }
   voice_description: {
     gender_prediction: string
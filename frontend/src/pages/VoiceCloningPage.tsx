@@ -52,9 +52,9 @@ interface SimilarityResult {
   audio2_filename: string
   basic_analysis: {
     overall_similarity: number
-    pitch_similarity: number
+    pitch_similarity: number | null
     timbre_similarity: number
-    rhythm_similarity: number
+    rhythm_similarity: number | null
     confidence: number
   }
   comprehensive_analysis?: any
@@ -66,11 +66,11 @@ interface VoiceFeatures {
   filename: string
   duration: number
   basic_features: {
-    fundamental_frequency: number
-    pitch_range: number
-    speaking_rate: number
-    volume_mean: number
-    volume_variance: number
+    fundamental_frequency: number | null
+    pitch_range: number | null
+    speaking_rate: number | null
+    volume_mean: number | null
+    volume_variance: number | null
   }
   voice_description: {
     gender_prediction: string
@@ -757,7 +757,7 @@ const VoiceCloningPage: React.FC = () => {
                           <div>
                             <Text>音调相似度: </Text>
                             <Progress 
-                              percent={Math.round(similarityResult.basic_analysis.pitch_similarity * 100)} 
+                              percent={Math.round((similarityResult.basic_analysis.pitch_similarity ?? 0) * 100)} 
                               size="small"
                             />
                           </div>
@@ -771,7 +771,7 @@ const VoiceCloningPage: React.FC = () => {
                           <div>
                             <Text>节奏相似度: </Text>
                             <Progress 
-                              percent={Math.round(similarityResult.basic_analysis.rhythm_similarity * 100)} 
+                              percent={Math.round((similarityResult.basic_analysis.rhythm_similarity ?? 0) * 100)} 
                               size="small"
                             />
                           </div>
@@ -853,10 +853,10 @@ const VoiceCloningPage: React.FC = () => {
                       <div className="result-label">基础特征:</div>
                       <div className="result-content">
                         <Space direction="vertical" style={{ width: '100%' }}>
-                          <div>基频: {featureResult.basic_features.fundamental_frequency.toFixed(1)} Hz</div>
-                          <div>音调范围: {featureResult.basic_features.pitch_range.toFixed(1)}</div>
-                          <div>语速: {featureResult.basic_features.speaking_rate} 词/分钟</div>
-                          <div>平均音量: {(featureResult.basic_features.volume_mean * 100).toFixed(1)}%</div>
+                          <div>基频: {featureResult.basic_features.fundamental_frequency?.toFixed(1) ?? '-'} Hz</div>
+                          <div>音调范围: {featureResult.basic_features.pitch_range?.toFixed(1) ?? '-'}</div>
+                          <div>语速: {featureResult.basic_features.speaking_rate ?? '-'} 词/分钟</div>
+                          <div>平均音量: {featureResult.basic_features.volume_mean != null ? (featureResult.basic_features.volume_mean * 100).toFixed(1) : '-'}%</div>
                         </Space>
                       </div>
                     </div>
@@ -0,0 +1,200 @@
+"""
+数字嘉庚答案库离线合成
+
+读取 FAQ 答案库（backend/data/jiageng_answer_bank.json），用 IndexTTS 以陈嘉庚音色合成所有答案，
+输出到后端上传目录（默认 backend/uploads/answer_bank）：
+    - 每个答案按 '｜' 切分的片段音频 ``<id>_seg<k>.wav``（流式接口逐段返回）；
+    - 片段拼接（片段间插入短停顿）后的整段音频 ``<id>.wav``（非流式接口返回）；
+    - ``manifest.json``：答案文本、合成语速、各音频文件、时长与字幕时间轴，后端据此构建匹配器。
+
+所有待合成答案的片段一起交给 ``infer_fast`` 的批量模式，按长度分桶推理。
+可断点续跑：答案文本、音色、推理参数未变且音频文件齐全的条目直接跳过；每批完成后立即写入 manifest。
+
+用法（在仓库根目录，环境变量与 scripts/start-tts_cjg.sh 相同）：
+    bash scripts/build-answer-bank.sh
+    # 或
+    cd models/tts_service && PYTHONPATH=../../packages:../../backend \\
+        MODEL_DIR=ckpt/cjg AUDIO_PROMPT=speaker_audio/陈嘉庚.wav \\
+        python build_answer_bank.py --bank ../../backend/data/jiageng_answer_bank.json \\
+            --out ../../backend/uploads/answer_bank
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+import wave
+from typing import Any, Dict, List
+
+from indextts.infer import IndexTTS
+
+from app.services.subtitle_service import segment_text_to_subtitles
+
+# =============================
+#           配置区域
+# =============================
+
+MANIFEST_NAME = "manifest.json"
+SEGMENT_GAP_SECONDS = 0.15  # 整段音频中片段之间的停顿
+SPEAKING_SPEED = 1.0  # IndexTTS 按自然语速合成，答案库只服务 1.0 倍速请求
+
+
+def split_segments(answer: str) -> List[str]:
+    return [seg.strip() for seg in answer.split("｜") if seg.strip()]
+
+
+def entry_fingerprint(answer: str, speaker: str, params: Dict[str, Any]) -> str:
+    payload = json.dumps({"answer": answer, "speaker": speaker, "params": params}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    if os.path.isfile(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"version": 1, "entries": {}}
+
+
+def save_manifest(path: str, manifest: Dict[str, Any]) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def is_done(record: Dict[str, Any], fingerprint: str, out_dir: str) -> bool:
+    if not record or record.get("fingerprint") != fingerprint:
+        return False
+    files = [record["file"]] + [seg["file"] for seg in record["segments"]]
+    return all(os.path.isfile(os.path.join(out_dir, name)) for name in files)
+
+
+def wav_duration(path: str) -> float:
+    with wave.open(path, "rb") as w:
+        return w.getnframes() / float(w.getframerate())
+
+
+def concat_wavs(paths: List[str], out_path: str, gap_seconds: float) -> None:
+    """按顺序拼接同格式的 PCM wav，片段间插入静音"""
+    with wave.open(paths[0], "rb") as first:
+        params = first.getparams()
+    silence = b"\x00" * (int(params.framerate * gap_seconds) * params.sampwidth * params.nchannels)
+    with wave.open(out_path, "wb") as out:
+        out.setparams(params)
+        for i, path in enumerate(paths):
+            if i:
+                out.writeframes(silence)
+            with wave.open(path, "rb") as w:
+                out.writeframes(w.readframes(w.getnframes()))
+
+
+def build_record(entry: Dict[str, Any], segments: List[str], seg_files: List[str], out_dir: str,
+                 fingerprint: str) -> Dict[str, Any]:
+    seg_paths = [os.path.join(out_dir, name) for name in seg_files]
+    full_file = f"{entry['id']}.wav"
+    concat_wavs(seg_paths, os.path.join(out_dir, full_file), SEGMENT_GAP_SECONDS)
+
+    seg_records, full_subtitles, offset = [], [], 0.0
+    for text, name, path in zip(segments, seg_files, seg_paths):
+        duration = wav_duration(path)
+        subtitles = segment_text_to_subtitles(text, duration)
+        seg_records.append({"text": text, "file": name, "duration": round(duration, 3), "subtitles": subtitles})
+        full_subtitles.extend(
+            {**s, "start_time": round(s["start_time"] + offset, 3), "end_time": round(s["end_time"] + offset, 3)}
+            for s in subtitles
+        )
+        offset += duration + SEGMENT_GAP_SECONDS
+    return {
+        "fingerprint": fingerprint,
+        "answer": entry["answer"],
+        "speaking_speed": SPEAKING_SPEED,
+        "file": full_file,
+        "duration": round(wav_duration(os.path.join(out_dir, full_file)), 3),
+        "subtitles": full_subtitles,
+        "segments": seg_records,
+        "built_at": int(time.time()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数字嘉庚答案库离线合成")
+    parser.add_argument("--bank", type=str, default="../../backend/data/jiageng_answer_bank.json")
+    parser.add_argument("--out", type=str, default="../../backend/uploads/answer_bank")
+    parser.add_argument("--model_dir", type=str, default=os.getenv("MODEL_DIR", "ckpt/cjg"))
+    parser.add_argument("--audio_prompt", type=str, default=os.getenv("AUDIO_PROMPT", "speaker_audio/陈嘉庚.wav"))
+    parser.add_argument("--batch_entries", type=int, default=8, help="每批合成的答案数（每批完成后写入 manifest）")
+    parser.add_argument("--max_text_tokens_per_sentence", type=int, default=120)
+    parser.add_argument("--sentences_bucket_max_size", type=int, default=8)
+    parser.add_argument("--max_batch_tokens", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="忽略 manifest，全部重新合成")
+    args = parser.parse_args()
+
+    with open(args.bank, "r", encoding="utf-8") as f:
+        bank = json.load(f)
+    speaker = bank.get("speaker", "cjg")
+    os.makedirs(args.out, exist_ok=True)
+    manifest_path = os.path.join(args.out, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    manifest["speaker"] = speaker
+    manifest["speaking_speed"] = SPEAKING_SPEED
+
+    params = {
+        "max_text_tokens_per_sentence": args.max_text_tokens_per_sentence,
+        "sentences_bucket_max_size": args.sentences_bucket_max_size,
+        "speaking_speed": SPEAKING_SPEED,
+    }
+    bank_ids = {entry["id"] for entry in bank["entries"]}
+    for stale in set(manifest["entries"]) - bank_ids:
+        del manifest["entries"][stale]
+
+    pending = []
+    for entry in bank["entries"]:
+        fingerprint = entry_fingerprint(entry["answer"], speaker, params)
+        if not args.force and is_done(manifest["entries"].get(entry["id"]), fingerprint, args.out):
+            continue
+        pending.append((entry, fingerprint))
+    print(f">> 答案库共 {len(bank['entries'])} 条，待合成 {len(pending)} 条")
+    if not pending:
+        save_manifest(manifest_path, manifest)
+        return
+
+    snapshot_path = os.environ.get("TTS_SNAPSHOT", os.path.join(args.model_dir, "snapshot.safetensors"))
+    tts = IndexTTS(
+        model_dir=args.model_dir,
+        cfg_path=os.path.join(args.model_dir, "config.yaml"),
+        speaker_info_path=os.path.join(args.model_dir, "speaker_info.json"),
+        snapshot_path=snapshot_path if os.path.isfile(snapshot_path) else None,
+    )
+
+    start = time.perf_counter()
+    for i in range(0, len(pending), args.batch_entries):
+        batch = pending[i:i + args.batch_entries]
+        texts, outputs, layout = [], [], []
+        for entry, fingerprint in batch:
+            segments = split_segments(entry["answer"])
+            seg_files = [f"{entry['id']}_seg{k}.wav" for k in range(len(segments))]
+            texts.extend(segments)
+            outputs.extend(os.path.join(args.out, name) for name in seg_files)
+            layout.append((entry, fingerprint, segments, seg_files))
+
+        batch_start = time.perf_counter()
+        tts.infer_fast(
+            audio_prompt=args.audio_prompt,
+            text=texts,
+            output_path=outputs,
+            speaker_id=speaker,
+            max_text_tokens_per_sentence=args.max_text_tokens_per_sentence,
+            sentences_bucket_max_size=args.sentences_bucket_max_size,
+            max_batch_tokens=args.max_batch_tokens,
+        )
+        for entry, fingerprint, segments, seg_files in layout:
+            manifest["entries"][entry["id"]] = build_record(entry, segments, seg_files, args.out, fingerprint)
+        save_manifest(manifest_path, manifest)
+        print(f">> 第 {i // args.batch_entries + 1} 批完成：{len(batch)} 条答案 / {len(texts)} 个片段，"
+              f"耗时 {time.perf_counter() - batch_start:.1f}s")
+
+    print(f">> 全部完成，耗时 {time.perf_counter() - start:.1f}s，manifest: {manifest_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,18 +5,27 @@ import os
 import time
 import logging
 import io
+import base64
+import wave
 import asyncio
+import functools
 import uuid
 import tempfile
 import torch
 import torchaudio
-from concurrent.futures import ThreadPoolExecutor
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, File, Form, Request, UploadFile
 from fastapi.responses import FileResponse, Response
 from pydantic import BaseModel
-from typing import Optional, List, Union
+from typing import Optional, List, Tuple, Union
+
+import numpy as np
 
 from indextts.infer import IndexTTS
+from indextts.utils.cancellation import CancellationRegistry, CancellationToken, InferenceCancelled, validate_request_id
+from indextts.utils.scheduler import DeadlineExceeded, Priority, PriorityExecutor, deadline_after, parse_priority
+from indextts.utils.snapshot import process_memory_mb, read_snapshot_metadata, stage_snapshot
+from indextts.utils.speaker_index import SpeakerEmbedder, SpeakerIndex, cosine_similarity_matrix, load_audio
+from indextts.utils.voice_profile import VoiceProfileStore, speaker_similarity
 
 # ------------------------------
 # Worker 标识（用于区分不同的 worker 进程）
@@ -46,8 +55,24 @@ logger.info(f"[TTS-CJG] Worker 进程启动: PID={_process_id}, Worker={_worker_
 MODEL_DIR = os.environ.get("MODEL_DIR", "/root/data/MintaiDialect/models/tts_service/ckpt/cjg")
 CFG_PATH = os.path.join(MODEL_DIR, "config.yaml")
 SPEAKER_INFO_PATH = os.path.join(MODEL_DIR, "speaker_info.json")
+# 预构建的模型快照（python -m indextts.utils.snapshot 生成），存在时 mmap 加载以加快冷启动
+SNAPSHOT_PATH = os.environ.get("TTS_SNAPSHOT", os.path.join(MODEL_DIR, "snapshot.safetensors"))
+# 多 worker 共享权重：快照放入 /dev/shm，所有 worker 只读映射同一份物理内存（需快照存在）
+SHARE_WEIGHTS = os.environ.get("TTS_SHARE_WEIGHTS", "0").lower() in ("1", "true", "yes")
+# CPU 量化（仅 CPU 生效）：TTS_QUANTIZE=int8 对 GPT 做动态 int8 量化；TTS_BIGVGAN_BF16=1 时 BigVGAN 用 bf16
+QUANTIZE = os.environ.get("TTS_QUANTIZE") or None
+BIGVGAN_BF16 = os.environ.get("TTS_BIGVGAN_BF16", "0").lower() in ("1", "true", "yes")
+# 投机解码：草稿模型使用 GPT 前 N 层（0 关闭），仅对 num_beams=1 的请求生效
+SPECULATIVE_LAYERS = int(os.environ.get("TTS_SPECULATIVE_LAYERS", "0"))
+SPECULATIVE_K = int(os.environ.get("TTS_SPECULATIVE_K", "4"))
 OUTPUT_DIR = os.path.join(os.getcwd(), "outputs")
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+# 音色克隆的声音档案目录（.npz，所有 worker 共享），参考音频上传一次后按档案 ID 复用
+VOICE_PROFILE_DIR = os.environ.get("TTS_VOICE_PROFILE_DIR", os.path.join(os.getcwd(), "voice_profiles"))
+# 说话人向量索引目录（memmap + IVF，所有 worker 共享）
+SPEAKER_INDEX_DIR = os.environ.get("TTS_SPEAKER_INDEX_DIR", os.path.join(os.getcwd(), "speaker_index"))
+# 参考音频上传大小上限（字节）
+MAX_REFERENCE_BYTES = int(os.environ.get("TTS_MAX_REFERENCE_BYTES", str(20 * 1024 * 1024)))
 
 # ------------------------------
 # 临时文件目录配置（I/O 优化：优先使用 /dev/shm）
@@ -68,11 +93,33 @@ if not os.path.isfile(AUDIO_PROMPT):
 # ------------------------------
 # 初始化 TTS 模型
 # ------------------------------
+_load_start = time.perf_counter()
+_use_snapshot = bool(SNAPSHOT_PATH) and os.path.isfile(SNAPSHOT_PATH)
+if SHARE_WEIGHTS and _use_snapshot:
+    if torch.cuda.is_available():
+        # GPU 上权重会被 .to(device) 拷到显存，/dev/shm 中的副本只会白占主机内存
+        logger.warning("[TTS-CJG] GPU 节点上共享权重不起作用，已忽略 TTS_SHARE_WEIGHTS")
+        SHARE_WEIGHTS = False
+    elif read_snapshot_metadata(SNAPSHOT_PATH).get("is_fp16") == "1":
+        # fp16 快照在 CPU 上会被 .float() 转成私有拷贝，共享映射不起作用，不再占用 /dev/shm
+        logger.warning("[TTS-CJG] fp16 快照在 CPU 上无法共享权重，已忽略 TTS_SHARE_WEIGHTS（请用 --fp32 重新构建快照）")
+        SHARE_WEIGHTS = False
+if SHARE_WEIGHTS:
+    if _use_snapshot:
+        SNAPSHOT_PATH = stage_snapshot(SNAPSHOT_PATH)
+        logger.info(f"[TTS-CJG] 共享权重模式：映射快照 {SNAPSHOT_PATH}")
+    else:
+        logger.warning(f"[TTS-CJG] 已开启 TTS_SHARE_WEIGHTS 但快照不存在: {SNAPSHOT_PATH}，回退为每个 worker 独立加载")
 try:
     tts = IndexTTS(
         model_dir=MODEL_DIR,
         cfg_path=CFG_PATH,
-        speaker_info_path=SPEAKER_INFO_PATH
+        speaker_info_path=SPEAKER_INFO_PATH,
+        snapshot_path=SNAPSHOT_PATH if _use_snapshot else None,
+        quantize=QUANTIZE,
+        bigvgan_bf16=BIGVGAN_BF16,
+        speculative_draft_layers=SPECULATIVE_LAYERS,
+        num_speculative_tokens=SPECULATIVE_K,
     )
 except Exception as e:
     raise RuntimeError(f"[TTS-CJG] 模型加载失败，请检查 MODEL_DIR 是否正确: {MODEL_DIR}\n错误信息: {e}")
@@ -83,13 +130,43 @@ speaker_list = getattr(tts, "speaker_list", None)
 available_speakers = speaker_list if speaker_list else ["cjg"]
 logger.info(f"Multi-speaker support enabled with {len(available_speakers)} speakers: {available_speakers}")
 logger.info(f"Model directory: {MODEL_DIR}")
+logger.info(
+    f"[TTS-CJG] 模型加载完成，耗时 {time.perf_counter() - _load_start:.1f}s"
+    f"（{'快照: ' + SNAPSHOT_PATH if _use_snapshot else '原始 checkpoint'}）"
+)
+_mem = process_memory_mb()
+logger.info(
+    f"[TTS-CJG] 内存占用: RSS={_mem.get('rss', -1):.0f}MB, 私有={_mem.get('anon', -1):.0f}MB, "
+    f"共享映射={_mem.get('file', 0) + _mem.get('shmem', 0):.0f}MB"
+)
 logger.info(f"Audio prompt file: {AUDIO_PROMPT}")
 logger.info(f"Output directory: {OUTPUT_DIR}")
 
+voice_profiles = VoiceProfileStore(VOICE_PROFILE_DIR)
+logger.info(f"Voice profile directory: {VOICE_PROFILE_DIR}")
+
+# 说话人向量服务固定在 CPU 上运行，不占用推理设备
+speaker_embedder = SpeakerEmbedder.from_bigvgan(tts.bigvgan, device="cpu")
+speaker_index = SpeakerIndex(SPEAKER_INDEX_DIR, dim=speaker_embedder.dim)
+logger.info(f"Speaker index directory: {SPEAKER_INDEX_DIR} ({len(speaker_index)} voices)")
+
 # ------------------------------
-# 线程池执行器（用于并发推理）
+# 线程池执行器（用于并发推理）：按优先级 + 截止时间出队，实时对话首个片段优先于批量合成
 # ------------------------------
-executor = ThreadPoolExecutor(max_workers=4)
+executor = PriorityExecutor(max_workers=4, default_priority=Priority.INTERACTIVE, thread_name_prefix="tts")
+# 后端透传的调度信息：优先级（interactive-first / interactive / bulk）与剩余时间预算（毫秒）
+PRIORITY_HEADER = "X-Priority"
+DEADLINE_HEADER = "X-Deadline-Ms"
+
+# ------------------------------
+# 请求取消（后端透传 X-Request-ID；客户端断开或调用 /cancel 时停止推理）
+# ------------------------------
+REQUEST_ID_HEADER = "X-Request-ID"
+# 取消标记放在内存文件系统中，所有 worker 共享
+CANCEL_DIR = os.path.join(TEMP_DIR, "tts_cancel")
+# 检查客户端是否断开的间隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.5
+cancellations = CancellationRegistry(CANCEL_DIR)
 
 # ------------------------------
 # 音频合并工具函数
@@ -118,7 +195,7 @@ def concatenate_audio_files(audio_files: List[str]) -> str:
         merged_bytes = merge_audio_tensors(audio_files)
         
         # 保存到输出目录
-        merged_path = os.path.join(OUTPUT_DIR, f"merged_{int(time.time())}.wav")
+        merged_path = os.path.join(OUTPUT_DIR, f"merged_{uuid.uuid4().hex}.wav")
         with open(merged_path, 'wb') as f:
             f.write(merged_bytes)
         
@@ -241,6 +318,107 @@ def concatenate_audio_bytes(audio_bytes_list: List[bytes]) -> bytes:
     return merge_audio_tensors(audio_bytes_list)
 
 
+def wav_to_bytes(sampling_rate: int, wav_data: np.ndarray) -> bytes:
+    """
+    把 infer_fast 返回的 int16 音频 [T, C] 编码成 WAV bytes（标准库 wave，不经过临时文件）
+    """
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(wav_data.shape[1] if wav_data.ndim == 2 else 1)
+        wf.setsampwidth(2)
+        wf.setframerate(sampling_rate)
+        wf.writeframes(np.ascontiguousarray(wav_data, dtype=np.int16).tobytes())
+    return buffer.getvalue()
+
+
+# 只有 infer_fast 接受的分句打包参数，tts.infer 会把多余参数传给 generate
+PACKING_KWARGS = ("sentences_bucket_max_size", "max_batch_tokens")
+
+
+def _split_packing_kwargs(kwargs: dict) -> Tuple[dict, dict]:
+    """拆分为 (生成参数, 打包参数)，打包参数中值为 None 的项省略"""
+    generation = {k: v for k, v in kwargs.items() if k not in PACKING_KWARGS}
+    packing = {k: kwargs[k] for k in PACKING_KWARGS if kwargs.get(k) is not None}
+    return generation, packing
+
+
+async def _watch_disconnect(request: Request, token: CancellationToken):
+    """客户端断开连接后只取消本连接的推理（同一请求 ID 的其他片段不受影响）"""
+    while not token.cancelled:
+        if await request.is_disconnected():
+            logger.info(f"[TTS-CJG] 客户端已断开，取消请求: {token.request_id}")
+            token.cancel()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+def _start_cancellation(request: Request) -> Tuple[str, CancellationToken, asyncio.Task]:
+    """返回 (请求 ID, 取消标记, 断开监视任务)，请求结束时调用 _finish_cancellation"""
+    request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    try:
+        validate_request_id(request_id)
+    except ValueError:
+        request_id = uuid.uuid4().hex
+    token = cancellations.acquire(request_id)
+    watcher = asyncio.create_task(_watch_disconnect(request, token))
+    return request_id, token, watcher
+
+
+def _finish_cancellation(request_id: str, watcher: asyncio.Task) -> None:
+    watcher.cancel()
+    cancellations.release(request_id)
+
+
+def _read_schedule(request: Request, default: Priority) -> Tuple[Priority, Optional[float]]:
+    """从请求头读取 (优先级, 截止时间)，缺省时使用 ``default``（可被 request.state.default_priority 覆盖）"""
+    default = getattr(request.state, "default_priority", default)
+    priority = parse_priority(request.headers.get(PRIORITY_HEADER), default)
+    deadline = None
+    budget_ms = request.headers.get(DEADLINE_HEADER)
+    if budget_ms:
+        try:
+            deadline = deadline_after(float(budget_ms) / 1000.0)
+        except ValueError:
+            logger.warning(f"[TTS-CJG] 无效的 {DEADLINE_HEADER}: {budget_ms}")
+    return priority, deadline
+
+
+def _schedule(schedule: Tuple[Priority, Optional[float]], fn, *args, **kwargs) -> asyncio.Future:
+    """按 (优先级, 截止时间) 提交到推理线程池；等待方取消时，尚未开始的任务直接出队丢弃"""
+    priority, deadline = schedule
+    return asyncio.wrap_future(executor.submit_with_priority(priority, deadline, fn, *args, **kwargs))
+
+
+def _clone_sync(profile_id: str, texts: List[str], max_text_tokens_per_sentence: int, kwargs: dict,
+                cancel_token: Optional[CancellationToken] = None):
+    """
+    同步音色克隆（在线程池中执行）：所有文本在一次 infer_fast 调用中批量合成
+
+    Returns:
+        (WAV bytes 列表, 与参考音频的说话人相似度列表)
+    Raises:
+        KeyError: 声音档案不存在
+    """
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
+    profile = voice_profiles.load(profile_id, tts.device)
+    results = tts.infer_fast(
+        audio_prompt=None,
+        text=texts,
+        output_path=None,
+        voice_profile=profile,
+        max_text_tokens_per_sentence=max_text_tokens_per_sentence,
+        cancel_token=cancel_token,
+        **kwargs
+    )
+    audio_bytes_list = [wav_to_bytes(sr, wav_data) for sr, wav_data in results]
+    similarities = [
+        speaker_similarity(tts, profile, torch.from_numpy(wav_data.T.copy())) if wav_data.size else 0.0
+        for _, wav_data in results
+    ]
+    return audio_bytes_list, similarities
+
+
 def _synthesize_segment_sync(
     segment_text: str,
     speaker: str,
@@ -248,6 +426,7 @@ def _synthesize_segment_sync(
     max_text_tokens_per_sentence: int,
     infer_mode: str,
     segment_index: int,
+    cancel_token: Optional[CancellationToken] = None,
 ) -> str:
     """
     同步合成单个文本片段的音频（在线程池中执行）- 返回文件路径（保留用于向后兼容）
@@ -255,9 +434,13 @@ def _synthesize_segment_sync(
     Returns:
         str: 生成的音频文件路径
     """
-    segment_output_path = os.path.join(OUTPUT_DIR, f"{speaker}_seg{segment_index}_{int(time.time())}.wav")
+    segment_output_path = os.path.join(OUTPUT_DIR, f"{speaker}_seg{segment_index}_{uuid.uuid4().hex}.wav")
+    generation_kwargs, packing_kwargs = _split_packing_kwargs(kwargs)
     
     try:
+        # 排队期间请求已取消的片段直接丢弃，不再占用推理
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
         if infer_mode == "普通推理":
             tts.infer(
                 audio_prompt=AUDIO_PROMPT,
@@ -265,7 +448,8 @@ def _synthesize_segment_sync(
                 output_path=segment_output_path,
                 speaker_id=speaker,
                 max_text_tokens_per_sentence=max_text_tokens_per_sentence,
-                **kwargs
+                cancel_token=cancel_token,
+                **generation_kwargs
             )
         else:
             tts.infer_fast(
@@ -274,8 +458,9 @@ def _synthesize_segment_sync(
                 output_path=segment_output_path,
                 speaker_id=speaker,
                 max_text_tokens_per_sentence=max_text_tokens_per_sentence,
-                sentences_bucket_max_size=kwargs.get("sentences_bucket_max_size", 4),
-                **kwargs
+                **packing_kwargs,
+                cancel_token=cancel_token,
+                **generation_kwargs
             )
         
         if not os.path.exists(segment_output_path):
@@ -285,6 +470,9 @@ def _synthesize_segment_sync(
                    segment_index, segment_text[:50] + ('...' if len(segment_text) > 50 else ''), segment_output_path)
         return segment_output_path
     
+    except InferenceCancelled:
+        logger.info("[TTS-CJG] 片段 %d 已取消，跳过", segment_index)
+        raise
     except Exception as e:
         logger.error("[TTS-CJG] 片段 %d 合成失败: %s, 错误: %s", segment_index, segment_text[:30], e)
         raise
@@ -297,6 +485,7 @@ def _synthesize_segment_to_bytes_sync(
     max_text_tokens_per_sentence: int,
     infer_mode: str,
     segment_index: int,
+    cancel_token: Optional[CancellationToken] = None,
 ) -> bytes:
     """
     同步合成单个文本片段的音频（在线程池中执行）- 返回音频bytes
@@ -310,8 +499,12 @@ def _synthesize_segment_to_bytes_sync(
         # 在 /dev/shm 中读写，实际上是在内存中操作，速度极快
         temp_filename = f"tts_{speaker}_seg{segment_index}_{uuid.uuid4().hex}.wav"
         temp_file_path = os.path.join(TEMP_DIR, temp_filename)
+        generation_kwargs, packing_kwargs = _split_packing_kwargs(kwargs)
         
         try:
+            # 排队期间请求已取消的片段直接丢弃，不再占用推理
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
             if infer_mode == "普通推理":
                 tts.infer(
                     audio_prompt=AUDIO_PROMPT,
@@ -319,7 +512,8 @@ def _synthesize_segment_to_bytes_sync(
                     output_path=temp_file_path,
                     speaker_id=speaker,
                     max_text_tokens_per_sentence=max_text_tokens_per_sentence,
-                    **kwargs
+                    cancel_token=cancel_token,
+                    **generation_kwargs
                 )
             else:
                 tts.infer_fast(
@@ -328,8 +522,9 @@ def _synthesize_segment_to_bytes_sync(
                     output_path=temp_file_path,
                     speaker_id=speaker,
                     max_text_tokens_per_sentence=max_text_tokens_per_sentence,
-                    sentences_bucket_max_size=kwargs.get("sentences_bucket_max_size", 4),
-                    **kwargs
+                    **packing_kwargs,
+                    cancel_token=cancel_token,
+                    **generation_kwargs
                 )
             
             # 读取文件内容到内存（即使在 /dev/shm，读取也是极快的）
@@ -348,6 +543,9 @@ def _synthesize_segment_to_bytes_sync(
             except Exception as cleanup_error:
                 logger.warning("[TTS-CJG] 清理临时文件失败: %s, 错误: %s", temp_file_path, cleanup_error)
     
+    except InferenceCancelled:
+        logger.info("[TTS-CJG] 片段 %d 已取消，跳过", segment_index)
+        raise
     except Exception as e:
         logger.error("[TTS-CJG] 片段 %d 合成失败: %s, 错误: %s", segment_index, segment_text[:30], e)
         raise
@@ -373,7 +571,9 @@ class TTSRequest(BaseModel):
     max_mel_tokens: Optional[int] = 600
     max_text_tokens_per_sentence: Optional[int] = 120
     sentences_bucket_max_size: Optional[int] = 4
+    max_batch_tokens: Optional[int] = None  # 每个分句 bucket 的 token 预算（批次推理），None 不限制
     infer_mode: Optional[str] = "普通推理"  # 可选: 普通推理 / 批次推理
+    use_speculative: Optional[bool] = True  # 投机解码开关（服务开启且 num_beams=1 时生效）
 
 
 class TTSBatchRequest(BaseModel):
@@ -390,7 +590,26 @@ class TTSBatchRequest(BaseModel):
     max_mel_tokens: Optional[int] = 600
     max_text_tokens_per_sentence: Optional[int] = 120
     sentences_bucket_max_size: Optional[int] = 4
+    max_batch_tokens: Optional[int] = None  # 每个分句 bucket 的 token 预算（批次推理），None 不限制
     infer_mode: Optional[str] = "普通推理"  # 可选: 普通推理 / 批次推理
+    use_speculative: Optional[bool] = True  # 投机解码开关（服务开启且 num_beams=1 时生效）
+
+class VoiceCloneRequest(BaseModel):
+    """音色克隆请求体：引用已上传的声音档案"""
+    profile_id: str
+    texts: List[str]
+    do_sample: Optional[bool] = True
+    top_p: Optional[float] = 0.8
+    top_k: Optional[int] = 30
+    temperature: Optional[float] = 0.6
+    length_penalty: Optional[float] = 0.0
+    num_beams: Optional[int] = 3
+    repetition_penalty: Optional[float] = 10.0
+    max_mel_tokens: Optional[int] = 600
+    max_text_tokens_per_sentence: Optional[int] = 120
+    sentences_bucket_max_size: Optional[int] = 4
+    max_batch_tokens: Optional[int] = None  # 每个分句 bucket 的 token 预算（批次推理），None 不限制
+    use_speculative: Optional[bool] = True
 
 # ------------------------------
 # 接口：文本转语音
@@ -417,7 +636,7 @@ async def synthesize(req: TTSRequest, request: Request):
         logger.error(f"[TTS-CJG] 无效的说话人: {req.speaker}, 可用说话人: {available_speakers}")
         return {"error": f"speaker {req.speaker} not found. Available: {available_speakers}"}
 
-    output_path = os.path.join(OUTPUT_DIR, f"{req.speaker}_{int(time.time())}.wav")
+    output_path = os.path.join(OUTPUT_DIR, f"{req.speaker}_{uuid.uuid4().hex}.wav")
     logger.info(f"[TTS-CJG] 输出文件路径: {output_path}")
 
     kwargs = {
@@ -429,7 +648,9 @@ async def synthesize(req: TTSRequest, request: Request):
         "num_beams": int(req.num_beams),
         "repetition_penalty": float(req.repetition_penalty),
         "max_mel_tokens": int(req.max_mel_tokens),
+        "use_speculative": bool(req.use_speculative),
         "sentences_bucket_max_size": int(req.sentences_bucket_max_size),
+        "max_batch_tokens": req.max_batch_tokens,
     }
     
     logger.info(f"[TTS-CJG] 推理参数: {kwargs}")
@@ -437,6 +658,9 @@ async def synthesize(req: TTSRequest, request: Request):
 
     # 开始推理计时
     start_time = time.time()
+    schedule = _read_schedule(request, Priority.INTERACTIVE)
+    logger.info(f"[TTS-CJG] 调度优先级: {schedule[0].name}")
+    request_id, cancel_token, watcher = _start_cancellation(request)
     
     try:
         # 检测文本中是否包含 '｜' 分隔符（pause_format 模式）
@@ -454,38 +678,41 @@ async def synthesize(req: TTSRequest, request: Request):
 
         # 如果只有一个片段，使用原有逻辑（避免不必要的并发开销）
         if len(text_segments) == 1:
+            # 在线程池中推理，事件循环保持响应以便检测客户端断开
             if req.infer_mode == "普通推理":
                 logger.info(f"[TTS-CJG] 开始普通推理...")
-                tts.infer(
+                await _schedule(schedule, functools.partial(
+                    tts.infer,
                     audio_prompt=AUDIO_PROMPT,  # 必传参考音频
                     text=text_segments[0],
                     output_path=output_path,
                     speaker_id=req.speaker,
                     max_text_tokens_per_sentence=int(req.max_text_tokens_per_sentence),
-                    **kwargs
-                )
+                    cancel_token=cancel_token,
+                    **_split_packing_kwargs(kwargs)[0]
+                ))
             else:
                 # 批次推理
                 logger.info(f"[TTS-CJG] 开始批次推理...")
-                tts.infer_fast(
+                await _schedule(schedule, functools.partial(
+                    tts.infer_fast,
                     audio_prompt=AUDIO_PROMPT,  # 必传参考音频
                     text=text_segments[0],
                     output_path=output_path,
                     speaker_id=req.speaker,
                     max_text_tokens_per_sentence=int(req.max_text_tokens_per_sentence),
-                    sentences_bucket_max_size=int(req.sentences_bucket_max_size),
+                    cancel_token=cancel_token,
                     **kwargs
-                )
+                ))
         else:
             # 并发处理多个片段
             logger.info(f"[TTS-CJG] 开始并发合成 {len(text_segments)} 个音频片段...")
             
             # 准备并发任务（使用线程池执行器）
-            loop = asyncio.get_event_loop()
             futures = []
             for idx, segment_text in enumerate(text_segments):
-                future = loop.run_in_executor(
-                    executor,
+                future = _schedule(
+                    schedule,
                     _synthesize_segment_sync,
                     segment_text,
                     req.speaker,
@@ -493,6 +720,7 @@ async def synthesize(req: TTSRequest, request: Request):
                     int(req.max_text_tokens_per_sentence),
                     req.infer_mode,
                     idx,
+                    cancel_token,
                 )
                 futures.append(future)
             
@@ -531,14 +759,57 @@ async def synthesize(req: TTSRequest, request: Request):
             logger.error(f"[TTS-CJG] 输出文件未生成: {output_path}")
             return {"error": "TTS推理失败，输出文件未生成"}
 
+    except InferenceCancelled:
+        logger.info(f"[TTS-CJG] 请求已取消: {request_id}，耗时: {time.time() - start_time:.2f}秒")
+        return {"error": "请求已取消"}
+    except DeadlineExceeded:
+        logger.warning(f"[TTS-CJG] 排队超过截止时间，未执行: {request_id}，等待: {time.time() - start_time:.2f}秒")
+        return {"error": "请求已超过截止时间"}
     except Exception as e:
         inference_time = time.time() - start_time
         logger.error(f"[TTS-CJG] 推理失败，耗时: {inference_time:.2f}秒, 错误: {str(e)}")
         return {"error": f"TTS推理失败: {str(e)}"}
+    finally:
+        _finish_cancellation(request_id, watcher)
 
     return FileResponse(output_path, media_type="audio/wav")
 
 
+# ------------------------------
+# 接口：健康检查
+# ------------------------------
+@app.get("/health")
+async def health():
+    """健康检查，附带当前 worker 的内存占用（共享权重模式下私有内存应远小于模型大小）"""
+    return {
+        "status": "ok",
+        "worker": _worker_prefix,
+        "snapshot": SNAPSHOT_PATH if _use_snapshot else None,
+        "shared_weights": SHARE_WEIGHTS and _use_snapshot,
+        "quantize": tts.quantize,
+        "bigvgan_bf16": tts.bigvgan_bf16,
+        "memory_mb": process_memory_mb(),
+        "queued": executor.queued(),
+    }
+
+
+# ------------------------------
+# 接口：取消请求
+# ------------------------------
+@app.post("/cancel/{request_id}")
+async def cancel_request(request_id: str):
+    """
+    取消指定请求 ID 的推理（所有 worker 上的同 ID 请求都会停止，排队中的片段直接丢弃）
+    取消可以早于请求到达，之后到达的同 ID 请求会立即返回
+    """
+    try:
+        active = cancellations.cancel(request_id)
+    except ValueError as e:
+        return {"error": str(e)}
+    logger.info(f"[TTS-CJG] 收到取消请求: {request_id}, 本 worker 正在处理: {active}")
+    return {"request_id": request_id, "active": active}
+
+
 # ------------------------------
 # 接口：批处理文本转语音（优先级1优化）
 # ------------------------------
@@ -570,9 +841,10 @@ async def synthesize_batch(req: TTSBatchRequest, request: Request):
     if not text_segments:
         return {"error": "没有有效的文本片段"}
     
-    # 如果只有一个片段，直接调用单次接口
+    # 如果只有一个片段，直接调用单次接口（未指定优先级时仍按批量任务调度）
     if len(text_segments) == 1:
         logger.info("[TTS-CJG-BATCH] 只有一个片段，使用单次接口")
+        request.state.default_priority = Priority.BULK
         single_req = TTSRequest(
             text=text_segments[0],
             speaker=req.speaker,
@@ -584,8 +856,10 @@ async def synthesize_batch(req: TTSBatchRequest, request: Request):
             num_beams=req.num_beams,
             repetition_penalty=req.repetition_penalty,
             max_mel_tokens=req.max_mel_tokens,
+            use_speculative=req.use_speculative,
             max_text_tokens_per_sentence=req.max_text_tokens_per_sentence,
             sentences_bucket_max_size=req.sentences_bucket_max_size,
+            max_batch_tokens=req.max_batch_tokens,
             infer_mode=req.infer_mode,
         )
         return await synthesize(single_req, request)
@@ -600,19 +874,22 @@ async def synthesize_batch(req: TTSBatchRequest, request: Request):
         "num_beams": int(req.num_beams),
         "repetition_penalty": float(req.repetition_penalty),
         "max_mel_tokens": int(req.max_mel_tokens),
+        "use_speculative": bool(req.use_speculative),
         "sentences_bucket_max_size": int(req.sentences_bucket_max_size),
+        "max_batch_tokens": req.max_batch_tokens,
     }
     
     start_time = time.time()
-    logger.info(f"[TTS-CJG-BATCH] 开始批处理合成: {len(text_segments)} 个片段")
+    schedule = _read_schedule(request, Priority.BULK)
+    logger.info(f"[TTS-CJG-BATCH] 开始批处理合成: {len(text_segments)} 个片段, 调度优先级: {schedule[0].name}")
+    request_id, cancel_token, watcher = _start_cancellation(request)
     
     try:
         # 准备并发任务（使用线程池执行器，返回bytes）
-        loop = asyncio.get_event_loop()
         futures = []
         for idx, segment_text in enumerate(text_segments):
-            future = loop.run_in_executor(
-                executor,
+            future = _schedule(
+                schedule,
                 _synthesize_segment_to_bytes_sync,
                 segment_text,
                 req.speaker,
@@ -620,6 +897,7 @@ async def synthesize_batch(req: TTSBatchRequest, request: Request):
                 int(req.max_text_tokens_per_sentence),
                 req.infer_mode,
                 idx,
+                cancel_token,
             )
             futures.append(future)
         
@@ -627,6 +905,12 @@ async def synthesize_batch(req: TTSBatchRequest, request: Request):
         try:
             audio_bytes_list = await asyncio.gather(*futures)
             logger.info(f"[TTS-CJG-BATCH] 所有片段合成完成，开始合并音频")
+        except InferenceCancelled:
+            logger.info(f"[TTS-CJG-BATCH] 请求已取消: {request_id}，耗时: {time.time() - start_time:.2f}秒")
+            return {"error": "请求已取消"}
+        except DeadlineExceeded:
+            logger.warning(f"[TTS-CJG-BATCH] 排队超过截止时间，未执行: {request_id}，等待: {time.time() - start_time:.2f}秒")
+            return {"error": "请求已超过截止时间"}
         except Exception as e:
             logger.error(f"[TTS-CJG-BATCH] 并发合成过程中出错: {e}")
             return {"error": f"并发合成失败: {str(e)}"}
@@ -655,3 +939,190 @@ async def synthesize_batch(req: TTSBatchRequest, request: Request):
         inference_time = time.time() - start_time
         logger.error(f"[TTS-CJG-BATCH] 批处理失败，耗时: {inference_time:.2f}秒, 错误: {str(e)}")
         return {"error": f"批处理失败: {str(e)}"}
+    finally:
+        _finish_cancellation(request_id, watcher)
+
+
+# ------------------------------
+# 接口：声音档案（零样本音色克隆）
+# ------------------------------
+@app.post("/voice-profiles")
+async def create_voice_profile(request: Request):
+    """
+    上传参考音频（请求体为原始音频字节），计算并保存声音档案
+    同一音频内容得到同一档案 ID，重复上传直接返回已有档案
+    """
+    audio_bytes = await request.body()
+    if not audio_bytes:
+        return {"error": "参考音频不能为空"}
+    if len(audio_bytes) > MAX_REFERENCE_BYTES:
+        return {"error": f"参考音频超过大小限制: {MAX_REFERENCE_BYTES} bytes"}
+
+    start_time = time.time()
+    try:
+        profile, created = await _schedule(_read_schedule(request, Priority.BULK),
+                                           voice_profiles.get_or_create, tts, audio_bytes)
+    except Exception as e:
+        logger.error(f"[TTS-CJG-CLONE] 声音档案创建失败: {e}")
+        return {"error": f"声音档案创建失败: {str(e)}"}
+
+    if created:
+        try:
+            speaker_index.add([f"profile:{profile.profile_id}"], profile.speaker_embedding.float().cpu().numpy().reshape(1, -1))
+        except Exception as e:
+            logger.warning(f"[TTS-CJG-CLONE] 声音档案写入说话人索引失败: {e}")
+    logger.info(
+        f"[TTS-CJG-CLONE] 声音档案 {profile.profile_id} {'已创建' if created else '已存在'}，"
+        f"参考音频 {profile.duration:.2f}s，耗时 {time.time() - start_time:.2f}秒"
+    )
+    return {"profile_id": profile.profile_id, "duration": profile.duration, "cached": not created}
+
+
+@app.get("/voice-profiles/{profile_id}")
+async def get_voice_profile(profile_id: str):
+    """查询声音档案是否存在"""
+    try:
+        profile = voice_profiles.load(profile_id, tts.device)
+    except (KeyError, ValueError) as e:
+        return {"error": str(e)}
+    return {"profile_id": profile.profile_id, "duration": profile.duration}
+
+
+@app.post("/tts/clone")
+async def synthesize_clone(req: VoiceCloneRequest, request: Request):
+    """
+    使用声音档案批量合成（所有文本一次 infer_fast 调用），
+    返回 base64 编码的 WAV 列表及每条音频与参考音频的说话人相似度（ECAPA 余弦）
+    请求示例:
+    {
+        "profile_id": "3f2a9c0d1b7e5a64",
+        "texts": ["第一句", "第二句"]
+    }
+    """
+    client_ip = request.client.host if request.client else "unknown"
+    texts = [t.strip() for t in req.texts]
+    logger.info(f"[TTS-CJG-CLONE] 收到克隆请求 - IP: {client_ip}, profile={req.profile_id}, 文本数: {len(texts)}")
+    if not texts or not all(texts):
+        return {"error": "文本内容为空，无法合成音频"}
+
+    kwargs = {
+        "do_sample": bool(req.do_sample),
+        "top_p": float(req.top_p),
+        "top_k": int(req.top_k) if req.top_k > 0 else None,
+        "temperature": float(req.temperature),
+        "length_penalty": float(req.length_penalty),
+        "num_beams": int(req.num_beams),
+        "repetition_penalty": float(req.repetition_penalty),
+        "max_mel_tokens": int(req.max_mel_tokens),
+        "use_speculative": bool(req.use_speculative),
+        "sentences_bucket_max_size": int(req.sentences_bucket_max_size),
+        "max_batch_tokens": req.max_batch_tokens,
+    }
+
+    start_time = time.time()
+    schedule = _read_schedule(request, Priority.BULK)
+    request_id, cancel_token, watcher = _start_cancellation(request)
+    try:
+        audio_bytes_list, similarities = await _schedule(
+            schedule, _clone_sync, req.profile_id, texts, int(req.max_text_tokens_per_sentence), kwargs, cancel_token
+        )
+    except InferenceCancelled:
+        logger.info(f"[TTS-CJG-CLONE] 请求已取消: {request_id}，耗时: {time.time() - start_time:.2f}秒")
+        return {"error": "请求已取消"}
+    except DeadlineExceeded:
+        logger.warning(f"[TTS-CJG-CLONE] 排队超过截止时间，未执行: {request_id}，等待: {time.time() - start_time:.2f}秒")
+        return {"error": "请求已超过截止时间"}
+    except (KeyError, ValueError) as e:
+        logger.error(f"[TTS-CJG-CLONE] 无效的声音档案: {req.profile_id}, 错误: {e}")
+        return {"error": f"声音档案不可用: {str(e)}"}
+    except Exception as e:
+        logger.error(f"[TTS-CJG-CLONE] 克隆合成失败，耗时: {time.time() - start_time:.2f}秒, 错误: {str(e)}")
+        return {"error": f"克隆合成失败: {str(e)}"}
+    finally:
+        _finish_cancellation(request_id, watcher)
+
+    logger.info(f"[TTS-CJG-CLONE] 克隆合成完成: {len(audio_bytes_list)} 条音频，耗时: {time.time() - start_time:.2f}秒")
+    return {
+        "profile_id": req.profile_id,
+        "audios": [base64.b64encode(b).decode("ascii") for b in audio_bytes_list],
+        "similarities": similarities,
+    }
+
+
+# ------------------------------
+# 接口：说话人向量（ECAPA-TDNN，CPU）
+# ------------------------------
+async def _read_uploads(files: List[UploadFile]) -> List[bytes]:
+    contents = [await f.read() for f in files]
+    for f, data in zip(files, contents):
+        if not data:
+            raise ValueError(f"音频文件为空: {f.filename}")
+        if len(data) > MAX_REFERENCE_BYTES:
+            raise ValueError(f"音频文件超过大小限制: {f.filename}")
+    return contents
+
+
+def _embed_sync(contents: List[bytes]):
+    """解码 + 批量提取说话人向量（在线程池中执行），返回 (向量 [n, dim], 时长列表)"""
+    wavs = [load_audio(data) for data in contents]
+    durations = [w.shape[-1] / 24000 for w in wavs]
+    return speaker_embedder.embed(wavs), durations
+
+
+@app.post("/speaker/embed")
+async def speaker_embed(request: Request, files: List[UploadFile] = File(...)):
+    """批量提取说话人向量（L2 归一化）"""
+    start_time = time.time()
+    try:
+        contents = await _read_uploads(files)
+        embeddings, durations = await _schedule(_read_schedule(request, Priority.BULK), _embed_sync, contents)
+    except Exception as e:
+        logger.error(f"[TTS-CJG-SPK] 说话人向量提取失败: {e}")
+        return {"error": f"说话人向量提取失败: {str(e)}"}
+    logger.info(f"[TTS-CJG-SPK] 提取 {len(files)} 条说话人向量，耗时 {time.time() - start_time:.3f}秒")
+    return {"dim": int(embeddings.shape[1]), "embeddings": embeddings.tolist(), "durations": durations}
+
+
+@app.post("/speaker/similarity")
+async def speaker_similarity_matrix(request: Request, files: List[UploadFile] = File(...)):
+    """多段音频两两之间的说话人余弦相似度矩阵"""
+    if len(files) < 2:
+        return {"error": "至少需要两段音频"}
+    try:
+        contents = await _read_uploads(files)
+        embeddings, durations = await _schedule(_read_schedule(request, Priority.BULK), _embed_sync, contents)
+    except Exception as e:
+        logger.error(f"[TTS-CJG-SPK] 相似度计算失败: {e}")
+        return {"error": f"相似度计算失败: {str(e)}"}
+    return {"matrix": cosine_similarity_matrix(embeddings).tolist(), "durations": durations}
+
+
+@app.post("/speaker/enroll")
+async def speaker_enroll(request: Request, files: List[UploadFile] = File(...), ids: List[str] = Form(...)):
+    """把音频的说话人向量写入索引（同 id 覆盖）"""
+    if len(files) != len(ids):
+        return {"error": f"音频数与 id 数不一致: {len(files)} vs {len(ids)}"}
+    try:
+        contents = await _read_uploads(files)
+        schedule = _read_schedule(request, Priority.BULK)
+        embeddings, _ = await _schedule(schedule, _embed_sync, contents)
+        await _schedule(schedule, speaker_index.add, ids, embeddings)
+    except Exception as e:
+        logger.error(f"[TTS-CJG-SPK] 说话人入库失败: {e}")
+        return {"error": f"说话人入库失败: {str(e)}"}
+    logger.info(f"[TTS-CJG-SPK] 入库 {len(ids)} 条说话人向量，索引共 {len(speaker_index)} 条")
+    return {"count": len(speaker_index)}
+
+
+@app.post("/speaker/search")
+async def speaker_search(request: Request, files: List[UploadFile] = File(...), k: int = Form(5)):
+    """在说话人索引中查找与每段音频最接近的 k 个已存声音"""
+    try:
+        contents = await _read_uploads(files)
+        schedule = _read_schedule(request, Priority.BULK)
+        embeddings, _ = await _schedule(schedule, _embed_sync, contents)
+        results = await _schedule(schedule, speaker_index.search, embeddings, k)
+    except Exception as e:
+        logger.error(f"[TTS-CJG-SPK] 说话人检索失败: {e}")
+        return {"error": f"说话人检索失败: {str(e)}"}
+    return {"matches": [[{"id": sid, "score": score} for sid, score in row] for row in results]}
@@ -1,15 +1,17 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import FileResponse
-import torch, scipy
-from transformers import VitsModel, AutoTokenizer, set_seed
-import uuid, os, time, random, re, warnings, logging
+from fastapi.responses import JSONResponse, StreamingResponse
+import torch
+from transformers import VitsModel, AutoTokenizer
+import os, time, random, re, struct, warnings, logging
 import numpy as np
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List
+from concurrent.futures import Future
+from typing import Iterator, List, Optional
 from contextlib import asynccontextmanager
 from pydantic import BaseModel, validator
 from transformers.utils import logging as hf_logging
 
+from vits_batch import EagerVitsBackend, MicroBatcher, SegmentJob, split_text, synthesize_jobs
+
 # =============================
 # 全局随机数种子固定，保证结果可复现
 # =============================
@@ -51,10 +53,12 @@ hf_logging.set_verbosity_error()
 # =============================
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    BATCHER.start()
     logger.info("[TTS] startup complete")
     try:
         yield
     finally:
+        BATCHER.stop()
         logger.info("[TTS] shutdown")
 
 
@@ -64,62 +68,120 @@ app = FastAPI(lifespan=lifespan)
 # =============================
 # 模型初始化
 # =============================
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-DTYPE = torch.float32
+MODEL_NAME = os.getenv("TTS_MODEL", "facebook/mms-tts-nan")
+# 推理后端：torch（eager，默认）/ onnx（onnxruntime CPU，需先用 vits_onnx.py 导出）
+BACKEND = os.getenv("TTS_BACKEND", "torch").lower()
+ONNX_DIR = os.getenv("TTS_ONNX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ckpt", "mms-tts-nan-onnx"))
+ONNX_INT8 = os.getenv("TTS_ONNX_INT8", "0").lower() in ("1", "true", "yes")
+ORT_THREADS = int(os.getenv("TTS_ORT_THREADS", "0"))  # 0 表示由 onnxruntime 决定
+ORT_INTER_THREADS = int(os.getenv("TTS_ORT_INTER_THREADS", "1"))
+
+if BACKEND == "onnx":
+    from vits_onnx import OnnxVitsBackend
+
+    DEVICE = "cpu"
+    DTYPE = torch.float32
+    vits = OnnxVitsBackend(ONNX_DIR, int8=ONNX_INT8, intra_op_threads=ORT_THREADS, inter_op_threads=ORT_INTER_THREADS)
+    tokenizer = AutoTokenizer.from_pretrained(ONNX_DIR)
+else:
+    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+    DTYPE = torch.float32
+    model = VitsModel.from_pretrained(MODEL_NAME, torch_dtype=DTYPE)
+    model = model.to(DEVICE).eval()
+    vits = EagerVitsBackend(model)
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+SAMPLING_RATE = vits.sampling_rate
+
 
-model = VitsModel.from_pretrained("facebook/mms-tts-nan", torch_dtype=DTYPE)
-model = model.to(DEVICE).eval()
-tokenizer = AutoTokenizer.from_pretrained("facebook/mms-tts-nan")
+# 批量推理：所有请求的片段经微批队列在单个线程内合成，语速 / 噪声 / 种子按片段传入，不修改模型属性
+MAX_BATCH = int(os.getenv("TTS_MAX_BATCH", "16"))  # 每批最多片段数
+BATCH_WAIT_MS = float(os.getenv("TTS_BATCH_WAIT_MS", "10"))  # 攒批等待时间
+MAX_BATCH_TOKENS = int(os.getenv("TTS_MAX_BATCH_TOKENS", "4096"))  # 每次前向 padding 后的 token 上限
+SEGMENT_GAP_SECONDS = 0.08  # 片段之间的停顿
 
 
-# CPU 情况下允许并行合成
-EXECUTOR = ThreadPoolExecutor(max_workers=min(4, (os.cpu_count() or 2))) if DEVICE == "cpu" else None
+def _run_batch(jobs: List[SegmentJob]) -> List[torch.Tensor]:
+    return synthesize_jobs(vits, tokenizer, jobs, max_batch_tokens=MAX_BATCH_TOKENS)
+
+
+BATCHER = MicroBatcher(_run_batch, max_batch=MAX_BATCH, max_wait=BATCH_WAIT_MS / 1000.0)
 
 logger.info(
-    "[TTS] service starting: device=%s dtype=%s sample_rate=%s cpu_workers=%s",
+    "[TTS] service starting: backend=%s%s device=%s dtype=%s sample_rate=%s max_batch=%d batch_wait=%.0fms",
+    vits.name,
+    "(int8)" if BACKEND == "onnx" and ONNX_INT8 else "",
     DEVICE,
     str(DTYPE),
-    getattr(model.config, "sampling_rate", "-"),
-    getattr(EXECUTOR, "_max_workers", 0) if EXECUTOR else 0,
+    SAMPLING_RATE,
+    MAX_BATCH,
+    BATCH_WAIT_MS,
 )
 
 
 # =============================
 # 工具函数
 # =============================
-def _split_text(text: str) -> List[str]:
-    """分割文本为语音片段，目前简单实现，必要时可改成按标点拆分"""
-    s = (text or "").strip()
-    return [s] if s else []
-
-
-def _synthesize_segment(text: str, speaking_rate: float, seed: int = 42) -> torch.Tensor:
-    """合成单个文本片段"""
-    logger.debug(f"[TTS] segment: len={len(text)} rate={speaking_rate} seed={seed}")
-    set_seed(seed)
-    inputs = tokenizer(text, return_tensors="pt").to(DEVICE)
-
-    # ⚠️ 确保 input_ids 是 Long 类型
-    if "input_ids" in inputs:
-        inputs["input_ids"] = inputs["input_ids"].long()
-
-    model.speaking_rate = speaking_rate
-    model.noise_scale = 0.0
-    with torch.inference_mode():
-        out = model(**inputs).waveform[0]
-    return out.detach().cpu()
-
-
-def _concat_tensor_wav(parts: List[torch.Tensor]) -> np.ndarray:
-    """拼接多个语音片段，并归一化为 int16 PCM"""
-    if not parts:
-        return np.zeros((0,), dtype=np.int16)
-    wav = torch.cat(parts, dim=-1).numpy().astype(np.float32)
-    if wav.size == 0:
-        return np.zeros((0,), dtype=np.int16)
-    max_amp = float(np.max(np.abs(wav))) or 1.0
-    wav = np.clip(wav / max_amp, -1.0, 1.0)
-    return (wav * 32767.0).astype(np.int16)
+def _wav_header(sample_rate: int, num_samples: Optional[int] = None) -> bytes:
+    """16-bit 单声道 PCM 的 RIFF 头；流式输出时总长度未知，按惯例填 0xFFFFFFFF"""
+    data_size = 0xFFFFFFFF if num_samples is None else num_samples * 2
+    riff_size = 0xFFFFFFFF if num_samples is None else 36 + data_size
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", riff_size, b"WAVE",
+        b"fmt ", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16,
+        b"data", data_size,
+    )
+
+
+class _PeakNormalizer:
+    """
+    逐段峰值归一化：增益取 32767 / 已输出片段的最大峰值，无需等全部片段合成完再整体归一化。
+    各片段峰值接近时与整体归一化一致；后续片段更响时只降低其后的增益，不会削波。
+    """
+
+    def __init__(self):
+        self.peak = 0.0
+
+    def write(self, wave: torch.Tensor, out: np.ndarray) -> None:
+        """把 float 波形归一化后直接写入 int16 缓冲区 ``out``（不生成中间数组）"""
+        samples = wave.numpy()
+        if samples.size:
+            self.peak = max(self.peak, float(np.abs(samples).max()))
+        np.multiply(samples, 32767.0 / (self.peak or 1.0), out=out, casting="unsafe")
+
+
+def _stream_wav(first: torch.Tensor, futures: List[Future], sample_rate: int) -> Iterator[bytes]:
+    """
+    先发 RIFF 头，再按顺序逐段编码输出；片段间插入短停顿（按标点切分后，片段间的停顿不再由模型生成）。
+    首段在发送响应头之前已合成（失败时端点直接返回错误状态码）；之后的片段失败时抛出异常中断响应，
+    客户端收到不完整的分块传输而报错，不会把截断的 WAV 当作成功结果。
+    """
+    yield _wav_header(sample_rate)
+    normalizer = _PeakNormalizer()
+    gap = bytes(int(sample_rate * SEGMENT_GAP_SECONDS) * 2)
+    buffer = np.empty(0, dtype=np.int16)  # 复用的 int16 缓冲区，按最长片段扩容
+    started = False
+    total_samples = 0
+    for index, fut in enumerate([None] + futures):
+        try:
+            wave = first if fut is None else fut.result()
+        except Exception as e:
+            logger.exception("[TTS-SVC] 片段 %d 合成失败，中断输出: %s", index, e)
+            for pending in futures[index:]:
+                pending.cancel()
+            raise
+        if wave.numel() == 0:
+            continue
+        if buffer.size < wave.numel():
+            buffer = np.empty(wave.numel(), dtype=np.int16)
+        out = buffer[:wave.numel()]
+        normalizer.write(wave, out)
+        if started:
+            yield gap
+        started = True
+        total_samples += wave.numel()
+        yield out.tobytes()
+    logger.info("[TTS-SVC] 输出完成: segments=%d duration=%.2fs", len(futures) + 1, total_samples / sample_rate)
 
 
 # =============================
@@ -128,6 +190,8 @@ def _concat_tensor_wav(parts: List[torch.Tensor]) -> np.ndarray:
 class TTSPostRequest(BaseModel):
     text: str
     speaking_rate: float = 1.0
+    noise_scale: float = 0.0
+    seed: int = 42
 
 # =============================
 # API 路由
@@ -136,25 +200,30 @@ class TTSPostRequest(BaseModel):
 def synthesize_post(req: TTSPostRequest, request: Request):
     logger.info("[TTS-SVC] 收到 /tts 请求: len(text)=%d, speaking_rate=%.2f", len(req.text or ""), req.speaking_rate)
     t0 = time.time()
-    segments = _split_text(req.text)
-    wave_parts: List[torch.Tensor] = []
-
-    if DEVICE == "cpu" and len(segments) > 1:
-        future_map = {EXECUTOR.submit(_synthesize_segment, seg, req.speaking_rate): idx for idx, seg in enumerate(segments)}
-        wave_parts = [None]*len(segments)
-        for fut in as_completed(future_map):
-            wave_parts[future_map[fut]] = fut.result()
-    else:
-        for seg in segments:
-            wave_parts.append(_synthesize_segment(seg, req.speaking_rate))
-
-    wav_np = _concat_tensor_wav(wave_parts)
-    filename = f"{uuid.uuid4()}.wav"
-    filepath = os.path.join("/tmp", filename)
-    scipy.io.wavfile.write(filepath, rate=model.config.sampling_rate, data=wav_np)
-    logger.info("[TTS-SVC] 生成完成: file=%s time=%.1fms size=%d bytes", filepath, (time.time()-t0)*1000.0, os.path.getsize(filepath))
-
-    return FileResponse(filepath, media_type="audio/wav", filename="output.wav")
+    segments = split_text(req.text)
+    if not segments:
+        return {"error": "文本内容为空，无法合成音频"}
+    jobs = [
+        SegmentJob(text=seg, speaking_rate=req.speaking_rate, noise_scale=req.noise_scale, seed=req.seed)
+        for seg in segments
+    ]
+    futures = BATCHER.submit(jobs)
+    # 等第一个片段合成完再开始响应：此前的失败仍可返回错误，之后边合成边输出
+    try:
+        first = futures[0].result()
+    except Exception as e:
+        logger.exception("[TTS-SVC] 合成失败: %s", e)
+        for fut in futures[1:]:
+            fut.cancel()
+        return JSONResponse(status_code=500, content={"error": f"TTS推理失败: {str(e)}"})
+    logger.info("[TTS-SVC] 首段就绪: segments=%d ttfb=%.1fms batcher=%s",
+                len(segments), (time.time()-t0)*1000.0, BATCHER.stats())
+
+    return StreamingResponse(
+        _stream_wav(first, futures[1:], SAMPLING_RATE),
+        media_type="audio/wav",
+        headers={"Content-Disposition": "attachment; filename=output.wav"},
+    )
 
 
 # =============================
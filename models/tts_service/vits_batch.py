@@ -0,0 +1,371 @@
+"""
+闽南语 VITS（facebook/mms-tts-nan）批量推理
+
+HF ``VitsModel.forward`` 从模块属性读取 ``speaking_rate`` / ``noise_scale``，且噪声取自全局随机数，
+多线程共享一个模型时不同语速的请求会互相覆盖。这里按 ``VitsModel.forward`` 的推理路径重新组织：
+    - 拆成两个无状态阶段：``VitsEncoderStage``（文本编码 + 时长预测）与 ``VitsDecoderStage``
+      （时长展开 + flow + 声码器），两者也是 ONNX 导出的单元（见 vits_onnx）；
+    - 语速、噪声系数作为每条样本的参数传入（形状 (B, 1, 1) 的张量），不修改模型状态；
+    - 时长预测与先验采样的噪声按每条样本的种子单独生成，结果与同批次的其他样本无关；
+    - 变长输入 padding 后一次前向，按预测长度裁剪各自的波形。
+``MicroBatcher`` 把多个请求的片段在短时间窗内攒成一批，由单个工作线程串行执行前向。
+"""
+import logging
+import queue
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+import torch
+
+logger = logging.getLogger("tts_service")
+
+# 片段切分：句末 / 句中标点之后断开，标点保留在片段末尾
+_SPLIT_RE = re.compile(r"(?<=[。！？；!?;…\n，,、：:｜|])")
+
+
+def _graphemes(text: str) -> List[str]:
+    """按字符切开，组合附加符号（POJ 声调符号、鼻化符等）跟随其基字母，不会被拆开"""
+    clusters: List[str] = []
+    for ch in text:
+        if clusters and unicodedata.combining(ch):
+            clusters[-1] += ch
+        else:
+            clusters.append(ch)
+    return clusters
+
+
+def _split_long(piece: str, max_chars: int) -> List[str]:
+    """
+    超长片段的切分：优先在空白处断开，其次在 POJ 音节连字符 '-' 之后，
+    单个音节（或不含空白的汉字串）仍超长时才按字符切，且不拆开组合附加符号
+    """
+    units: List[str] = []
+    for word in re.findall(r"\S+\s*", piece):
+        if len(word) <= max_chars:
+            units.append(word)
+            continue
+        for syllable in re.findall(r"[^-]+-*|-+", word):
+            if len(syllable) <= max_chars:
+                units.append(syllable)
+                continue
+            chunk = ""
+            for cluster in _graphemes(syllable):
+                if chunk and len(chunk) + len(cluster) > max_chars:
+                    units.append(chunk)
+                    chunk = ""
+                chunk += cluster
+            units.append(chunk)
+
+    segments: List[str] = []
+    current = ""
+    for unit in units:
+        if current and len(current) + len(unit) > max_chars:
+            segments.append(current)
+            current = ""
+        current += unit
+    segments.append(current)
+    return [seg.strip().strip("-") for seg in segments if seg.strip().strip("-")]
+
+
+def split_text(text: str, min_chars: int = 6, max_chars: int = 60) -> List[str]:
+    """
+    按标点切分文本：过短的片段并入前一段，过长的片段在空白 / '-' 处断开（输入通常是 POJ）
+    """
+    pieces = [p.strip() for p in _SPLIT_RE.split(text or "") if p.strip()]
+    segments: List[str] = []
+    for piece in pieces:
+        if segments and (len(piece) < min_chars or len(segments[-1]) < min_chars) \
+                and len(segments[-1]) + len(piece) + 1 <= max_chars:
+            # 拉丁字母（POJ）片段之间保留空格，汉字标点后直接拼接
+            segments[-1] += (" " if segments[-1][-1].isascii() else "") + piece
+            continue
+        segments.extend(_split_long(piece, max_chars))
+    return segments
+
+
+@dataclass
+class SegmentJob:
+    text: str
+    speaking_rate: float = 1.0
+    noise_scale: float = 0.0
+    noise_scale_duration: Optional[float] = None  # None 时使用模型配置的默认值
+    seed: int = 42
+
+
+def _per_item_noise(generators: Sequence[torch.Generator], channels: int, lengths: Sequence[int],
+                    max_length: int, dtype: torch.dtype, device: torch.device) -> torch.Tensor:
+    """按样本各自的随机数生成器生成 (B, channels, max_length) 的高斯噪声，padding 部分为 0"""
+    noise = torch.zeros(len(generators), channels, max_length, dtype=dtype)
+    for i, (gen, length) in enumerate(zip(generators, lengths)):
+        noise[i, :, :length] = torch.randn(channels, length, generator=gen, dtype=dtype)
+    return noise.to(device)
+
+
+def _stochastic_duration_reverse(predictor, hidden_states: torch.Tensor, padding_mask: torch.Tensor,
+                                 latents: torch.Tensor) -> torch.Tensor:
+    """``VitsStochasticDurationPredictor`` 的推理分支，噪声 ``latents`` 由调用方给定"""
+    inputs = predictor.conv_pre(hidden_states)
+    inputs = predictor.conv_dds(inputs, padding_mask)
+    inputs = predictor.conv_proj(inputs) * padding_mask
+    flows = list(reversed(predictor.flows))
+    flows = flows[:-2] + [flows[-1]]  # 与 HF 实现一致：去掉无用的 vflow
+    for flow in flows:
+        latents = torch.flip(latents, [1])
+        latents, _ = flow(latents, padding_mask, global_conditioning=inputs, reverse=True)
+    log_duration, _ = torch.split(latents, [1, 1], dim=1)
+    return log_duration
+
+
+class VitsEncoderStage(torch.nn.Module):
+    """
+    文本编码 + 时长预测：(input_ids, attention_mask, duration_noise) → (log_duration, prior_means, prior_log_variances)
+    ``duration_noise`` 为 (B, 2, T_in) 的时长噪声（已乘 noise_scale_duration；非随机时长预测时不使用）
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor, duration_noise: torch.Tensor):
+        model = self.model
+        input_padding_mask = attention_mask.unsqueeze(-1).to(duration_noise.dtype)
+        encoder_output = model.text_encoder(
+            input_ids=input_ids,
+            padding_mask=input_padding_mask,
+            attention_mask=attention_mask,
+            return_dict=True,
+        )
+        hidden_states = encoder_output.last_hidden_state.transpose(1, 2)
+        input_padding_mask = input_padding_mask.transpose(1, 2)
+        if model.config.use_stochastic_duration_prediction:
+            log_duration = _stochastic_duration_reverse(
+                model.duration_predictor, hidden_states, input_padding_mask, duration_noise
+            )
+        else:
+            log_duration = model.duration_predictor(hidden_states, input_padding_mask, None)
+        return log_duration, encoder_output.prior_means, encoder_output.prior_log_variances
+
+
+class VitsDecoderStage(torch.nn.Module):
+    """
+    时长展开 + flow + HiFi-GAN：(duration, prior_means, prior_log_variances, prior_noise) → waveform
+    ``duration`` 为 (B, 1, T_in) 的帧数（已按语速缩放并取整，padding 处为 0）；
+    ``prior_noise`` 为 (B, C, T_out) 的先验噪声（已乘 noise_scale），T_out 即本批最长的输出帧数。
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, duration: torch.Tensor, prior_means: torch.Tensor, prior_log_variances: torch.Tensor,
+                prior_noise: torch.Tensor) -> torch.Tensor:
+        batch_size, _, input_length = duration.shape
+        output_length = prior_noise.shape[2]
+        predicted_lengths = torch.clamp_min(torch.sum(duration, [1, 2]), 1)
+
+        # 输出帧 padding 掩码 (B, 1, T_out) 与对齐矩阵 (B, T_out, T_in)；padding 的输入位置时长为 0，不参与对齐
+        indices = torch.arange(output_length, device=duration.device).to(duration.dtype)
+        output_padding_mask = (indices.unsqueeze(0) < predicted_lengths.unsqueeze(1)).unsqueeze(1).to(duration.dtype)
+        cum_duration = torch.cumsum(duration, -1).reshape(-1, 1)
+        valid_indices = (indices.unsqueeze(0) < cum_duration).to(duration.dtype)
+        valid_indices = valid_indices.reshape(batch_size, input_length, output_length)
+        padded_indices = valid_indices - torch.nn.functional.pad(valid_indices, [0, 0, 1, 0, 0, 0])[:, :-1]
+        attn = padded_indices.transpose(1, 2) * output_padding_mask.transpose(1, 2)
+
+        prior_means = torch.matmul(attn, prior_means).transpose(1, 2)
+        prior_log_variances = torch.matmul(attn, prior_log_variances).transpose(1, 2)
+        prior_latents = prior_means + prior_noise * torch.exp(prior_log_variances)
+        latents = self.model.flow(prior_latents, output_padding_mask, None, reverse=True)
+        return self.model.decoder(latents * output_padding_mask, None).squeeze(1)
+
+
+class EagerVitsBackend:
+    """PyTorch eager 推理（两个阶段直接调用 HF 子模块）"""
+
+    name = "torch"
+
+    def __init__(self, model):
+        self.encoder = VitsEncoderStage(model).eval()
+        self.decoder = VitsDecoderStage(model).eval()
+        self.device = next(model.parameters()).device
+        self.dtype = model.decoder.conv_pre.weight.dtype
+        self.sampling_rate = model.config.sampling_rate
+        self.hop_length = int(np.prod(model.config.upsample_rates))
+        self.noise_scale_duration = getattr(model, "noise_scale_duration", 0.8)
+
+    def encode(self, input_ids, attention_mask, duration_noise):
+        return self.encoder(input_ids, attention_mask, duration_noise)
+
+    def decode(self, duration, prior_means, prior_log_variances, prior_noise):
+        return self.decoder(duration, prior_means, prior_log_variances, prior_noise)
+
+
+@torch.inference_mode()
+def batched_vits_forward(
+    backend,
+    input_ids: torch.Tensor,
+    attention_mask: torch.Tensor,
+    speaking_rates: Sequence[float],
+    noise_scales: Sequence[float],
+    noise_scale_durations: Sequence[float],
+    seeds: Sequence[int],
+) -> List[torch.Tensor]:
+    """
+    一次前向合成一批 padding 后的输入（单说话人模型）。两个阶段之间在宿主侧按语速计算帧数，
+    并按各样本的种子生成噪声，因此 eager 与 ONNX 后端在相同种子下结果一致。
+    Args:
+        backend: ``EagerVitsBackend`` 或 ``vits_onnx.OnnxVitsBackend``
+    Returns:
+        每条样本的波形（CPU float 张量，已按预测长度裁剪）
+    """
+    batch_size = input_ids.size(0)
+    device, dtype = backend.device, backend.dtype
+    input_ids, attention_mask = input_ids.to(device), attention_mask.to(device)
+
+    def _column(values: Sequence[float]) -> torch.Tensor:
+        return torch.as_tensor(list(values), dtype=dtype, device=device).view(batch_size, 1, 1)
+
+    generators = [torch.Generator().manual_seed(int(s)) for s in seeds]
+    input_lengths = attention_mask.sum(-1).tolist()
+    duration_noise = _per_item_noise(generators, 2, input_lengths, input_ids.size(1), dtype, device)
+    log_duration, prior_means, prior_log_variances = backend.encode(
+        input_ids, attention_mask, duration_noise * _column(noise_scale_durations)
+    )
+
+    input_padding_mask = attention_mask.unsqueeze(1).to(dtype)
+    duration = torch.ceil(torch.exp(log_duration) * input_padding_mask / _column(speaking_rates))
+    output_lengths = torch.clamp_min(torch.sum(duration, [1, 2]), 1).long().tolist()
+    prior_noise = _per_item_noise(generators, prior_means.size(2), output_lengths, max(output_lengths), dtype, device)
+    waveform = backend.decode(duration, prior_means, prior_log_variances, prior_noise * _column(noise_scales))
+
+    hop_length = backend.hop_length
+    return [waveform[i, :length * hop_length].float().cpu() for i, length in enumerate(output_lengths)]
+
+
+def synthesize_jobs(backend, tokenizer, jobs: Sequence[SegmentJob], max_batch_tokens: int = 4096) -> List[torch.Tensor]:
+    """
+    合成一组片段：分词后按长度排序，按 padding 后的 token 数（最长 × 条数）不超过 ``max_batch_tokens`` 分批前向
+    Returns:
+        与 ``jobs`` 顺序一致的波形；分词结果为空的片段返回空张量
+    """
+    results: List[torch.Tensor] = [torch.zeros(0) for _ in jobs]
+    token_ids = tokenizer([job.text for job in jobs])["input_ids"]
+    order = sorted((i for i, ids in enumerate(token_ids) if ids), key=lambda i: len(token_ids[i]))
+
+    start = 0
+    while start < len(order):
+        end = start + 1
+        while end < len(order) and len(token_ids[order[end]]) * (end - start + 1) <= max_batch_tokens:
+            end += 1
+        chunk = order[start:end]
+        max_len = len(token_ids[chunk[-1]])
+        input_ids = torch.full((len(chunk), max_len), tokenizer.pad_token_id or 0, dtype=torch.long)
+        attention_mask = torch.zeros((len(chunk), max_len), dtype=torch.long)
+        for row, i in enumerate(chunk):
+            ids = token_ids[i]
+            input_ids[row, :len(ids)] = torch.as_tensor(ids, dtype=torch.long)
+            attention_mask[row, :len(ids)] = 1
+        batch_jobs = [jobs[i] for i in chunk]
+        waves = batched_vits_forward(
+            backend,
+            input_ids,
+            attention_mask,
+            speaking_rates=[job.speaking_rate for job in batch_jobs],
+            noise_scales=[job.noise_scale for job in batch_jobs],
+            noise_scale_durations=[
+                backend.noise_scale_duration if job.noise_scale_duration is None else job.noise_scale_duration
+                for job in batch_jobs
+            ],
+            seeds=[job.seed for job in batch_jobs],
+        )
+        for i, wave in zip(chunk, waves):
+            results[i] = wave
+        start = end
+    return results
+
+
+class MicroBatcher:
+    """
+    跨请求的微批处理：片段入队后，工作线程等待至多 ``max_wait`` 秒攒够 ``max_batch`` 条再统一执行
+    ``run_batch``；模型只在该线程内使用，请求线程之间不共享任何可变状态。
+    """
+
+    def __init__(self, run_batch: Callable[[List[SegmentJob]], List[torch.Tensor]],
+                 max_batch: int = 16, max_wait: float = 0.01):
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self.batches = 0
+        self.items = 0
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="vits-batcher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def submit(self, jobs: Sequence[SegmentJob]) -> List[Future]:
+        """同一请求的片段一起入队（尽量落在同一批）"""
+        self.start()
+        futures = []
+        for job in jobs:
+            fut: Future = Future()
+            futures.append(fut)
+            self._queue.put((job, fut))
+        return futures
+
+    def _collect(self, first) -> list:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [item for item in self._collect(first) if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                waves = self.run_batch([job for job, _ in batch])
+            except Exception as e:
+                logger.exception("[TTS] batch inference failed: %s", e)
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, fut), wave in zip(batch, waves):
+                fut.set_result(wave)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
@@ -0,0 +1,245 @@
+"""
+闽南语 VITS 的 ONNX 导出与 onnxruntime 推理（CPU 节点）
+
+导出单元与 eager 批量推理相同（见 vits_batch）：
+    - ``encoder.onnx``：文本编码 + 时长预测，输入 (input_ids, attention_mask, duration_noise)；
+    - ``decoder.onnx``：时长展开 + flow + HiFi-GAN，输入 (duration, prior_means, prior_log_variances, prior_noise)。
+批大小、文本长度、输出帧数均为动态维度；两阶段之间的帧数计算与噪声生成留在宿主侧，
+因此相同种子下 ONNX 与 eager 的输出可直接比对。可选生成动态 int8 量化版本（``*.int8.onnx``）。
+
+导出目录同时保存分词器与 ``vits_onnx.json``（采样率、hop 长度等），服务端使用 ONNX 后端时无需加载 PyTorch 模型。
+
+用法（在 models/tts_service 目录）：
+    python vits_onnx.py --model facebook/mms-tts-nan --out ckpt/mms-tts-nan-onnx --int8
+导出后自动与 eager 输出比对（余弦相似度低于阈值时以非零状态退出）。
+"""
+import argparse
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import torch
+
+from vits_batch import EagerVitsBackend, SegmentJob, VitsDecoderStage, VitsEncoderStage, synthesize_jobs
+
+logger = logging.getLogger("tts_service")
+
+META_NAME = "vits_onnx.json"
+ENCODER_NAME = "encoder"
+DECODER_NAME = "decoder"
+
+
+def _onnx_path(onnx_dir: str, stage: str, int8: bool = False) -> str:
+    return os.path.join(onnx_dir, f"{stage}.int8.onnx" if int8 else f"{stage}.onnx")
+
+
+@torch.no_grad()
+def export_onnx(model, tokenizer, out_dir: str, opset: int = 17, int8: bool = False) -> Dict[str, str]:
+    """
+    导出两个阶段的 ONNX 图（fp32，可选再生成 int8 动态量化版本）
+    Returns:
+        {阶段名: 文件路径}
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    model = model.float().cpu().eval()
+    backend = EagerVitsBackend(model)
+    encoder, decoder = VitsEncoderStage(model).eval(), VitsDecoderStage(model).eval()
+
+    # 示例输入：两条不同长度的文本（让 padding 路径进入图）
+    batch = tokenizer(PARITY_TEXTS[:2], padding=True, return_tensors="pt")
+    input_ids, attention_mask = batch["input_ids"].long(), batch["attention_mask"].long()
+    duration_noise = torch.randn(input_ids.size(0), 2, input_ids.size(1)) * backend.noise_scale_duration
+    log_duration, prior_means, prior_log_variances = encoder(input_ids, attention_mask, duration_noise)
+    duration = torch.ceil(torch.exp(log_duration) * attention_mask.unsqueeze(1).float())
+    output_length = int(torch.clamp_min(duration.sum([1, 2]), 1).max())
+    prior_noise = torch.zeros(input_ids.size(0), prior_means.size(2), output_length)
+
+    paths = {ENCODER_NAME: _onnx_path(out_dir, ENCODER_NAME), DECODER_NAME: _onnx_path(out_dir, DECODER_NAME)}
+    torch.onnx.export(
+        encoder,
+        (input_ids, attention_mask, duration_noise),
+        paths[ENCODER_NAME],
+        input_names=["input_ids", "attention_mask", "duration_noise"],
+        output_names=["log_duration", "prior_means", "prior_log_variances"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "text_len"},
+            "attention_mask": {0: "batch", 1: "text_len"},
+            "duration_noise": {0: "batch", 2: "text_len"},
+            "log_duration": {0: "batch", 2: "text_len"},
+            "prior_means": {0: "batch", 1: "text_len"},
+            "prior_log_variances": {0: "batch", 1: "text_len"},
+        },
+        opset_version=opset,
+        do_constant_folding=True,
+    )
+    torch.onnx.export(
+        decoder,
+        (duration, prior_means, prior_log_variances, prior_noise),
+        paths[DECODER_NAME],
+        input_names=["duration", "prior_means", "prior_log_variances", "prior_noise"],
+        output_names=["waveform"],
+        dynamic_axes={
+            "duration": {0: "batch", 2: "text_len"},
+            "prior_means": {0: "batch", 1: "text_len"},
+            "prior_log_variances": {0: "batch", 1: "text_len"},
+            "prior_noise": {0: "batch", 2: "frames"},
+            "waveform": {0: "batch", 1: "samples"},
+        },
+        opset_version=opset,
+        do_constant_folding=True,
+    )
+
+    if int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        for stage in (ENCODER_NAME, DECODER_NAME):
+            paths[f"{stage}.int8"] = _onnx_path(out_dir, stage, int8=True)
+            quantize_dynamic(paths[stage], paths[f"{stage}.int8"], weight_type=QuantType.QInt8)
+
+    meta = {
+        "sampling_rate": backend.sampling_rate,
+        "hop_length": backend.hop_length,
+        "noise_scale_duration": backend.noise_scale_duration,
+        "opset": opset,
+    }
+    with open(os.path.join(out_dir, META_NAME), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    tokenizer.save_pretrained(out_dir)
+    return paths
+
+
+class OnnxVitsBackend:
+    """onnxruntime CPU 推理，接口与 ``EagerVitsBackend`` 相同（供 ``synthesize_jobs`` 使用）"""
+
+    name = "onnx"
+
+    def __init__(self, onnx_dir: str, int8: bool = False, intra_op_threads: int = 0, inter_op_threads: int = 1):
+        """
+        Args:
+            onnx_dir: ``export_onnx`` 的输出目录
+            int8: 使用动态 int8 量化的图
+            intra_op_threads: 单个算子内的并行线程数，0 表示由 onnxruntime 按物理核数决定
+            inter_op_threads: 算子间并行线程数（图基本是串行的，默认 1）
+        """
+        import onnxruntime as ort
+
+        with open(os.path.join(onnx_dir, META_NAME), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.sampling_rate = meta["sampling_rate"]
+        self.hop_length = meta["hop_length"]
+        self.noise_scale_duration = meta["noise_scale_duration"]
+        self.device = torch.device("cpu")
+        self.dtype = torch.float32
+        self.int8 = int8
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        providers = ["CPUExecutionProvider"]
+        self.encoder = ort.InferenceSession(_onnx_path(onnx_dir, ENCODER_NAME, int8), options, providers=providers)
+        self.decoder = ort.InferenceSession(_onnx_path(onnx_dir, DECODER_NAME, int8), options, providers=providers)
+        # 非随机时长预测的模型导出后没有 duration_noise 输入
+        self._encoder_inputs = {i.name for i in self.encoder.get_inputs()}
+
+    def encode(self, input_ids, attention_mask, duration_noise):
+        feeds = {
+            "input_ids": input_ids.numpy().astype(np.int64, copy=False),
+            "attention_mask": attention_mask.numpy().astype(np.int64, copy=False),
+            "duration_noise": duration_noise.numpy().astype(np.float32, copy=False),
+        }
+        outputs = self.encoder.run(None, {k: v for k, v in feeds.items() if k in self._encoder_inputs})
+        return tuple(torch.from_numpy(o) for o in outputs)
+
+    def decode(self, duration, prior_means, prior_log_variances, prior_noise):
+        (waveform,) = self.decoder.run(None, {
+            "duration": duration.numpy().astype(np.float32, copy=False),
+            "prior_means": prior_means.numpy().astype(np.float32, copy=False),
+            "prior_log_variances": prior_log_variances.numpy().astype(np.float32, copy=False),
+            "prior_noise": prior_noise.numpy().astype(np.float32, copy=False),
+        })
+        return torch.from_numpy(waveform)
+
+
+def waveform_similarity(reference: torch.Tensor, candidate: torch.Tensor) -> Dict[str, float]:
+    """波形相似度：长度比、重叠部分的余弦相似度与 SNR（dB）"""
+    n = min(reference.numel(), candidate.numel())
+    ref, cand = reference[:n].double(), candidate[:n].double()
+    cosine = float(torch.dot(ref, cand) / (ref.norm() * cand.norm()).clamp_min(1e-12))
+    noise = (ref - cand).pow(2).sum().clamp_min(1e-12)
+    snr = float(10 * torch.log10(ref.pow(2).sum().clamp_min(1e-12) / noise))
+    return {
+        "length_ratio": candidate.numel() / max(reference.numel(), 1),
+        "cosine": cosine,
+        "snr_db": snr,
+    }
+
+
+def parity_check(reference_backend, candidate_backend, tokenizer, texts: Sequence[str],
+                 speaking_rate: float = 1.0, seed: int = 42) -> List[Dict[str, float]]:
+    """同一批文本、相同种子下，比较两个后端逐条输出的波形"""
+    jobs = [SegmentJob(text, speaking_rate=speaking_rate, seed=seed) for text in texts]
+    reference = synthesize_jobs(reference_backend, tokenizer, jobs)
+    candidate = synthesize_jobs(candidate_backend, tokenizer, jobs)
+    return [waveform_similarity(r, c) for r, c in zip(reference, candidate)]
+
+
+def summarize_parity(results: List[Dict[str, float]], min_cosine: float) -> Optional[str]:
+    """汇总比对结果；未达标时返回原因"""
+    worst = min(results, key=lambda r: r["cosine"])
+    logger.info("[TTS-ONNX] parity: min_cosine=%.4f min_snr=%.1fdB length_ratio=%.3f~%.3f",
+                worst["cosine"], min(r["snr_db"] for r in results),
+                min(r["length_ratio"] for r in results), max(r["length_ratio"] for r in results))
+    if worst["cosine"] < min_cosine:
+        return f"最小余弦相似度 {worst['cosine']:.4f} 低于阈值 {min_cosine}"
+    return None
+
+
+# 服务只会把 POJ 送进模型（后端 poj_converter 的输出格式），比对也用 POJ，覆盖真实的词表与声调符号
+PARITY_TEXTS = [
+    "ta̍k-ke-hó góa-sī-Tân-Kah-kiⁿ",  # 逐家好，我是陈嘉庚
+    "kàu-io̍k-sī-li̍p-kok-ê-kun-pún heng-ha̍k-sī-kok-bîn-ê-thiⁿ-chit",  # 教育是立国的根本，兴学是国民的天职
+    "Chi̍p-bí-ha̍k-chhoan-sī-goán-kò͘-hiong goán-tī-chia-chhòng-pān-liáu-sió-ha̍k tiong-ha̍k "
+    "su-hoān-kap-hâng-hái-ha̍k-hāu",  # 集美学村是阮故乡，阮佇遮创办了小学、中学、师范佮航海学校
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="闽南语 VITS ONNX 导出")
+    parser.add_argument("--model", type=str, default="facebook/mms-tts-nan")
+    parser.add_argument("--out", type=str, default="ckpt/mms-tts-nan-onnx")
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--int8", action="store_true", help="同时生成动态 int8 量化版本")
+    parser.add_argument("--min_cosine", type=float, default=0.99, help="fp32 图与 eager 的最小余弦相似度")
+    parser.add_argument("--min_cosine_int8", type=float, default=0.9, help="int8 图与 eager 的最小余弦相似度")
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer, VitsModel
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    model = VitsModel.from_pretrained(args.model).eval()
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    paths = export_onnx(model, tokenizer, args.out, opset=args.opset, int8=args.int8)
+    for stage, path in paths.items():
+        print(f">> {stage}: {path} ({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
+
+    eager = EagerVitsBackend(model)
+    failures = []
+    for int8, threshold in [(False, args.min_cosine)] + ([(True, args.min_cosine_int8)] if args.int8 else []):
+        results = parity_check(eager, OnnxVitsBackend(args.out, int8=int8), tokenizer, PARITY_TEXTS)
+        for text, r in zip(PARITY_TEXTS, results):
+            print(f"   [{'int8' if int8 else 'fp32'}] cos={r['cosine']:.4f} snr={r['snr_db']:.1f}dB "
+                  f"len={r['length_ratio']:.3f} {text}")
+        reason = summarize_parity(results, threshold)
+        if reason:
+            failures.append(f"{'int8' if int8 else 'fp32'}: {reason}")
+    if failures:
+        raise SystemExit("一致性检查未通过: " + "; ".join(failures))
+    print(">> 一致性检查通过")
+
+
+if __name__ == "__main__":
+    main()
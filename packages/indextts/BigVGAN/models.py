@@ -198,9 +198,20 @@ class BigVGAN(torch.nn.Module):
 
         # self.logit_scale = nn.Parameter(torch.ones([]) * np.log(1 / 0.07))
 
-    def forward(self, x, mel_ref, lens=None):
-        speaker_embedding = self.speaker_encoder(mel_ref, lens)
+    def get_speaker_embedding(self, mel_ref, lens=None):
+        """
+        ECAPA-TDNN speaker embedding of the reference mel, shape (b, 1, speaker_embedding_dim).
+        It only depends on the reference audio, so callers can compute it once and pass it to
+        ``forward(speaker_embedding=...)`` for every vocoder call with the same prompt.
+        """
+        return self.speaker_encoder(mel_ref, lens)
+
+    def forward(self, x, mel_ref=None, lens=None, speaker_embedding=None):
+        if speaker_embedding is None:
+            speaker_embedding = self.get_speaker_embedding(mel_ref, lens)
         n_batch = x.size(0)
+        if speaker_embedding.size(0) == 1 and n_batch > 1:
+            speaker_embedding = speaker_embedding.expand(n_batch, -1, -1)
         contrastive_loss = None
         if n_batch * 2 == speaker_embedding.size(0):
             spe_emb_chunk1, spe_emb_chunk2 = speaker_embedding[:n_batch, :, :], speaker_embedding[n_batch:, :, :]
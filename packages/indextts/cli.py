@@ -15,6 +15,11 @@ def main():
     parser.add_argument("--fp16", action="store_true", default=True, help="Use FP16 for inference if available")
     parser.add_argument("-f", "--force", action="store_true", default=False, help="Force to overwrite the output file if it exists")
     parser.add_argument("-d", "--device", type=str, default=None, help="Device to run the model on (cpu, cuda, mps)." )
+    parser.add_argument("--snapshot", type=str, default=None, help="Path to a prepared model snapshot (built by `python -m indextts.utils.snapshot`)")
+    parser.add_argument("--quantize", type=str, default=None, choices=["int8"], help="CPU only: dynamic int8 quantization for the GPT")
+    parser.add_argument("--bigvgan_bf16", action="store_true", default=False, help="CPU only: run BigVGAN in bf16 if supported by the CPU")
+    parser.add_argument("--speculative_layers", type=int, default=0, help="Enable speculative decoding with a draft model of the first N GPT layers (requires beam size 1, 0 disables)")
+    parser.add_argument("--speculative_k", type=int, default=4, help="Mel codes proposed by the draft model per step")
     args = parser.parse_args()
     if len(args.text.strip()) == 0:
         print("ERROR: Text is empty.")
@@ -24,7 +29,7 @@ def main():
         print(f"Audio prompt file {args.voice} does not exist.")
         parser.print_help()
         sys.exit(1)
-    if not os.path.exists(args.config):
+    if args.snapshot is None and not os.path.exists(args.config):
         print(f"Config file {args.config} does not exist.")
         parser.print_help()
         sys.exit(1)
@@ -55,8 +60,11 @@ def main():
             print("WARNING: Running on CPU may be slow.")
 
     from indextts.infer import IndexTTS
-    tts = IndexTTS(cfg_path=args.config, model_dir=args.model_dir, is_fp16=args.fp16, device=args.device)
-    tts.infer(audio_prompt=args.voice, text=args.text.strip(), output_path=output_path)
+    tts = IndexTTS(cfg_path=args.config, model_dir=args.model_dir, is_fp16=args.fp16, device=args.device,
+                   snapshot_path=args.snapshot, quantize=args.quantize, bigvgan_bf16=args.bigvgan_bf16,
+                   speculative_draft_layers=args.speculative_layers, num_speculative_tokens=args.speculative_k)
+    generation_kwargs = {"num_beams": 1} if args.speculative_layers else {}
+    tts.infer(audio_prompt=args.voice, text=args.text.strip(), output_path=output_path, **generation_kwargs)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
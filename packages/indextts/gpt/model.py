@@ -9,6 +9,7 @@ from transformers import (
     GPT2Config,
     GPT2PreTrainedModel,
     LogitsProcessorList,
+    StoppingCriteriaList,
 )
 from transformers.modeling_outputs import CausalLMOutputWithCrossAttentions
 from transformers.utils.model_parallel_utils import assert_device_map, get_device_map
@@ -16,6 +17,7 @@ from transformers.utils.model_parallel_utils import assert_device_map, get_devic
 from indextts.gpt.conformer_encoder import ConformerEncoder
 from indextts.gpt.perceiver import PerceiverResampler
 from indextts.utils.arch_util import AttentionBlock
+from indextts.utils.cancellation import CancellationStoppingCriteria
 from indextts.utils.typical_sampling import TypicalLogitsWarper
 
 
@@ -392,6 +394,11 @@ class UnifiedVoice(nn.Module):
             
         # 初始化 mean_condition 为 None，后续可以设置
         self.mean_condition = None
+        # 多说话人条件表（build_speaker_table 构建）：(num_speakers, 32, dim) 与 speaker_id -> 行号
+        self.speaker_conds = None
+        self.speaker_rows = {}
+        # 投机解码（enable_speculative 开启），None 表示关闭
+        self.speculative = None
 
     def post_init_gpt2_config(self, use_deepspeed=False, kv_cache=False, half=False):
         seq_length = self.max_mel_tokens + self.max_text_tokens + 2
@@ -434,6 +441,20 @@ class UnifiedVoice(nn.Module):
         # self.inference_model = PrunedGPT2InferenceModel(gpt_config, self.gpt, self.mel_pos_embedding, self.mel_embedding, self.final_norm, self.mel_head)
         self.gpt.wte = self.mel_embedding
 
+    def enable_speculative(self, draft_layers: int, num_speculative_tokens: int = 4):
+        """
+        开启投机解码：用前 draft_layers 层（与完整模型共享权重）作为草稿模型，
+        每步提出 num_speculative_tokens 个 mel code，由完整模型一次前向验证。
+        需在 post_init_gpt2_config 之后调用；仅对 batch=1 且 num_beams=1 的生成生效。
+        """
+        from indextts.gpt.speculative import SpeculativeDecoder
+
+        self.speculative = SpeculativeDecoder(self, draft_layers, num_speculative_tokens)
+        logger.info(f"Speculative decoding enabled: draft_layers={draft_layers}/{self.layers}, k={num_speculative_tokens}")
+
+    def disable_speculative(self):
+        self.speculative = None
+
     def build_aligned_inputs_and_targets(self, input, start_token, stop_token):
         inp = F.pad(input, (1, 0), value=start_token)
         tar = F.pad(input, (0, 1), value=stop_token)
@@ -495,10 +516,46 @@ class UnifiedVoice(nn.Module):
         else:
             return first_logits
 
+    def build_speaker_table(self):
+        """
+        把所有 mean_condition_{speaker_id} 合并为一张连续的条件表，推理加载完成后调用一次。
+        条件向量即 GPT 输入的前缀 embedding，表中已是模型的设备与 dtype，
+        查表时批量 index_select，不再逐个 getattr / .to(device) / reshape。
+        训练时不调用（各说话人条件是独立的 Parameter），get_conditioning 走原来的逐个查找。
+        """
+        conds, rows = [], {}
+        for name, param in self.named_parameters():
+            if not name.startswith("mean_condition_"):
+                continue
+            cond = param.detach()
+            # 统一为 (32, dim)
+            while cond.ndim > 2:
+                cond = cond.squeeze(0)
+            rows[name[len("mean_condition_"):]] = len(conds)
+            conds.append(cond)
+        if not conds:
+            self.speaker_conds, self.speaker_rows = None, {}
+            return
+        self.speaker_conds = torch.stack(conds, dim=0).contiguous()
+        self.speaker_rows = rows
+
+    def lookup_speaker_conditions(self, speaker_ids):
+        """按 speaker_id 批量查条件表，返回 (len(speaker_ids), 32, dim)"""
+        for speaker_id in speaker_ids:
+            if speaker_id not in self.speaker_rows:
+                raise ValueError(f"No condition found for speaker {speaker_id}")
+        if len(speaker_ids) == 1:
+            row = self.speaker_rows[speaker_ids[0]]
+            return self.speaker_conds[row:row + 1]
+        index = torch.tensor([self.speaker_rows[speaker_id] for speaker_id in speaker_ids],
+                             dtype=torch.long, device=self.speaker_conds.device)
+        return self.speaker_conds.index_select(0, index)
+
     def get_conditioning(self, speech_conditioning_input, cond_mel_lengths=None, speaker_ids=None):
         # 如果设置了多说话人的 mean_condition，根据 speaker_id 选择对应的条件向量
+        if speaker_ids is not None and self.speaker_conds is not None:
+            return self.lookup_speaker_conditions(speaker_ids)
         if speaker_ids is not None:
-            batch_size = len(speaker_ids)
             device = speech_conditioning_input.device if speech_conditioning_input is not None else next(self.parameters()).device
             # 为每个样本选择对应说话人的 mean_condition
             conds_list = []
@@ -534,7 +591,13 @@ class UnifiedVoice(nn.Module):
             # 直接扩展到批次大小
             return self.mean_condition.expand(batch_size, -1, -1)
         
-        # 原有的动态计算逻辑
+        return self.encode_conditioning(speech_conditioning_input, cond_mel_lengths)
+
+    def encode_conditioning(self, speech_conditioning_input, cond_mel_lengths=None):
+        """
+        从参考音频 mel 动态计算条件向量（不走 mean_condition），
+        用于音色克隆：每个参考音频只计算一次，结果存入声音档案后直接传给 ``conds_latent``。
+        """
         if self.condition_type == "perceiver":
             if speech_conditioning_input.ndim == 4:
                 speech_conditioning_input = speech_conditioning_input.squeeze(1)
@@ -569,7 +632,7 @@ class UnifiedVoice(nn.Module):
 
     def forward(self, speech_conditioning_latent, text_inputs, text_lengths, mel_codes, wav_lengths,
                 cond_mel_lengths=None, types=None, text_first=True, raw_mels=None, return_attentions=False,
-                return_latent=False, clip_inputs=False, speaker_ids=None):
+                return_latent=False, clip_inputs=False, speaker_ids=None, conds_latent=None):
         """
         Forward pass that uses both text and voice in either text conditioning mode or voice conditioning mode
         (actuated by `text_first`).
@@ -584,9 +647,13 @@ class UnifiedVoice(nn.Module):
         If return_attentions is specified, only logits are returned.
         If return_latent is specified, loss & logits are not computed or returned. Only the predicted latents are returned.
         If clip_inputs is True, the inputs will be clipped to the smallest input size across each input modality.
+        If conds_latent (b or 1, 32, dim) is given, it is used directly instead of `get_conditioning()`.
         """
 
-        speech_conditioning_latent = self.get_conditioning(speech_conditioning_latent, cond_mel_lengths, speaker_ids)
+        if conds_latent is not None:
+            speech_conditioning_latent = conds_latent.expand(text_inputs.shape[0], -1, -1)
+        else:
+            speech_conditioning_latent = self.get_conditioning(speech_conditioning_latent, cond_mel_lengths, speaker_ids)
         # Types are expressed by expanding the text embedding space.
         if types is not None:
             text_inputs = text_inputs * (1 + types).unsqueeze(-1)
@@ -658,38 +725,29 @@ class UnifiedVoice(nn.Module):
         single_cond = conditional_latents.ndim == 3 and conditional_latents.shape[0] == 1
         if not single_cond:
             assert conditional_latents.shape[0] == b, f"batch size mismatch: {conditional_latents.shape[0]} vs {b}"
-        batched_mel_emb = []
-        attention_masks = []
-        target_len = conditional_latents.shape[1] + L + 2
-        for i in range(b):
-            valid_mask = (text_inputs[i] != self.stop_text_token) & (text_inputs[i] != self.start_text_token)
-            text_input = text_inputs[i][valid_mask]
-            text_input = F.pad(text_input, (1, 0), value=self.start_text_token)
-            text_input = F.pad(text_input, (0, 1), value=self.stop_text_token)
-            text_input_pos = torch.arange(0, text_input.size(-1), device=device)
-            text_emb = self.text_embedding(text_input) + self.text_pos_embedding.emb(text_input_pos)
-            # concatenate [conditional latents][text embeddings]
-            conds_text_emb = [
-                conditional_latents.squeeze(0) if single_cond else conditional_latents[i],
-                text_emb,
-            ]
-            # +1 for the start_mel_token
-            attention_mask = torch.ones(target_len+1, dtype=torch.long, device=device)
-            # check this text input is padded
-            padding: int = L + 2 - text_input.size(-1)
-            # pad left of [cond][text] -> [pad][cond][text]
-            if padding > 0:
-                pad = torch.zeros((padding, conditional_latents.size(-1)), dtype=text_emb.dtype, device=device) # [p, dim]
-                conds_text_emb.insert(0, pad)
-                attention_mask[:padding] = 0
-            mel_emb = torch.cat(conds_text_emb) #[s, dim]
-            assert mel_emb.shape[0] == target_len, f"mel_emb.shape: {mel_emb.shape}, target_len: {target_len}"
-            batched_mel_emb.append(mel_emb)
-            attention_masks.append(attention_mask)
-        # [b, s, dim]
-        batched_mel_emb = torch.stack(batched_mel_emb, dim=0)
-        # [b, s+1]
-        attention_mask = torch.stack(attention_masks, dim=0)
+        cond_len = conditional_latents.shape[1]
+        target_len = cond_len + L + 2
+        # 整批一次完成，不再逐样本循环：
+        # 1. 去掉原有的 start/stop，把有效 token 左对齐为 [start][text][stop][填充]
+        valid_mask = (text_inputs != self.stop_text_token) & (text_inputs != self.start_text_token)
+        valid_lens = valid_mask.sum(dim=1)  # (b,)
+        compact_pos = torch.cumsum(valid_mask.long(), dim=1)  # 有效 token 在 [start] 之后的位置
+        aligned = torch.full((b, L + 2), self.stop_text_token, dtype=text_inputs.dtype, device=device)
+        aligned[:, 0] = self.start_text_token
+        aligned.scatter_(1, torch.where(valid_mask, compact_pos, L + 1), torch.where(valid_mask, text_inputs, self.stop_text_token))
+        text_pos = torch.arange(L + 2, device=device)
+        text_emb = self.text_embedding(aligned) + self.text_pos_embedding.emb(text_pos).unsqueeze(0)
+        # 2. [cond][text][填充] 整体右移 padding 位，得到 [pad][cond][text]
+        conds = conditional_latents.expand(b, -1, -1) if single_cond else conditional_latents
+        left_aligned = torch.cat([conds, text_emb], dim=1)  # [b, s, dim]
+        padding = L - valid_lens  # (b,)
+        columns = torch.arange(target_len, device=device).unsqueeze(0) - padding.unsqueeze(1)  # [b, s]
+        batched_mel_emb = torch.gather(
+            left_aligned, 1, columns.clamp(min=0).unsqueeze(-1).expand(-1, -1, left_aligned.shape[-1])
+        )
+        batched_mel_emb = batched_mel_emb.masked_fill((columns < 0).unsqueeze(-1), 0)
+        # +1 for the start_mel_token
+        attention_mask = F.pad((columns >= 0).long(), (0, 1), value=1)
         # [b, s+1]
         fake_inputs = torch.ones(
             (
@@ -702,7 +760,9 @@ class UnifiedVoice(nn.Module):
         fake_inputs[:, -1] = self.start_mel_token
         return fake_inputs, batched_mel_emb, attention_mask
     def inference_speech(self, speech_conditioning_mel, text_inputs, cond_mel_lengths=None, input_tokens=None, num_return_sequences=1,
-                         max_generate_length=None, typical_sampling=False, typical_mass=.9, speaker_ids=None, **hf_generate_kwargs):
+                         max_generate_length=None, typical_sampling=False, typical_mass=.9, speaker_ids=None,
+                         use_speculative=True, conds_latent=None, cancel_token=None, speculative_stats=None,
+                         **hf_generate_kwargs):
         """
         Args:
             speech_conditioning_mel: (b, n_mels, frames) or (n_mels, frames)
@@ -710,13 +770,18 @@ class UnifiedVoice(nn.Module):
             cond_mel_lengths: lengths of the conditioning mel spectrograms in shape (b,) or (1,)
             input_tokens: additional tokens for generation in shape (b, s) or (s,)
             max_generate_length: limit the number of generated tokens
+            use_speculative: use speculative decoding if enabled and applicable (b=1, num_beams=1)
+            conds_latent: precomputed (1, 32, dim) conditioning (e.g. from a voice profile), skips `get_conditioning()`
+            cancel_token: `CancellationToken` checked at every decoding step, raises `InferenceCancelled` once set
+            speculative_stats: `SpeculativeStats` of the calling request, filled when speculative decoding is used
             hf_generate_kwargs: kwargs for `GPT2InferenceModel.generate(**hf_generate_kwargs)`
         """
         if speech_conditioning_mel.ndim == 2:
             speech_conditioning_mel = speech_conditioning_mel.unsqueeze(0)
         if cond_mel_lengths is None:
             cond_mel_lengths = torch.tensor([speech_conditioning_mel.shape[-1]], device=speech_conditioning_mel.device)
-        conds_latent = self.get_conditioning(speech_conditioning_mel, cond_mel_lengths, speaker_ids=speaker_ids)
+        if conds_latent is None:
+            conds_latent = self.get_conditioning(speech_conditioning_mel, cond_mel_lengths, speaker_ids=speaker_ids)
         input_ids, inputs_embeds, attention_mask = self.prepare_gpt_inputs(conds_latent, text_inputs)
         self.inference_model.store_mel_emb(inputs_embeds)
         if input_tokens is None:
@@ -744,12 +809,49 @@ class UnifiedVoice(nn.Module):
             min_tokens_to_keep = 2 if hf_generate_kwargs.get("num_beams", 1) > 1 else 1
             logits_processor.append(TypicalLogitsWarper(mass=typical_mass, min_tokens_to_keep=min_tokens_to_keep))
         max_length = (trunc_index + self.max_mel_tokens - 1) if max_generate_length is None else trunc_index + max_generate_length
+        if (
+            use_speculative
+            and self.speculative is not None
+            and inputs.shape[0] == 1
+            and num_return_sequences == 1
+            and hf_generate_kwargs.get("num_beams", 1) == 1
+            and not hf_generate_kwargs.get("return_dict_in_generate", False)
+        ):
+            from indextts.gpt.speculative import build_logits_processors
+
+            processors = build_logits_processors(
+                do_sample=hf_generate_kwargs.get("do_sample", False),
+                temperature=hf_generate_kwargs.get("temperature", 1.0),
+                top_k=hf_generate_kwargs.get("top_k", None),
+                top_p=hf_generate_kwargs.get("top_p", 1.0),
+                repetition_penalty=hf_generate_kwargs.get("repetition_penalty", 1.0),
+                extra=logits_processor,
+            )
+            output = self.speculative.generate(
+                inputs,
+                inputs_embeds,
+                max_length=max_length,
+                stop_token=self.stop_mel_token,
+                processors=processors,
+                do_sample=hf_generate_kwargs.get("do_sample", False),
+                should_stop=(lambda: cancel_token.cancelled) if cancel_token is not None else None,
+                stats=speculative_stats,
+            )
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            return output[:, trunc_index:]
+        if cancel_token is not None:
+            stopping_criteria = StoppingCriteriaList(hf_generate_kwargs.pop("stopping_criteria", None) or [])
+            stopping_criteria.append(CancellationStoppingCriteria(cancel_token))
+            hf_generate_kwargs["stopping_criteria"] = stopping_criteria
         output = self.inference_model.generate(inputs, 
                                             bos_token_id=self.start_mel_token, pad_token_id=self.stop_mel_token,
                                             eos_token_id=self.stop_mel_token, attention_mask=attention_mask,
                                             max_length=max_length, logits_processor=logits_processor,
                                             num_return_sequences=num_return_sequences,
                                             **hf_generate_kwargs)
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
         if isinstance(output, torch.Tensor):
             return output[:, trunc_index:]
         # GenerateOutput
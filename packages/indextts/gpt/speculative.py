@@ -0,0 +1,274 @@
+"""
+Speculative decoding for UnifiedVoice mel-code generation.
+
+A layer-truncated copy of the GPT2 stack (sharing all weights, embeddings and the
+mel head with the full model) drafts ``k`` mel codes; the full model scores the
+draft in a single forward pass and accepts/rejects them with the standard
+speculative sampling rule, so the output distribution is identical to sampling
+from the full model with the same logits processors (repetition penalty,
+temperature, top-k/top-p, typical).
+
+Only batch size 1 without beam search is supported; other cases fall back to
+``GPT2InferenceModel.generate``.
+"""
+import copy
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import torch
+import torch.nn as nn
+from transformers import (
+    LogitsProcessorList,
+    RepetitionPenaltyLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper,
+)
+
+
+@dataclass
+class SpeculativeStats:
+    proposed: int = 0
+    accepted: int = 0
+    target_forwards: int = 0
+    generated: int = 0
+    history: list = field(default_factory=list)
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted / self.proposed if self.proposed else 0.0
+
+    def merge(self, other: "SpeculativeStats") -> None:
+        """累加另一次调用的计数（不合并逐步的 history）"""
+        self.proposed += other.proposed
+        self.accepted += other.accepted
+        self.target_forwards += other.target_forwards
+        self.generated += other.generated
+
+    def reset(self):
+        self.proposed = 0
+        self.accepted = 0
+        self.target_forwards = 0
+        self.generated = 0
+        self.history = []
+
+
+def build_draft_transformer(gpt: nn.Module, num_layers: int) -> nn.Module:
+    """
+    Shallow copy of a HF GPT2Model keeping only the first ``num_layers`` blocks.
+    Blocks, ln_f and every other submodule are shared with ``gpt`` (no extra weights).
+    """
+    if not 0 < num_layers < len(gpt.h):
+        raise ValueError(f"draft layers must be in [1, {len(gpt.h) - 1}], got {num_layers}")
+    draft = copy.copy(gpt)
+    # copy.copy shares the _modules dict, give the draft its own before replacing `h`
+    draft._modules = dict(gpt._modules)
+    draft.h = nn.ModuleList(list(gpt.h)[:num_layers])
+    draft.config = copy.deepcopy(gpt.config)
+    draft.config.n_layer = num_layers
+    return draft
+
+
+def _crop_past(past, length: int):
+    if past is None:
+        return None
+    if hasattr(past, "crop"):
+        past.crop(length)
+        return past
+    return tuple(tuple(t[:, :, :length] for t in layer) for layer in past)
+
+
+def build_logits_processors(
+    do_sample: bool = True,
+    temperature: float = 1.0,
+    top_k: Optional[int] = None,
+    top_p: float = 1.0,
+    repetition_penalty: float = 1.0,
+    extra: Optional[LogitsProcessorList] = None,
+) -> LogitsProcessorList:
+    """Same processor/warper order as ``GenerationMixin.generate``."""
+    processors = LogitsProcessorList()
+    if repetition_penalty is not None and repetition_penalty != 1.0:
+        processors.append(RepetitionPenaltyLogitsProcessor(penalty=repetition_penalty))
+    if extra:
+        processors.extend(extra)
+    if do_sample:
+        if temperature is not None and temperature != 1.0:
+            processors.append(TemperatureLogitsWarper(temperature))
+        if top_k is not None and top_k > 0:
+            processors.append(TopKLogitsWarper(top_k=top_k, min_tokens_to_keep=1))
+        if top_p is not None and top_p < 1.0:
+            processors.append(TopPLogitsWarper(top_p=top_p, min_tokens_to_keep=1))
+    return processors
+
+
+class SpeculativeDecoder:
+    def __init__(self, model: nn.Module, draft_layers: int, num_speculative_tokens: int = 4):
+        """
+        Args:
+            model: UnifiedVoice (after ``post_init_gpt2_config``)
+            draft_layers: number of leading GPT2 blocks used by the draft model
+            num_speculative_tokens: codes proposed by the draft per verification step
+        """
+        self.model = model
+        self.draft_layers = draft_layers
+        self.num_speculative_tokens = max(1, num_speculative_tokens)
+        self.draft = build_draft_transformer(model.gpt, draft_layers)
+        # generate 可能被多个线程并发调用：每次调用的统计在局部对象中累计，结束后加锁并入进程级累计值
+        self.totals = SpeculativeStats()
+        self._totals_lock = threading.Lock()
+
+    def _embed(self, seq: torch.Tensor, cached_emb: torch.Tensor, start: int, end: int) -> torch.Tensor:
+        """
+        Embeddings for absolute positions [start, end) of ``seq``.
+        Positions < mel_len come from the cached [cond][text] embedding; mel positions
+        replicate ``GPT2InferenceModel.forward`` (start token at 0, then attention_mask length - mel_len).
+        """
+        mel_len = cached_emb.shape[1]
+        parts = []
+        if start < mel_len:
+            parts.append(cached_emb[:, start:min(end, mel_len)])
+        if end > mel_len:
+            s = max(start, mel_len)
+            ids = seq[:, s:end]
+            pos = torch.arange(s, end, device=seq.device) - mel_len
+            pos = pos + (pos > 0).long()
+            parts.append(self.model.mel_embedding(ids) + self.model.mel_pos_embedding.emb(pos).unsqueeze(0))
+        return torch.cat(parts, dim=1) if len(parts) > 1 else parts[0]
+
+    def _forward(self, transformer, seq, cached_emb, past, start, end, num_logits):
+        emb = self._embed(seq, cached_emb, start, end)
+        attention_mask = torch.ones((1, end), dtype=torch.long, device=seq.device)
+        out = transformer(
+            inputs_embeds=emb,
+            past_key_values=past,
+            attention_mask=attention_mask,
+            use_cache=True,
+            return_dict=True,
+        )
+        hidden = out.last_hidden_state[:, -num_logits:]
+        logits = self.model.mel_head(self.model.final_norm(hidden))
+        return logits.float(), out.past_key_values
+
+    @staticmethod
+    def _pick(scores: torch.Tensor, do_sample: bool):
+        if do_sample:
+            probs = torch.softmax(scores, dim=-1)
+            return torch.multinomial(probs, num_samples=1), probs
+        return scores.argmax(dim=-1, keepdim=True), None
+
+    @torch.no_grad()
+    def generate(
+        self,
+        inputs: torch.Tensor,
+        cached_emb: torch.Tensor,
+        max_length: int,
+        stop_token: int,
+        processors: LogitsProcessorList,
+        do_sample: bool,
+        should_stop: Optional[Callable[[], bool]] = None,
+        stats: Optional[SpeculativeStats] = None,
+    ) -> torch.Tensor:
+        """
+        Args:
+            inputs: (1, mel_len + 1) fake prompt ids ending with start_mel_token
+            cached_emb: (1, mel_len, dim) [cond][text] embeddings (``store_mel_emb``)
+            max_length: same meaning as ``generate(max_length=...)``
+            should_stop: checked before every draft/verify step, e.g. request cancellation
+            stats: per-call counters to accumulate into (owned by the caller, never shared across threads)
+        Returns:
+            (1, max_length') full sequence including the prompt, like ``generate``
+        """
+        assert inputs.shape[0] == 1, "speculative decoding only supports batch size 1"
+        if stats is None:
+            stats = SpeculativeStats()
+        call_stats = SpeculativeStats()
+        seq = inputs
+        past_t, past_d = None, None
+        t_len, d_len = 0, 0
+        k = self.num_speculative_tokens
+        while seq.shape[1] < max_length:
+            if should_stop is not None and should_stop():
+                break
+            cur_len = seq.shape[1]
+            n = min(k, max_length - cur_len - 1)
+
+            # 1) draft proposes n codes
+            draft_tokens, draft_probs = [], []
+            if n > 0:
+                d_logits, past_d = self._forward(self.draft, seq, cached_emb, past_d, d_len, cur_len, 1)
+                d_len = cur_len
+                d_seq = seq
+                for i in range(n):
+                    scores = processors(d_seq, d_logits[:, -1])
+                    token, q = self._pick(scores, do_sample)
+                    draft_tokens.append(token)
+                    draft_probs.append(q)
+                    d_seq = torch.cat([d_seq, token], dim=1)
+                    if token.item() == stop_token:
+                        break
+                    if i < n - 1:
+                        d_logits, past_d = self._forward(self.draft, d_seq, cached_emb, past_d, d_len, d_len + 1, 1)
+                        d_len += 1
+                n = len(draft_tokens)
+                cand = d_seq
+            else:
+                cand = seq
+
+            # 2) full model scores [last token][draft codes] in one pass
+            t_logits, past_t = self._forward(self.model.gpt, cand, cached_emb, past_t, t_len, cand.shape[1], n + 1)
+            t_len = cand.shape[1]
+            call_stats.target_forwards += 1
+            call_stats.proposed += n
+
+            # 3) accept / reject left to right
+            accepted = 0
+            new_token = None
+            for j in range(n):
+                prefix = cand[:, : cur_len + j]
+                scores = processors(prefix, t_logits[:, j])
+                x = draft_tokens[j]
+                if do_sample:
+                    p = torch.softmax(scores, dim=-1)
+                    q = draft_probs[j]
+                    px = p[0, x.item()]
+                    qx = q[0, x.item()]
+                    if qx > 0 and torch.rand((), device=p.device) < torch.clamp(px / qx, max=1.0):
+                        accepted += 1
+                        continue
+                    residual = torch.clamp(p - q, min=0)
+                    if residual.sum() <= 0:
+                        residual = p
+                    new_token = torch.multinomial(residual / residual.sum(), num_samples=1)
+                else:
+                    target = scores.argmax(dim=-1, keepdim=True)
+                    if target.item() == x.item():
+                        accepted += 1
+                        continue
+                    new_token = target
+                break
+            call_stats.accepted += accepted
+            call_stats.history.append(accepted)
+
+            accepted_seq = cand[:, : cur_len + accepted]
+            if new_token is None and not (accepted > 0 and accepted_seq[0, -1].item() == stop_token):
+                # all draft codes accepted: bonus code from the full model
+                scores = processors(accepted_seq, t_logits[:, accepted])
+                new_token, _ = self._pick(scores, do_sample)
+            seq = torch.cat([accepted_seq, new_token], dim=1) if new_token is not None else accepted_seq
+
+            # 4) roll back the KV caches to the longest still-valid prefix
+            t_len = min(t_len, cur_len + accepted)
+            past_t = _crop_past(past_t, t_len)
+            d_len = min(d_len, cur_len + accepted)
+            past_d = _crop_past(past_d, d_len)
+
+            if seq[0, -1].item() == stop_token:
+                break
+        call_stats.generated += seq.shape[1] - inputs.shape[1]
+        stats.merge(call_stats)
+        stats.history.extend(call_stats.history)
+        with self._totals_lock:
+            self.totals.merge(call_stats)
+        return seq
@@ -21,9 +21,18 @@ import numpy as np
 
 from indextts.BigVGAN.models import BigVGAN as Generator
 from indextts.gpt.model import UnifiedVoice
+from indextts.gpt.speculative import SpeculativeStats
 from indextts.utils.checkpoint import load_checkpoint
 from indextts.utils.feature_extractors import MelSpectrogramFeatures
 from indextts.utils.front import TextNormalizer, TextTokenizer
+from indextts.utils.packing import PackingPlan, plan_batches
+from indextts.utils.quantization import (
+    SUPPORTED_QUANTIZE_MODES,
+    bigvgan_autocast,
+    cpu_supports_bf16,
+    quantize_gpt_int8,
+)
+from indextts.utils.snapshot import apply_gpt_snapshot, load_snapshot_tensors, read_snapshot_metadata
 
 
 def set_seed(seed):
@@ -39,6 +48,8 @@ class IndexTTS:
     def __init__(
         self, cfg_path="checkpoints/config.yaml", model_dir="checkpoints", is_fp16=True, device=None, use_cuda_kernel=None,
         speaker_info_path=None,  # 新增：说话人信息文件路径
+        snapshot_path=None, quantize=None, bigvgan_bf16=False,
+        speculative_draft_layers=None, num_speculative_tokens=4,
     ):
         """
         Args:
@@ -47,6 +58,13 @@ class IndexTTS:
             is_fp16 (bool): whether to use fp16.
             device (str): device to use (e.g., 'cuda:0', 'cpu'). If None, it will be set automatically based on the availability of CUDA or MPS.
             use_cuda_kernel (None | bool): whether to use BigVGan custom fused activation CUDA kernel, only for CUDA device.
+            snapshot_path (str): path to a prepared snapshot built by `indextts.utils.snapshot`.
+                If given, config and weights are mmap-loaded from it instead of the raw checkpoints.
+            quantize (None | str): CPU only. "int8" applies dynamic int8 quantization to the GPT2 layers and mel_head.
+            bigvgan_bf16 (bool): CPU only. Run BigVGAN under bf16 autocast if the CPU supports bf16 natively.
+            speculative_draft_layers (None | int): enable speculative mel-code decoding with a draft model made of
+                the first N GPT layers. Only used when generating with num_beams=1; None or 0 disables it.
+            num_speculative_tokens (int): codes proposed by the draft model per verification step.
         """
         if device is not None:
             self.device = device
@@ -66,7 +84,25 @@ class IndexTTS:
             self.use_cuda_kernel = False
             print(">> Be patient, it may take a while to run in CPU mode.")
 
-        self.cfg = OmegaConf.load(cfg_path)
+        if quantize is not None and quantize not in SUPPORTED_QUANTIZE_MODES:
+            raise ValueError(f"Unsupported quantize mode: {quantize}, supported: {SUPPORTED_QUANTIZE_MODES}")
+        if quantize and self.device != "cpu":
+            print(f">> quantize={quantize} is only supported on CPU, ignored on {self.device}")
+            quantize = None
+        self.quantize = quantize
+        self.bigvgan_bf16 = False
+        if bigvgan_bf16 and self.device == "cpu":
+            self.bigvgan_bf16 = cpu_supports_bf16()
+            if not self.bigvgan_bf16:
+                print(">> bigvgan_bf16 requested but the CPU has no native bf16 support, keep fp32")
+
+        self.snapshot_path = snapshot_path
+        snapshot_meta = None
+        if snapshot_path:
+            snapshot_meta = read_snapshot_metadata(snapshot_path)
+            self.cfg = OmegaConf.create(snapshot_meta["config"])
+        else:
+            self.cfg = OmegaConf.load(cfg_path)
         self.model_dir = model_dir
         self.dtype = torch.float16 if self.is_fp16 else None
         self.stop_mel_token = self.cfg.gpt.stop_mel_token
@@ -85,14 +121,30 @@ class IndexTTS:
         #     self.dvae.eval()
         # print(">> vqvae weights restored from:", self.dvae_path)
         self.gpt = UnifiedVoice(**self.cfg.gpt)
-        self.gpt_path = os.path.join(self.model_dir, self.cfg.gpt_checkpoint)
-        load_checkpoint(self.gpt, self.gpt_path)
+        if snapshot_path:
+            # 快照中的权重已完成 dtype 转换和说话人条件注册，mmap 零拷贝接管
+            self.gpt_path = snapshot_path
+            gpt_state, bigvgan_state, mean_condition = load_snapshot_tensors(snapshot_path)
+            apply_gpt_snapshot(self.gpt, gpt_state, mean_condition)
+        else:
+            self.gpt_path = os.path.join(self.model_dir, self.cfg.gpt_checkpoint)
+            load_checkpoint(self.gpt, self.gpt_path)
         self.gpt = self.gpt.to(self.device)
         if self.is_fp16:
             self.gpt.eval().half()
+        elif snapshot_meta is not None and snapshot_meta.get("is_fp16") == "1":
+            # fp16 快照在 CPU/MPS 上运行时需转回 fp32（会产生私有拷贝，多 worker 共享权重时请用 --fp32 构建快照）
+            print(">> fp16 snapshot converted to fp32, weights are no longer shared with the mmap file")
+            self.gpt.eval().float()
         else:
             self.gpt.eval()
         print(">> GPT weights restored from:", self.gpt_path)
+        if self.quantize == "int8":
+            quantize_gpt_int8(self.gpt)
+        # 多说话人条件表在权重的最终设备/dtype 上构建一次，推理时按行批量查表
+        self.gpt.build_speaker_table()
+        if self.gpt.speaker_conds is not None:
+            print(f">> speaker condition table built: {tuple(self.gpt.speaker_conds.shape)}")
         if self.is_fp16:
             try:
                 import deepspeed
@@ -106,6 +158,8 @@ class IndexTTS:
             self.gpt.post_init_gpt2_config(use_deepspeed=use_deepspeed, kv_cache=True, half=True)
         else:
             self.gpt.post_init_gpt2_config(use_deepspeed=False, kv_cache=True, half=False)
+        if speculative_draft_layers:
+            self.gpt.enable_speculative(speculative_draft_layers, num_speculative_tokens)
 
         if self.use_cuda_kernel:
             # preload the CUDA kernel for BigVGAN
@@ -123,12 +177,20 @@ class IndexTTS:
                 )
                 self.use_cuda_kernel = False
         self.bigvgan = Generator(self.cfg.bigvgan, use_cuda_kernel=self.use_cuda_kernel)
-        self.bigvgan_path = os.path.join(self.model_dir, self.cfg.bigvgan_checkpoint)
-        vocoder_dict = torch.load(self.bigvgan_path, map_location="cpu")
-        self.bigvgan.load_state_dict(vocoder_dict["generator"])
-        self.bigvgan = self.bigvgan.to(self.device)
-        # remove weight norm on eval mode
-        self.bigvgan.remove_weight_norm()
+        if snapshot_path:
+            # 快照中的 BigVGAN 已移除 weight norm，先移除再按新结构装载
+            self.bigvgan_path = snapshot_path
+            self.bigvgan.remove_weight_norm()
+            self.bigvgan.load_state_dict(bigvgan_state, assign=True)
+            self.bigvgan = self.bigvgan.to(self.device)
+            del gpt_state, bigvgan_state
+        else:
+            self.bigvgan_path = os.path.join(self.model_dir, self.cfg.bigvgan_checkpoint)
+            vocoder_dict = torch.load(self.bigvgan_path, map_location="cpu")
+            self.bigvgan.load_state_dict(vocoder_dict["generator"])
+            self.bigvgan = self.bigvgan.to(self.device)
+            # remove weight norm on eval mode
+            self.bigvgan.remove_weight_norm()
         self.bigvgan.eval()
         print(">> bigvgan weights restored from:", self.bigvgan_path)
         self.bpe_path = os.path.join(self.model_dir, self.cfg.dataset["bpe_model"])
@@ -137,16 +199,19 @@ class IndexTTS:
         print(">> TextNormalizer loaded")
         self.tokenizer = TextTokenizer(self.bpe_path, self.normalizer)
         print(">> bpe model loaded from:", self.bpe_path)
-        # 缓存参考音频mel：
-        self.cache_audio_prompt = None
-        self.cache_cond_mel = None
+        # 缓存参考音频：(audio_prompt, cond_mel, BigVGAN 说话人向量)，整体一次赋值，
+        # 并发请求切换参考音频时不会读到另一个参考音频的 mel 或说话人向量
+        self.cache_prompt = None
         # 进度引用显示（可选）
         self.gr_progress = None
         self.model_version = self.cfg.version if hasattr(self.cfg, "version") else None
         
         # 初始化多说话人支持
         self.speaker_list = []
-        if speaker_info_path and os.path.exists(speaker_info_path):
+        if snapshot_meta is not None and json.loads(snapshot_meta.get("speaker_list", "[]")):
+            self.speaker_list = json.loads(snapshot_meta["speaker_list"])
+            print(f">> Multi-speaker support enabled with {len(self.speaker_list)} speakers (from snapshot): {self.speaker_list}")
+        elif speaker_info_path and os.path.exists(speaker_info_path):
             try:
                 with open(speaker_info_path, 'r', encoding='utf-8') as f:
                     speaker_info = json.load(f)
@@ -215,62 +280,28 @@ class IndexTTS:
         code_lens = torch.tensor(code_lens, dtype=torch.long, device=device)
         return codes, code_lens
 
-    def bucket_sentences(self, sentences, bucket_max_size=4) -> List[List[Dict]]:
+    def bucket_sentences(self, sentences, bucket_max_size=4, max_batch_tokens=None, max_mel_tokens=None) -> List[List[Dict]]:
         """
         Sentence data bucketing.
-        if ``bucket_max_size=1``, return all sentences in one bucket.
+        if ``bucket_max_size=1``, each sentence gets its own bucket.
+        分桶由 ``indextts.utils.packing.plan_batches`` 规划：在批大小与 token 预算内批数最少、填充最少
         """
-        outputs: List[Dict] = []
-        for idx, sent in enumerate(sentences):
-            outputs.append({"idx": idx, "sent": sent, "len": len(sent)})
-       
-        if len(outputs) > bucket_max_size:
-            # split sentences into buckets by sentence length
-            buckets: List[List[Dict]] = []
-            factor = 1.5
-            last_bucket = None
-            last_bucket_sent_len_median = 0
-
-            for sent in sorted(outputs, key=lambda x: x["len"]):
-                current_sent_len = sent["len"]
-                if current_sent_len == 0:
-                    print(">> skip empty sentence")
-                    continue
-                if last_bucket is None \
-                        or current_sent_len >= int(last_bucket_sent_len_median * factor) \
-                        or len(last_bucket) >= bucket_max_size:
-                    # new bucket
-                    buckets.append([sent])
-                    last_bucket = buckets[-1]
-                    last_bucket_sent_len_median = current_sent_len
-                else:
-                    # current bucket can hold more sentences
-                    last_bucket.append(sent) # sorted
-                    mid = len(last_bucket) // 2
-                    last_bucket_sent_len_median = last_bucket[mid]["len"]
-            last_bucket=None
-            # merge all buckets with size 1
-            out_buckets: List[List[Dict]] = []
-            only_ones: List[Dict] = []
-            for b in buckets:
-                if len(b) == 1:
-                    only_ones.append(b[0])
-                else:
-                    out_buckets.append(b)
-            if len(only_ones) > 0:
-                # merge into previous buckets if possible
-                # print("only_ones:", [(o["idx"], o["len"]) for o in only_ones])
-                for i in range(len(out_buckets)):
-                    b = out_buckets[i]
-                    if len(b) < bucket_max_size:
-                        b.append(only_ones.pop(0))
-                        if len(only_ones) == 0:
-                            break
-                # combined all remaining sized 1 buckets
-                if len(only_ones) > 0:
-                    out_buckets.extend([only_ones[i:i+bucket_max_size] for i in range(0, len(only_ones), bucket_max_size)])
-            return out_buckets
-        return [outputs]
+        plan = plan_batches(
+            [len(sent) for sent in sentences],
+            max_batch_size=bucket_max_size,
+            max_batch_tokens=max_batch_tokens,
+            max_mel_tokens=max_mel_tokens,
+        )
+        return self.buckets_from_plan(sentences, plan)
+
+    @staticmethod
+    def buckets_from_plan(sentences, plan: PackingPlan) -> List[List[Dict]]:
+        if plan.skipped:
+            print(f">> skip {len(plan.skipped)} empty sentence(s)")
+        return [
+            [{"idx": idx, "sent": sentences[idx], "len": len(sentences[idx])} for idx in batch.indices]
+            for batch in plan.batches
+        ]
 
     def pad_tokens_cat(self, tokens: List[torch.Tensor]) -> torch.Tensor:
         if self.model_version and self.model_version >= 1.5:
@@ -300,20 +331,59 @@ class IndexTTS:
         except Exception as e:
             pass
 
+    def _print_speculative_stats(self, stats):
+        """打印本次请求的投机解码接受率（统计对象由每次推理调用各自持有，并发请求互不混杂）"""
+        spec = self.gpt.speculative
+        if spec is None or stats.target_forwards == 0:
+            return
+        print(f">> speculative: draft_layers={spec.draft_layers}, k={spec.num_speculative_tokens}, "
+              f"acceptance={stats.acceptance_rate:.2%}, codes/target_forward={stats.generated / stats.target_forwards:.2f}")
+
+    def _get_prompt_conditioning(self, audio_prompt, verbose=False):
+        """
+        参考音频的 cond_mel 与 ECAPA-TDNN 说话人向量，每个参考音频只计算一次
+
+        返回调用方自己的局部引用；缓存以 (audio_prompt, cond_mel, spk_emb) 元组整体替换。
+        """
+        cached = self.cache_prompt
+        if cached is not None and cached[0] == audio_prompt:
+            return cached[1], cached[2]
+        audio, sr = torchaudio.load(audio_prompt)
+        audio = torch.mean(audio, dim=0, keepdim=True)
+        if audio.shape[0] > 1:
+            audio = audio[0].unsqueeze(0)
+        if 24000 != sr:
+            audio = torchaudio.transforms.Resample(sr, 24000)(audio)
+        cond_mel = MelSpectrogramFeatures()(audio).to(self.device)
+        if verbose:
+            print(f"cond_mel shape: {cond_mel.shape}", "dtype:", cond_mel.dtype)
+        with torch.no_grad():
+            spk_emb = self.bigvgan.get_speaker_embedding(cond_mel.transpose(1, 2))
+        self.cache_prompt = (audio_prompt, cond_mel, spk_emb)
+        return cond_mel, spk_emb
+
     def _set_gr_progress(self, value, desc):
         if self.gr_progress is not None:
             self.gr_progress(value, desc=desc)
 
     # 快速推理：对于“多句长文本”，可实现至少 2~10 倍以上的速度提升~ （First modified by sunnyboxs 2025-04-16）
-    def infer_fast(self, audio_prompt, text, output_path, verbose=False, max_text_tokens_per_sentence=100, speaker_id=None, sentences_bucket_max_size=4, **generation_kwargs):
+    def infer_fast(self, audio_prompt, text, output_path, verbose=False, max_text_tokens_per_sentence=100, speaker_id=None, sentences_bucket_max_size=4, voice_profile=None, max_batch_tokens=None, cancel_token=None, **generation_kwargs):
         """
         Args:
+            ``text``: 文本，或文本列表（批量合成：所有文本的分句一起分桶推理，按文本分别输出音频，
+                ``output_path`` 此时为与文本一一对应的路径列表或 ``None``，返回值为列表）
+            ``voice_profile``: ``VoiceProfile`` 声音档案，提供后直接使用其中的 cond_mel、GPT 条件向量
+                和说话人向量，忽略 ``audio_prompt``，也不读写参考音频缓存
             ``max_text_tokens_per_sentence``: 分句的最大token数，默认``100``，可以根据GPU硬件情况调整
                 - 越小，batch 越多，推理速度越*快*，占用内存更多，可能影响质量
                 - 越大，batch 越少，推理速度越*慢*，占用内存和质量更接近于非快速推理
             ``sentences_bucket_max_size``: 分句分桶的最大容量，默认``4``，可以根据GPU内存调整
                 - 越大，bucket数量越少，batch越多，推理速度越*快*，占用内存更多，可能影响质量
                 - 越小，bucket数量越多，batch越少，推理速度越*慢*，占用内存和质量更接近于非快速推理
+            ``max_batch_tokens``: 每个 bucket 的 token 预算（批大小 × (最长文本 token + 估计 mel token)），
+                默认不限制；显存受限时设置，长句会自动分到更小的 bucket
+            ``cancel_token``: ``CancellationToken``，取消后在当前生成步结束并抛出 ``InferenceCancelled``，
+                剩余分句和声码器解码都会跳过
         """
         print(">> start fast inference...")
         # 验证speaker_id
@@ -322,6 +392,16 @@ class IndexTTS:
                 raise ValueError("Multi-speaker support not enabled. Please initialize with speaker_info_path.")
             if speaker_id not in self.speaker_list:
                 raise ValueError(f"Invalid speaker_id: {speaker_id}. Available speakers: {self.speaker_list}")
+            if voice_profile is not None:
+                raise ValueError("speaker_id and voice_profile are mutually exclusive")
+        batch_mode = isinstance(text, (list, tuple))
+        texts = list(text) if batch_mode else [text]
+        if batch_mode:
+            output_paths = list(output_path) if output_path else [None] * len(texts)
+            if len(output_paths) != len(texts):
+                raise ValueError(f"output_path count mismatch: {len(output_paths)} vs {len(texts)} texts")
+        else:
+            output_paths = [output_path]
         if verbose:
             print(f"origin text:{text}")
             if speaker_id:
@@ -332,34 +412,34 @@ class IndexTTS:
             print(f"origin text:{text}")
         start_time = time.perf_counter()
 
-        # 如果参考音频改变了，才需要重新生成 cond_mel, 提升速度
-        if self.cache_cond_mel is None or self.cache_audio_prompt != audio_prompt:
-            audio, sr = torchaudio.load(audio_prompt)
-            audio = torch.mean(audio, dim=0, keepdim=True)
-            if audio.shape[0] > 1:
-                audio = audio[0].unsqueeze(0)
-            audio = torchaudio.transforms.Resample(sr, 24000)(audio)
-            cond_mel = MelSpectrogramFeatures()(audio).to(self.device)
+        conds_latent = None
+        if voice_profile is not None:
+            # 声音档案：参考音频相关的计算都已预先完成
+            cond_mel = voice_profile.cond_mel
             cond_mel_frame = cond_mel.shape[-1]
-            if verbose:
-                print(f"cond_mel shape: {cond_mel.shape}", "dtype:", cond_mel.dtype)
-
-            self.cache_audio_prompt = audio_prompt
-            self.cache_cond_mel = cond_mel
+            conds_latent = voice_profile.conds_latent.to(self.gpt.text_embedding.weight.dtype)
+            speaker_embedding = voice_profile.speaker_embedding
         else:
-            cond_mel = self.cache_cond_mel
+            # 如果参考音频改变了，才需要重新生成 cond_mel 和说话人向量, 提升速度
+            cond_mel, speaker_embedding = self._get_prompt_conditioning(audio_prompt, verbose)
             cond_mel_frame = cond_mel.shape[-1]
-            pass
 
         auto_conditioning = cond_mel
         cond_mel_lengths = torch.tensor([cond_mel_frame], device=self.device)
 
-        # text_tokens
-        text_tokens_list = self.tokenizer.tokenize(text)
-
-        sentences = self.tokenizer.split_sentences(text_tokens_list, max_tokens_per_sentence=max_text_tokens_per_sentence)
+        # text_tokens（归一化/分词/分句/转 id 结果带缓存，重复文本直接命中）
+        if batch_mode:
+            encoded = self.tokenizer.batch_encode_sentences(texts, max_tokens_per_sentence=max_text_tokens_per_sentence)
+        else:
+            encoded = [self.tokenizer.encode_sentences(text, max_tokens_per_sentence=max_text_tokens_per_sentence)]
+        # 所有文本的分句拉平后统一分桶，sentence_owner 记录每个分句属于第几个文本
+        sentences, sentences_ids, sentence_owner = [], [], []
+        for owner, (_, text_sentences, text_sentences_ids) in enumerate(encoded):
+            sentences.extend(text_sentences)
+            sentences_ids.extend(text_sentences_ids)
+            sentence_owner.extend([owner] * len(text_sentences))
         if verbose:
-            print(">> text token count:", len(text_tokens_list))
+            print(">> text token count:", sum(len(tokens) for tokens, _, _ in encoded))
             print("   splited sentences count:", len(sentences))
             print("   max_text_tokens_per_sentence:", max_text_tokens_per_sentence)
             print(*sentences, sep="\n")
@@ -372,10 +452,12 @@ class IndexTTS:
         num_beams = generation_kwargs.pop("num_beams", 3)
         repetition_penalty = generation_kwargs.pop("repetition_penalty", 10.0)
         max_mel_tokens = generation_kwargs.pop("max_mel_tokens", 800)
+        use_speculative = generation_kwargs.pop("use_speculative", True)
+        spec_stats = SpeculativeStats()
         sampling_rate = 24000
         # lang = "EN"
         # lang = "ZH"
-        wavs = []
+        wavs: List[List[torch.Tensor]] = [[] for _ in texts]
         gpt_gen_time = 0
         gpt_forward_time = 0
         bigvgan_time = 0
@@ -384,19 +466,21 @@ class IndexTTS:
         all_text_tokens: List[List[torch.Tensor]] = []
         self._set_gr_progress(0.1, "text processing...")
         bucket_max_size = sentences_bucket_max_size if self.device != "cpu" else 1
-        all_sentences = self.bucket_sentences(sentences, bucket_max_size=bucket_max_size)
+        packing_plan = plan_batches([len(sent) for sent in sentences], max_batch_size=bucket_max_size,
+                                    max_batch_tokens=max_batch_tokens, max_mel_tokens=max_mel_tokens)
+        all_sentences = self.buckets_from_plan(sentences, packing_plan)
         bucket_count = len(all_sentences)
         if verbose:
             print(">> sentences bucket_count:", bucket_count,
                   "bucket sizes:", [(len(s), [t["idx"] for t in s]) for s in all_sentences],
                   "bucket_max_size:", bucket_max_size)
+            print(">> packing:", packing_plan.summary())
         for sentences in all_sentences:
             temp_tokens: List[torch.Tensor] = []
             all_text_tokens.append(temp_tokens)
             for item in sentences:
                 sent = item["sent"]
-                text_tokens = self.tokenizer.convert_tokens_to_ids(sent)
-                text_tokens = torch.tensor(text_tokens, dtype=torch.int32, device=self.device).unsqueeze(0)
+                text_tokens = torch.tensor(sentences_ids[item["idx"]], dtype=torch.int32, device=self.device).unsqueeze(0)
                 if verbose:
                     print(text_tokens)
                     print(f"text_tokens shape: {text_tokens.shape}, text_tokens type: {text_tokens.dtype}")
@@ -411,6 +495,8 @@ class IndexTTS:
         all_batch_codes = []
         processed_num = 0
         for item_tokens in all_text_tokens:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
             batch_num = len(item_tokens)
             if batch_num > 1:
                 batch_text_tokens = self.pad_tokens_cat(item_tokens)
@@ -435,6 +521,10 @@ class IndexTTS:
                                         num_beams=num_beams,
                                         repetition_penalty=repetition_penalty,
                                         max_generate_length=max_mel_tokens,
+                                        use_speculative=use_speculative,
+                                        conds_latent=conds_latent,
+                                        cancel_token=cancel_token,
+                                        speculative_stats=spec_stats,
                                         **generation_kwargs)
                     all_batch_codes.append(temp_codes)
             gpt_gen_time += time.perf_counter() - m_start_time
@@ -445,6 +535,8 @@ class IndexTTS:
         all_latents = []
         has_warned = False
         for batch_codes, batch_tokens, batch_sentences in zip(all_batch_codes, all_text_tokens, all_sentences):
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
             for i in range(batch_codes.shape[0]):
                 codes = batch_codes[i]  # [x]
                 if not has_warned and codes[-1] != self.stop_mel_token:
@@ -475,72 +567,88 @@ class IndexTTS:
                                         code_lens*self.gpt.mel_length_compression,
                                         cond_mel_lengths=torch.tensor([auto_conditioning.shape[-1]], device=text_tokens.device),
                                         speaker_ids=[speaker_id] if speaker_id else None,
-                                        return_latent=True, clip_inputs=False)
+                                        return_latent=True, clip_inputs=False, conds_latent=conds_latent)
                         gpt_forward_time += time.perf_counter() - m_start_time
                         all_latents.append(latent)
         del all_batch_codes, all_text_tokens, all_sentences
-        # bigvgan chunk
+        # bigvgan chunk（按文本分组，每个文本单独拼接输出）
         chunk_size = 2
-        all_latents = [all_latents[all_idxs.index(i)] for i in range(len(all_latents))]
+        order = sorted(range(len(all_idxs)), key=all_idxs.__getitem__)
+        text_latents: List[List[torch.Tensor]] = [[] for _ in texts]
+        for i in order:
+            text_latents[sentence_owner[all_idxs[i]]].append(all_latents[i])
         if verbose:
             print(">> all_latents:", len(all_latents))
             print("  latents length:", [l.shape[1] for l in all_latents])
-        chunk_latents = [all_latents[i : i + chunk_size] for i in range(0, len(all_latents), chunk_size)]
+        chunk_latents = [
+            (owner, latents[i : i + chunk_size])
+            for owner, latents in enumerate(text_latents)
+            for i in range(0, len(latents), chunk_size)
+        ]
         chunk_length = len(chunk_latents)
         latent_length = len(all_latents)
 
         # bigvgan chunk decode
         self._set_gr_progress(0.7, "bigvgan decode...")
         tqdm_progress = tqdm(total=latent_length, desc="bigvgan")
-        for items in chunk_latents:
+        for owner, items in chunk_latents:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
             tqdm_progress.update(len(items))
             latent = torch.cat(items, dim=1)
             with torch.no_grad():
-                with torch.amp.autocast(latent.device.type, enabled=self.dtype is not None, dtype=self.dtype):
+                with torch.amp.autocast(latent.device.type, enabled=self.dtype is not None, dtype=self.dtype), \
+                        bigvgan_autocast(self.bigvgan_bf16):
                     m_start_time = time.perf_counter()
-                    wav, _ = self.bigvgan(latent, auto_conditioning.transpose(1, 2))
+                    wav, _ = self.bigvgan(latent, speaker_embedding=speaker_embedding)
                     bigvgan_time += time.perf_counter() - m_start_time
-                    wav = wav.squeeze(1)
+                    wav = wav.squeeze(1).float()
                     pass
             wav = torch.clamp(32767 * wav, -32767.0, 32767.0)
-            wavs.append(wav.cpu()) # to cpu before saving
+            wavs[owner].append(wav.cpu()) # to cpu before saving
 
         # clear cache
         tqdm_progress.close()  # 确保进度条被关闭
-        del all_latents, chunk_latents
+        del all_latents, chunk_latents, text_latents
         end_time = time.perf_counter()
         self.torch_empty_cache()
 
         # wav audio output
         self._set_gr_progress(0.9, "save audio...")
-        wav = torch.cat(wavs, dim=1)
-        wav_length = wav.shape[-1] / sampling_rate
+        text_wavs = [torch.cat(w, dim=1) if w else torch.zeros((1, 0)) for w in wavs]
+        wav_length = sum(w.shape[-1] for w in text_wavs) / sampling_rate
         print(f">> Reference audio length: {cond_mel_frame * 256 / sampling_rate:.2f} seconds")
         print(f">> gpt_gen_time: {gpt_gen_time:.2f} seconds")
+        self._print_speculative_stats(spec_stats)
         print(f">> gpt_forward_time: {gpt_forward_time:.2f} seconds")
         print(f">> bigvgan_time: {bigvgan_time:.2f} seconds")
         print(f">> Total fast inference time: {end_time - start_time:.2f} seconds")
         print(f">> Generated audio length: {wav_length:.2f} seconds")
         print(f">> [fast] bigvgan chunk_length: {chunk_length}")
-        print(f">> [fast] batch_num: {all_batch_num} bucket_max_size: {bucket_max_size}", f"bucket_count: {bucket_count}" if bucket_max_size > 1 else "")
-        print(f">> [fast] RTF: {(end_time - start_time) / wav_length:.4f}")
+        print(f">> [fast] batch_num: {all_batch_num} bucket_max_size: {bucket_max_size}", f"bucket_count: {bucket_count}" if bucket_max_size > 1 else "",
+              f"padding efficiency: {packing_plan.efficiency:.1%}")
+        if batch_mode:
+            print(f">> [fast] texts: {len(texts)}")
+        print(f">> [fast] RTF: {(end_time - start_time) / max(wav_length, 1e-6):.4f}")
 
         # save audio
-        wav = wav.cpu()  # to cpu
-        if output_path:
-            # 直接保存音频到指定路径中
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            torchaudio.save(output_path, wav.type(torch.int16), sampling_rate)
-            print(">> wav file saved to:", output_path)
-            return output_path
-        else:
-            # 返回以符合Gradio的格式要求
-            wav_data = wav.type(torch.int16)
-            wav_data = wav_data.numpy().T
-            return (sampling_rate, wav_data)
+        results = []
+        for wav, path in zip(text_wavs, output_paths):
+            if path:
+                # 直接保存音频到指定路径中
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                torchaudio.save(path, wav.type(torch.int16), sampling_rate)
+                print(">> wav file saved to:", path)
+                results.append(path)
+            else:
+                # 返回以符合Gradio的格式要求
+                wav_data = wav.type(torch.int16)
+                wav_data = wav_data.numpy().T
+                results.append((sampling_rate, wav_data))
+        return results if batch_mode else results[0]
 
     # 原始推理模式
-    def infer(self, audio_prompt, text, output_path, verbose=False, max_text_tokens_per_sentence=120, speaker_id=None, **generation_kwargs):
+    def infer(self, audio_prompt, text, output_path, verbose=False, max_text_tokens_per_sentence=120, speaker_id=None, cancel_token=None, **generation_kwargs):
         # 验证speaker_id
         if speaker_id is not None:
             if not hasattr(self, 'speaker_list') or not self.speaker_list:
@@ -554,30 +662,15 @@ class IndexTTS:
                 print(f"using speaker: {speaker_id}")
         start_time = time.perf_counter()
 
-        # 如果参考音频改变了，才需要重新生成 cond_mel, 提升速度
-        if self.cache_cond_mel is None or self.cache_audio_prompt != audio_prompt:
-            audio, sr = torchaudio.load(audio_prompt)
-            audio = torch.mean(audio, dim=0, keepdim=True)
-            if audio.shape[0] > 1:
-                audio = audio[0].unsqueeze(0)
-            if 24000 != sr:
-                audio = torchaudio.transforms.Resample(sr, 24000)(audio)
-            cond_mel = MelSpectrogramFeatures()(audio).to(self.device)
-            cond_mel_frame = cond_mel.shape[-1]
-            if verbose:
-                print(f"cond_mel shape: {cond_mel.shape}", "dtype:", cond_mel.dtype)
-
-            self.cache_audio_prompt = audio_prompt
-            self.cache_cond_mel = cond_mel
-        else:
-            cond_mel = self.cache_cond_mel
-            cond_mel_frame = cond_mel.shape[-1]
-            pass
+        # 如果参考音频改变了，才需要重新生成 cond_mel 和说话人向量, 提升速度
+        cond_mel, speaker_embedding = self._get_prompt_conditioning(audio_prompt, verbose)
+        cond_mel_frame = cond_mel.shape[-1]
 
         self._set_gr_progress(0.1, "text processing...")
         auto_conditioning = cond_mel
-        text_tokens_list = self.tokenizer.tokenize(text)
-        sentences = self.tokenizer.split_sentences(text_tokens_list, max_text_tokens_per_sentence)
+        text_tokens_list, sentences, sentences_ids = self.tokenizer.encode_sentences(
+            text, max_tokens_per_sentence=max_text_tokens_per_sentence
+        )
         if verbose:
             print("text token count:", len(text_tokens_list))
             print("sentences count:", len(sentences))
@@ -592,6 +685,8 @@ class IndexTTS:
         num_beams = generation_kwargs.pop("num_beams", 3)
         repetition_penalty = generation_kwargs.pop("repetition_penalty", 10.0)
         max_mel_tokens = generation_kwargs.pop("max_mel_tokens", 800)
+        use_speculative = generation_kwargs.pop("use_speculative", True)
+        spec_stats = SpeculativeStats()
         sampling_rate = 24000
         # lang = "EN"
         # lang = "ZH"
@@ -601,9 +696,10 @@ class IndexTTS:
         bigvgan_time = 0
         progress = 0
         has_warned = False
-        for sent in sentences:
-            text_tokens = self.tokenizer.convert_tokens_to_ids(sent)
-            text_tokens = torch.tensor(text_tokens, dtype=torch.int32, device=self.device).unsqueeze(0)
+        for sent, sent_ids in zip(sentences, sentences_ids):
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            text_tokens = torch.tensor(sent_ids, dtype=torch.int32, device=self.device).unsqueeze(0)
             # text_tokens = F.pad(text_tokens, (0, 1))  # This may not be necessary.
             # text_tokens = F.pad(text_tokens, (1, 0), value=0)
             # text_tokens = F.pad(text_tokens, (0, 1), value=1)
@@ -633,6 +729,9 @@ class IndexTTS:
                                                         length_penalty=length_penalty,
                                                         num_beams=num_beams,
                                                         repetition_penalty=repetition_penalty,
+                                                        use_speculative=use_speculative,
+                                                        cancel_token=cancel_token,
+                                                        speculative_stats=spec_stats,
                                                         # 移除 speaker_id=speaker_id 这一行
                                                         )
                 gpt_gen_time += time.perf_counter() - m_start_time
@@ -676,9 +775,10 @@ class IndexTTS:
                     gpt_forward_time += time.perf_counter() - m_start_time
 
                     m_start_time = time.perf_counter()
-                    wav, _ = self.bigvgan(latent, auto_conditioning.transpose(1, 2))
+                    with bigvgan_autocast(self.bigvgan_bf16):
+                        wav, _ = self.bigvgan(latent, speaker_embedding=speaker_embedding)
                     bigvgan_time += time.perf_counter() - m_start_time
-                    wav = wav.squeeze(1)
+                    wav = wav.squeeze(1).float()
 
                 wav = torch.clamp(32767 * wav, -32767.0, 32767.0)
                 if verbose:
@@ -691,6 +791,7 @@ class IndexTTS:
         wav_length = wav.shape[-1] / sampling_rate
         print(f">> Reference audio length: {cond_mel_frame * 256 / sampling_rate:.2f} seconds")
         print(f">> gpt_gen_time: {gpt_gen_time:.2f} seconds")
+        self._print_speculative_stats(spec_stats)
         print(f">> gpt_forward_time: {gpt_forward_time:.2f} seconds")
         print(f">> bigvgan_time: {bigvgan_time:.2f} seconds")
         print(f">> Total inference time: {end_time - start_time:.2f} seconds")
@@ -0,0 +1,151 @@
+"""
+推理取消：客户端断开或主动中止时，尽快停止 GPT 自回归生成并跳过后续分句/声码器
+
+- ``CancellationToken``      : 线程安全的取消标记，可选地同时检查共享目录中的取消标记文件
+                               （多个 uvicorn worker 之间互相可见）
+- ``CancellationStoppingCriteria`` : HF ``generate`` 每步检查一次取消标记
+- ``CancellationRegistry``   : 服务端按请求 ID 管理取消标记：每个连接一个独立标记，
+                               同一请求 ID 的连接共享一个父标记，只有 ``cancel(request_id)`` 会波及全部连接
+"""
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+import torch
+from transformers import StoppingCriteria
+
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{1,128}$")
+MARKER_SUFFIX = ".cancel"
+
+
+class InferenceCancelled(Exception):
+    """推理被取消"""
+
+
+class CancellationToken:
+    def __init__(self, request_id: Optional[str] = None, marker_path: Optional[str] = None, poll_interval: float = 0.2,
+                 parent: Optional["CancellationToken"] = None):
+        """
+        Args:
+            marker_path: 取消标记文件路径，存在即视为已取消；每 ``poll_interval`` 秒最多检查一次
+            parent: 父标记，父标记取消时本标记也视为已取消（取消本标记不影响父标记）
+        """
+        self.request_id = request_id
+        self.marker_path = marker_path
+        self.poll_interval = poll_interval
+        self.parent = parent
+        self._event = threading.Event()
+        self._next_poll = 0.0
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self.parent is not None and self.parent.cancelled:
+            self._event.set()
+            return True
+        if self.marker_path is not None:
+            now = time.monotonic()
+            if now >= self._next_poll:
+                self._next_poll = now + self.poll_interval
+                if os.path.exists(self.marker_path):
+                    self._event.set()
+                    return True
+        return False
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise InferenceCancelled(f"Inference cancelled: {self.request_id or ''}")
+
+
+class CancellationStoppingCriteria(StoppingCriteria):
+    """取消后让 ``generate`` 在当前步结束"""
+
+    def __init__(self, token: CancellationToken):
+        self.token = token
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.token.cancelled, dtype=torch.bool, device=input_ids.device)
+
+
+def validate_request_id(request_id: str) -> str:
+    if not isinstance(request_id, str) or not _REQUEST_ID_RE.match(request_id):
+        raise ValueError(f"Invalid request id: {request_id!r}")
+    return request_id
+
+
+class CancellationRegistry:
+    def __init__(self, marker_dir: str, marker_ttl: float = 600.0):
+        """
+        Args:
+            marker_dir: 取消标记文件目录（多 worker 共享，建议放在 /dev/shm）
+            marker_ttl: 标记文件保留秒数，取消请求可能早于推理请求到达，过期后才清理
+        """
+        self.marker_dir = marker_dir
+        self.marker_ttl = marker_ttl
+        os.makedirs(marker_dir, exist_ok=True)
+        self._tokens: Dict[str, CancellationToken] = {}
+        self._refs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _marker_path(self, request_id: str) -> str:
+        return os.path.join(self.marker_dir, f"{validate_request_id(request_id)}{MARKER_SUFFIX}")
+
+    def acquire(self, request_id: str) -> CancellationToken:
+        """
+        为一个连接创建取消标记。同一请求 ID 的并发请求（如同一回答的多个片段、对冲副本）共享父标记：
+        ``cancel(request_id)`` 会停止全部连接，而某个连接自身断开只取消它自己的标记。
+        """
+        marker_path = self._marker_path(request_id)
+        with self._lock:
+            shared = self._tokens.get(request_id)
+            if shared is None:
+                shared = CancellationToken(request_id, marker_path)
+                self._tokens[request_id] = shared
+            self._refs[request_id] = self._refs.get(request_id, 0) + 1
+        return CancellationToken(request_id, parent=shared)
+
+    def release(self, request_id: str) -> None:
+        with self._lock:
+            refs = self._refs.get(request_id, 0) - 1
+            if refs > 0:
+                self._refs[request_id] = refs
+                return
+            self._refs.pop(request_id, None)
+            self._tokens.pop(request_id, None)
+
+    def cancel(self, request_id: str) -> bool:
+        """
+        取消请求：设置本进程的标记并写入标记文件（其他 worker 上的同一请求也会停止）。
+        返回本进程中是否有正在进行的该请求。
+        """
+        marker_path = self._marker_path(request_id)
+        with open(marker_path, "w"):
+            pass
+        self._cleanup_markers()
+        with self._lock:
+            token = self._tokens.get(request_id)
+        if token is not None:
+            token.cancel()
+            return True
+        return False
+
+    def _cleanup_markers(self) -> None:
+        deadline = time.time() - self.marker_ttl
+        try:
+            entries = list(os.scandir(self.marker_dir))
+        except OSError:
+            return
+        for entry in entries:
+            if not entry.name.endswith(MARKER_SUFFIX):
+                continue
+            try:
+                if entry.stat().st_mtime < deadline:
+                    os.remove(entry.path)
+            except OSError:
+                pass
@@ -26,6 +26,13 @@ def load_audio(audiopath, sampling_rate):
     return audio
 
 
+# The CJK ranges is from https://github.com/alvations/nltk/blob/79eed6ddea0d0a2c212c1060b477fc268fec4d4b/nltk/tokenize/util.py
+CJK_RANGE_PATTERN = (
+    r"([\u1100-\u11ff\u2e80-\ua4cf\ua840-\uD7AF\uF900-\uFAFF\uFE30-\uFE4F\uFF65-\uFFDC\U00020000-\U0002FFFF])"
+)
+_CJK_RANGE_RE = re.compile(CJK_RANGE_PATTERN)
+
+
 def tokenize_by_CJK_char(line: str, do_upper_case=True) -> str:
     """
     Tokenize a line of text with CJK char.
@@ -43,11 +50,7 @@ def tokenize_by_CJK_char(line: str, do_upper_case=True) -> str:
     Return:
       A new string tokenize by CJK char.
     """
-    # The CJK ranges is from https://github.com/alvations/nltk/blob/79eed6ddea0d0a2c212c1060b477fc268fec4d4b/nltk/tokenize/util.py
-    CJK_RANGE_PATTERN = (
-        r"([\u1100-\u11ff\u2e80-\ua4cf\ua840-\uD7AF\uF900-\uFAFF\uFE30-\uFE4F\uFF65-\uFFDC\U00020000-\U0002FFFF])"
-    )
-    chars = re.split(CJK_RANGE_PATTERN, line.strip())
+    chars = _CJK_RANGE_RE.split(line.strip())
     return " ".join([w.strip().upper() if do_upper_case else w.strip() for w in chars if w.strip()])
 
 
@@ -1,13 +1,55 @@
 # -*- coding: utf-8 -*-
 import os
+import threading
 import traceback
 import re
-from typing import List, Union, overload
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Tuple, Union, overload
 import warnings
 from indextts.utils.common import tokenize_by_CJK_char, de_tokenized_by_CJK_char
 from sentencepiece import SentencePieceProcessor
 
 
+class LRUCache:
+    """
+    线程安全的简单 LRU 缓存（服务端多个推理线程共享同一个 tokenizer）
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
 class TextNormalizer:
     def __init__(self):
         self.zh_normalizer = None
@@ -53,11 +95,13 @@ class TextNormalizer:
             "$": ".",
             **self.char_rep_map,
         }
+        # 替换表固定不变，初始化时编译一次，避免每次 normalize 重新编译
+        self.char_rep_pattern = re.compile("|".join(re.escape(p) for p in self.char_rep_map.keys()))
+        self.zh_char_rep_pattern = re.compile("|".join(re.escape(p) for p in self.zh_char_rep_map.keys()))
 
     def match_email(self, email):
         # 正则表达式匹配邮箱格式：数字英文@数字英文.英文
-        pattern = r"^[a-zA-Z0-9]+@[a-zA-Z0-9]+\.[a-zA-Z]+$"
-        return re.match(pattern, email) is not None
+        return _EMAIL_RE.match(email) is not None
 
     PINYIN_TONE_PATTERN = r"(?<![a-z])((?:[bpmfdtnlgkhjqxzcsryw]|[zcs]h)?(?:[aeiouüv]|[ae]i|u[aio]|ao|ou|i[aue]|[uüv]e|[uvü]ang?|uai|[aeiuv]n|[aeio]ng|ia[no]|i[ao]ng)|ng|er)([1-5])"
     """
@@ -76,13 +120,13 @@ class TextNormalizer:
 
 
     def use_chinese(self, s):
-        has_chinese = bool(re.search(r"[\u4e00-\u9fff]", s))
-        has_alpha = bool(re.search(r"[a-zA-Z]", s))
+        has_chinese = bool(_CHINESE_CHAR_RE.search(s))
+        has_alpha = bool(_ALPHA_RE.search(s))
         is_email = self.match_email(s)
         if has_chinese or not has_alpha or is_email:
             return True
 
-        has_pinyin = bool(re.search(TextNormalizer.PINYIN_TONE_PATTERN, s, re.IGNORECASE))
+        has_pinyin = bool(_PINYIN_TONE_RE.search(s))
         return has_pinyin
 
     def load(self):
@@ -115,7 +159,7 @@ class TextNormalizer:
             print("Error, text normalizer is not initialized !!!")
             return ""
         if self.use_chinese(text):
-            text = re.sub(TextNormalizer.ENGLISH_CONTRACTION_PATTERN, r"\1 is", text, flags=re.IGNORECASE)
+            text = _ENGLISH_CONTRACTION_RE.sub(r"\1 is", text)
             replaced_text, pinyin_list = self.save_pinyin_tones(text.rstrip())
             
             replaced_text, original_name_list = self.save_names(replaced_text)
@@ -128,17 +172,15 @@ class TextNormalizer:
             result = self.restore_names(result, original_name_list)
             # 恢复拼音声调
             result = self.restore_pinyin_tones(result, pinyin_list)
-            pattern = re.compile("|".join(re.escape(p) for p in self.zh_char_rep_map.keys()))
-            result = pattern.sub(lambda x: self.zh_char_rep_map[x.group()], result)
+            result = self.zh_char_rep_pattern.sub(lambda x: self.zh_char_rep_map[x.group()], result)
         else:
             try:
-                text = re.sub(TextNormalizer.ENGLISH_CONTRACTION_PATTERN, r"\1 is", text, flags=re.IGNORECASE)
+                text = _ENGLISH_CONTRACTION_RE.sub(r"\1 is", text)
                 result = self.en_normalizer.normalize(text)
             except Exception:
                 result = text
                 print(traceback.format_exc())
-            pattern = re.compile("|".join(re.escape(p) for p in self.char_rep_map.keys()))
-            result = pattern.sub(lambda x: self.char_rep_map[x.group()], result)
+            result = self.char_rep_pattern.sub(lambda x: self.char_rep_map[x.group()], result)
         return result
 
     def correct_pinyin(self, pinyin: str):
@@ -149,9 +191,8 @@ class TextNormalizer:
         if pinyin[0] not in "jqxJQX":
             return pinyin
         # 匹配 jqx 的韵母为 u/ü 的拼音
-        pattern = r"([jqx])[uü](n|e|an)*(\d)"
         repl = r"\g<1>v\g<2>\g<3>"
-        pinyin = re.sub(pattern, repl, pinyin, flags=re.IGNORECASE)
+        pinyin = _JQX_PINYIN_RE.sub(repl, pinyin)
         return pinyin.upper()
 
     def save_names(self, original_text):
@@ -160,8 +201,7 @@ class TextNormalizer:
         例如：克里斯托弗·诺兰 -> <n_a>
         """
         # 人名
-        name_pattern = re.compile(TextNormalizer.NAME_PATTERN, re.IGNORECASE)
-        original_name_list = re.findall(name_pattern, original_text)
+        original_name_list = _NAME_RE.findall(original_text)
         if len(original_name_list) == 0:
             return (original_text, None)
         original_name_list = list(set("".join(n) for n in original_name_list))
@@ -194,8 +234,7 @@ class TextNormalizer:
         例如：xuan4 -> <pinyin_a>
         """
         # 声母韵母+声调数字
-        origin_pinyin_pattern = re.compile(TextNormalizer.PINYIN_TONE_PATTERN, re.IGNORECASE)
-        original_pinyin_list = re.findall(origin_pinyin_pattern, original_text)
+        original_pinyin_list = _PINYIN_TONE_RE.findall(original_text)
         if len(original_pinyin_list) == 0:
             return (original_text, None)
         original_pinyin_list = list(set("".join(p) for p in original_pinyin_list))
@@ -228,10 +267,24 @@ class TextNormalizer:
         return transformed_text
 
 
+# 模块级预编译正则（normalize 热路径上每次调用都会用到）
+_EMAIL_RE = re.compile(r"^[a-zA-Z0-9]+@[a-zA-Z0-9]+\.[a-zA-Z]+$")
+_CHINESE_CHAR_RE = re.compile(r"[\u4e00-\u9fff]")
+_ALPHA_RE = re.compile(r"[a-zA-Z]")
+_PINYIN_TONE_RE = re.compile(TextNormalizer.PINYIN_TONE_PATTERN, re.IGNORECASE)
+_NAME_RE = re.compile(TextNormalizer.NAME_PATTERN, re.IGNORECASE)
+_ENGLISH_CONTRACTION_RE = re.compile(TextNormalizer.ENGLISH_CONTRACTION_PATTERN, re.IGNORECASE)
+_JQX_PINYIN_RE = re.compile(r"([jqx])[uü](n|e|an)*(\d)", re.IGNORECASE)
+
+
 class TextTokenizer:
-    def __init__(self, vocab_file: str, normalizer: TextNormalizer = None):
+    def __init__(self, vocab_file: str, normalizer: TextNormalizer = None, cache_size: int = 1024):
         self.vocab_file = vocab_file
         self.normalizer = normalizer
+        # 文本前端缓存：服务场景下固定话术/历史回复会被反复合成，
+        # 归一化（WeTextProcessing）+ 分词 + 分句的结果可直接复用
+        self.normalize_cache = LRUCache(cache_size)
+        self.sentences_cache = LRUCache(cache_size)
 
         if self.vocab_file is None:
             raise ValueError("vocab_file is None")
@@ -313,28 +366,91 @@ class TextTokenizer:
     def tokenize(self, text: str) -> List[str]:
         return self.encode(text, out_type=str)
 
+    def preprocess(self, text: str) -> str:
+        """
+        归一化 + 预分词（带 LRU 缓存），返回可直接送入 sentencepiece 的字符串
+        """
+        cached = self.normalize_cache.get(text)
+        if cached is not None:
+            return cached
+        result = text
+        if self.normalizer:
+            result = self.normalizer.normalize(result)
+        for pre_tokenizer in self.pre_tokenizers:
+            result = pre_tokenizer(result)
+        self.normalize_cache.put(text, result)
+        return result
+
     def encode(self, text: str, **kwargs):
         if len(text) == 0:
             return []
         if len(text.strip()) == 1:
             return self.sp_model.Encode(text, out_type=kwargs.pop("out_type", int), **kwargs)
         # 预处理
-        if self.normalizer:
-            text = self.normalizer.normalize(text)
-        if len(self.pre_tokenizers) > 0:
-            for pre_tokenizer in self.pre_tokenizers:
-                text = pre_tokenizer(text)
+        text = self.preprocess(text)
         return self.sp_model.Encode(text, out_type=kwargs.pop("out_type", int), **kwargs)
 
     def batch_encode(self, texts: List[str], **kwargs):
         # 预处理
-        if self.normalizer:
-            texts = [self.normalizer.normalize(text) for text in texts]
-        if len(self.pre_tokenizers) > 0:
-            for pre_tokenizer in self.pre_tokenizers:
-                texts = [pre_tokenizer(text) for text in texts]
+        texts = [self.preprocess(text) for text in texts]
         return self.sp_model.Encode(texts, out_type=kwargs.pop("out_type", int), **kwargs)
 
+    def encode_sentences(
+        self, text: str, max_tokens_per_sentence: int = 120
+    ) -> Tuple[List[str], List[List[str]], List[List[int]]]:
+        """
+        文本前端完整流水线（归一化 -> 分词 -> 分句 -> token id），结果按 (text, max_tokens) 缓存
+
+        Returns:
+            (tokens, sentences, sentence_ids)，每次返回新的 list，调用方可随意修改
+        """
+        return self.batch_encode_sentences([text], max_tokens_per_sentence)[0]
+
+    def batch_encode_sentences(
+        self, texts: List[str], max_tokens_per_sentence: int = 120
+    ) -> List[Tuple[List[str], List[List[str]], List[List[int]]]]:
+        """
+        批量版 encode_sentences：未命中缓存的文本合并成一次 sp_model.Encode 调用
+        """
+        results: List[Optional[Tuple[List[str], List[List[str]], List[List[int]]]]] = [None] * len(texts)
+        miss_indices: List[int] = []
+        for i, text in enumerate(texts):
+            cached = self.sentences_cache.get((text, max_tokens_per_sentence))
+            if cached is not None:
+                results[i] = cached
+            else:
+                miss_indices.append(i)
+
+        if miss_indices:
+            # 单字符文本与 encode 保持一致：不做归一化
+            preprocessed = []
+            for i in miss_indices:
+                text = texts[i]
+                preprocessed.append(text if len(text.strip()) <= 1 else self.preprocess(text))
+            encoded = self.sp_model.Encode(preprocessed, out_type=str)
+            for i, tokens in zip(miss_indices, encoded):
+                sentences = self.split_sentences(tokens, max_tokens_per_sentence=max_tokens_per_sentence)
+                # 一次性转换所有句子的 token id，再按句子长度切回去
+                flat_ids = self.sp_model.PieceToId([t for sent in sentences for t in sent]) if sentences else []
+                sentence_ids = []
+                offset = 0
+                for sent in sentences:
+                    sentence_ids.append(flat_ids[offset : offset + len(sent)])
+                    offset += len(sent)
+                entry = (tuple(tokens), tuple(tuple(s) for s in sentences), tuple(tuple(s) for s in sentence_ids))
+                self.sentences_cache.put((texts[i], max_tokens_per_sentence), entry)
+                results[i] = entry
+
+        # 缓存中存放的是 tuple（不可变），对外返回 list 副本
+        return [
+            (list(tokens), [list(s) for s in sentences], [list(s) for s in sentence_ids])
+            for tokens, sentences, sentence_ids in results
+        ]
+
+    def clear_cache(self) -> None:
+        self.normalize_cache.clear()
+        self.sentences_cache.clear()
+
     def decode(self, ids: Union[List[int], int], do_lower_case=False, **kwargs):
         if isinstance(ids, int):
             ids = [ids]
@@ -0,0 +1,166 @@
+"""
+推理任务的优先级 + 截止时间调度
+
+同一进程内所有推理共享少量线程（GPU 同时只能高效跑几路），先来先服务时，实时对话的首个片段
+可能排在批量合成、音色克隆的大量片段之后。``PriorityExecutor`` 按以下顺序出队：
+    1. 优先级类别：``INTERACTIVE_FIRST``（实时对话首个片段）< ``INTERACTIVE``（后续片段）< ``BULK``（批量任务）；
+    2. 同一类别内截止时间早的优先（无截止时间的排在最后）；
+    3. 其余按提交顺序。
+出队时已超过截止时间的任务不再执行，其 Future 以 ``DeadlineExceeded`` 结束。
+已在执行的任务不会被抢占，高优先级任务最多等待当前正在执行的任务之一结束。
+"""
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Executor, Future
+from enum import IntEnum
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+
+class Priority(IntEnum):
+    INTERACTIVE_FIRST = 0
+    INTERACTIVE = 1
+    BULK = 2
+
+
+PRIORITY_NAMES: Dict[str, Priority] = {
+    "interactive-first": Priority.INTERACTIVE_FIRST,
+    "interactive": Priority.INTERACTIVE,
+    "bulk": Priority.BULK,
+}
+
+
+class DeadlineExceeded(Exception):
+    """任务在截止时间前未能开始执行"""
+
+
+def parse_priority(value: Union[str, int, Priority, None], default: Priority = Priority.INTERACTIVE) -> Priority:
+    """解析优先级（名称如 ``interactive-first`` 或数字），无法识别时返回 ``default``"""
+    if value is None or value == "":
+        return default
+    if isinstance(value, str):
+        name = value.strip().lower().replace("_", "-")
+        if name in PRIORITY_NAMES:
+            return PRIORITY_NAMES[name]
+        try:
+            value = int(name)
+        except ValueError:
+            return default
+    try:
+        return Priority(value)
+    except ValueError:
+        return default
+
+
+def deadline_after(seconds: Optional[float]) -> Optional[float]:
+    """剩余时间（秒）转换为 ``time.monotonic()`` 时钟上的截止时间"""
+    if seconds is None:
+        return None
+    return time.monotonic() + max(float(seconds), 0.0)
+
+
+class _WorkItem:
+    __slots__ = ("future", "fn", "args", "kwargs", "priority", "deadline")
+
+    def __init__(self, future: Future, fn: Callable, args: tuple, kwargs: dict,
+                 priority: Priority, deadline: Optional[float]):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.deadline = deadline
+
+    def run(self) -> None:
+        if not self.future.set_running_or_notify_cancel():
+            return
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except BaseException as e:
+            self.future.set_exception(e)
+        else:
+            self.future.set_result(result)
+
+
+class PriorityExecutor(Executor):
+    def __init__(self, max_workers: int = 4, default_priority: Priority = Priority.INTERACTIVE,
+                 thread_name_prefix: str = "PriorityExecutor"):
+        """
+        Args:
+            max_workers: 工作线程数
+            default_priority: ``submit``（如 ``loop.run_in_executor``）提交的任务使用的优先级
+        """
+        if max_workers < 1:
+            raise ValueError(f"max_workers must be >= 1, got {max_workers}")
+        self.max_workers = max_workers
+        self.default_priority = default_priority
+        self._queue: List[Tuple[int, float, int, _WorkItem]] = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._shutdown = False
+        self._threads = []
+        for i in range(max_workers):
+            t = threading.Thread(target=self._worker, name=f"{thread_name_prefix}_{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        return self.submit_with_priority(self.default_priority, None, fn, *args, **kwargs)
+
+    def submit_with_priority(self, priority: Priority, deadline: Optional[float], fn: Callable, /,
+                             *args, **kwargs) -> Future:
+        """
+        Args:
+            priority: 优先级类别
+            deadline: ``time.monotonic()`` 时钟上的截止时间，None 表示不限
+        """
+        future = Future()
+        item = _WorkItem(future, fn, args, kwargs, Priority(priority), deadline)
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            heapq.heappush(self._queue, (
+                int(item.priority),
+                deadline if deadline is not None else float("inf"),
+                next(self._counter),
+                item,
+            ))
+            self._cond.notify()
+        return future
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._shutdown:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                item = heapq.heappop(self._queue)[-1]
+            if item.deadline is not None and time.monotonic() > item.deadline:
+                if item.future.set_running_or_notify_cancel():
+                    item.future.set_exception(DeadlineExceeded(
+                        f"Deadline exceeded before start (priority={item.priority.name})"
+                    ))
+                continue
+            item.run()
+            del item
+
+    def queued(self) -> Dict[str, int]:
+        """各优先级排队中的任务数（含已取消但尚未出队的任务）"""
+        with self._cond:
+            counts = {p.name: 0 for p in Priority}
+            for entry in self._queue:
+                counts[entry[-1].priority.name] += 1
+        return counts
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        with self._cond:
+            self._shutdown = True
+            if cancel_futures:
+                while self._queue:
+                    heapq.heappop(self._queue)[-1].future.cancel()
+            self._cond.notify_all()
+        if wait:
+            for t in self._threads:
+                t.join()
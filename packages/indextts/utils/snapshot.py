@@ -0,0 +1,285 @@
+"""
+IndexTTS 模型快照（compile snapshot）
+
+把启动阶段的准备工作（torch.load 原始 checkpoint、load_state_dict、remove_weight_norm、
+fp16 转换、多说话人条件向量注册）离线做一次，结果写成单个 safetensors 文件：
+    - gpt.*      : UnifiedVoice 权重（已转换 dtype，含 mean_condition_{speaker_id}）
+    - bigvgan.*  : BigVGAN 权重（已移除 weight norm）
+    - metadata   : config.yaml 内容、dtype、说话人列表等
+
+服务启动时用 safetensors 的 mmap 方式零拷贝加载，重启/扩容只需几秒。
+
+用法：
+    PYTHONPATH=packages python -m indextts.utils.snapshot \\
+        --model_dir models/tts_service/ckpt/cjg --output models/tts_service/ckpt/cjg/snapshot.safetensors
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import struct
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+
+import torch
+from omegaconf import OmegaConf
+from safetensors import safe_open
+from safetensors.torch import save_file
+
+SNAPSHOT_FORMAT_VERSION = "1"
+GPT_PREFIX = "gpt."
+BIGVGAN_PREFIX = "bigvgan."
+MEAN_CONDITION_KEY = "extra.mean_condition"
+
+
+def build_snapshot(
+    model_dir: str,
+    output_path: str,
+    cfg_path: Optional[str] = None,
+    is_fp16: bool = True,
+    speaker_info_path: Optional[str] = None,
+) -> str:
+    """
+    从原始 checkpoint 构建快照文件，返回输出路径
+
+    注意：不调用 post_init_gpt2_config（DeepSpeed / kv cache 包装在加载时按设备决定），
+    inference_model 与 gpt 共享权重，快照中只保存一份。
+    """
+    from indextts.BigVGAN.models import BigVGAN as Generator
+    from indextts.gpt.model import UnifiedVoice
+    from indextts.utils.checkpoint import load_checkpoint
+
+    cfg_path = cfg_path or os.path.join(model_dir, "config.yaml")
+    cfg = OmegaConf.load(cfg_path)
+
+    start = time.perf_counter()
+    gpt = UnifiedVoice(**cfg.gpt)
+    gpt_path = os.path.join(model_dir, cfg.gpt_checkpoint)
+    load_checkpoint(gpt, gpt_path)
+    gpt.eval()
+    if is_fp16:
+        gpt.half()
+    print(">> GPT weights restored from:", gpt_path)
+
+    bigvgan = Generator(cfg.bigvgan, use_cuda_kernel=False)
+    bigvgan_path = os.path.join(model_dir, cfg.bigvgan_checkpoint)
+    vocoder_dict = torch.load(bigvgan_path, map_location="cpu")
+    bigvgan.load_state_dict(vocoder_dict["generator"])
+    bigvgan.remove_weight_norm()
+    bigvgan.eval()
+    print(">> bigvgan weights restored from:", bigvgan_path)
+
+    tensors: Dict[str, torch.Tensor] = {}
+    for name, tensor in gpt.state_dict().items():
+        if name.startswith("inference_model."):
+            continue
+        # clone 断开共享存储，safetensors 不允许多个 key 指向同一块内存
+        tensors[GPT_PREFIX + name] = tensor.detach().contiguous().clone()
+    for name, tensor in bigvgan.state_dict().items():
+        tensors[BIGVGAN_PREFIX + name] = tensor.detach().contiguous().clone()
+    # 单一 mean_condition 不是 Parameter，单独保存
+    if getattr(gpt, "mean_condition", None) is not None:
+        tensors[MEAN_CONDITION_KEY] = gpt.mean_condition.detach().contiguous().clone()
+
+    speakers = sorted(
+        name[len("mean_condition_"):]
+        for name, _ in gpt.named_parameters()
+        if name.startswith("mean_condition_")
+    )
+    speaker_list = []
+    if speaker_info_path and os.path.exists(speaker_info_path):
+        with open(speaker_info_path, "r", encoding="utf-8") as f:
+            speaker_list = [item["speaker"] for item in json.load(f) if "speaker" in item]
+
+    metadata = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "config": OmegaConf.to_yaml(cfg),
+        "is_fp16": "1" if is_fp16 else "0",
+        "speaker_conditions": json.dumps(speakers, ensure_ascii=False),
+        "speaker_list": json.dumps(speaker_list, ensure_ascii=False),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    save_file(tensors, output_path, metadata=metadata)
+    size_mb = os.path.getsize(output_path) / 1024 / 1024
+    print(f">> snapshot saved to {output_path} ({size_mb:.1f} MB, {len(tensors)} tensors, "
+          f"{time.perf_counter() - start:.1f}s)")
+    return output_path
+
+
+def read_snapshot_metadata(snapshot_path: str) -> Dict[str, str]:
+    with safe_open(snapshot_path, framework="pt", device="cpu") as f:
+        metadata = f.metadata() or {}
+    if metadata.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported snapshot format version: {metadata.get('format_version')} "
+            f"(expected {SNAPSHOT_FORMAT_VERSION}), please rebuild the snapshot"
+        )
+    return metadata
+
+
+_SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def mmap_safetensors(path: str) -> Dict[str, torch.Tensor]:
+    """
+    把 safetensors 文件整体 mmap（MAP_PRIVATE），每个张量都是映射区的一个视图。
+
+    多个进程映射同一个文件时，物理页由页缓存（或 /dev/shm）共享，
+    只有被写入的页才会在进程内复制，因此推理时每个 worker 不再各自持有一份权重。
+    """
+    with open(path, "rb") as f:
+        header_len = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_len))
+    data_start = 8 + header_len
+    nbytes = os.path.getsize(path)
+    storage = torch.UntypedStorage.from_file(path, False, nbytes)
+    buffer = torch.empty(0, dtype=torch.uint8).set_(storage)
+
+    tensors: Dict[str, torch.Tensor] = {}
+    for key, info in header.items():
+        if key == "__metadata__":
+            continue
+        begin, end = info["data_offsets"]
+        dtype = _SAFETENSORS_DTYPES[info["dtype"]]
+        raw = buffer[data_start + begin : data_start + end]
+        tensors[key] = raw.view(dtype).reshape(info["shape"])
+    return tensors
+
+
+def load_snapshot_tensors(
+    snapshot_path: str,
+) -> Tuple[Dict[str, torch.Tensor], Dict[str, torch.Tensor], Optional[torch.Tensor]]:
+    """
+    以 mmap 方式读取快照，返回 (gpt_state_dict, bigvgan_state_dict, mean_condition)
+
+    张量直接引用文件映射，不会把整份权重读进进程堆内存。
+    """
+    gpt_state: Dict[str, torch.Tensor] = {}
+    bigvgan_state: Dict[str, torch.Tensor] = {}
+    mean_condition = None
+    for key, tensor in mmap_safetensors(snapshot_path).items():
+        if key.startswith(GPT_PREFIX):
+            gpt_state[key[len(GPT_PREFIX):]] = tensor
+        elif key.startswith(BIGVGAN_PREFIX):
+            bigvgan_state[key[len(BIGVGAN_PREFIX):]] = tensor
+        elif key == MEAN_CONDITION_KEY:
+            mean_condition = tensor
+    return gpt_state, bigvgan_state, mean_condition
+
+
+def stage_snapshot(snapshot_path: str, target_dir: str = "/dev/shm") -> str:
+    """
+    把快照放到共享内存目录（默认 /dev/shm），返回共享副本路径
+
+    副本名为 indextts-{源路径哈希}-{大小}-{修改时间}.safetensors，同一主机上多个服务互不干扰。
+    多个 worker 并发调用时，各自写入唯一的临时文件后 os.replace 原子替换，
+    已存在且大小、修改时间一致的副本直接复用。
+    同一源快照更新后，其旧版本副本会被删除，避免 tmpfs 被历史副本占满。
+    """
+    if not os.path.isdir(target_dir):
+        return snapshot_path
+    src_stat = os.stat(snapshot_path)
+    prefix = f"indextts-{hashlib.sha1(os.path.realpath(snapshot_path).encode('utf-8')).hexdigest()[:12]}-"
+    target_path = os.path.join(target_dir, f"{prefix}{src_stat.st_size}-{int(src_stat.st_mtime)}.safetensors")
+    if os.path.exists(target_path) and os.path.getsize(target_path) == src_stat.st_size:
+        _remove_stale_copies(target_dir, prefix, target_path)
+        return target_path
+    tmp_path = f"{target_path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        shutil.copyfile(snapshot_path, tmp_path)
+        os.replace(tmp_path, target_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    _remove_stale_copies(target_dir, prefix, target_path)
+    return target_path
+
+
+def _remove_stale_copies(target_dir: str, prefix: str, keep_path: str) -> None:
+    """
+    删除共享目录中同一源快照的旧版本副本（{prefix}*.safetensors），其他服务的副本不动
+
+    仍在 mmap 旧副本的进程不受影响：Linux 下删除只移除目录项，映射解除后内存才释放。
+    其他 worker 正在写入的 .tmp 文件不动。
+    """
+    keep_name = os.path.basename(keep_path)
+    for name in os.listdir(target_dir):
+        if name == keep_name or not (name.startswith(prefix) and name.endswith(".safetensors")):
+            continue
+        try:
+            os.remove(os.path.join(target_dir, name))
+        except OSError:
+            pass
+
+
+def process_memory_mb() -> Dict[str, float]:
+    """
+    当前进程内存占用（MB），仅 Linux 下可用：
+        rss   : 常驻内存总量（含共享的文件映射页）
+        anon  : 进程私有的匿名内存（真正每个 worker 独占的部分）
+        file  : 文件映射页（mmap 的快照，多进程共享）
+        shmem : 共享内存页（/dev/shm 中的快照）
+    """
+    fields = {"VmRSS:": "rss", "RssAnon:": "anon", "RssFile:": "file", "RssShmem:": "shmem"}
+    result: Dict[str, float] = {}
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                key = line.split(":", 1)[0] + ":"
+                if key in fields:
+                    result[fields[key]] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return result
+
+
+def apply_gpt_snapshot(model: torch.nn.Module, state: Dict[str, torch.Tensor], mean_condition=None) -> None:
+    """
+    把快照中的 GPT 权重装入 UnifiedVoice：
+    先注册 mean_condition_{speaker_id} 参数，再用 assign=True 直接接管 mmap 张量（不拷贝）
+    """
+    for name, tensor in state.items():
+        if name.startswith("mean_condition_"):
+            setattr(model, name, torch.nn.Parameter(tensor, requires_grad=False))
+    if mean_condition is not None:
+        model.mean_condition = mean_condition
+    model.load_state_dict(state, strict=False, assign=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build IndexTTS compile snapshot (safetensors, mmap-able)")
+    parser.add_argument("--model_dir", type=str, required=True, help="Model checkpoints directory")
+    parser.add_argument("-c", "--config", type=str, default=None, help="Path to config.yaml (default: <model_dir>/config.yaml)")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="Output snapshot path (default: <model_dir>/snapshot.safetensors)")
+    parser.add_argument("--fp32", action="store_true", default=False, help="Keep GPT weights in fp32 (for CPU inference)")
+    parser.add_argument("--speaker_info", type=str, default=None,
+                        help="Path to speaker_info.json (default: <model_dir>/speaker_info.json)")
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(args.model_dir, "snapshot.safetensors")
+    speaker_info = args.speaker_info or os.path.join(args.model_dir, "speaker_info.json")
+    build_snapshot(
+        model_dir=args.model_dir,
+        output_path=output,
+        cfg_path=args.config,
+        is_fp16=not args.fp32,
+        speaker_info_path=speaker_info,
+    )
+
+
+if __name__ == "__main__":
+    main()
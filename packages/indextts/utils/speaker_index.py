@@ -0,0 +1,340 @@
+"""
+说话人向量服务：批量 ECAPA-TDNN 声纹提取 + 余弦相似度 + 持久化近邻索引
+
+- SpeakerEmbedder : 多段音频一次性补零成批，批量提取 mel，ECAPA 前向时用相对长度做掩码，
+                    输出 L2 归一化的说话人向量（与 BigVGAN 的说话人编码器共用权重）
+- cosine_similarity_matrix : 归一化后一次矩阵乘得到两组向量两两之间的余弦相似度
+- SpeakerIndex    : 向量存放在 NumPy memmap 文件中，配合球面 k-means 的 IVF 倒排索引，
+                    用于"与哪个已存声音最接近"的查询
+
+全部在 CPU 上运行，不依赖网络。
+"""
+import contextlib
+import fcntl
+import io
+import json
+import os
+import threading
+import uuid
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+import torchaudio
+
+from indextts.utils.feature_extractors import MelSpectrogramFeatures
+
+SAMPLE_RATE = 24000
+MEL_HOP_LENGTH = 256
+
+
+def l2_normalize(x: np.ndarray, eps: float = 1e-12) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), eps)
+
+
+def cosine_similarity_matrix(a: np.ndarray, b: Optional[np.ndarray] = None) -> np.ndarray:
+    """a: [n, d], b: [m, d]（缺省为 a 自身）-> [n, m] 余弦相似度，一次矩阵乘完成"""
+    a = l2_normalize(np.atleast_2d(a))
+    b = a if b is None else l2_normalize(np.atleast_2d(b))
+    return a @ b.T
+
+
+def load_audio(source: Union[str, bytes], sample_rate: int = SAMPLE_RATE) -> torch.Tensor:
+    """文件路径或音频字节 -> 单声道 [T] 波形（重采样到 sample_rate）"""
+    audio, sr = torchaudio.load(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+    audio = torch.mean(audio, dim=0)
+    if sr != sample_rate:
+        audio = torchaudio.functional.resample(audio, sr, sample_rate)
+    return audio
+
+
+class SpeakerEmbedder:
+    def __init__(self, encoder: torch.nn.Module, device: str = "cpu", batch_size: int = 16):
+        """
+        Args:
+            encoder: ECAPA_TDNN（通常是 ``BigVGAN.speaker_encoder``）
+            device: 推理设备，默认 CPU
+            batch_size: 单次 ECAPA 前向的最大音频数
+        """
+        self.device = torch.device(device)
+        self.encoder = encoder.to(self.device).float().eval()
+        self.batch_size = batch_size
+        self.mel_extractor = MelSpectrogramFeatures().to(self.device)
+
+    @classmethod
+    def from_bigvgan(cls, bigvgan: torch.nn.Module, device: str = "cpu", batch_size: int = 16) -> "SpeakerEmbedder":
+        """复用已加载 BigVGAN 的说话人编码器；BigVGAN 在其他设备上时复制一份到 ``device``"""
+        encoder = bigvgan.speaker_encoder
+        param = next(encoder.parameters())
+        if param.device != torch.device(device) or param.dtype != torch.float32:
+            import copy
+
+            encoder = copy.deepcopy(encoder)
+        return cls(encoder, device=device, batch_size=batch_size)
+
+    @classmethod
+    def from_checkpoint(cls, model_dir: str, cfg_path: Optional[str] = None, device: str = "cpu",
+                        batch_size: int = 16) -> "SpeakerEmbedder":
+        """只从 BigVGAN checkpoint 中取出 speaker_encoder.* 权重，不构建整个声码器"""
+        from omegaconf import OmegaConf
+
+        from indextts.BigVGAN.ECAPA_TDNN import ECAPA_TDNN
+
+        cfg = OmegaConf.load(cfg_path or os.path.join(model_dir, "config.yaml"))
+        encoder = ECAPA_TDNN(cfg.bigvgan.num_mels, lin_neurons=cfg.bigvgan.speaker_embedding_dim)
+        state = torch.load(os.path.join(model_dir, cfg.bigvgan_checkpoint), map_location="cpu")["generator"]
+        prefix = "speaker_encoder."
+        encoder.load_state_dict({k[len(prefix):]: v for k, v in state.items() if k.startswith(prefix)})
+        return cls(encoder, device=device, batch_size=batch_size)
+
+    @property
+    def dim(self) -> int:
+        return self.encoder.fc.conv.out_channels
+
+    @torch.no_grad()
+    def embed(self, wavs: Sequence[torch.Tensor]) -> np.ndarray:
+        """
+        Args:
+            wavs: 24kHz 单声道波形列表，每个 [T]
+        Returns:
+            [n, dim] L2 归一化的说话人向量，顺序与输入一致
+        """
+        if not wavs:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        # 按长度排序后分批，减少补零
+        order = sorted(range(len(wavs)), key=lambda i: wavs[i].shape[-1])
+        out = np.zeros((len(wavs), self.dim), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            out[idx] = self._embed_batch([wavs[i] for i in idx])
+        return out
+
+    def _embed_batch(self, wavs: List[torch.Tensor]) -> np.ndarray:
+        lengths = torch.tensor([w.shape[-1] for w in wavs])
+        batch = torch.zeros((len(wavs), int(lengths.max())))
+        for i, w in enumerate(wavs):
+            batch[i, : w.shape[-1]] = w
+        mel = self.mel_extractor(batch.to(self.device))  # [b, n_mels, frames]
+        # center padding: 帧数 = T // hop + 1；ECAPA 的掩码使用相对长度
+        frames = lengths // MEL_HOP_LENGTH + 1
+        rel_lengths = (frames.float() / mel.shape[-1]).to(self.device)
+        emb = self.encoder(mel.transpose(1, 2), lengths=rel_lengths)  # [b, 1, dim]
+        return l2_normalize(emb.squeeze(1).float().cpu().numpy())
+
+    def embed_audio(self, sources: Sequence[Union[str, bytes]]) -> np.ndarray:
+        return self.embed([load_audio(s) for s in sources])
+
+
+class SpeakerIndex:
+    """
+    持久化说话人向量索引
+
+    root_dir/
+        embeddings.f32 : memmap [capacity, dim] float32（L2 归一化）
+        index.json     : dim / count / ids
+        ivf.npz        : IVF 聚类中心 [nlist, dim] 与每条向量的所属簇 [count]
+
+    向量数较少时直接暴力矩阵乘；超过 ``min_train_size`` 后训练 IVF，
+    查询只在与 query 最接近的 ``nprobe`` 个簇内计算相似度。
+    多个 worker 可共用同一目录：写入时持有文件锁，并在读写前按 index.json 的修改时间重新加载。
+    """
+
+    EMBEDDINGS_FILE = "embeddings.f32"
+    META_FILE = "index.json"
+    IVF_FILE = "ivf.npz"
+    LOCK_FILE = ".lock"
+
+    def __init__(self, root_dir: str, dim: int, nlist: int = 16, nprobe: int = 4, min_train_size: int = 256):
+        self.root_dir = root_dir
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self._lock = threading.RLock()
+        os.makedirs(root_dir, exist_ok=True)
+
+        self._meta_mtime = None
+        self._load()
+
+    def _load(self) -> None:
+        """从磁盘加载 ids / IVF，并重新映射向量文件"""
+        self.ids: List[str] = []
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self._trained_count = 0
+        meta_path = os.path.join(self.root_dir, self.META_FILE)
+        if os.path.exists(meta_path):
+            self._meta_mtime = os.stat(meta_path).st_mtime_ns
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["dim"] != self.dim:
+                raise ValueError(f"Speaker index dim mismatch: {meta['dim']} vs {self.dim}")
+            self.ids = meta["ids"]
+            self._trained_count = meta.get("trained_count", 0)
+        self._row_of: Dict[str, int] = {sid: i for i, sid in enumerate(self.ids)}
+        self._open_memmap(max(len(self.ids), 1024))
+        ivf_path = os.path.join(self.root_dir, self.IVF_FILE)
+        if self._trained_count and os.path.exists(ivf_path):
+            with np.load(ivf_path) as data:
+                self.centroids = data["centroids"]
+                self.assignments = data["assignments"]
+            if len(self.assignments) < len(self.ids):
+                tail = np.asarray(self._data[len(self.assignments): len(self.ids)])
+                self.assignments = np.concatenate(
+                    [self.assignments, np.argmax(tail @ self.centroids.T, axis=1).astype(np.int32)]
+                )
+        self._build_lists()
+
+    def _refresh(self) -> None:
+        """其他进程写入过索引时重新加载"""
+        meta_path = os.path.join(self.root_dir, self.META_FILE)
+        if os.path.exists(meta_path) and os.stat(meta_path).st_mtime_ns != self._meta_mtime:
+            self._load()
+
+    @contextlib.contextmanager
+    def _write_lock(self):
+        with self._lock, open(os.path.join(self.root_dir, self.LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        return self._data[: len(self.ids)]
+
+    def _open_memmap(self, capacity: int) -> None:
+        path = os.path.join(self.root_dir, self.EMBEDDINGS_FILE)
+        nbytes = capacity * self.dim * 4
+        if not os.path.exists(path) or os.path.getsize(path) < nbytes:
+            with open(path, "ab") as f:
+                f.truncate(nbytes)
+        capacity = os.path.getsize(path) // (self.dim * 4)
+        self._data = np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _build_lists(self) -> None:
+        if self.centroids is None:
+            self._lists = None
+            return
+        order = np.argsort(self.assignments, kind="stable")
+        bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+        self._lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(self.centroids))]
+
+    def add(self, ids: Sequence[str], embeddings: np.ndarray) -> None:
+        """添加或覆盖（同 id）向量，并持久化"""
+        embeddings = l2_normalize(np.atleast_2d(embeddings))
+        if embeddings.shape != (len(ids), self.dim):
+            raise ValueError(f"embeddings shape {embeddings.shape} does not match ({len(ids)}, {self.dim})")
+        with self._write_lock():
+            rows = []
+            for sid in ids:
+                row = self._row_of.get(sid)
+                if row is None:
+                    row = len(self.ids)
+                    self.ids.append(sid)
+                    self._row_of[sid] = row
+                rows.append(row)
+            if len(self.ids) > self._data.shape[0]:
+                self._data.flush()
+                self._open_memmap(max(len(self.ids), self._data.shape[0] * 2))
+            self._data[rows] = embeddings
+            self._data.flush()
+
+            if len(self.ids) >= self.min_train_size and len(self.ids) >= 2 * max(self._trained_count, 1):
+                # 数据量翻倍后重新训练，避免聚类中心过时
+                self._train()
+            elif self.centroids is not None:
+                assignments = np.zeros(len(self.ids), dtype=np.int32)
+                assignments[: len(self.assignments)] = self.assignments
+                assignments[rows] = np.argmax(embeddings @ self.centroids.T, axis=1)
+                self.assignments = assignments
+                self._build_lists()
+            self._save_meta()
+
+    def train(self, iterations: int = 20, seed: int = 0) -> None:
+        """球面 k-means 训练 IVF 聚类中心"""
+        with self._write_lock():
+            self._train(iterations, seed)
+            self._save_meta()
+
+    def _train(self, iterations: int = 20, seed: int = 0) -> None:
+        # 调用方需持有写锁（flock 不可重入）
+        data = np.asarray(self.embeddings)
+        nlist = min(self.nlist, len(data))
+        if nlist == 0:
+            return
+        rng = np.random.default_rng(seed)
+        centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(data @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = data[assignments == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids = l2_normalize(centroids)
+        self.centroids = centroids.astype(np.float32)
+        self.assignments = np.argmax(data @ self.centroids.T, axis=1).astype(np.int32)
+        self._trained_count = len(data)
+        self._build_lists()
+
+    def search(self, queries: np.ndarray, k: int = 5) -> List[List[Tuple[str, float]]]:
+        """返回每个 query 最相似的 k 个 (id, 余弦相似度)"""
+        queries = l2_normalize(np.atleast_2d(queries))
+        with self._lock:
+            self._refresh()
+            data = self.embeddings
+            if len(data) == 0:
+                return [[] for _ in range(len(queries))]
+            results = []
+            if self._lists is None:
+                scores = queries @ data.T
+                for row in scores:
+                    results.append(self._topk(np.arange(len(data)), row, k))
+                return results
+            probe = np.argsort(-(queries @ self.centroids.T), axis=1)[:, : self.nprobe]
+            for q, lists in zip(queries, probe):
+                candidates = np.concatenate([self._lists[c] for c in lists])
+                if len(candidates) == 0:
+                    results.append([])
+                    continue
+                results.append(self._topk(candidates, data[candidates] @ q, k))
+            return results
+
+    def _topk(self, rows: np.ndarray, scores: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[rows[i]], float(scores[i])) for i in top]
+
+    def _save_meta(self) -> None:
+        # 先写 IVF 再写 index.json：其他进程以 index.json 的修改时间判断是否需要重新加载
+        if self.centroids is not None:
+            self._atomic_write(
+                self.IVF_FILE,
+                lambda f: np.savez(f, centroids=self.centroids, assignments=self.assignments),
+            )
+        self._atomic_write(
+            self.META_FILE,
+            lambda f: f.write(json.dumps(
+                {"dim": self.dim, "count": len(self.ids), "trained_count": self._trained_count, "ids": self.ids},
+                ensure_ascii=False,
+            ).encode("utf-8")),
+        )
+        self._meta_mtime = os.stat(os.path.join(self.root_dir, self.META_FILE)).st_mtime_ns
+
+    def _atomic_write(self, name: str, writer) -> None:
+        path = os.path.join(self.root_dir, name)
+        tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                writer(f)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
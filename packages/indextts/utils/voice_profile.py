@@ -0,0 +1,157 @@
+"""
+声音档案（voice profile）：零样本音色克隆的参考音频预处理结果
+
+上传参考音频时一次性计算：
+    - cond_mel          : 24kHz 参考音频的 mel 谱 (1, n_mels, frames)
+    - conds_latent      : GPT 条件向量 (1, 32, dim)，即 ``UnifiedVoice.encode_conditioning``
+    - speaker_embedding : BigVGAN 的 ECAPA-TDNN 说话人向量 (1, 1, D)
+以参考音频内容的 sha256 作为档案 ID，保存为压缩 .npz，多个 worker 共享同一目录。
+之后的克隆请求只需带档案 ID，完全跳过参考音频的解码、重采样和编码。
+"""
+import hashlib
+import io
+import os
+import re
+import threading
+import uuid
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+import torch
+import torchaudio
+
+from indextts.utils.feature_extractors import MelSpectrogramFeatures
+from indextts.utils.front import LRUCache
+
+PROFILE_ID_LENGTH = 16
+_PROFILE_ID_RE = re.compile(rf"^[0-9a-f]{{{PROFILE_ID_LENGTH}}}$")
+SAMPLE_RATE = 24000
+# mel 帧移（MelSpectrogramFeatures 默认 hop_length）
+MEL_HOP_LENGTH = 256
+
+
+@dataclass
+class VoiceProfile:
+    profile_id: str
+    cond_mel: torch.Tensor
+    conds_latent: torch.Tensor
+    speaker_embedding: torch.Tensor
+
+    @property
+    def duration(self) -> float:
+        """参考音频时长（秒）"""
+        return self.cond_mel.shape[-1] * MEL_HOP_LENGTH / SAMPLE_RATE
+
+
+@torch.no_grad()
+def speaker_similarity(tts, profile: VoiceProfile, wav: torch.Tensor) -> float:
+    """
+    合成音频与档案参考音频的 ECAPA-TDNN 说话人向量余弦相似度
+
+    Args:
+        wav: 24kHz int16 幅度的合成音频 (1, T)
+    """
+    mel = MelSpectrogramFeatures()(wav.float() / 32767.0).to(tts.device)
+    embedding = tts.bigvgan.get_speaker_embedding(mel.transpose(1, 2)).float()
+    return torch.nn.functional.cosine_similarity(
+        embedding.flatten(), profile.speaker_embedding.float().flatten(), dim=0
+    ).item()
+
+
+def compute_profile_id(audio_bytes: bytes) -> str:
+    return hashlib.sha256(audio_bytes).hexdigest()[:PROFILE_ID_LENGTH]
+
+
+def validate_profile_id(profile_id: str) -> str:
+    if not isinstance(profile_id, str) or not _PROFILE_ID_RE.match(profile_id):
+        raise ValueError(f"Invalid voice profile id: {profile_id!r}")
+    return profile_id
+
+
+class VoiceProfileStore:
+    def __init__(self, root_dir: str, cache_size: int = 64):
+        """
+        Args:
+            root_dir: .npz 档案目录（多 worker 共享）
+            cache_size: 进程内缓存的档案数（张量已在推理设备上）
+        """
+        self.root_dir = root_dir
+        os.makedirs(root_dir, exist_ok=True)
+        self.cache = LRUCache(maxsize=cache_size)
+        # 同一参考音频并发上传时只计算一次
+        self._lock = threading.Lock()
+
+    def path(self, profile_id: str) -> str:
+        return os.path.join(self.root_dir, f"{validate_profile_id(profile_id)}.npz")
+
+    def exists(self, profile_id: str) -> bool:
+        return os.path.isfile(self.path(profile_id))
+
+    def get_or_create(self, tts, audio_bytes: bytes) -> Tuple[VoiceProfile, bool]:
+        """
+        返回 (profile, created)。已有同内容档案时直接加载，created 为 False。
+        """
+        profile_id = compute_profile_id(audio_bytes)
+        with self._lock:
+            if self.exists(profile_id):
+                return self.load(profile_id, tts.device), False
+            profile = self._extract(tts, profile_id, audio_bytes)
+            self._save(profile)
+        self.cache.put((profile_id, str(tts.device)), profile)
+        return profile, True
+
+    def load(self, profile_id: str, device) -> VoiceProfile:
+        """按 ID 加载档案，不存在时抛出 KeyError"""
+        key = (validate_profile_id(profile_id), str(device))
+        profile = self.cache.get(key)
+        if profile is not None:
+            return profile
+        path = self.path(profile_id)
+        if not os.path.isfile(path):
+            raise KeyError(f"Voice profile not found: {profile_id}")
+        with np.load(path) as data:
+            profile = VoiceProfile(
+                profile_id=profile_id,
+                cond_mel=torch.from_numpy(data["cond_mel"]).to(device),
+                conds_latent=torch.from_numpy(data["conds_latent"]).to(device),
+                speaker_embedding=torch.from_numpy(data["speaker_embedding"]).to(device),
+            )
+        self.cache.put(key, profile)
+        return profile
+
+    @torch.no_grad()
+    def _extract(self, tts, profile_id: str, audio_bytes: bytes) -> VoiceProfile:
+        """与 IndexTTS.infer 相同的参考音频预处理，外加条件向量与说话人向量"""
+        audio, sr = torchaudio.load(io.BytesIO(audio_bytes))
+        audio = torch.mean(audio, dim=0, keepdim=True)
+        if sr != SAMPLE_RATE:
+            audio = torchaudio.transforms.Resample(sr, SAMPLE_RATE)(audio)
+        cond_mel = MelSpectrogramFeatures()(audio).to(tts.device)
+        cond_mel_lengths = torch.tensor([cond_mel.shape[-1]], device=tts.device)
+        with torch.amp.autocast(cond_mel.device.type, enabled=tts.dtype is not None, dtype=tts.dtype):
+            conds_latent = tts.gpt.encode_conditioning(cond_mel, cond_mel_lengths)
+        speaker_embedding = tts.bigvgan.get_speaker_embedding(cond_mel.transpose(1, 2))
+        return VoiceProfile(
+            profile_id=profile_id,
+            cond_mel=cond_mel,
+            conds_latent=conds_latent.float(),
+            speaker_embedding=speaker_embedding.float(),
+        )
+
+    def _save(self, profile: VoiceProfile) -> None:
+        path = self.path(profile.profile_id)
+        tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            # 传文件对象，避免 numpy 自动追加 .npz 后缀
+            with open(tmp_path, "wb") as f:
+                np.savez_compressed(
+                    f,
+                    cond_mel=profile.cond_mel.float().cpu().numpy(),
+                    conds_latent=profile.conds_latent.float().cpu().numpy(),
+                    speaker_embedding=profile.speaker_embedding.float().cpu().numpy(),
+                )
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
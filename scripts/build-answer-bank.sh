@@ -0,0 +1,22 @@
+#!/bin/bash
+set -euo pipefail
+
+source "$(dirname "$0")/load_config.sh"
+
+ROOT_DIR=$(cd "$(dirname "$0")/.." && pwd)
+
+# 与 start-tts_cjg.sh 相同：本地 indextts + 后端 app（复用字幕切分逻辑）
+export PYTHONPATH="${ROOT_DIR}/packages:${ROOT_DIR}/backend"
+export MODEL_DIR=${MODEL_DIR:-"${ROOT_DIR}/models/tts_service/ckpt/cjg"}
+export AUDIO_PROMPT=${AUDIO_PROMPT:-"${ROOT_DIR}/models/tts_service/speaker_audio/陈嘉庚.wav"}
+
+export DS_BUILD_OPS=0
+export DS_SKIP_CUDA_CHECK=1
+
+echo "🎙️ 合成数字嘉庚答案库"
+cd "$ROOT_DIR/models/tts_service"
+
+exec python build_answer_bank.py \
+  --bank "${ROOT_DIR}/backend/data/jiageng_answer_bank.json" \
+  --out "${ROOT_DIR}/backend/uploads/answer_bank" \
+  "$@"
@@ -16,6 +16,21 @@ INDEXTTS_DIR="${ROOT_DIR}/packages"
 export PYTHONPATH="${INDEXTTS_DIR}:${ROOT_DIR}"
 export MODEL_DIR="${ROOT_DIR}/models/tts_service/ckpt/cjg"
 export AUDIO_PROMPT="${ROOT_DIR}/models/tts_service/speaker_audio/陈嘉庚.wav"
+# 模型快照（可选）与多 worker 共享权重（快照放入 /dev/shm 后只读映射）：
+#   - GPU 节点：权重会被拷到显存，共享无意义，默认关闭，使用 fp16 快照
+#   - CPU 节点：必须是 fp32 快照（fp16 会被转成每个 worker 的私有拷贝），缺失时自动构建，默认开启共享
+if command -v nvidia-smi >/dev/null 2>&1; then
+  export TTS_SNAPSHOT=${TTS_SNAPSHOT:-"${MODEL_DIR}/snapshot.safetensors"}
+  export TTS_SHARE_WEIGHTS=${TTS_SHARE_WEIGHTS:-0}
+else
+  export TTS_SNAPSHOT=${TTS_SNAPSHOT:-"${MODEL_DIR}/snapshot-fp32.safetensors"}
+  export TTS_SHARE_WEIGHTS=${TTS_SHARE_WEIGHTS:-1}
+  if [ "$TTS_SHARE_WEIGHTS" = "1" ] && [ ! -f "$TTS_SNAPSHOT" ]; then
+    echo "📦 构建 fp32 模型快照: $TTS_SNAPSHOT"
+    python -m indextts.utils.snapshot --model_dir "$MODEL_DIR" --fp32 --output "$TTS_SNAPSHOT" \
+      || echo "⚠️  fp32 快照构建失败，回退为每个 worker 独立加载"
+  fi
+fi
 
 export DS_BUILD_OPS=0
 export DS_SKIP_CUDA_CHECK=1
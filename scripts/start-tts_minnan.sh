@@ -14,6 +14,9 @@ LOG_LEVEL=${LOG_LEVEL:-debug}
 ROOT_DIR=$(cd "$(dirname "$0")/.." && pwd)
 export PYTHONPATH="$ROOT_DIR"
 export LOG_LEVEL
+# 推理后端：torch（默认）/ onnx（CPU 节点推荐，先执行 cd models/tts_service && python vits_onnx.py --int8 导出）
+export TTS_BACKEND=${TTS_BACKEND:-torch}
+export TTS_ONNX_INT8=${TTS_ONNX_INT8:-0}
 
 echo "🔊 启动TTS模型服务 (端口: $PORT, 主机: $HOST, 进程: $WORKERS, 日志: $LOG_LEVEL)"
 cd "$ROOT_DIR/models/tts_service"
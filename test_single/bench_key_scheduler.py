@@ -0,0 +1,86 @@
+"""
+Provider Key 调度压测：对本地 OpenAI 兼容桩服务并发发起请求，观察各 Key 的流量分配、限流与冷却
+
+用法（在仓库根目录）：
+    # 终端 1：每把 Key 每分钟 20 次请求上限
+    python test_single/mock_openai_server.py --port 9099 --rpm 20
+    # 终端 2：后端配置的 RPM 故意高于桩服务的实际配额，观察 429 冷却后流量转移到其他 Key
+    cd backend && LLM_PROVIDER_BASE_URL=http://127.0.0.1:9099/v1 PROVIDER_NAME=qwen \\
+        PROVIDER_API_KEY=k1,k2,k3 PROVIDER_KEY_RPM=30 \\
+        python ../test_single/bench_key_scheduler.py --requests 60 --concurrency 8
+
+输出成功率、平均/P95 延迟、各 Key 的调度统计以及桩服务侧的统计。
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from app.core.config import settings
+from app.services import llm_service
+
+# =============================
+#           配置区域
+# =============================
+
+MESSAGES = [
+    {"role": "system", "content": "你是陈嘉庚先生。"},
+    {"role": "user", "content": "你为什么创办厦门大学？"},
+]
+
+
+async def run(total: int, concurrency: int, stream: bool):
+    sem = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one():
+        nonlocal failures
+        async with sem:
+            start = time.perf_counter()
+            if stream:
+                last = {}
+                async for last in llm_service.call_qwen_stream(MESSAGES, None):
+                    pass
+                ok = "error" not in (last.get("raw") or {})
+            else:
+                result = await llm_service.call_qwen(MESSAGES, None)
+                ok = bool(result.get("text"))
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(total)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"请求 {total}，成功 {len(latencies)}，失败 {failures}，总耗时 {elapsed:.2f}s")
+    if latencies:
+        p95 = latencies[min(int(0.95 * len(latencies)), len(latencies) - 1)]
+        print(f"平均延迟 {sum(latencies) / len(latencies) * 1000:.1f}ms，P95 {p95 * 1000:.1f}ms")
+    print("后端 Key 调度统计：")
+    print(json.dumps(llm_service.key_metrics(), ensure_ascii=False, indent=2))
+
+    stats_url = settings.llm_provider_base_url.rsplit("/v1", 1)[0] + "/stats"
+    async with httpx.AsyncClient() as client:
+        resp = await client.get(stats_url)
+        print("桩服务统计：")
+        print(json.dumps(resp.json(), ensure_ascii=False, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Provider Key 调度压测（需先启动 mock_openai_server.py）")
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--stream", action="store_true", help="使用流式接口")
+    args = parser.parse_args()
+    if not settings.llm_provider_base_url:
+        raise SystemExit("请设置 LLM_PROVIDER_BASE_URL 指向桩服务，例如 http://127.0.0.1:9099/v1")
+    asyncio.run(run(args.requests, args.concurrency, args.stream))
+
+
+if __name__ == "__main__":
+    main()
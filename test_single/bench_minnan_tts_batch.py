@@ -0,0 +1,133 @@
+"""
+闽南语 VITS（facebook/mms-tts-nan）CPU 吞吐基准：逐片段前向 vs 批量前向 vs 跨请求微批
+
+用法（在仓库根目录）：
+    PYTHONPATH=models/tts_service python test_single/bench_minnan_tts_batch.py --threads 4 --clients 8
+
+输出：
+    - 逐片段（原实现：修改 model.speaking_rate 后调用 HF forward）的片段/秒与 RTF；
+    - 不同批大小下 ``synthesize_jobs`` 的片段/秒与 RTF；
+    - 多个并发客户端经 ``MicroBatcher`` 合成时的请求吞吐、平均 / P95 延迟与平均批大小；
+    - 同一片段单独合成与混在批次中合成的波形差异（批内样本互不影响时应接近 0）。
+"""
+import argparse
+import threading
+import time
+
+import torch
+from transformers import AutoTokenizer, VitsModel, set_seed
+
+from vits_batch import EagerVitsBackend, MicroBatcher, SegmentJob, split_text, synthesize_jobs
+
+# =============================
+#           配置区域
+# =============================
+
+# 服务实际收到的是 POJ（由后端 poj_converter 从汉字转换而来），基准使用同样格式的输入
+TEXTS = [
+    "ta̍k-ke-hó góa-sī-Tân-Kah-kiⁿ chin-hoaⁿ-hí-kin-á-ji̍t-kap-ta̍k-ke-khui-kóng",  # 逐家好，我是陈嘉庚，真欢喜今仔日佮逐家开讲
+    "kàu-io̍k-sī-li̍p-kok-ê-kun-pún heng-ha̍k-sī-kok-bîn-ê-thiⁿ-chit",  # 教育是立国的根本，兴学是国民的天职
+    "Chi̍p-bí-ha̍k-chhoan-sī-goán-kò͘-hiong goán-tī-chia-chhòng-pān-liáu-sió-ha̍k tiong-ha̍k "
+    "su-hoān-kap-hâng-hái-ha̍k-hāu",  # 集美学村是阮故乡，阮佇遮创办了小学、中学、师范佮航海学校
+    "chò-lâng-tio̍h-sêng-khún chò-tāi-chì-tio̍h-ū-gē-la̍t",  # 做人着诚恳，做代志着有毅力
+    "Ē-mn̂g-tāi-ha̍k-sī-chi̍t-káu-jī-chi̍t-nî-chhòng-pān-ê "
+    "sī-tē-chi̍t-keng-hôa-kiâu-chhòng-pān-ê-tāi-ha̍k",  # 厦门大学是一九二一年创办的，是第一间华侨创办的大学
+    "kin-á-ji̍t-thiⁿ-khì-chin-hó hoan-gêng-ta̍k-ke-lâi-Chi̍p-bí-kiâⁿ-kiâⁿ-khòaⁿ-khòaⁿ",  # 今仔日天气真好，欢迎逐家来集美行行看看
+]
+
+
+def sequential(model, tokenizer, segments, speaking_rate: float) -> list:
+    """原实现：逐片段调用 HF forward（语速写在模型属性上）"""
+    waves = []
+    for seg in segments:
+        set_seed(42)
+        inputs = tokenizer(seg, return_tensors="pt")
+        model.speaking_rate = speaking_rate
+        model.noise_scale = 0.0
+        with torch.inference_mode():
+            waves.append(model(**inputs).waveform[0])
+    return waves
+
+
+def report(name: str, elapsed: float, waves: list, sample_rate: int) -> None:
+    audio_seconds = sum(w.numel() for w in waves) / sample_rate
+    print(f"{name:<24} {len(waves) / elapsed:8.2f} 片段/s   RTF {elapsed / audio_seconds:6.3f}   ({elapsed:.2f}s)")
+
+
+def bench_batcher(backend, tokenizer, clients: int, requests: int, max_batch: int, wait_ms: float):
+    batcher = MicroBatcher(lambda jobs: synthesize_jobs(backend, tokenizer, jobs),
+                           max_batch=max_batch, max_wait=wait_ms / 1000.0)
+    batcher.start()
+    latencies, lock = [], threading.Lock()
+
+    def client(idx: int):
+        for r in range(requests):
+            text = TEXTS[(idx + r) % len(TEXTS)] + " " + TEXTS[(idx + r + 1) % len(TEXTS)]
+            jobs = [SegmentJob(seg, speaking_rate=0.8 + 0.1 * (idx % 4)) for seg in split_text(text)]
+            start = time.perf_counter()
+            for fut in batcher.submit(jobs):
+                fut.result()
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    batcher.stop()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+    print(f"微批 clients={clients} max_batch={max_batch} wait={wait_ms:.0f}ms: "
+          f"{len(latencies) / elapsed:.2f} 请求/s，平均 {sum(latencies) / len(latencies) * 1000:.0f}ms，"
+          f"P95 {p95 * 1000:.0f}ms，{batcher.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="闽南语 VITS CPU 吞吐基准")
+    parser.add_argument("--model", type=str, default="facebook/mms-tts-nan")
+    parser.add_argument("--threads", type=int, default=4, help="torch 线程数")
+    parser.add_argument("--repeat", type=int, default=2, help="片段集合重复次数")
+    parser.add_argument("--batch_sizes", type=str, default="1,4,8,16")
+    parser.add_argument("--clients", type=int, default=8, help="微批测试的并发客户端数")
+    parser.add_argument("--requests", type=int, default=4, help="每个客户端的请求数")
+    parser.add_argument("--wait_ms", type=float, default=10.0)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    model = VitsModel.from_pretrained(args.model).eval()
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    backend = EagerVitsBackend(model)
+    sample_rate = model.config.sampling_rate
+    segments = [seg for text in TEXTS for seg in split_text(text)] * args.repeat
+    print(f">> {len(segments)} 个片段，torch 线程 {args.threads}")
+
+    sequential(model, tokenizer, segments[:2], 1.0)  # 预热
+    start = time.perf_counter()
+    waves = sequential(model, tokenizer, segments, 1.0)
+    report("逐片段 (HF forward)", time.perf_counter() - start, waves, sample_rate)
+
+    for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+        jobs = [SegmentJob(seg) for seg in segments]
+        start = time.perf_counter()
+        waves = []
+        for i in range(0, len(jobs), batch_size):
+            waves.extend(synthesize_jobs(backend, tokenizer, jobs[i:i + batch_size]))
+        report(f"批量 batch={batch_size}", time.perf_counter() - start, waves, sample_rate)
+
+    # 批内独立性：同一片段单独合成与混在批次中合成
+    probe = SegmentJob(segments[0], speaking_rate=0.9, seed=7)
+    alone = synthesize_jobs(backend, tokenizer, [probe])[0]
+    mixed = synthesize_jobs(backend, tokenizer, [SegmentJob(s, speaking_rate=1.2) for s in segments[1:8]] + [probe])[-1]
+    n = min(alone.numel(), mixed.numel())
+    print(f"批内独立性: 长度 {alone.numel()} vs {mixed.numel()}，最大差值 {float((alone[:n] - mixed[:n]).abs().max()):.2e}")
+
+    bench_batcher(backend, tokenizer, args.clients, args.requests, max_batch=1, wait_ms=0)
+    bench_batcher(backend, tokenizer, args.clients, args.requests, max_batch=16, wait_ms=args.wait_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+闽南语 VITS：eager PyTorch vs onnxruntime（fp32 / int8）的一致性与 CPU 延迟、吞吐对比
+
+用法（在仓库根目录，先导出 ONNX）：
+    cd models/tts_service && python vits_onnx.py --out ckpt/mms-tts-nan-onnx --int8 && cd ../..
+    PYTHONPATH=models/tts_service python test_single/bench_minnan_tts_onnx.py \\
+        --onnx_dir models/tts_service/ckpt/mms-tts-nan-onnx --threads 4
+
+输出：
+    - 一致性：相同种子下各后端与 eager 输出波形的余弦相似度 / SNR / 长度比（低于阈值时非零退出）；
+    - 延迟：单片段（batch=1）合成的 P50 / P95；
+    - 吞吐：按批合成全部片段的片段/秒与 RTF。
+"""
+import argparse
+import time
+
+import torch
+from transformers import AutoTokenizer, VitsModel
+
+from vits_batch import EagerVitsBackend, SegmentJob, split_text, synthesize_jobs
+from vits_onnx import OnnxVitsBackend, parity_check, summarize_parity
+
+# =============================
+#           配置区域
+# =============================
+
+# 服务实际收到的是 POJ（由后端 poj_converter 从汉字转换而来），基准使用同样格式的输入
+TEXTS = [
+    "ta̍k-ke-hó góa-sī-Tân-Kah-kiⁿ chin-hoaⁿ-hí-kin-á-ji̍t-kap-ta̍k-ke-khui-kóng",  # 逐家好，我是陈嘉庚，真欢喜今仔日佮逐家开讲
+    "kàu-io̍k-sī-li̍p-kok-ê-kun-pún heng-ha̍k-sī-kok-bîn-ê-thiⁿ-chit",  # 教育是立国的根本，兴学是国民的天职
+    "Chi̍p-bí-ha̍k-chhoan-sī-goán-kò͘-hiong goán-tī-chia-chhòng-pān-liáu-sió-ha̍k tiong-ha̍k "
+    "su-hoān-kap-hâng-hái-ha̍k-hāu",  # 集美学村是阮故乡，阮佇遮创办了小学、中学、师范佮航海学校
+    "chò-lâng-tio̍h-sêng-khún chò-tāi-chì-tio̍h-ū-gē-la̍t",  # 做人着诚恳，做代志着有毅力
+    "Ē-mn̂g-tāi-ha̍k-sī-chi̍t-káu-jī-chi̍t-nî-chhòng-pān-ê "
+    "sī-tē-chi̍t-keng-hôa-kiâu-chhòng-pān-ê-tāi-ha̍k",  # 厦门大学是一九二一年创办的，是第一间华侨创办的大学
+    "kin-á-ji̍t-thiⁿ-khì-chin-hó hoan-gêng-ta̍k-ke-lâi-Chi̍p-bí-kiâⁿ-kiâⁿ-khòaⁿ-khòaⁿ",  # 今仔日天气真好，欢迎逐家来集美行行看看
+]
+
+
+def latency(backend, tokenizer, segments, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        for seg in segments:
+            start = time.perf_counter()
+            synthesize_jobs(backend, tokenizer, [SegmentJob(seg)])
+            samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.95) - 1]
+
+
+def throughput(backend, tokenizer, segments, batch_size: int, sample_rate: int):
+    jobs = [SegmentJob(seg) for seg in segments]
+    start = time.perf_counter()
+    waves = []
+    for i in range(0, len(jobs), batch_size):
+        waves.extend(synthesize_jobs(backend, tokenizer, jobs[i:i + batch_size]))
+    elapsed = time.perf_counter() - start
+    audio_seconds = sum(w.numel() for w in waves) / sample_rate
+    return len(waves) / elapsed, elapsed / audio_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="闽南语 VITS eager vs ONNX 基准")
+    parser.add_argument("--model", type=str, default="facebook/mms-tts-nan")
+    parser.add_argument("--onnx_dir", type=str, default="models/tts_service/ckpt/mms-tts-nan-onnx")
+    parser.add_argument("--threads", type=int, default=4, help="torch 与 onnxruntime 的算子内线程数")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--min_cosine", type=float, default=0.99)
+    parser.add_argument("--min_cosine_int8", type=float, default=0.9)
+    parser.add_argument("--no_int8", action="store_true", help="跳过 int8 图")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    model = VitsModel.from_pretrained(args.model).eval()
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    eager = EagerVitsBackend(model)
+    backends = [("eager", eager, None)]
+    backends.append(("onnx-fp32", OnnxVitsBackend(args.onnx_dir, intra_op_threads=args.threads), args.min_cosine))
+    if not args.no_int8:
+        backends.append(("onnx-int8", OnnxVitsBackend(args.onnx_dir, int8=True, intra_op_threads=args.threads),
+                         args.min_cosine_int8))
+
+    segments = [seg for text in TEXTS for seg in split_text(text)]
+    print(f">> {len(segments)} 个片段，线程 {args.threads}")
+
+    failures = []
+    for name, backend, threshold in backends[1:]:
+        results = parity_check(eager, backend, tokenizer, segments)
+        worst = min(results, key=lambda r: r["cosine"])
+        print(f"一致性 {name:<10} min_cos={worst['cosine']:.4f} "
+              f"min_snr={min(r['snr_db'] for r in results):.1f}dB "
+              f"len_ratio={min(r['length_ratio'] for r in results):.3f}~{max(r['length_ratio'] for r in results):.3f}")
+        reason = summarize_parity(results, threshold)
+        if reason:
+            failures.append(f"{name}: {reason}")
+
+    print(f"{'后端':<12}{'P50(ms)':>10}{'P95(ms)':>10}{'片段/s':>10}{'RTF':>8}")
+    for name, backend, _ in backends:
+        synthesize_jobs(backend, tokenizer, [SegmentJob(segments[0])])  # 预热
+        p50, p95 = latency(backend, tokenizer, segments, args.repeat)
+        rate, rtf = throughput(backend, tokenizer, segments * args.repeat, args.batch_size, eager.sampling_rate)
+        print(f"{name:<12}{p50 * 1000:>10.1f}{p95 * 1000:>10.1f}{rate:>10.2f}{rtf:>8.3f}")
+
+    if failures:
+        raise SystemExit("一致性检查未通过: " + "; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
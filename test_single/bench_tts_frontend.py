@@ -0,0 +1,74 @@
+"""
+IndexTTS 文本前端（归一化 + 分词 + 分句 + 转 id）微基准
+
+用法（在仓库根目录）：
+    PYTHONPATH=packages python test_single/bench_tts_frontend.py --model_dir /path/to/checkpoints
+
+输出冷启动（无缓存）与热缓存两种情况下每句的平均前端耗时。
+"""
+import argparse
+import os
+import time
+
+from indextts.utils.front import TextNormalizer, TextTokenizer
+
+# =============================
+#           配置区域
+# =============================
+
+TEXTS = [
+    "大家好，我是陈嘉庚。今天很高兴和大家聊一聊集美学村的故事。",
+    "1913年，我在家乡集美创办了第一所小学，后来又陆续办了师范、中学、水产、航海等学校。",
+    "教育是立国之本，兴学是国民天职。",
+    "现在是北京时间2025年01月11日 20:00，欢迎来到厦门大学。",
+    "See you at 8:00 AM, 我们在群贤楼见面。",
+]
+
+
+def bench(tokenizer: TextTokenizer, texts, repeat: int, max_tokens: int) -> float:
+    """返回每个文本的平均前端耗时（毫秒）"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            tokenizer.encode_sentences(text, max_tokens_per_sentence=max_tokens)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(texts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IndexTTS 文本前端微基准")
+    parser.add_argument("--model_dir", type=str, default=os.getenv("MODEL_DIR", "checkpoints"))
+    parser.add_argument("--bpe_model", type=str, default="bpe.model")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--max_tokens", type=int, default=100)
+    args = parser.parse_args()
+
+    normalizer = TextNormalizer()
+    tokenizer = TextTokenizer(os.path.join(args.model_dir, args.bpe_model), normalizer)
+
+    # 冷启动：每轮都清空缓存
+    cold_total = 0.0
+    for _ in range(args.repeat):
+        tokenizer.clear_cache()
+        cold_total += bench(tokenizer, TEXTS, 1, args.max_tokens)
+    cold = cold_total / args.repeat
+
+    # 热缓存：先预热一遍再计时
+    tokenizer.clear_cache()
+    bench(tokenizer, TEXTS, 1, args.max_tokens)
+    warm = bench(tokenizer, TEXTS, args.repeat, args.max_tokens)
+
+    # 批量未命中路径：一次 sp_model.Encode 处理所有文本
+    tokenizer.clear_cache()
+    start = time.perf_counter()
+    tokenizer.batch_encode_sentences(TEXTS, max_tokens_per_sentence=args.max_tokens)
+    batch_cold = (time.perf_counter() - start) * 1000 / len(TEXTS)
+
+    print(f"[*] 文本数: {len(TEXTS)}, 重复次数: {args.repeat}")
+    print(f"[*] 冷启动（逐条）: {cold:.3f} ms/句")
+    print(f"[*] 冷启动（批量）: {batch_cold:.3f} ms/句")
+    print(f"[*] 热缓存:         {warm:.4f} ms/句  (加速 {cold / max(warm, 1e-9):.1f}x)")
+    print(f"[*] 缓存命中: {tokenizer.sentences_cache.hits}, 未命中: {tokenizer.sentences_cache.misses}")
+
+
+if __name__ == "__main__":
+    main()
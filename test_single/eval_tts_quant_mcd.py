@@ -0,0 +1,116 @@
+"""
+IndexTTS CPU 量化质量回归：对比量化模型与 fp32 模型输出的梅尔倒谱距离（MCD）
+
+用法（在仓库根目录）：
+    PYTHONPATH=packages python test_single/eval_tts_quant_mcd.py \
+        --model_dir models/tts_service/ckpt/cjg --prompt models/tts_service/speaker_audio/陈嘉庚.wav
+
+两个模型都用贪心解码（do_sample=False）在固定文本集上合成，
+MCD 在 DTW 对齐后的帧上计算（不含 c0），同时输出两者的 RTF 便于权衡速度与质量。
+"""
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+import torch
+import torchaudio
+
+from indextts.infer import IndexTTS, set_seed
+
+# =============================
+#           配置区域
+# =============================
+
+TEXTS = [
+    "大家好，我是陈嘉庚。",
+    "教育是立国之本，兴学是国民天职。",
+    "1913年，我在家乡集美创办了第一所小学。",
+    "诚毅二字，是集美学校的校训。",
+    "希望同学们努力学习，将来报效国家。",
+]
+
+SAMPLE_RATE = 24000
+N_MFCC = 25
+# 经验阈值：MCD 超过该值视为量化导致的明显音质退化
+MCD_THRESHOLD_DB = 6.0
+
+
+def mel_cepstrum(wav: torch.Tensor) -> np.ndarray:
+    """int16 幅度的 wav [1, T] -> 梅尔倒谱 [frames, N_MFCC-1]（去掉能量项 c0）"""
+    mfcc = torchaudio.transforms.MFCC(
+        sample_rate=SAMPLE_RATE,
+        n_mfcc=N_MFCC,
+        melkwargs={"n_fft": 1024, "hop_length": 256, "n_mels": 80},
+    )
+    feats = mfcc(wav.float() / 32767.0)[0].T.numpy()
+    return feats[:, 1:]
+
+
+def dtw_mcd(ref: np.ndarray, hyp: np.ndarray) -> float:
+    """DTW 对齐后的平均 MCD（dB）"""
+    n, m = len(ref), len(hyp)
+    dist = np.sqrt(((ref[:, None, :] - hyp[None, :, :]) ** 2).sum(-1))
+    cost = np.full((n + 1, m + 1), np.inf)
+    steps = np.zeros((n + 1, m + 1), dtype=np.int64)
+    cost[0, 0] = 0.0
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            prev = min(
+                (cost[i - 1, j - 1], steps[i - 1, j - 1]),
+                (cost[i - 1, j], steps[i - 1, j]),
+                (cost[i, j - 1], steps[i, j - 1]),
+            )
+            cost[i, j] = prev[0] + dist[i - 1, j - 1]
+            steps[i, j] = prev[1] + 1
+    mean_dist = cost[n, m] / max(steps[n, m], 1)
+    return (10.0 / math.log(10.0)) * math.sqrt(2.0) * mean_dist
+
+
+def synthesize_all(tts: IndexTTS, prompt: str):
+    wavs = []
+    start = time.perf_counter()
+    for text in TEXTS:
+        set_seed(1234)
+        sr, wav = tts.infer(prompt, text, output_path=None, do_sample=False, num_beams=1)
+        wavs.append(torch.from_numpy(wav.T.copy()))
+    elapsed = time.perf_counter() - start
+    audio_seconds = sum(w.shape[-1] for w in wavs) / SAMPLE_RATE
+    return wavs, elapsed / max(audio_seconds, 1e-6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IndexTTS 量化 MCD 回归")
+    parser.add_argument("--model_dir", type=str, default=os.getenv("MODEL_DIR", "checkpoints"))
+    parser.add_argument("--prompt", type=str, default=os.getenv("AUDIO_PROMPT"), required=os.getenv("AUDIO_PROMPT") is None)
+    parser.add_argument("--quantize", type=str, default="int8")
+    parser.add_argument("--bigvgan_bf16", action="store_true", default=False)
+    args = parser.parse_args()
+
+    cfg_path = os.path.join(args.model_dir, "config.yaml")
+    base = IndexTTS(cfg_path=cfg_path, model_dir=args.model_dir, device="cpu")
+    ref_wavs, ref_rtf = synthesize_all(base, args.prompt)
+    del base
+
+    quant = IndexTTS(cfg_path=cfg_path, model_dir=args.model_dir, device="cpu",
+                     quantize=args.quantize, bigvgan_bf16=args.bigvgan_bf16)
+    hyp_wavs, hyp_rtf = synthesize_all(quant, args.prompt)
+
+    mcds = []
+    for text, ref, hyp in zip(TEXTS, ref_wavs, hyp_wavs):
+        mcd = dtw_mcd(mel_cepstrum(ref), mel_cepstrum(hyp))
+        mcds.append(mcd)
+        print(f"[*] MCD={mcd:6.2f} dB  |  {text}")
+
+    mean_mcd = float(np.mean(mcds))
+    print(f"[*] fp32 RTF: {ref_rtf:.4f}, {args.quantize}{'+bf16' if args.bigvgan_bf16 else ''} RTF: {hyp_rtf:.4f}")
+    print(f"[*] 平均 MCD: {mean_mcd:.2f} dB (阈值 {MCD_THRESHOLD_DB} dB)")
+    if mean_mcd > MCD_THRESHOLD_DB:
+        print("[!] 量化后音质退化超过阈值")
+        raise SystemExit(1)
+    print("[✓] 量化质量回归通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+本地 OpenAI 兼容桩服务（/v1/chat/completions，支持流式与非流式），用于离线测试 LLM 客户端
+
+用法（在仓库根目录）：
+    python test_single/mock_openai_server.py --port 9099 --ttft 0.2 --rpm 30
+    # 后端指向桩服务
+    LLM_PROVIDER_BASE_URL=http://127.0.0.1:9099/v1 PROVIDER_NAME=qwen PROVIDER_API_KEY=k1,k2 ...
+
+- ``--ttft`` / ``--token-interval``：首个 token 延迟与后续 token 间隔（秒）；
+- ``--rpm``：每把 Key 每分钟请求上限，超出时返回 429 与 ``Retry-After``；
+- 响应包含 ``usage`` 字段（流式时在最后一个 chunk 中，需 ``stream_options.include_usage``）；
+- ``GET /stats``：各 Key 的请求数、429 次数与连接数（用于观察连接复用）。
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# =============================
+#           配置区域
+# =============================
+
+REPLY = "诸君好，我是陈嘉庚。教育是立国之本，兴学是国民天职，愿大家为国家多出一份力。"
+
+
+class MockState:
+    def __init__(self, rpm: int):
+        self.rpm = rpm
+        self.lock = threading.Lock()
+        self.windows = defaultdict(deque)
+        self.stats = defaultdict(lambda: {"requests": 0, "rate_limited": 0})
+        self.connections = 0
+
+    def admit(self, key: str) -> float:
+        """返回 0 表示放行，否则为建议的 Retry-After 秒数"""
+        now = time.monotonic()
+        with self.lock:
+            self.stats[key]["requests"] += 1
+            if self.rpm <= 0:
+                return 0.0
+            window = self.windows[key]
+            while window and now - window[0] >= 60:
+                window.popleft()
+            if len(window) >= self.rpm:
+                self.stats[key]["rate_limited"] += 1
+                return 60 - (now - window[0])
+            window.append(now)
+            return 0.0
+
+
+def make_handler(state: MockState, ttft: float, token_interval: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # 支持 keep-alive
+
+        def setup(self):
+            super().setup()
+            with state.lock:
+                state.connections += 1
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _json(self, status: int, body: dict, headers: dict = None):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                with state.lock:
+                    self._json(200, {"keys": dict(state.stats), "connections": state.connections})
+            else:
+                self._json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._json(404, {"error": "not found"})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            req = json.loads(self.rfile.read(length) or b"{}")
+            key = (self.headers.get("Authorization") or "").removeprefix("Bearer ").strip() or "anonymous"
+            retry_after = state.admit(key)
+            if retry_after:
+                self._json(429, {"error": {"message": "rate limited", "type": "rate_limit"}},
+                           {"Retry-After": str(max(int(retry_after), 1))})
+                return
+
+            model = req.get("model", "mock")
+            prompt_tokens = sum(len(m.get("content") or "") for m in req.get("messages", []))
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(REPLY),
+                     "total_tokens": prompt_tokens + len(REPLY)}
+            cid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            time.sleep(ttft)
+
+            if not req.get("stream"):
+                self._json(200, {
+                    "id": cid, "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": REPLY},
+                                 "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def send_event(payload):
+                data = f"data: {payload}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def chunk(delta: dict, finish_reason=None, with_usage=False):
+                body = {"id": cid, "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+                if with_usage:
+                    body["choices"] = []
+                    body["usage"] = usage
+                return json.dumps(body, ensure_ascii=False)
+
+            send_event(chunk({"role": "assistant", "content": ""}))
+            for i in range(0, len(REPLY), 3):
+                send_event(chunk({"content": REPLY[i:i + 3]}))
+                time.sleep(token_interval)
+            send_event(chunk({}, finish_reason="stop"))
+            if (req.get("stream_options") or {}).get("include_usage"):
+                send_event(chunk({}, with_usage=True))
+            send_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容桩服务")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9099)
+    parser.add_argument("--ttft", type=float, default=0.2, help="首个 token 延迟（秒）")
+    parser.add_argument("--token-interval", type=float, default=0.02, help="流式 chunk 间隔（秒）")
+    parser.add_argument("--rpm", type=int, default=0, help="每把 Key 每分钟请求上限，0 表示不限")
+    args = parser.parse_args()
+
+    state = MockState(args.rpm)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state, args.ttft, args.token_interval))
+    print(f"Mock OpenAI server on http://{args.host}:{args.port}/v1 (ttft={args.ttft}s, rpm={args.rpm or '∞'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()